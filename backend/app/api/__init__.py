@@ -17,10 +17,12 @@ from app.api import (
     dating,  # 交友模块
     admin_dating,  # 交友后台管理
     ranking,  # 排行榜
+    search,  # 统一搜索
     admin_unified_comments,  # 统一评论管理
     transcode_callback,  # GPU转码回调
     transcode_monitor,  # 转码监控
     download_page,  # 下载页管理
+    monitoring,  # 性能监控
     # 新增的后台管理模块
     admin_finance, admin_logs, admin_content, admin_video_ops, admin_creator_mgmt
 )
@@ -56,10 +58,12 @@ api_router.include_router(gallery_novel.router, tags=["图集小说"])
 api_router.include_router(darkweb.router, tags=["暗网视频"])
 api_router.include_router(dating.router, tags=["交友模块"])
 api_router.include_router(ranking.router, tags=["排行榜"])
+api_router.include_router(search.router, tags=["搜索"])
 
 # 后台管理路由 - 注意：更具体的路由需要先注册，避免被通配路由拦截
 api_router.include_router(admin_video_ops.router, tags=["后台-视频批量操作"])  # /admin/videos/* 在前
 api_router.include_router(admin_gallery_novel.router, tags=["后台-图集小说管理"])  # /admin/gallery-novel/* 在前
+api_router.include_router(monitoring.router, tags=["后台-性能监控"])  # /admin/monitoring/* 在前
 api_router.include_router(admin.router, prefix="/admin", tags=["管理后台"])    # /admin/* 在后
 api_router.include_router(admin_points.router, tags=["后台-福利任务"])
 api_router.include_router(admin_creator_mgmt.router, tags=["后台-创作者管理"])  # 新的创作者管理
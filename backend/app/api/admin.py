@@ -17,6 +17,8 @@ from app.models.video import Video, VideoStatus, VideoCategory, VideoTag
 from app.models.payment import PaymentOrder, PaymentStatus
 from app.models.ad import Advertisement
 from app.models.comment import Comment
+from app.models.statistics import DailyRevenueReport
+from app.services.stats_rollup import StatsRollup
 from app.core.vip_config import VIP_LEVEL_CONFIG, update_vip_level_config, get_vip_level_name
 
 
@@ -64,61 +66,25 @@ async def get_dashboard_stats(
     current_user: User = Depends(get_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取仪表盘统计"""
+    """获取仪表盘统计（读取预聚合的日汇总，按 UTC 日期）"""
     today = datetime.utcnow().date()
-    today_start = datetime.combine(today, datetime.min.time())
     
-    # 总用户数
-    result = await db.execute(select(func.count()).select_from(User))
-    total_users = result.scalar()
+    # 累计值与快照取最近一天的汇总，今日指标只认今天的汇总行
+    latest = await StatsRollup.latest(db)
+    today_stats = latest if latest and latest.stat_date == today else None
     
-    # VIP用户数
-    result = await db.execute(
-        select(func.count()).select_from(UserVIP).where(
-            UserVIP.is_active == True,
-            UserVIP.expire_date > datetime.utcnow()
-        )
-    )
-    total_vip_users = result.scalar()
-    
-    # 总视频数
-    result = await db.execute(
-        select(func.count()).select_from(Video).where(Video.status == VideoStatus.PUBLISHED)
-    )
-    total_videos = result.scalar()
-    
-    # 总收入
-    result = await db.execute(
-        select(func.sum(PaymentOrder.amount)).where(PaymentOrder.status == PaymentStatus.SUCCESS)
-    )
+    # 总收入（VIP支付累计）
+    result = await db.execute(select(func.sum(DailyRevenueReport.total_vip_sales)))
     total_revenue = result.scalar() or 0
     
-    # 今日新用户
-    result = await db.execute(
-        select(func.count()).select_from(User).where(User.created_at >= today_start)
-    )
-    new_users_today = result.scalar()
-    
-    # 今日新视频
-    result = await db.execute(
-        select(func.count()).select_from(Video).where(Video.created_at >= today_start)
-    )
-    new_videos_today = result.scalar()
-    
-    # 今日活跃用户
-    result = await db.execute(
-        select(func.count()).select_from(User).where(User.last_login >= today_start)
-    )
-    active_users_today = result.scalar()
-    
     return DashboardStats(
-        total_users=total_users,
-        total_vip_users=total_vip_users,
-        total_videos=total_videos,
+        total_users=(latest.total_users if latest else 0) or 0,
+        total_vip_users=(latest.vip_users if latest else 0) or 0,
+        total_videos=(latest.published_videos if latest else 0) or 0,
         total_revenue=float(total_revenue),
-        new_users_today=new_users_today,
-        new_videos_today=new_videos_today,
-        active_users_today=active_users_today
+        new_users_today=(today_stats.new_users if today_stats else 0) or 0,
+        new_videos_today=(today_stats.new_videos if today_stats else 0) or 0,
+        active_users_today=(today_stats.dau if today_stats else 0) or 0
     )
 
 
@@ -1788,6 +1754,11 @@ async def update_comment(
     if data.is_official is not None:
         comment.is_official = data.is_official
     
+    if data.is_hidden is not None:
+        from app.services.comment_threads import CommentThreads
+        await db.flush()
+        await CommentThreads.recount(db, "video", [comment.video_id])
+    
     await db.commit()
     
     return {"message": "更新成功"}
@@ -1815,13 +1786,13 @@ async def delete_comment_admin(
         from sqlalchemy import delete as sql_delete
         await db.execute(sql_delete(Comment).where(Comment.parent_id == comment_id))
     
-    # 更新视频评论数
-    video_result = await db.execute(select(Video).where(Video.id == comment.video_id))
-    video = video_result.scalar_one_or_none()
-    if video:
-        video.comment_count = max(0, video.comment_count - 1 - comment.reply_count)
-    
+    video_id = comment.video_id
     await db.delete(comment)
+    
+    # 重新核对视频评论数
+    from app.services.comment_threads import CommentThreads
+    await db.flush()
+    await CommentThreads.recount(db, "video", [video_id])
     await db.commit()
     
     return {"message": "删除成功"}
@@ -1838,6 +1809,11 @@ async def batch_delete_comments(
         raise HTTPException(status_code=400, detail="请选择要删除的评论")
     
     from sqlalchemy import delete as sql_delete
+    from app.services.comment_threads import CommentThreads
+    
+    video_ids = (await db.execute(
+        select(Comment.video_id).where(Comment.id.in_(data.ids)).distinct()
+    )).scalars().all()
     
     # 先删除子评论
     await db.execute(sql_delete(Comment).where(Comment.parent_id.in_(data.ids)))
@@ -1845,6 +1821,8 @@ async def batch_delete_comments(
     # 再删除主评论
     await db.execute(sql_delete(Comment).where(Comment.id.in_(data.ids)))
     
+    # 重新核对视频评论数
+    await CommentThreads.recount(db, "video", video_ids)
     await db.commit()
     
     return {"message": f"成功删除 {len(data.ids)} 条评论"}
@@ -12,6 +12,7 @@ from app.core.database import get_db
 from app.api.deps import get_current_admin
 from app.models.user import User
 from app.models.community import Post, PostComment, Topic, PostLike, TopicFollow
+from app.services.notification_inbox import NotificationInbox
 
 router = APIRouter(prefix="/admin/community", tags=["社区管理"])
 
@@ -565,6 +566,7 @@ async def delete_comment_admin(
             post.comment_count = max(0, post.comment_count - 1)
     
     comment.status = "deleted"
+    await NotificationInbox.retract_comment(db, "post", comment.id)
     await db.commit()
     
     return {"message": "删除成功"}
@@ -586,6 +588,7 @@ async def batch_delete_comments(
         if comment.status != "deleted":
             post_updates[comment.post_id] = post_updates.get(comment.post_id, 0) + 1
         comment.status = "deleted"
+        await NotificationInbox.retract_comment(db, "post", comment.id)
     
     # 更新帖子评论数
     for post_id, count in post_updates.items():
@@ -16,6 +16,8 @@ from app.models.user import User
 from app.models.comment import Comment
 from app.models.community import PostComment, GalleryComment, NovelComment
 from app.models.video import Video
+from app.services.notification_inbox import NotificationInbox
+from app.services.comment_threads import CommentThreads, KINDS
 
 router = APIRouter(prefix="/admin/unified-comments", tags=["Unified Comments"])
 
@@ -36,6 +38,17 @@ class UpdateCommentRequest(BaseModel):
     is_god: Optional[bool] = None
 
 
+async def recount_comment_targets(db: AsyncSession, comments: list):
+    """Re-check comment_count / reply_count of the content touched by hide/delete (comments: [(type, comment)])"""
+    targets = {}
+    for content_type, comment in comments:
+        kind = "video" if content_type == "short" else content_type
+        targets.setdefault(kind, set()).add(KINDS[kind].target_id(comment))
+    await db.flush()
+    for kind, target_ids in targets.items():
+        await CommentThreads.recount(db, kind, target_ids)
+
+
 @router.get("/stats")
 async def get_comment_stats(
     db: AsyncSession = Depends(get_db),
@@ -394,6 +407,11 @@ async def update_comment(
     else:
         raise HTTPException(status_code=400, detail="Invalid content type")
     
+    if update_data.is_hidden:
+        await NotificationInbox.retract_comment(db, content_type, comment_id)
+    if update_data.is_hidden is not None:
+        await recount_comment_targets(db, [(content_type, comment)])
+    
     await db.commit()
     return {"message": "Comment updated successfully"}
 
@@ -437,6 +455,8 @@ async def delete_comment(
     else:
         raise HTTPException(status_code=400, detail="Invalid content type")
     
+    await NotificationInbox.retract_comment(db, content_type, comment_id)
+    await recount_comment_targets(db, [(content_type, comment)])
     await db.commit()
     return {"message": "Comment deleted successfully"}
 
@@ -449,6 +469,7 @@ async def batch_delete_comments(
 ):
     """Batch delete comments"""
     deleted_count = 0
+    touched = []
     
     for item in request.items:
         try:
@@ -456,32 +477,41 @@ async def batch_delete_comments(
                 result = await db.execute(select(Comment).where(Comment.id == item.id))
                 comment = result.scalar_one_or_none()
                 if comment:
+                    await NotificationInbox.retract_comment(db, item.type, item.id)
                     await db.delete(comment)
+                    touched.append((item.type, comment))
                     deleted_count += 1
             
             elif item.type == "post":
                 result = await db.execute(select(PostComment).where(PostComment.id == item.id))
                 comment = result.scalar_one_or_none()
                 if comment:
+                    await NotificationInbox.retract_comment(db, item.type, item.id)
                     await db.delete(comment)
+                    touched.append((item.type, comment))
                     deleted_count += 1
             
             elif item.type == "gallery":
                 result = await db.execute(select(GalleryComment).where(GalleryComment.id == item.id))
                 comment = result.scalar_one_or_none()
                 if comment:
+                    await NotificationInbox.retract_comment(db, item.type, item.id)
                     await db.delete(comment)
+                    touched.append((item.type, comment))
                     deleted_count += 1
             
             elif item.type == "novel":
                 result = await db.execute(select(NovelComment).where(NovelComment.id == item.id))
                 comment = result.scalar_one_or_none()
                 if comment:
+                    await NotificationInbox.retract_comment(db, item.type, item.id)
                     await db.delete(comment)
+                    touched.append((item.type, comment))
                     deleted_count += 1
         except Exception as e:
             print(f"Failed to delete comment {item.type}/{item.id}: {e}")
     
+    await recount_comment_targets(db, touched)
     await db.commit()
     return {"message": f"Deleted {deleted_count} comments", "deleted_count": deleted_count}
 
@@ -494,6 +524,7 @@ async def batch_hide_comments(
 ):
     """Batch hide comments"""
     hidden_count = 0
+    touched = []
     
     for item in request.items:
         try:
@@ -502,6 +533,8 @@ async def batch_hide_comments(
                 comment = result.scalar_one_or_none()
                 if comment:
                     comment.is_hidden = True
+                    await NotificationInbox.retract_comment(db, item.type, item.id)
+                    touched.append((item.type, comment))
                     hidden_count += 1
             
             elif item.type == "post":
@@ -509,6 +542,8 @@ async def batch_hide_comments(
                 comment = result.scalar_one_or_none()
                 if comment:
                     comment.status = "hidden"
+                    await NotificationInbox.retract_comment(db, item.type, item.id)
+                    touched.append((item.type, comment))
                     hidden_count += 1
             
             elif item.type == "gallery":
@@ -516,6 +551,8 @@ async def batch_hide_comments(
                 comment = result.scalar_one_or_none()
                 if comment:
                     comment.is_hidden = True
+                    await NotificationInbox.retract_comment(db, item.type, item.id)
+                    touched.append((item.type, comment))
                     hidden_count += 1
             
             elif item.type == "novel":
@@ -523,9 +560,12 @@ async def batch_hide_comments(
                 comment = result.scalar_one_or_none()
                 if comment:
                     comment.is_hidden = True
+                    await NotificationInbox.retract_comment(db, item.type, item.id)
+                    touched.append((item.type, comment))
                     hidden_count += 1
         except Exception as e:
             print(f"Failed to hide comment {item.type}/{item.id}: {e}")
     
+    await recount_comment_targets(db, touched)
     await db.commit()
     return {"message": f"Hidden {hidden_count} comments", "hidden_count": hidden_count}
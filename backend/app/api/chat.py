@@ -4,7 +4,7 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query, UploadFile, File
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, and_, or_, desc
-from typing import Dict, List, Optional
+from typing import Dict, Optional
 from datetime import datetime
 import json
 import asyncio
@@ -15,6 +15,7 @@ from app.core.database import get_db, AsyncSessionLocal
 from app.models.chat import ChatSession, ChatMessage, QuickReply
 from app.models.user import User, UserRole, UserVIP
 from app.api.deps import get_current_user, get_admin_user
+from app.services.chat_hub import ChatHub, MessageBatcher
 from pydantic import BaseModel
 
 
@@ -53,53 +54,9 @@ def check_rate_limit(user_id: int) -> tuple[bool, str]:
     return True, ""
 
 
-# WebSocket连接管理器
-class ConnectionManager:
-    def __init__(self):
-        # user_id -> WebSocket
-        self.user_connections: Dict[int, WebSocket] = {}
-        # agent_id -> WebSocket (客服)
-        self.agent_connections: Dict[int, WebSocket] = {}
-        # session_id -> List[WebSocket] (会话中的连接)
-        self.session_connections: Dict[int, List[WebSocket]] = {}
-    
-    async def connect_user(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        self.user_connections[user_id] = websocket
-    
-    async def connect_agent(self, websocket: WebSocket, agent_id: int):
-        await websocket.accept()
-        self.agent_connections[agent_id] = websocket
-    
-    def disconnect_user(self, user_id: int):
-        if user_id in self.user_connections:
-            del self.user_connections[user_id]
-    
-    def disconnect_agent(self, agent_id: int):
-        if agent_id in self.agent_connections:
-            del self.agent_connections[agent_id]
-    
-    async def send_to_user(self, user_id: int, message: dict):
-        if user_id in self.user_connections:
-            try:
-                await self.user_connections[user_id].send_json(message)
-            except Exception:
-                self.disconnect_user(user_id)
-    
-    async def send_to_agent(self, agent_id: int, message: dict):
-        if agent_id in self.agent_connections:
-            try:
-                await self.agent_connections[agent_id].send_json(message)
-            except Exception:
-                self.disconnect_agent(agent_id)
-    
-    async def broadcast_to_agents(self, message: dict):
-        """广播消息给所有在线客服"""
-        for agent_id in list(self.agent_connections.keys()):
-            await self.send_to_agent(agent_id, message)
-
-
-manager = ConnectionManager()
+# WebSocket连接管理（跨 worker 投递）与消息组提交
+manager = ChatHub()
+message_batcher = MessageBatcher()
 
 
 # Pydantic模型
@@ -124,6 +81,7 @@ class SessionResponse(BaseModel):
     avatar: Optional[str] = None
     is_vip: bool = False
     vip_level: int = 0
+    is_online: bool = False  # 用户是否有 WebSocket 连接（任意 worker）
 
 
 class MessageResponse(BaseModel):
@@ -365,6 +323,7 @@ async def get_all_sessions(
     
     result = await db.execute(query)
     sessions = result.scalars().all()
+    online = await manager.online_users([s.user_id for s in sessions])
     
     # 获取用户信息
     response = []
@@ -398,12 +357,20 @@ async def get_all_sessions(
             nickname=user.nickname if user else None,
             avatar=user.avatar if user else None,
             is_vip=is_vip,
-            vip_level=vip_level
+            vip_level=vip_level,
+            is_online=s.user_id in online
         ))
     
     return response
 
 
+@router.get("/admin/agents/online")
+async def get_online_agents(current_user: User = Depends(get_admin_user)):
+    """在线客服（所有 worker）"""
+    agents = sorted(await manager.online_agents())
+    return {"count": len(agents), "agent_ids": agents}
+
+
 @router.post("/admin/sessions/{session_id}/claim")
 async def claim_session(
     session_id: int,
@@ -771,8 +738,9 @@ async def websocket_user(websocket: WebSocket, user_id: int, token: str = Query(
         while True:
             data = await websocket.receive_json()
             
-            # 处理心跳
+            # 处理心跳（同时续期在线状态）
             if data.get("type") == "ping":
+                await manager.touch(users=[user_id])
                 await websocket.send_json({"type": "pong"})
                 continue
             
@@ -783,65 +751,57 @@ async def websocket_user(websocket: WebSocket, user_id: int, token: str = Query(
                     user_query = select(User).where(User.id == user_id)
                     user_result = await db.execute(user_query)
                     user = user_result.scalar_one_or_none()
+                    if not user:
+                        continue
                     
-                    if user:
-                        # 创建或获取会话
-                        session_query = select(ChatSession).where(
-                            and_(
-                                ChatSession.user_id == user_id,
-                                ChatSession.status != "closed"
-                            )
-                        )
-                        session_result = await db.execute(session_query)
-                        session = session_result.scalar_one_or_none()
-                        
-                        if not session:
-                            session = ChatSession(user_id=user_id, status="waiting")
-                            db.add(session)
-                            await db.commit()
-                            await db.refresh(session)
-                        
-                        # 创建消息
-                        message = ChatMessage(
-                            session_id=session.id,
-                            sender_id=user_id,
-                            is_from_user=True,
-                            content=data.get("content", "")
+                    # 创建或获取会话
+                    session_query = select(ChatSession).where(
+                        and_(
+                            ChatSession.user_id == user_id,
+                            ChatSession.status != "closed"
                         )
-                        db.add(message)
-                        
-                        if not session.title:
-                            session.title = data.get("content", "")[:50]
-                        session.updated_at = datetime.utcnow()
-                        session.unread_count += 1
-                        
+                    )
+                    session_result = await db.execute(session_query)
+                    session = session_result.scalar_one_or_none()
+                    
+                    if not session:
+                        session = ChatSession(user_id=user_id, status="waiting")
+                        db.add(session)
                         await db.commit()
-                        await db.refresh(message)
-                        
-                        # 发送给客服
-                        msg_data = {
-                            "type": "new_message",
-                            "session_id": session.id,
-                            "message": {
-                                "id": message.id,
-                                "sender_id": message.sender_id,
-                                "is_from_user": True,
-                                "content": message.content,
-                                "created_at": message.created_at.isoformat()
-                            }
-                        }
-                        
-                        if session.agent_id:
-                            await manager.send_to_agent(session.agent_id, msg_data)
-                        else:
-                            await manager.broadcast_to_agents(msg_data)
-                        
-                        # 确认消息已发送
-                        await websocket.send_json({
-                            "type": "message_sent",
-                            "message_id": message.id,
-                            "session_id": session.id
-                        })
+                        await db.refresh(session)
+                
+                # 创建消息（与同时到达的消息合并提交，会话未读数和标题在同一事务中更新）
+                message = await message_batcher.save(
+                    session_id=session.id,
+                    sender_id=user_id,
+                    is_from_user=True,
+                    content=data.get("content", "")
+                )
+                
+                # 发送给客服
+                msg_data = {
+                    "type": "new_message",
+                    "session_id": session.id,
+                    "message": {
+                        "id": message.id,
+                        "sender_id": message.sender_id,
+                        "is_from_user": True,
+                        "content": message.content,
+                        "created_at": message.created_at.isoformat()
+                    }
+                }
+                
+                if session.agent_id:
+                    await manager.send_to_agent(session.agent_id, msg_data)
+                else:
+                    await manager.broadcast_to_agents(msg_data)
+                
+                # 确认消息已发送
+                await websocket.send_json({
+                    "type": "message_sent",
+                    "message_id": message.id,
+                    "session_id": session.id
+                })
     
     except WebSocketDisconnect:
         manager.disconnect_user(user_id)
@@ -857,8 +817,9 @@ async def websocket_agent(websocket: WebSocket, agent_id: int, token: str = Quer
         while True:
             data = await websocket.receive_json()
             
-            # 处理心跳
+            # 处理心跳（同时续期在线状态）
             if data.get("type") == "ping":
+                await manager.touch(agents=[agent_id])
                 await websocket.send_json({"type": "pong"})
                 continue
             
@@ -872,40 +833,33 @@ async def websocket_agent(websocket: WebSocket, agent_id: int, token: str = Quer
                         session_query = select(ChatSession).where(ChatSession.id == session_id)
                         session_result = await db.execute(session_query)
                         session = session_result.scalar_one_or_none()
+                    
+                    if session:
+                        message = await message_batcher.save(
+                            session_id=session.id,
+                            sender_id=agent_id,
+                            is_from_user=False,
+                            content=content
+                        )
                         
-                        if session:
-                            message = ChatMessage(
-                                session_id=session.id,
-                                sender_id=agent_id,
-                                is_from_user=False,
-                                content=content
-                            )
-                            db.add(message)
-                            session.updated_at = datetime.utcnow()
-                            session.user_unread_count += 1
-                            
-                            await db.commit()
-                            await db.refresh(message)
-                            
-                            # 发送给用户
-                            await manager.send_to_user(session.user_id, {
-                                "type": "new_message",
-                                "session_id": session.id,
-                                "message": {
-                                    "id": message.id,
-                                    "sender_id": message.sender_id,
-                                    "is_from_user": False,
-                                    "content": message.content,
-                                    "created_at": message.created_at.isoformat()
-                                }
-                            })
-                            
-                            # 确认
-                            await websocket.send_json({
-                                "type": "message_sent",
-                                "message_id": message.id
-                            })
+                        # 发送给用户
+                        await manager.send_to_user(session.user_id, {
+                            "type": "new_message",
+                            "session_id": session.id,
+                            "message": {
+                                "id": message.id,
+                                "sender_id": message.sender_id,
+                                "is_from_user": False,
+                                "content": message.content,
+                                "created_at": message.created_at.isoformat()
+                            }
+                        })
+                        
+                        # 确认
+                        await websocket.send_json({
+                            "type": "message_sent",
+                            "message_id": message.id
+                        })
     
     except WebSocketDisconnect:
         manager.disconnect_agent(agent_id)
-
@@ -3,8 +3,7 @@
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select
 from typing import Optional, List, Dict, Set
 from datetime import datetime
 import os
@@ -12,12 +11,15 @@ import uuid
 import aiofiles
 
 from app.core.database import get_db
+from app.core.query_optimizer import KeysetCursorError
 from app.api.deps import get_current_user, get_current_user_optional
 from app.models.user import User, UserVIP, UserRole
 from app.models.video import Video
 from app.models.comment import Comment, CommentLike
 from app.schemas.comment import CommentCreate, CommentUpdate, CommentResponse, CommentListResponse
 from app.services.image_service import ImageService
+from app.services.notification_inbox import NotificationInbox, NotificationCategory
+from app.services.comment_threads import CommentThreads
 
 router = APIRouter()
 
@@ -183,6 +185,7 @@ async def create_comment(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="视频不存在")
     
     # 检查父评论
+    parent = None
     if comment_in.parent_id:
         result = await db.execute(select(Comment).where(Comment.id == comment_in.parent_id))
         parent = result.scalar_one_or_none()
@@ -201,6 +204,25 @@ async def create_comment(
     )
     db.add(comment)
     video.comment_count += 1
+    await db.flush()
+    
+    # 通知：被回复的评论作者、视频作者（同一人只通知一次）
+    target_type = 'short' if video.is_short else 'video'
+    if parent:
+        await NotificationInbox.push(
+            db, user_id=parent.user_id, actor_id=current_user.id,
+            category=NotificationCategory.COMMENT, notification_type='reply',
+            source_type='video_comment', source_id=comment.id,
+            target_type=target_type, target_id=video.id, target_title=video.title,
+            content=comment.content
+        )
+    await NotificationInbox.push(
+        db, user_id=video.uploader_id, actor_id=current_user.id,
+        category=NotificationCategory.COMMENT, notification_type='comment',
+        source_type='video_comment', source_id=comment.id,
+        target_type=target_type, target_id=video.id, target_title=video.title,
+        content=comment.content
+    )
     
     await db.commit()
     await db.refresh(comment)
@@ -222,104 +244,54 @@ async def list_video_comments(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     sort_by: str = Query("newest", description="排序方式: newest(最新), hottest(最热)"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的 next_cursor），传入时忽略 page"),
     current_user: Optional[User] = Depends(get_current_user_optional),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取视频评论列表（优化版 - 批量查询）"""
-    # 基础查询：只获取顶级评论，预加载用户关系
-    query = select(Comment).where(
-        Comment.video_id == video_id,
-        Comment.parent_id == None,
-        Comment.is_hidden == False
-    ).options(selectinload(Comment.user))
-    
-    # 统计总数
-    count_query = select(func.count()).select_from(
-        select(Comment.id).where(
-            Comment.video_id == video_id,
-            Comment.parent_id == None,
-            Comment.is_hidden == False
-        ).subquery()
-    )
-    result = await db.execute(count_query)
-    total = result.scalar()
-    
-    # 排序
-    if sort_by == "hottest":
-        query = query.order_by(desc(Comment.is_pinned), desc(Comment.like_count), desc(Comment.created_at))
-    else:
-        query = query.order_by(desc(Comment.is_pinned), desc(Comment.created_at))
-    
-    # 分页
-    query = query.offset((page - 1) * page_size).limit(page_size)
+    """获取视频评论列表（游标分页，回复批量加载）"""
+    # 总数读视频上冗余的评论数，不再 COUNT(*)
+    total = await CommentThreads.comment_count(db, "video", video_id)
     
-    result = await db.execute(query)
-    comments = result.scalars().all()
+    try:
+        thread = await CommentThreads.load(
+            db, "video", video_id, sort=sort_by, cursor=cursor, page=page, page_size=page_size
+        )
+    except KeysetCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     
-    if not comments:
+    if not thread.comments:
         return CommentListResponse(items=[], total=total, page=page, page_size=page_size)
     
-    # 收集所有需要查询的用户ID和评论ID
-    user_ids = set(c.user_id for c in comments)
-    comment_ids = [c.id for c in comments]
-    
-    # 获取有回复的评论的回复（限制3条）
-    comments_with_replies = [c for c in comments if c.reply_count > 0]
-    reply_map: Dict[int, List[Comment]] = {}
-    
-    if comments_with_replies:
-        parent_ids = [c.id for c in comments_with_replies]
-        # 批量查询回复（每个父评论最多3条）
-        for parent_id in parent_ids:
-            reply_result = await db.execute(
-                select(Comment)
-                .where(Comment.parent_id == parent_id, Comment.is_hidden == False)
-                .options(selectinload(Comment.user))
-                .order_by(Comment.created_at)
-                .limit(3)
-            )
-            replies = reply_result.scalars().all()
-            reply_map[parent_id] = replies
-            # 收集回复的用户ID和评论ID
-            for r in replies:
-                user_ids.add(r.user_id)
-                comment_ids.append(r.id)
-    
-    # 批量查询VIP等级
-    vip_map = await batch_get_user_vip_levels(db, list(user_ids))
-    
-    # 批量查询点赞状态
+    # 批量查询用户、VIP等级、点赞状态（顶级评论和回复一起）
+    user_ids = thread.user_ids
+    users_result = await db.execute(select(User).where(User.id.in_(user_ids)))
+    users_map = {u.id: u for u in users_result.scalars().all()}
+    vip_map = await batch_get_user_vip_levels(db, user_ids)
     liked_ids = set()
     if current_user:
-        liked_ids = await batch_get_liked_comment_ids(db, comment_ids, current_user.id)
-    
-    # 构建响应
-    items = []
-    for comment in comments:
-        # 构建回复列表
-        replies_response = []
-        if comment.id in reply_map:
-            for reply in reply_map[comment.id]:
-                replies_response.append(build_comment_response(
-                    comment=reply,
-                    user=reply.user,
-                    vip_level=vip_map.get(reply.user_id, 0),
-                    is_liked=reply.id in liked_ids
-                ))
-        
-        items.append(build_comment_response(
+        liked_ids = await batch_get_liked_comment_ids(db, thread.comment_ids, current_user.id)
+    
+    def build(comment: Comment, replies: List[CommentResponse] = None) -> CommentResponse:
+        return build_comment_response(
             comment=comment,
-            user=comment.user,
+            user=users_map.get(comment.user_id),
             vip_level=vip_map.get(comment.user_id, 0),
             is_liked=comment.id in liked_ids,
-            replies=replies_response
-        ))
+            replies=replies
+        )
+    
+    items = [
+        build(comment, [build(reply) for reply in thread.replies.get(comment.id, [])])
+        for comment in thread.comments
+    ]
     
     return CommentListResponse(
         items=items,
         total=total,
         page=page,
-        page_size=page_size
+        page_size=page_size,
+        next_cursor=thread.next_cursor,
+        has_more=thread.has_more
     )
 
 
@@ -328,60 +300,55 @@ async def list_comment_replies(
     parent_id: int,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的 next_cursor），传入时忽略 page"),
     current_user: Optional[User] = Depends(get_current_user_optional),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取评论的回复列表（优化版）"""
-    # 检查父评论
+    """获取评论的回复列表（游标分页）"""
+    # 检查父评论，总数读父评论上冗余的回复数
     parent_result = await db.execute(select(Comment).where(Comment.id == parent_id))
-    if not parent_result.scalar_one_or_none():
+    parent = parent_result.scalar_one_or_none()
+    if not parent:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="评论不存在")
+    total = parent.reply_count or 0
     
-    # 查询回复，预加载用户
-    query = select(Comment).where(
-        Comment.parent_id == parent_id,
-        Comment.is_hidden == False
-    ).options(selectinload(Comment.user))
-    
-    # 统计总数
-    count_query = select(func.count()).select_from(
-        select(Comment.id).where(
-            Comment.parent_id == parent_id,
-            Comment.is_hidden == False
-        ).subquery()
-    )
-    result = await db.execute(count_query)
-    total = result.scalar()
-    
-    # 分页
-    query = query.order_by(Comment.created_at).offset((page - 1) * page_size).limit(page_size)
-    
-    result = await db.execute(query)
-    replies = result.scalars().all()
+    try:
+        thread = await CommentThreads.load_replies(
+            db, "video", parent_id, cursor=cursor, page=page, page_size=page_size
+        )
+    except KeysetCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     
-    if not replies:
+    if not thread.comments:
         return CommentListResponse(items=[], total=total, page=page, page_size=page_size)
     
     # 批量查询
-    user_ids = [r.user_id for r in replies]
-    comment_ids = [r.id for r in replies]
-    
+    user_ids = thread.user_ids
+    users_result = await db.execute(select(User).where(User.id.in_(user_ids)))
+    users_map = {u.id: u for u in users_result.scalars().all()}
     vip_map = await batch_get_user_vip_levels(db, user_ids)
     liked_ids = set()
     if current_user:
-        liked_ids = await batch_get_liked_comment_ids(db, comment_ids, current_user.id)
+        liked_ids = await batch_get_liked_comment_ids(db, thread.comment_ids, current_user.id)
     
     items = [
         build_comment_response(
             comment=reply,
-            user=reply.user,
+            user=users_map.get(reply.user_id),
             vip_level=vip_map.get(reply.user_id, 0),
             is_liked=reply.id in liked_ids
         )
-        for reply in replies
+        for reply in thread.comments
     ]
     
-    return CommentListResponse(items=items, total=total, page=page, page_size=page_size)
+    return CommentListResponse(
+        items=items,
+        total=total,
+        page=page,
+        page_size=page_size,
+        next_cursor=thread.next_cursor,
+        has_more=thread.has_more
+    )
 
 
 @router.post("/{comment_id}/like")
@@ -407,6 +374,7 @@ async def like_comment(
     existing_like = like_result.scalar_one_or_none()
     
     if existing_like:
+        await NotificationInbox.retract(db, 'video_comment_like', existing_like.id)
         await db.delete(existing_like)
         comment.like_count = max(0, comment.like_count - 1)
         message = "已取消点赞"
@@ -414,6 +382,14 @@ async def like_comment(
         like = CommentLike(comment_id=comment_id, user_id=current_user.id)
         db.add(like)
         comment.like_count += 1
+        await db.flush()
+        await NotificationInbox.push(
+            db, user_id=comment.user_id, actor_id=current_user.id,
+            category=NotificationCategory.LIKE, notification_type='like',
+            source_type='video_comment_like', source_id=like.id,
+            target_type='video_comment', target_id=comment.video_id,
+            content=comment.content
+        )
         message = "点赞成功"
     
     await db.commit()
@@ -438,12 +414,11 @@ async def delete_comment(
     
     # 软删除
     comment.is_hidden = True
+    await NotificationInbox.retract_comment(db, 'video', comment.id)
     
-    # 更新视频评论数
-    video_result = await db.execute(select(Video).where(Video.id == comment.video_id))
-    video = video_result.scalar_one_or_none()
-    if video:
-        video.comment_count = max(0, video.comment_count - 1)
+    # 重新核对视频评论数和父评论回复数
+    await db.flush()
+    await CommentThreads.recount(db, "video", [comment.video_id])
     
     await db.commit()
     return {"message": "删除成功"}
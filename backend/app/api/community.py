@@ -1,7 +1,7 @@
 """
 社区功能API - 动态、话题、关注
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, or_, desc
 from typing import Optional, List
@@ -9,10 +9,14 @@ from datetime import datetime
 from pydantic import BaseModel
 
 from app.core.database import get_db
+from app.core.query_optimizer import KeysetCursorError
 from app.api.deps import get_current_user, get_current_user_optional
 from app.models.user import User, UserVIP
 from app.models.community import Post, PostComment, PostLike, PostCommentLike, Topic, TopicFollow
 from app.models.creator import UserFollow
+from app.services.ranking_service import RankingService
+from app.services.notification_inbox import NotificationInbox, NotificationCategory
+from app.services.comment_threads import CommentThreads, NEXT_CURSOR_HEADER
 
 router = APIRouter(prefix="/community", tags=["社区"])
 
@@ -110,6 +114,7 @@ class CommentResponse(BaseModel):
     created_at: datetime
     is_liked: bool = False
     is_god: bool = False
+    replies: List["CommentResponse"] = []  # 前几条回复（仅顶级评论）
 
 class TopicResponse(BaseModel):
     id: int
@@ -436,6 +441,7 @@ async def get_post_detail(
     # 增加浏览量
     post.view_count += 1
     await db.commit()
+    await RankingService.record("posts", post.id, post.created_at, views=1)
     
     user_result = await db.execute(select(User).where(User.id == post.user_id))
     post_user = user_result.scalar_one()
@@ -545,16 +551,27 @@ async def like_post(
     
     if existing_like:
         # 取消点赞
+        await NotificationInbox.retract(db, 'post_like', existing_like.id)
         await db.delete(existing_like)
         post.like_count = max(0, post.like_count - 1)
         await db.commit()
+        await RankingService.record("posts", post.id, post.created_at, likes=-1)
         return {"liked": False, "like_count": post.like_count}
     else:
         # 点赞
         like = PostLike(post_id=post_id, user_id=current_user.id)
         db.add(like)
         post.like_count += 1
+        await db.flush()
+        await NotificationInbox.push(
+            db, user_id=post.user_id, actor_id=current_user.id,
+            category=NotificationCategory.LIKE, notification_type='like',
+            source_type='post_like', source_id=like.id,
+            target_type='post', target_id=post.id,
+            target_title=post.content[:20] if post.content else '帖子'
+        )
         await db.commit()
+        await RankingService.record("posts", post.id, post.created_at, likes=1)
         return {"liked": True, "like_count": post.like_count}
 
 
@@ -797,6 +814,7 @@ async def create_comment(
     post.comment_count += 1
     
     # 如果是回复，更新父评论的回复数
+    parent = None
     if comment_in.parent_id:
         parent_result = await db.execute(
             select(PostComment).where(PostComment.id == comment_in.parent_id)
@@ -804,6 +822,25 @@ async def create_comment(
         parent = parent_result.scalar_one_or_none()
         if parent:
             parent.reply_count += 1
+    await db.flush()
+    
+    # 通知：被回复的评论作者、动态作者（同一人只通知一次）
+    post_title = post.content[:20] if post.content else '帖子'
+    if parent:
+        await NotificationInbox.push(
+            db, user_id=parent.user_id, actor_id=current_user.id,
+            category=NotificationCategory.COMMENT, notification_type='reply',
+            source_type='post_comment', source_id=comment.id,
+            target_type='post', target_id=post.id, target_title=post_title,
+            content=comment.content
+        )
+    await NotificationInbox.push(
+        db, user_id=post.user_id, actor_id=current_user.id,
+        category=NotificationCategory.COMMENT, notification_type='comment',
+        source_type='post_comment', source_id=comment.id,
+        target_type='post', target_id=post.id, target_title=post_title,
+        content=comment.content
+    )
     
     await db.commit()
     await db.refresh(comment)
@@ -836,35 +873,37 @@ async def create_comment(
 @router.get("/posts/{post_id}/comments", response_model=List[CommentResponse])
 async def get_comments(
     post_id: int,
+    response: Response,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=50),
     parent_id: Optional[int] = None,
+    sort_by: str = Query("newest", description="排序方式: newest(最新), hottest(最热)"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页响应头 X-Next-Cursor），传入时忽略 page"),
     current_user: Optional[User] = Depends(get_current_user_optional),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取评论列表 - 优化版本，批量查询减少N+1问题"""
-    query = select(PostComment).where(
-        PostComment.post_id == post_id,
-        PostComment.status == "visible"
-    )
-    
-    if parent_id:
-        query = query.where(PostComment.parent_id == parent_id)
-    else:
-        query = query.where(PostComment.parent_id == None)
-    
-    query = query.order_by(desc(PostComment.is_top), desc(PostComment.created_at))
-    query = query.offset((page - 1) * page_size).limit(page_size)
-    
-    result = await db.execute(query)
-    comments = result.scalars().all()
+    """获取评论列表（游标分页，顶级评论附带前几条回复；传 parent_id 时为该评论的回复列表）"""
+    try:
+        if parent_id:
+            thread = await CommentThreads.load_replies(
+                db, "post", parent_id, cursor=cursor, page=page, page_size=page_size
+            )
+        else:
+            thread = await CommentThreads.load(
+                db, "post", post_id, sort=sort_by, cursor=cursor, page=page, page_size=page_size
+            )
+    except KeysetCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if thread.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = thread.next_cursor
     
+    comments = thread.all_comments()
     if not comments:
         return []
     
     # ========== 批量查询优化 ==========
-    comment_ids = [c.id for c in comments]
-    user_ids = list(set(c.user_id for c in comments))
+    comment_ids = thread.comment_ids
+    user_ids = thread.user_ids
     reply_user_ids = list(set(c.reply_to_user_id for c in comments if c.reply_to_user_id))
     all_user_ids = list(set(user_ids + reply_user_ids))
     
@@ -907,17 +946,17 @@ async def get_comments(
         }
     
     # ========== 构建响应 ==========
-    response = []
-    for comment in comments:
+    def build(comment: PostComment) -> Optional[CommentResponse]:
         user_brief = build_user_brief(comment.user_id)
         if not user_brief:
-            continue
+            return None
         
         reply_to_user = None
         if comment.reply_to_user_id:
             reply_to_user = build_user_brief(comment.reply_to_user_id)
         
-        response.append(CommentResponse(
+        replies = [build(reply) for reply in thread.replies.get(comment.id, [])]
+        return CommentResponse(
             id=comment.id,
             user=user_brief,
             content=comment.content,
@@ -928,10 +967,12 @@ async def get_comments(
             reply_count=comment.reply_count,
             created_at=comment.created_at,
             is_liked=comment.id in liked_comment_ids,
-            is_god=getattr(comment, 'is_god', False) or False
-        ))
+            is_god=getattr(comment, 'is_god', False) or False,
+            replies=[reply for reply in replies if reply]
+        )
     
-    return response
+    items = [build(comment) for comment in thread.comments]
+    return [item for item in items if item]
 
 
 @router.post("/comments/{comment_id}/like")
@@ -956,6 +997,7 @@ async def like_comment(
     existing_like = like_result.scalar_one_or_none()
     
     if existing_like:
+        await NotificationInbox.retract(db, 'post_comment_like', existing_like.id)
         await db.delete(existing_like)
         comment.like_count = max(0, comment.like_count - 1)
         await db.commit()
@@ -964,6 +1006,14 @@ async def like_comment(
         like = PostCommentLike(comment_id=comment_id, user_id=current_user.id)
         db.add(like)
         comment.like_count += 1
+        await db.flush()
+        await NotificationInbox.push(
+            db, user_id=comment.user_id, actor_id=current_user.id,
+            category=NotificationCategory.LIKE, notification_type='like',
+            source_type='post_comment_like', source_id=like.id,
+            target_type='post_comment', target_id=comment.post_id,
+            content=comment.content
+        )
         await db.commit()
         return {"liked": True, "like_count": comment.like_count}
 
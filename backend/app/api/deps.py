@@ -1,29 +1,27 @@
 """
 API依赖项
 """
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from typing import Optional
 
 from app.core.database import get_db
-from app.core.security import decode_token
-from app.core.token_blacklist import TokenBlacklist
+from app.core.security import decode_request_token
 from app.models.user import User, UserRole
+from app.services.principal_cache import Principal, PrincipalCache
 
 security = HTTPBearer()
 
 
-async def get_current_user(
+async def get_current_principal(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
-) -> User:
-    """获取当前用户（优化版：并行检查黑名单）"""
-    import asyncio
-    
+) -> Principal:
+    """获取当前认证主体（黑名单 + 用户快照一次 MGET，快照命中时不查数据库）"""
     token = credentials.credentials
-    payload = decode_token(token)
+    payload = decode_request_token(request, token)
     
     if payload is None:
         raise HTTPException(
@@ -44,22 +42,7 @@ async def get_current_user(
             detail="无效的令牌内容"
         )
     
-    # 并行检查：令牌黑名单 + 用户黑名单 + 查询用户
-    async def check_token_blacklist():
-        return await TokenBlacklist.is_blacklisted(token)
-    
-    async def check_user_blacklist():
-        return await TokenBlacklist.is_user_blacklisted(int(user_id))
-    
-    async def get_user():
-        result = await db.execute(select(User).where(User.id == int(user_id)))
-        return result.scalar_one_or_none()
-    
-    token_blacklisted, user_blacklisted, user = await asyncio.gather(
-        check_token_blacklist(),
-        check_user_blacklist(),
-        get_user()
-    )
+    token_blacklisted, user_blacklisted, principal = await PrincipalCache.resolve(db, token, int(user_id))
     
     if token_blacklisted:
         raise HTTPException(
@@ -73,22 +56,30 @@ async def get_current_user(
             detail="账号已在其他地方登出，请重新登录"
         )
     
-    if user is None:
+    if principal is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="用户不存在"
         )
     
-    if not user.is_active:
+    if not principal.user.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="用户已被禁用"
         )
     
-    return user
+    return principal
+
+
+async def get_current_user(
+    principal: Principal = Depends(get_current_principal)
+) -> User:
+    """获取当前用户"""
+    return principal.user
 
 
 async def get_current_user_optional(
+    request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
     db: AsyncSession = Depends(get_db)
 ) -> Optional[User]:
@@ -98,7 +89,7 @@ async def get_current_user_optional(
     
     try:
         token = credentials.credentials
-        payload = decode_token(token)
+        payload = decode_request_token(request, token)
         
         if payload is None or payload.get("type") != "access":
             return None
@@ -107,11 +98,10 @@ async def get_current_user_optional(
         if user_id is None:
             return None
         
-        result = await db.execute(select(User).where(User.id == int(user_id)))
-        user = result.scalar_one_or_none()
+        token_blacklisted, user_blacklisted, principal = await PrincipalCache.resolve(db, token, int(user_id))
         
-        if user and user.is_active:
-            return user
+        if principal and principal.user.is_active:
+            return principal.user
     except:
         pass
     
@@ -119,23 +109,11 @@ async def get_current_user_optional(
 
 
 async def get_current_vip_user(
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    principal: Principal = Depends(get_current_principal)
 ) -> User:
-    """获取当前VIP用户"""
-    from datetime import datetime
-    from app.models.user import UserVIP
-    
-    result = await db.execute(
-        select(UserVIP).where(
-            UserVIP.user_id == current_user.id,
-            UserVIP.is_active == True,
-            UserVIP.expire_date > datetime.utcnow()
-        )
-    )
-    vip = result.scalar_one_or_none()
-    
-    if vip is None and current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
+    """获取当前VIP用户（VIP 状态来自认证主体快照）"""
+    current_user = principal.user
+    if not principal.is_vip and current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="需要VIP权限"
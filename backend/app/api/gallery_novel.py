@@ -2,7 +2,7 @@
 图集和小说API
 """
 import asyncio
-from fastapi import APIRouter, Depends, HTTPException, Query, Form, File, UploadFile, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Form, File, UploadFile, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, desc
 from typing import Optional, List
@@ -10,12 +10,17 @@ from datetime import datetime
 from pydantic import BaseModel
 
 from app.core.database import get_db
+from app.core.query_optimizer import KeysetCursorError
 from app.api.deps import get_current_user_optional
 from app.models.user import User
 from app.models.community import (
     GalleryCategory, Gallery, 
     NovelCategory, Novel, NovelChapter
 )
+from app.services.ranking_service import RankingService
+from app.services.search_index import SearchIndex
+from app.services.comment_threads import CommentThreads, NEXT_CURSOR_HEADER
+from app.services.notification_inbox import NotificationInbox, NotificationCategory
 
 router = APIRouter(prefix="/gallery-novel", tags=["图集小说"])
 
@@ -51,7 +56,7 @@ async def get_gallery_list(
     
     # 搜索
     if search:
-        query = query.where(Gallery.title.ilike(f"%{search}%"))
+        query = query.where(await SearchIndex.filter(db, "gallery", Gallery.id, Gallery.title, search))
     
     if sort == "new":
         query = query.order_by(desc(Gallery.created_at))
@@ -94,6 +99,7 @@ async def get_gallery_detail(
     # 增加浏览量
     gallery.view_count += 1
     await db.commit()
+    await RankingService.record("galleries", gallery.id, gallery.created_at, views=1)
     
     # 检查用户是否是VIP
     is_vip = False
@@ -187,7 +193,7 @@ async def get_novel_list(
     
     # 如果有搜索词，不限制类型
     if search:
-        query = query.where(Novel.title.ilike(f"%{search}%"))
+        query = query.where(await SearchIndex.filter(db, "novel", Novel.id, Novel.title, search))
     elif novel_type != "all":
         query = query.where(Novel.novel_type == novel_type)
     
@@ -258,6 +264,7 @@ async def get_novel_detail(
     
     # 增加浏览量（异步更新，不阻塞响应）
     novel.view_count += 1
+    await RankingService.record("novels", novel.id, novel.created_at, views=1)
     
     # 并行查询用户相关数据
     is_vip = False
@@ -528,54 +535,54 @@ async def get_read_progress(
 class CommentCreate(BaseModel):
     content: str
 
-@router.get("/gallery/{gallery_id}/comments")
-async def get_gallery_comments(
-    gallery_id: int,
-    page: int = Query(1, ge=1),
-    page_size: int = Query(20, ge=1, le=50),
-    current_user: User = Depends(get_current_user_optional),
-    db: AsyncSession = Depends(get_db)
-):
-    """获取图集评论（优化版 - 批量查询避免N+1）"""
-    from app.models.community import GalleryComment, GalleryCommentLike
+async def _comment_thread_items(
+    db: AsyncSession,
+    kind: str,
+    like_model,
+    target_id: int,
+    sort_by: str,
+    cursor: Optional[str],
+    page: int,
+    page_size: int,
+    current_user: Optional[User],
+    response: Response,
+) -> list:
+    """图集/小说评论列表：游标分页，顶级评论附带前几条回复（批量查询避免N+1）"""
     from sqlalchemy.orm import selectinload
     
-    result = await db.execute(
-        select(GalleryComment)
-        .where(GalleryComment.gallery_id == gallery_id)
-        .order_by(desc(GalleryComment.created_at))
-        .offset((page - 1) * page_size)
-        .limit(page_size)
-    )
-    comments = result.scalars().all()
+    try:
+        thread = await CommentThreads.load(
+            db, kind, target_id, sort=sort_by, cursor=cursor, page=page, page_size=page_size
+        )
+    except KeysetCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if thread.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = thread.next_cursor
     
-    if not comments:
+    if not thread.comments:
         return []
     
-    # 批量获取所有用户信息
-    user_ids = list(set(c.user_id for c in comments))
+    # 批量获取所有用户信息（含回复的作者）
     users_result = await db.execute(
-        select(User).options(selectinload(User.vip)).where(User.id.in_(user_ids))
+        select(User).options(selectinload(User.vip)).where(User.id.in_(thread.user_ids))
     )
     user_map = {u.id: u for u in users_result.scalars().all()}
     
     # 批量获取当前用户的点赞状态
     liked_ids = set()
     if current_user:
-        comment_ids = [c.id for c in comments]
         likes_result = await db.execute(
-            select(GalleryCommentLike.comment_id).where(
-                GalleryCommentLike.comment_id.in_(comment_ids),
-                GalleryCommentLike.user_id == current_user.id
+            select(like_model.comment_id).where(
+                like_model.comment_id.in_(thread.comment_ids),
+                like_model.user_id == current_user.id
             )
         )
         liked_ids = set(r[0] for r in likes_result.all())
     
     # 构建返回数据
-    comment_list = []
-    for c in comments:
+    def build(c) -> dict:
         user = user_map.get(c.user_id)
-        comment_list.append({
+        return {
             "id": c.id,
             "content": c.content,
             "image_url": c.image_url,
@@ -583,15 +590,36 @@ async def get_gallery_comments(
             "user_nickname": user.nickname if user else "用户",
             "user_avatar": user.avatar if user else None,
             "user_vip_level": user.vip.vip_level if user and user.vip else 0,
+            "parent_id": c.parent_id,
             "like_count": c.like_count or 0,
             "reply_count": c.reply_count or 0,
             "is_pinned": c.is_pinned or False,
             "is_official": c.is_official or False,
             "is_liked": c.id in liked_ids,
-            "created_at": c.created_at.isoformat() if c.created_at else None
-        })
+            "created_at": c.created_at.isoformat() if c.created_at else None,
+            "replies": [build(reply) for reply in thread.replies.get(c.id, [])]
+        }
+    
+    return [build(c) for c in thread.comments]
+
+
+@router.get("/gallery/{gallery_id}/comments")
+async def get_gallery_comments(
+    gallery_id: int,
+    response: Response,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=50),
+    sort_by: str = Query("newest", description="排序方式: newest(最新), hottest(最热)"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页响应头 X-Next-Cursor），传入时忽略 page"),
+    current_user: User = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取图集评论（游标分页，附带前几条回复）"""
+    from app.models.community import GalleryCommentLike
     
-    return comment_list
+    return await _comment_thread_items(
+        db, "gallery", GalleryCommentLike, gallery_id, sort_by, cursor, page, page_size, current_user, response
+    )
 
 @router.post("/gallery/{gallery_id}/comment")
 async def create_gallery_comment(
@@ -787,6 +815,7 @@ async def toggle_comment_like(
     
     if existing_like:
         # 取消点赞
+        await NotificationInbox.retract(db, 'gallery_comment_like', existing_like.id)
         await db.delete(existing_like)
         comment.like_count = max(0, (comment.like_count or 0) - 1)
         liked = False
@@ -795,6 +824,14 @@ async def toggle_comment_like(
         new_like = GalleryCommentLike(comment_id=comment_id, user_id=current_user.id)
         db.add(new_like)
         comment.like_count = (comment.like_count or 0) + 1
+        await db.flush()
+        await NotificationInbox.push(
+            db, user_id=comment.user_id, actor_id=current_user.id,
+            category=NotificationCategory.LIKE, notification_type='like',
+            source_type='gallery_comment_like', source_id=new_like.id,
+            target_type='gallery_comment', target_id=comment.gallery_id,
+            content=comment.content
+        )
         liked = True
     
     await db.commit()
@@ -1111,67 +1148,20 @@ async def toggle_novel_collect(
 @router.get("/novel/{novel_id}/comments")
 async def get_novel_comments(
     novel_id: int,
+    response: Response,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=50),
+    sort_by: str = Query("newest", description="排序方式: newest(最新), hottest(最热)"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页响应头 X-Next-Cursor），传入时忽略 page"),
     current_user: User = Depends(get_current_user_optional),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取小说评论（优化版 - 批量查询避免N+1）"""
-    from app.models.community import NovelComment, NovelCommentLike
-    from sqlalchemy.orm import selectinload
+    """获取小说评论（游标分页，附带前几条回复）"""
+    from app.models.community import NovelCommentLike
     
-    result = await db.execute(
-        select(NovelComment)
-        .where(NovelComment.novel_id == novel_id)
-        .order_by(desc(NovelComment.created_at))
-        .offset((page - 1) * page_size)
-        .limit(page_size)
+    return await _comment_thread_items(
+        db, "novel", NovelCommentLike, novel_id, sort_by, cursor, page, page_size, current_user, response
     )
-    comments = result.scalars().all()
-    
-    if not comments:
-        return []
-    
-    # 批量获取所有用户信息
-    user_ids = list(set(c.user_id for c in comments))
-    users_result = await db.execute(
-        select(User).options(selectinload(User.vip)).where(User.id.in_(user_ids))
-    )
-    user_map = {u.id: u for u in users_result.scalars().all()}
-    
-    # 批量获取当前用户的点赞状态
-    liked_ids = set()
-    if current_user:
-        comment_ids = [c.id for c in comments]
-        likes_result = await db.execute(
-            select(NovelCommentLike.comment_id).where(
-                NovelCommentLike.comment_id.in_(comment_ids),
-                NovelCommentLike.user_id == current_user.id
-            )
-        )
-        liked_ids = set(r[0] for r in likes_result.all())
-    
-    # 构建返回数据
-    comment_list = []
-    for c in comments:
-        user = user_map.get(c.user_id)
-        comment_list.append({
-            "id": c.id,
-            "content": c.content,
-            "image_url": c.image_url,
-            "user_id": c.user_id,
-            "user_nickname": user.nickname if user else "用户",
-            "user_avatar": user.avatar if user else None,
-            "user_vip_level": user.vip.vip_level if user and user.vip else 0,
-            "like_count": c.like_count or 0,
-            "reply_count": c.reply_count or 0,
-            "is_pinned": c.is_pinned or False,
-            "is_official": c.is_official or False,
-            "is_liked": c.id in liked_ids,
-            "created_at": c.created_at.isoformat() if c.created_at else None
-        })
-    
-    return comment_list
 
 
 @router.post("/novel/{novel_id}/comment")
@@ -13,7 +13,7 @@ from collections import defaultdict
 import json
 import logging
 
-from app.core.database import get_db
+from app.core.database import get_db, AsyncSessionLocal
 from app.core.redis import RedisCache
 from app.api.deps import get_current_user_optional
 from app.models.user import User, UserVIP
@@ -123,18 +123,19 @@ CACHE_TTL = 300  # 5分钟
 
 
 # ========== 缓存辅助函数 ==========
+# 加载函数自己打开数据库会话：缓存过期后会在后台刷新，不能依赖请求内的会话
 
-async def get_cached_categories(db: AsyncSession) -> List[dict]:
-    """获取分类数据（带缓存）- 优化：单次查询 + 内存分组"""
-    cached = await CacheService.get(CACHE_KEY_CATEGORIES)
-    if cached:
-        return cached
-    
-    # 单次查询所有分类
-    result = await db.execute(
-        select(VideoCategory).order_by(VideoCategory.sort_order)
-    )
-    all_categories = result.scalars().all()
+# 缓存过期后继续返回旧值、后台刷新的时间窗口
+STALE_TTL = 600
+
+
+async def _load_categories() -> List[dict]:
+    """单次查询 + 内存分组"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(VideoCategory).order_by(VideoCategory.sort_order)
+        )
+        all_categories = result.scalars().all()
     
     # 内存中分组
     parents = []
@@ -161,113 +162,74 @@ async def get_cached_categories(db: AsyncSession) -> List[dict]:
         for child in parent["children"]:
             del child["parent_id"]
         categories.append(parent)
-    
-    await CacheService.set(CACHE_KEY_CATEGORIES, categories, CacheTTL.LONG)
     return categories
 
 
-async def get_cached_func_entries(db: AsyncSession) -> List[dict]:
-    """获取功能入口（带缓存）"""
-    cached = await CacheService.get(CACHE_KEY_FUNC_ENTRIES)
-    if cached:
-        return cached
-    
-    result = await db.execute(
-        select(FuncEntry)
-        .where(FuncEntry.is_active == True)
-        .order_by(FuncEntry.sort_order)
-    )
-    entries_db = result.scalars().all()
+async def _load_func_entries() -> List[dict]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(FuncEntry)
+            .where(FuncEntry.is_active == True)
+            .order_by(FuncEntry.sort_order)
+        )
+        entries_db = result.scalars().all()
     
     if entries_db:
-        entries = [
+        return [
             {"id": e.id, "name": e.name, "image": e.image, "link": e.link}
             for e in entries_db
         ]
-    else:
-        entries = [
-            {"id": i+1, "name": e["name"], "image": e.get("image"), "link": e["link"]}
-            for i, e in enumerate(DEFAULT_FUNC_ENTRIES)
-        ]
-    
-    await CacheService.set(CACHE_KEY_FUNC_ENTRIES, entries, CacheTTL.LONG)
-    return entries
+    return [
+        {"id": i+1, "name": e["name"], "image": e.get("image"), "link": e["link"]}
+        for i, e in enumerate(DEFAULT_FUNC_ENTRIES)
+    ]
 
 
-async def get_cached_icon_ads(db: AsyncSession) -> List[dict]:
-    """获取图标广告（带缓存）"""
-    cached = await CacheService.get(CACHE_KEY_ICON_ADS)
-    if cached:
-        return cached
-    
-    result = await db.execute(
-        select(IconAd)
-        .where(IconAd.is_active == True)
-        .order_by(IconAd.sort_order, IconAd.id)
-    )
-    ads_db = result.scalars().all()
+async def _load_icon_ads() -> List[dict]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(IconAd)
+            .where(IconAd.is_active == True)
+            .order_by(IconAd.sort_order, IconAd.id)
+        )
+        ads_db = result.scalars().all()
     
     if ads_db:
-        ads = [
+        return [
             {"id": a.id, "name": a.name, "icon": a.icon, "image": a.image, "link": a.link}
             for a in ads_db
         ]
-    else:
-        ads = [
-            {"id": i+1, "name": a["name"], "icon": a["icon"], "image": a.get("image"), "link": a["link"]}
-            for i, a in enumerate(DEFAULT_ICON_ADS)
-        ]
-    
-    await CacheService.set(CACHE_KEY_ICON_ADS, ads, CacheTTL.MEDIUM)
-    return ads
+    return [
+        {"id": i+1, "name": a["name"], "icon": a["icon"], "image": a.get("image"), "link": a["link"]}
+        for i, a in enumerate(DEFAULT_ICON_ADS)
+    ]
 
 
-async def get_cached_announcements(db: AsyncSession) -> List[dict]:
-    """获取公告（带缓存）"""
-    cached = await CacheService.get(CACHE_KEY_ANNOUNCEMENTS)
-    if cached:
-        return cached
-    
-    result = await db.execute(
-        select(Announcement)
-        .where(Announcement.is_active == True)
-        .order_by(Announcement.sort_order.desc())
-        .limit(5)
-    )
-    announcements_db = result.scalars().all()
+async def _load_announcements() -> List[dict]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Announcement)
+            .where(Announcement.is_active == True)
+            .order_by(Announcement.sort_order.desc())
+            .limit(5)
+        )
+        announcements_db = result.scalars().all()
     
-    announcements = [
+    return [
         {"id": a.id, "content": a.content, "link": a.link}
         for a in announcements_db
     ]
-    
-    await CacheService.set(CACHE_KEY_ANNOUNCEMENTS, announcements, CacheTTL.MEDIUM)
-    return announcements
 
 
-async def get_cached_site_settings() -> dict:
-    """获取网站设置（带缓存）"""
-    cached = await CacheService.get(CACHE_KEY_SITE_SETTINGS)
-    if cached:
-        return cached
-    
+async def _load_site_settings() -> dict:
     settings_data = load_settings()
-    site_settings = {
+    return {
         "site_name": settings_data.get("site_name", "Soul"),
         "logo": settings_data.get("logo")
     }
-    
-    await CacheService.set(CACHE_KEY_SITE_SETTINGS, site_settings, CacheTTL.LONG)
-    return site_settings
 
 
-async def get_cached_banners(db: AsyncSession, position: str = "home") -> List[dict]:
-    """获取轮播图（带缓存）"""
-    cache_key = f"banners:{position}"
-    cached = await CacheService.get(cache_key)
-    if cached:
-        return cached
-    
+async def _load_banners(position: str) -> List[dict]:
     now = datetime.utcnow()
     query = select(Banner).where(
         Banner.is_active == True,
@@ -281,10 +243,11 @@ async def get_cached_banners(db: AsyncSession, position: str = "home") -> List[d
     )
     query = query.order_by(Banner.sort_order.asc())
     
-    result = await db.execute(query)
-    banners_db = result.scalars().all()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(query)
+        banners_db = result.scalars().all()
     
-    banners = [
+    return [
         {
             "id": b.id,
             "title": b.title,
@@ -295,9 +258,102 @@ async def get_cached_banners(db: AsyncSession, position: str = "home") -> List[d
         }
         for b in banners_db
     ]
+
+
+async def _load_home_videos(category_id: Optional[int], sort_by: str, limit: int) -> List[dict]:
+    query = select(Video).where(
+        Video.status == VideoStatus.PUBLISHED,
+        Video.is_short != True
+    )
+    
+    if category_id and category_id > 0:
+        # 指定分类
+        query = query.where(Video.category_id == category_id)
+    elif sort_by == "hot":
+        # "推荐"分类 + "热门推荐"筛选：只显示 is_featured=true 的视频
+        query = query.where(Video.is_featured == True)
+    # 其他筛选（最新上架、最多观看）显示所有视频
+    
+    if sort_by == "created_at":
+        query = query.order_by(Video.created_at.desc())
+    elif sort_by == "view_count":
+        query = query.order_by(Video.view_count.desc())
+    else:
+        query = query.order_by(Video.view_count.desc(), Video.created_at.desc())
+    
+    query = query.options(selectinload(Video.category)).limit(limit)
     
-    await CacheService.set(cache_key, banners, CacheTTL.MEDIUM)
-    return banners
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(query)
+        videos_db = result.scalars().all()
+    
+    return [
+        {
+            "id": v.id,
+            "title": v.title,
+            "cover_url": v.cover_url,
+            "preview_url": v.preview_url,
+            "duration": v.duration or 0,
+            "view_count": v.view_count or 0,
+            "comment_count": v.comment_count or 0,
+            "is_vip_only": v.is_vip_only if hasattr(v, 'is_vip_only') else False,
+            "category_name": v.category.name if v.category else None,
+            "tags": []
+        }
+        for v in videos_db
+    ]
+
+
+async def get_cached_categories() -> List[dict]:
+    """获取分类数据（带缓存）"""
+    return await CacheService.get_or_load(
+        CACHE_KEY_CATEGORIES, _load_categories, CacheTTL.LONG, stale_ttl=STALE_TTL
+    )
+
+
+async def get_cached_func_entries() -> List[dict]:
+    """获取功能入口（带缓存）"""
+    return await CacheService.get_or_load(
+        CACHE_KEY_FUNC_ENTRIES, _load_func_entries, CacheTTL.LONG, stale_ttl=STALE_TTL
+    )
+
+
+async def get_cached_icon_ads() -> List[dict]:
+    """获取图标广告（带缓存）"""
+    return await CacheService.get_or_load(
+        CACHE_KEY_ICON_ADS, _load_icon_ads, CacheTTL.MEDIUM, stale_ttl=STALE_TTL
+    )
+
+
+async def get_cached_announcements() -> List[dict]:
+    """获取公告（带缓存）"""
+    return await CacheService.get_or_load(
+        CACHE_KEY_ANNOUNCEMENTS, _load_announcements, CacheTTL.MEDIUM, stale_ttl=STALE_TTL
+    )
+
+
+async def get_cached_site_settings() -> dict:
+    """获取网站设置（带缓存）"""
+    return await CacheService.get_or_load(
+        CACHE_KEY_SITE_SETTINGS, _load_site_settings, CacheTTL.LONG, stale_ttl=STALE_TTL
+    )
+
+
+async def get_cached_banners(position: str = "home") -> List[dict]:
+    """获取轮播图（带缓存）"""
+    return await CacheService.get_or_load(
+        f"banners:{position}", lambda: _load_banners(position), CacheTTL.MEDIUM, stale_ttl=STALE_TTL
+    )
+
+
+async def get_cached_home_videos(category_id: Optional[int], sort_by: str, limit: int) -> List[dict]:
+    """获取首页视频列表（带缓存）"""
+    return await CacheService.get_or_load(
+        f"home:videos:{category_id or 'all'}:{sort_by}:{limit}",
+        lambda: _load_home_videos(category_id, sort_by, limit),
+        CacheTTL.SHORT,
+        stale_ttl=CacheTTL.SHORT
+    )
 
 
 # ========== API 路由 ==========
@@ -311,60 +367,17 @@ async def get_public_banners(
     获取公开轮播图（用户端）- 带缓存
     只返回当前时间内有效的、已启用的轮播图
     """
-    # 尝试从缓存获取
-    cache_key = f"banners:{position}"
-    cached = await CacheService.get(cache_key)
-    if cached:
-        # 异步更新展示次数（不阻塞响应）
-        banner_ids = [b["id"] for b in cached]
-        if banner_ids:
-            await db.execute(
-                Banner.__table__.update()
-                .where(Banner.id.in_(banner_ids))
-                .values(impression_count=Banner.impression_count + 1)
-            )
-            await db.commit()
-        return cached
-    
-    now = datetime.utcnow()
-    
-    query = select(Banner).where(
-        Banner.is_active == True,
-        Banner.position == position
-    )
-    
-    # 过滤时间范围
-    query = query.where(
-        (Banner.start_time == None) | (Banner.start_time <= now)
-    )
-    query = query.where(
-        (Banner.end_time == None) | (Banner.end_time >= now)
-    )
-    
-    query = query.order_by(Banner.sort_order.asc())
-    
-    result = await db.execute(query)
-    banners = result.scalars().all()
+    data = await get_cached_banners(position)
     
     # 更新展示次数
-    for b in banners:
-        b.impression_count = (b.impression_count or 0) + 1
-    await db.commit()
-    
-    data = [
-        {
-            "id": b.id,
-            "title": b.title,
-            "image_url": b.image_url,
-            "link_url": b.link_url,
-            "link_type": b.link_type or "none",
-            "position": b.position
-        }
-        for b in banners
-    ]
-    
-    # 缓存5分钟
-    await CacheService.set(cache_key, data, CacheTTL.MEDIUM)
+    banner_ids = [b["id"] for b in data]
+    if banner_ids:
+        await db.execute(
+            Banner.__table__.update()
+            .where(Banner.id.in_(banner_ids))
+            .values(impression_count=Banner.impression_count + 1)
+        )
+        await db.commit()
     
     return data
 
@@ -378,43 +391,34 @@ async def get_home_init(
     db: AsyncSession = Depends(get_db)
 ):
     """
-    首页初始化聚合接口（优化版：缓存优先 + 安全并行）
+    首页初始化聚合接口（优化版：两级缓存 + 并行加载）
     
     策略：
-    1. 先并行获取所有缓存数据（不需要db）
-    2. 缓存未命中的数据顺序查询（避免session并发问题）
+    1. 并行读取各项缓存，未命中的由缓存层单飞加载（各自使用独立会话）
+    2. 请求会话只用于查询当前用户的VIP状态
     """
     import asyncio
-    from app.core.database import AsyncSessionLocal
     
     try:
-        # ========== 第一阶段：并行获取缓存数据（无db依赖） ==========
-        async def get_cached_only(key: str):
-            """仅从缓存获取，不查数据库"""
-            return await CacheService.get(key)
-        
-        # 并行检查所有缓存
+        # 各项数据走两级缓存，未命中时各自用独立会话加载，可以安全并行
         (
-            cached_site_settings,
-            cached_categories,
-            cached_func_entries,
-            cached_icon_ads,
-            cached_announcements,
-            cached_banners,
-            cached_videos
+            site_settings_data,
+            categories_data,
+            func_entries_data,
+            icon_ads_data,
+            announcements_data,
+            banners,
+            videos_data
         ) = await asyncio.gather(
-            get_cached_only(CACHE_KEY_SITE_SETTINGS),
-            get_cached_only(CACHE_KEY_CATEGORIES),
-            get_cached_only(CACHE_KEY_FUNC_ENTRIES),
-            get_cached_only(CACHE_KEY_ICON_ADS),
-            get_cached_only(CACHE_KEY_ANNOUNCEMENTS),
-            get_cached_only("banners:home"),
-            get_cached_only(f"home:videos:{category_id or 'all'}:{sort_by}:{limit}")
+            get_cached_site_settings(),
+            get_cached_categories(),
+            get_cached_func_entries(),
+            get_cached_icon_ads(),
+            get_cached_announcements(),
+            get_cached_banners("home"),
+            get_cached_home_videos(category_id, sort_by, limit)
         )
         
-        # ========== 第二阶段：顺序获取缓存未命中的数据 ==========
-        # 使用传入的db session顺序执行，避免并发问题
-        
         # VIP状态
         is_vip = False
         if current_user:
@@ -427,91 +431,6 @@ async def get_home_init(
             )
             is_vip = result.scalar_one_or_none() is not None
         
-        # 网站设置
-        if cached_site_settings:
-            site_settings_data = cached_site_settings
-        else:
-            site_settings_data = await get_cached_site_settings()
-        
-        # 分类
-        if cached_categories:
-            categories_data = cached_categories
-        else:
-            categories_data = await get_cached_categories(db)
-        
-        # 功能入口
-        if cached_func_entries:
-            func_entries_data = cached_func_entries
-        else:
-            func_entries_data = await get_cached_func_entries(db)
-        
-        # 图标广告
-        if cached_icon_ads:
-            icon_ads_data = cached_icon_ads
-        else:
-            icon_ads_data = await get_cached_icon_ads(db)
-        
-        # 公告
-        if cached_announcements:
-            announcements_data = cached_announcements
-        else:
-            announcements_data = await get_cached_announcements(db)
-        
-        # 轮播图
-        if cached_banners:
-            banners = cached_banners
-        else:
-            banners = await get_cached_banners(db, "home")
-        
-        # 视频列表
-        if cached_videos:
-            videos_data = cached_videos
-        else:
-            video_cache_key = f"home:videos:{category_id or 'all'}:{sort_by}:{limit}"
-            
-            query = select(Video).where(
-                Video.status == VideoStatus.PUBLISHED,
-                Video.is_short != True
-            )
-            
-            if category_id and category_id > 0:
-                # 指定分类
-                query = query.where(Video.category_id == category_id)
-            elif sort_by == "hot":
-                # "推荐"分类 + "热门推荐"筛选：只显示 is_featured=true 的视频
-                query = query.where(Video.is_featured == True)
-            # 其他筛选（最新上架、最多观看）显示所有视频
-            
-            if sort_by == "created_at":
-                query = query.order_by(Video.created_at.desc())
-            elif sort_by == "view_count":
-                query = query.order_by(Video.view_count.desc())
-            else:
-                query = query.order_by(Video.view_count.desc(), Video.created_at.desc())
-            
-            query = query.options(selectinload(Video.category)).limit(limit)
-            
-            result = await db.execute(query)
-            videos_db = result.scalars().all()
-            
-            videos_data = [
-                {
-                    "id": v.id,
-                    "title": v.title,
-                    "cover_url": v.cover_url,
-                    "preview_url": v.preview_url,
-                    "duration": v.duration or 0,
-                    "view_count": v.view_count or 0,
-                    "comment_count": v.comment_count or 0,
-                    "is_vip_only": v.is_vip_only if hasattr(v, 'is_vip_only') else False,
-                    "category_name": v.category.name if v.category else None,
-                    "tags": []
-                }
-                for v in videos_db
-            ]
-            
-            await CacheService.set(video_cache_key, videos_data, CacheTTL.SHORT)
-        
         # 构建响应
         site_settings = SiteSettingsItem(**site_settings_data)
         
@@ -2,9 +2,13 @@
 监控API端点
 提供系统和应用性能指标
 """
-from fastapi import APIRouter, Depends, HTTPException
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.api.admin import get_admin_user
 from app.models.user import User
@@ -34,6 +38,54 @@ async def get_metrics(
     return monitor.get_full_report()
 
 
+@router.get("/prometheus")
+async def get_prometheus_metrics(
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Prometheus 抓取接口（合并所有 worker 的指标）
+    
+    使用 Authorization: Bearer <METRICS_TOKEN> 鉴权，未配置 METRICS_TOKEN 时不开放
+    """
+    from prometheus_client import CONTENT_TYPE_LATEST
+    
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="未开放指标导出")
+    if not hmac.compare_digest(authorization or "", f"Bearer {settings.METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="无效的指标导出令牌")
+    return Response(content=monitor.render_prometheus(), media_type=CONTENT_TYPE_LATEST)
+
+
+@router.get("/sql")
+async def get_sql_profile(
+    top_n: int = 20,
+    statements: int = 5,
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    SQL 分析：各端点的平均/最多 SQL 条数和疑似 N+1 的语句（当前 worker）
+    
+    需开启 SQL_PROFILING（开发/预发环境）
+    """
+    from app.core.database import sql_profiler
+    
+    return {
+        "enabled": sql_profiler.enabled,
+        "n_plus_one_threshold": settings.SQL_N_PLUS_ONE_THRESHOLD,
+        "endpoints": sql_profiler.top_offenders(top_n, statements)
+    }
+
+
+@router.get("/cache")
+async def get_cache_metrics(
+    current_user: User = Depends(get_admin_user)
+):
+    """获取缓存命中率与加载耗时"""
+    from app.services.cache_service import CacheService
+    
+    return CacheService.get_stats()
+
+
 @router.get("/system")
 async def get_system_metrics(
     current_user: User = Depends(get_admin_user)
@@ -64,7 +116,7 @@ async def get_slow_requests(
     limit: int = 50,
     current_user: User = Depends(get_admin_user)
 ):
-    """获取慢请求列表"""
+    """获取慢请求列表（当前 worker）"""
     return monitor.get_slow_requests(limit)
 
 
@@ -79,6 +131,10 @@ async def reset_metrics(
         raise HTTPException(status_code=403, detail="仅超级管理员可以重置指标")
     
     monitor.reset_metrics()
+    from app.core.database import sql_profiler
+    sql_profiler.reset()
+    from app.services.cache_service import CacheService
+    CacheService.reset_stats()
     return {"message": "监控指标已重置"}
 
 
@@ -1,25 +1,19 @@
 """
-通知相关 API - 优化版（解决N+1查询问题）
-支持所有栏目的评论和点赞通知
+通知相关 API - 收件箱版
+评论/回复/点赞在发生时写入接收者的收件箱（见 app/services/notification_inbox.py），
+这里只做按 id 倒序的 keyset 分页读取和计数行查询
 """
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Set
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select, desc, and_, or_, func
+from datetime import datetime
+from typing import Optional, List, Dict
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select, and_, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 
 from app.core.database import get_db
 from app.api.deps import get_current_user
 from app.models.user import User, UserVIP
-from app.models.video import Video
-from app.models.comment import Comment, CommentLike
-from app.models.social import VideoLike
-from app.models.community import (
-    Post, PostComment, PostLike, PostCommentLike,
-    Gallery, GalleryComment, GalleryLike, GalleryCommentLike,
-    Novel, NovelLike
-)
+from app.services.notification_inbox import NotificationInbox, NotificationCategory
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 
@@ -47,6 +41,7 @@ class NotificationListResponse(BaseModel):
     items: List[NotificationItem]
     total: int
     unread_count: int
+    next_cursor: Optional[int] = None  # 下一页的 cursor，没有更多时为空
 
 
 # ========== 批量查询辅助函数 ==========
@@ -110,462 +105,69 @@ def build_notification_item(
     }
 
 
+async def list_inbox(
+    db: AsyncSession,
+    user: User,
+    category: str,
+    page: int,
+    page_size: int,
+    cursor: Optional[int]
+) -> NotificationListResponse:
+    """读取一页收件箱：传 cursor 时按 id keyset 分页，否则按页码（兼容旧客户端）"""
+    rows = await NotificationInbox.fetch(
+        db, user.id, category,
+        limit=page_size,
+        before_id=cursor,
+        offset=(page - 1) * page_size
+    )
+    vip_map = await batch_get_user_vip_levels(db, [actor.id for _, actor in rows])
+    
+    items = [
+        build_notification_item(
+            item_id=item.id,
+            user=actor,
+            vip_level=vip_map.get(actor.id, 0),
+            content=item.content,
+            target_id=item.target_id,
+            target_title=item.target_title,
+            target_type=item.target_type,
+            notification_type=item.notification_type,
+            created_at=item.created_at
+        )
+        for item, actor in rows
+    ]
+    
+    counter = await NotificationInbox.counts(db, user.id)
+    return NotificationListResponse(
+        items=[NotificationItem(**item) for item in items],
+        total=getattr(counter, f"{category}_total", 0) if counter else 0,
+        unread_count=getattr(counter, f"{category}_unread", 0) if counter else 0,
+        next_cursor=items[-1]['id'] if len(items) == page_size else None
+    )
+
+
 @router.get("/comments", response_model=NotificationListResponse)
 async def get_comment_notifications(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=50),
+    cursor: Optional[int] = Query(None, description="上一页返回的 next_cursor"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取评论通知 - 所有栏目的评论和回复（优化版）"""
-    try:
-        # 收集所有原始数据和用户ID
-        raw_items = []
-        user_ids = set()
-        
-        # ========== 1. 视频评论通知 ==========
-        user_videos_result = await db.execute(
-            select(Video.id).where(Video.uploader_id == current_user.id)
-        )
-        user_video_ids = [row[0] for row in user_videos_result.fetchall()]
-        
-        if user_video_ids:
-            video_comments_query = (
-                select(Comment, User, Video)
-                .join(User, Comment.user_id == User.id)
-                .join(Video, Comment.video_id == Video.id)
-                .where(
-                    and_(
-                        Comment.video_id.in_(user_video_ids),
-                        Comment.user_id != current_user.id,
-                        Comment.is_hidden == False
-                    )
-                )
-                .order_by(desc(Comment.created_at))
-                .limit(50)
-            )
-            result = await db.execute(video_comments_query)
-            for comment, user, video in result.fetchall():
-                user_ids.add(user.id)
-                raw_items.append({
-                    'type': 'video_comment',
-                    'id': comment.id,
-                    'user': user,
-                    'content': comment.content,
-                    'target_id': video.id,
-                    'target_title': video.title,
-                    'target_type': 'short' if video.is_short else 'video',
-                    'notification_type': 'comment',
-                    'created_at': comment.created_at
-                })
-        
-        # 视频评论回复
-        my_video_comments_result = await db.execute(
-            select(Comment.id).where(Comment.user_id == current_user.id)
-        )
-        my_video_comment_ids = [row[0] for row in my_video_comments_result.fetchall()]
-        
-        if my_video_comment_ids:
-            video_replies_query = (
-                select(Comment, User, Video)
-                .join(User, Comment.user_id == User.id)
-                .join(Video, Comment.video_id == Video.id)
-                .where(
-                    and_(
-                        Comment.parent_id.in_(my_video_comment_ids),
-                        Comment.user_id != current_user.id,
-                        Comment.is_hidden == False
-                    )
-                )
-                .order_by(desc(Comment.created_at))
-                .limit(50)
-            )
-            result = await db.execute(video_replies_query)
-            for reply, user, video in result.fetchall():
-                user_ids.add(user.id)
-                raw_items.append({
-                    'type': 'video_reply',
-                    'id': reply.id + 100000,
-                    'user': user,
-                    'content': reply.content,
-                    'target_id': video.id,
-                    'target_title': video.title,
-                    'target_type': 'short' if video.is_short else 'video',
-                    'notification_type': 'reply',
-                    'created_at': reply.created_at
-                })
-        
-        # ========== 2. 帖子评论通知 ==========
-        user_posts_result = await db.execute(
-            select(Post.id).where(Post.user_id == current_user.id)
-        )
-        user_post_ids = [row[0] for row in user_posts_result.fetchall()]
-        
-        if user_post_ids:
-            post_comments_query = (
-                select(PostComment, User, Post)
-                .join(User, PostComment.user_id == User.id)
-                .join(Post, PostComment.post_id == Post.id)
-                .where(
-                    and_(
-                        PostComment.post_id.in_(user_post_ids),
-                        PostComment.user_id != current_user.id,
-                        PostComment.status == 'visible'
-                    )
-                )
-                .order_by(desc(PostComment.created_at))
-                .limit(50)
-            )
-            result = await db.execute(post_comments_query)
-            for comment, user, post in result.fetchall():
-                user_ids.add(user.id)
-                post_title = (post.content[:20] if post.content else '帖子')
-                raw_items.append({
-                    'type': 'post_comment',
-                    'id': comment.id + 1000000,
-                    'user': user,
-                    'content': comment.content,
-                    'target_id': post.id,
-                    'target_title': post_title,
-                    'target_type': 'post',
-                    'notification_type': 'comment',
-                    'created_at': comment.created_at
-                })
-        
-        # 帖子评论回复
-        my_post_comments_result = await db.execute(
-            select(PostComment.id).where(PostComment.user_id == current_user.id)
-        )
-        my_post_comment_ids = [row[0] for row in my_post_comments_result.fetchall()]
-        
-        if my_post_comment_ids:
-            post_replies_query = (
-                select(PostComment, User, Post)
-                .join(User, PostComment.user_id == User.id)
-                .join(Post, PostComment.post_id == Post.id)
-                .where(
-                    and_(
-                        PostComment.parent_id.in_(my_post_comment_ids),
-                        PostComment.user_id != current_user.id,
-                        PostComment.status == 'visible'
-                    )
-                )
-                .order_by(desc(PostComment.created_at))
-                .limit(50)
-            )
-            result = await db.execute(post_replies_query)
-            for reply, user, post in result.fetchall():
-                user_ids.add(user.id)
-                post_title = (post.content[:20] if post.content else '帖子')
-                raw_items.append({
-                    'type': 'post_reply',
-                    'id': reply.id + 1100000,
-                    'user': user,
-                    'content': reply.content,
-                    'target_id': post.id,
-                    'target_title': post_title,
-                    'target_type': 'post',
-                    'notification_type': 'reply',
-                    'created_at': reply.created_at
-                })
-        
-        # ========== 3. 图集评论回复 ==========
-        my_gallery_comments_result = await db.execute(
-            select(GalleryComment.id).where(GalleryComment.user_id == current_user.id)
-        )
-        my_gallery_comment_ids = [row[0] for row in my_gallery_comments_result.fetchall()]
-        
-        if my_gallery_comment_ids:
-            gallery_replies_query = (
-                select(GalleryComment, User, Gallery)
-                .join(User, GalleryComment.user_id == User.id)
-                .join(Gallery, GalleryComment.gallery_id == Gallery.id)
-                .where(
-                    and_(
-                        GalleryComment.parent_id.in_(my_gallery_comment_ids),
-                        GalleryComment.user_id != current_user.id,
-                        GalleryComment.is_hidden == False
-                    )
-                )
-                .order_by(desc(GalleryComment.created_at))
-                .limit(50)
-            )
-            result = await db.execute(gallery_replies_query)
-            for reply, user, gallery in result.fetchall():
-                user_ids.add(user.id)
-                raw_items.append({
-                    'type': 'gallery_reply',
-                    'id': reply.id + 2000000,
-                    'user': user,
-                    'content': reply.content,
-                    'target_id': gallery.id,
-                    'target_title': gallery.title,
-                    'target_type': 'gallery',
-                    'notification_type': 'reply',
-                    'created_at': reply.created_at
-                })
-        
-        # ========== 批量查询VIP信息 ==========
-        vip_map = await batch_get_user_vip_levels(db, list(user_ids))
-        
-        # ========== 构建响应 ==========
-        items = []
-        for raw in raw_items:
-            user = raw['user']
-            vip_level = vip_map.get(user.id, 0)
-            items.append(build_notification_item(
-                item_id=raw['id'],
-                user=user,
-                vip_level=vip_level,
-                content=raw['content'],
-                target_id=raw['target_id'],
-                target_title=raw['target_title'],
-                target_type=raw['target_type'],
-                notification_type=raw['notification_type'],
-                created_at=raw['created_at']
-            ))
-        
-        # 按时间排序并分页
-        items.sort(key=lambda x: x['created_at'], reverse=True)
-        total = len(items)
-        offset = (page - 1) * page_size
-        items = items[offset:offset + page_size]
-        
-        return NotificationListResponse(
-            items=[NotificationItem(**item) for item in items],
-            total=total,
-            unread_count=0
-        )
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+    """获取评论通知 - 所有栏目的评论和回复"""
+    return await list_inbox(db, current_user, NotificationCategory.COMMENT, page, page_size, cursor)
 
 
 @router.get("/likes", response_model=NotificationListResponse)
 async def get_like_notifications(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=50),
+    cursor: Optional[int] = Query(None, description="上一页返回的 next_cursor"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取点赞通知 - 所有栏目的点赞（优化版）"""
-    try:
-        # 收集所有原始数据和用户ID
-        raw_items = []
-        user_ids = set()
-        
-        # ========== 1. 视频点赞通知 ==========
-        user_videos_result = await db.execute(
-            select(Video.id).where(Video.uploader_id == current_user.id)
-        )
-        user_video_ids = [row[0] for row in user_videos_result.fetchall()]
-        
-        if user_video_ids:
-            video_likes_query = (
-                select(VideoLike, User, Video)
-                .join(User, VideoLike.user_id == User.id)
-                .join(Video, VideoLike.video_id == Video.id)
-                .where(
-                    and_(
-                        VideoLike.video_id.in_(user_video_ids),
-                        VideoLike.user_id != current_user.id
-                    )
-                )
-                .order_by(desc(VideoLike.created_at))
-                .limit(50)
-            )
-            result = await db.execute(video_likes_query)
-            for like, user, video in result.fetchall():
-                user_ids.add(user.id)
-                raw_items.append({
-                    'type': 'video_like',
-                    'id': like.id,
-                    'user': user,
-                    'content': None,
-                    'target_id': video.id,
-                    'target_title': video.title,
-                    'target_type': 'short' if video.is_short else 'video',
-                    'notification_type': 'like',
-                    'created_at': like.created_at
-                })
-        
-        # 视频评论点赞
-        my_video_comments_result = await db.execute(
-            select(Comment.id).where(Comment.user_id == current_user.id)
-        )
-        my_video_comment_ids = [row[0] for row in my_video_comments_result.fetchall()]
-        
-        if my_video_comment_ids:
-            video_comment_likes_query = (
-                select(CommentLike, User, Comment)
-                .join(User, CommentLike.user_id == User.id)
-                .join(Comment, CommentLike.comment_id == Comment.id)
-                .where(
-                    and_(
-                        CommentLike.comment_id.in_(my_video_comment_ids),
-                        CommentLike.user_id != current_user.id
-                    )
-                )
-                .order_by(desc(CommentLike.created_at))
-                .limit(50)
-            )
-            result = await db.execute(video_comment_likes_query)
-            for like, user, comment in result.fetchall():
-                user_ids.add(user.id)
-                raw_items.append({
-                    'type': 'video_comment_like',
-                    'id': like.id + 100000,
-                    'user': user,
-                    'content': (comment.content or '')[:30],
-                    'target_id': comment.video_id,
-                    'target_title': None,
-                    'target_type': 'video_comment',
-                    'notification_type': 'like',
-                    'created_at': like.created_at
-                })
-        
-        # ========== 2. 帖子点赞通知 ==========
-        user_posts_result = await db.execute(
-            select(Post.id).where(Post.user_id == current_user.id)
-        )
-        user_post_ids = [row[0] for row in user_posts_result.fetchall()]
-        
-        if user_post_ids:
-            post_likes_query = (
-                select(PostLike, User, Post)
-                .join(User, PostLike.user_id == User.id)
-                .join(Post, PostLike.post_id == Post.id)
-                .where(
-                    and_(
-                        PostLike.post_id.in_(user_post_ids),
-                        PostLike.user_id != current_user.id
-                    )
-                )
-                .order_by(desc(PostLike.created_at))
-                .limit(50)
-            )
-            result = await db.execute(post_likes_query)
-            for like, user, post in result.fetchall():
-                user_ids.add(user.id)
-                post_title = (post.content[:20] if post.content else '帖子')
-                raw_items.append({
-                    'type': 'post_like',
-                    'id': like.id + 1000000,
-                    'user': user,
-                    'content': None,
-                    'target_id': post.id,
-                    'target_title': post_title,
-                    'target_type': 'post',
-                    'notification_type': 'like',
-                    'created_at': like.created_at
-                })
-        
-        # 帖子评论点赞
-        my_post_comments_result = await db.execute(
-            select(PostComment.id).where(PostComment.user_id == current_user.id)
-        )
-        my_post_comment_ids = [row[0] for row in my_post_comments_result.fetchall()]
-        
-        if my_post_comment_ids:
-            post_comment_likes_query = (
-                select(PostCommentLike, User, PostComment)
-                .join(User, PostCommentLike.user_id == User.id)
-                .join(PostComment, PostCommentLike.comment_id == PostComment.id)
-                .where(
-                    and_(
-                        PostCommentLike.comment_id.in_(my_post_comment_ids),
-                        PostCommentLike.user_id != current_user.id
-                    )
-                )
-                .order_by(desc(PostCommentLike.created_at))
-                .limit(50)
-            )
-            result = await db.execute(post_comment_likes_query)
-            for like, user, comment in result.fetchall():
-                user_ids.add(user.id)
-                raw_items.append({
-                    'type': 'post_comment_like',
-                    'id': like.id + 1100000,
-                    'user': user,
-                    'content': (comment.content or '')[:30],
-                    'target_id': comment.post_id,
-                    'target_title': None,
-                    'target_type': 'post_comment',
-                    'notification_type': 'like',
-                    'created_at': like.created_at
-                })
-        
-        # ========== 3. 图集评论点赞 ==========
-        my_gallery_comments_result = await db.execute(
-            select(GalleryComment.id).where(GalleryComment.user_id == current_user.id)
-        )
-        my_gallery_comment_ids = [row[0] for row in my_gallery_comments_result.fetchall()]
-        
-        if my_gallery_comment_ids:
-            gallery_comment_likes_query = (
-                select(GalleryCommentLike, User, GalleryComment)
-                .join(User, GalleryCommentLike.user_id == User.id)
-                .join(GalleryComment, GalleryCommentLike.comment_id == GalleryComment.id)
-                .where(
-                    and_(
-                        GalleryCommentLike.comment_id.in_(my_gallery_comment_ids),
-                        GalleryCommentLike.user_id != current_user.id
-                    )
-                )
-                .order_by(desc(GalleryCommentLike.created_at))
-                .limit(50)
-            )
-            result = await db.execute(gallery_comment_likes_query)
-            for like, user, comment in result.fetchall():
-                user_ids.add(user.id)
-                raw_items.append({
-                    'type': 'gallery_comment_like',
-                    'id': like.id + 2000000,
-                    'user': user,
-                    'content': (comment.content or '')[:30],
-                    'target_id': comment.gallery_id,
-                    'target_title': None,
-                    'target_type': 'gallery_comment',
-                    'notification_type': 'like',
-                    'created_at': like.created_at
-                })
-        
-        # ========== 批量查询VIP信息 ==========
-        vip_map = await batch_get_user_vip_levels(db, list(user_ids))
-        
-        # ========== 构建响应 ==========
-        items = []
-        for raw in raw_items:
-            user = raw['user']
-            vip_level = vip_map.get(user.id, 0)
-            items.append(build_notification_item(
-                item_id=raw['id'],
-                user=user,
-                vip_level=vip_level,
-                content=raw['content'],
-                target_id=raw['target_id'],
-                target_title=raw['target_title'],
-                target_type=raw['target_type'],
-                notification_type=raw['notification_type'],
-                created_at=raw['created_at']
-            ))
-        
-        # 按时间排序并分页
-        items.sort(key=lambda x: x['created_at'], reverse=True)
-        total = len(items)
-        offset = (page - 1) * page_size
-        items = items[offset:offset + page_size]
-        
-        return NotificationListResponse(
-            items=[NotificationItem(**item) for item in items],
-            total=total,
-            unread_count=0
-        )
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+    """获取点赞通知 - 所有栏目的点赞"""
+    return await list_inbox(db, current_user, NotificationCategory.LIKE, page, page_size, cursor)
 
 
 @router.get("/unread-count")
@@ -573,106 +175,17 @@ async def get_unread_count(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取未读通知总数"""
-    from app.models.social import MessageConversation
-    
-    private_unread = 0
-    comment_unread = 0
-    like_unread = 0
-    
-    # 获取用户最后查看通知的时间
-    last_read_time = getattr(current_user, 'last_notification_read', None)
-    if not last_read_time:
-        last_read_time = datetime.utcnow() - timedelta(hours=24)
-    
-    # 1. 私信未读数
-    try:
-        conv_query = select(MessageConversation).where(
-            or_(
-                MessageConversation.user1_id == current_user.id,
-                MessageConversation.user2_id == current_user.id
-            )
-        )
-        conv_result = await db.execute(conv_query)
-        for conv in conv_result.scalars().all():
-            if conv.user1_id == current_user.id:
-                private_unread += conv.user1_unread or 0
-            else:
-                private_unread += conv.user2_unread or 0
-    except:
-        pass
-    
-    # 2. 评论未读数
-    try:
-        user_posts_result = await db.execute(
-            select(Post.id).where(Post.user_id == current_user.id)
-        )
-        user_post_ids = [row[0] for row in user_posts_result.fetchall()]
-        
-        if user_post_ids:
-            comment_count_query = select(func.count(PostComment.id)).where(
-                and_(
-                    PostComment.post_id.in_(user_post_ids),
-                    PostComment.user_id != current_user.id,
-                    PostComment.status == 'visible',
-                    PostComment.created_at > last_read_time
-                )
-            )
-            result = await db.execute(comment_count_query)
-            comment_unread += result.scalar() or 0
-        
-        my_comments_result = await db.execute(
-            select(PostComment.id).where(PostComment.user_id == current_user.id)
-        )
-        my_comment_ids = [row[0] for row in my_comments_result.fetchall()]
-        
-        if my_comment_ids:
-            reply_count_query = select(func.count(PostComment.id)).where(
-                and_(
-                    PostComment.parent_id.in_(my_comment_ids),
-                    PostComment.user_id != current_user.id,
-                    PostComment.status == 'visible',
-                    PostComment.created_at > last_read_time
-                )
-            )
-            result = await db.execute(reply_count_query)
-            comment_unread += result.scalar() or 0
-    except:
-        pass
-    
-    # 3. 点赞未读数
-    try:
-        if user_post_ids:
-            like_count_query = select(func.count(PostLike.id)).where(
-                and_(
-                    PostLike.post_id.in_(user_post_ids),
-                    PostLike.user_id != current_user.id,
-                    PostLike.created_at > last_read_time
-                )
-            )
-            result = await db.execute(like_count_query)
-            like_unread += result.scalar() or 0
-        
-        if my_comment_ids:
-            comment_like_query = select(func.count(PostCommentLike.id)).where(
-                and_(
-                    PostCommentLike.comment_id.in_(my_comment_ids),
-                    PostCommentLike.user_id != current_user.id,
-                    PostCommentLike.created_at > last_read_time
-                )
-            )
-            result = await db.execute(comment_like_query)
-            like_unread += result.scalar() or 0
-    except:
-        pass
-    
-    total = private_unread + comment_unread + like_unread
+    """获取未读通知总数（计数行主键查询）"""
+    counter = await NotificationInbox.counts(db, current_user.id)
+    private_unread = counter.private_unread if counter else 0
+    comment_unread = counter.comment_unread if counter else 0
+    like_unread = counter.like_unread if counter else 0
     
     return {
         "private_messages": private_unread,
         "comments": comment_unread,
         "likes": like_unread,
-        "total": total
+        "total": private_unread + comment_unread + like_unread
     }
 
 
@@ -701,14 +214,21 @@ async def mark_notifications_read(
                 )
             
             conv_result = await db.execute(conv_query)
+            cleared = 0
             for conv in conv_result.scalars().all():
                 if conv.user1_id == current_user.id:
+                    cleared += conv.user1_unread or 0
                     conv.user1_unread = 0
                 else:
+                    cleared += conv.user2_unread or 0
                     conv.user2_unread = 0
+            await NotificationInbox.add_private_unread(db, current_user.id, -cleared)
         
         if notification_type in ['comment', 'like', 'all']:
             current_user.last_notification_read = datetime.utcnow()
+            for category in NotificationCategory.ALL:
+                if notification_type in [category, 'all']:
+                    await NotificationInbox.mark_read(db, current_user.id, category)
         
         await db.commit()
         
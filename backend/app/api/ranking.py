@@ -1,12 +1,14 @@
 """排行榜API"""
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func
+from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from datetime import datetime, timedelta
 from typing import Optional
 
 from app.core.database import get_db
+from app.core.query_optimizer import QueryOptimizer, KeysetOrder, KeysetCursorError
+from app.services.ranking_service import RankingService
 from app.models.video import Video, VideoStatus
 from app.models.community import Post, Novel, Gallery
 
@@ -26,14 +28,50 @@ def get_time_range(time_range: str):
         return None
 
 
+async def get_board_page(db: AsyncSession, kind: str, time_range: str, page: int, page_size: int, cursor: Optional[str]):
+    """从物化榜单读取一页，返回 None 时走数据库查询"""
+    try:
+        return await RankingService.get_page(db, kind, time_range, page, page_size, cursor)
+    except KeysetCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def paginate_ranking(db: AsyncSession, query, model, page: int, page_size: int, cursor: Optional[str]):
+    """
+    按 (view_count, like_count, id) 降序分页，返回 (items, next_cursor, has_more)
+    
+    传入 cursor 时使用游标分页，否则按页码分页（兼容旧客户端）
+    """
+    order = KeysetOrder.of(model, "view_count", "like_count", "id")
+    if cursor:
+        try:
+            return await QueryOptimizer.keyset_query(db, query, order, cursor, page_size)
+        except KeysetCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    query = query.order_by(*order.order_by())
+    query = query.offset((page - 1) * page_size).limit(page_size + 1)
+    result = await db.execute(query)
+    items = list(result.scalars().all())
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    next_cursor = order.encode(items[-1]) if has_more else None
+    return items, next_cursor, has_more
+
+
 @router.get("/videos")
 async def get_video_ranking(
     time_range: str = Query("week", description="week/month/season/total"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor"),
     db: AsyncSession = Depends(get_db)
 ):
     """视频排行榜"""
+    board = await get_board_page(db, "videos", time_range, page, page_size, cursor)
+    if board is not None:
+        return board
+    
     query = select(Video).options(
         selectinload(Video.category),
         selectinload(Video.tags)
@@ -46,11 +84,7 @@ async def get_video_ranking(
     if start_time:
         query = query.where(Video.created_at >= start_time)
     
-    query = query.order_by(desc(Video.view_count), desc(Video.like_count))
-    query = query.offset((page - 1) * page_size).limit(page_size)
-    
-    result = await db.execute(query)
-    videos = result.scalars().all()
+    videos, next_cursor, has_more = await paginate_ranking(db, query, Video, page, page_size, cursor)
     
     return {
         "items": [
@@ -65,7 +99,9 @@ async def get_video_ranking(
                 "tags": [t.name for t in v.tags] if v.tags else []
             }
             for v in videos
-        ]
+        ],
+        "next_cursor": next_cursor,
+        "has_more": has_more
     }
 
 
@@ -74,9 +110,14 @@ async def get_short_ranking(
     time_range: str = Query("week", description="week/month/season/total"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor"),
     db: AsyncSession = Depends(get_db)
 ):
     """短视频排行榜"""
+    board = await get_board_page(db, "shorts", time_range, page, page_size, cursor)
+    if board is not None:
+        return board
+    
     query = select(Video).options(
         selectinload(Video.tags)
     ).where(
@@ -88,11 +129,7 @@ async def get_short_ranking(
     if start_time:
         query = query.where(Video.created_at >= start_time)
     
-    query = query.order_by(desc(Video.view_count), desc(Video.like_count))
-    query = query.offset((page - 1) * page_size).limit(page_size)
-    
-    result = await db.execute(query)
-    videos = result.scalars().all()
+    videos, next_cursor, has_more = await paginate_ranking(db, query, Video, page, page_size, cursor)
     
     return {
         "items": [
@@ -106,7 +143,9 @@ async def get_short_ranking(
                 "tags": [t.name for t in v.tags] if v.tags else []
             }
             for v in videos
-        ]
+        ],
+        "next_cursor": next_cursor,
+        "has_more": has_more
     }
 
 
@@ -115,9 +154,14 @@ async def get_post_ranking(
     time_range: str = Query("week", description="week/month/season/total"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor"),
     db: AsyncSession = Depends(get_db)
 ):
     """帖子排行榜"""
+    board = await get_board_page(db, "posts", time_range, page, page_size, cursor)
+    if board is not None:
+        return board
+    
     query = select(Post).options(
         selectinload(Post.user)
     ).where(Post.status == "published")
@@ -126,11 +170,7 @@ async def get_post_ranking(
     if start_time:
         query = query.where(Post.created_at >= start_time)
     
-    query = query.order_by(desc(Post.view_count), desc(Post.like_count))
-    query = query.offset((page - 1) * page_size).limit(page_size)
-    
-    result = await db.execute(query)
-    posts = result.scalars().all()
+    posts, next_cursor, has_more = await paginate_ranking(db, query, Post, page, page_size, cursor)
     
     # 获取所有话题ID
     all_topic_ids = set()
@@ -171,7 +211,9 @@ async def get_post_ranking(
                 "topics": [topics_map[tid] for tid in (p.topic_ids or []) if tid in topics_map]
             }
             for p in posts
-        ]
+        ],
+        "next_cursor": next_cursor,
+        "has_more": has_more
     }
 
 
@@ -180,20 +222,21 @@ async def get_novel_ranking(
     time_range: str = Query("week", description="week/month/season/total"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor"),
     db: AsyncSession = Depends(get_db)
 ):
     """小说排行榜"""
+    board = await get_board_page(db, "novels", time_range, page, page_size, cursor)
+    if board is not None:
+        return board
+    
     query = select(Novel).where(Novel.is_active == True)
     
     start_time = get_time_range(time_range)
     if start_time:
         query = query.where(Novel.created_at >= start_time)
     
-    query = query.order_by(desc(Novel.view_count), desc(Novel.like_count))
-    query = query.offset((page - 1) * page_size).limit(page_size)
-    
-    result = await db.execute(query)
-    novels = result.scalars().all()
+    novels, next_cursor, has_more = await paginate_ranking(db, query, Novel, page, page_size, cursor)
     
     return {
         "items": [
@@ -208,7 +251,9 @@ async def get_novel_ranking(
                 "tag": n.author or "小说"
             }
             for n in novels
-        ]
+        ],
+        "next_cursor": next_cursor,
+        "has_more": has_more
     }
 
 
@@ -217,20 +262,21 @@ async def get_gallery_ranking(
     time_range: str = Query("week", description="week/month/season/total"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor"),
     db: AsyncSession = Depends(get_db)
 ):
     """图集排行榜"""
+    board = await get_board_page(db, "galleries", time_range, page, page_size, cursor)
+    if board is not None:
+        return board
+    
     query = select(Gallery).where(Gallery.is_active == True)
     
     start_time = get_time_range(time_range)
     if start_time:
         query = query.where(Gallery.created_at >= start_time)
     
-    query = query.order_by(desc(Gallery.view_count), desc(Gallery.like_count))
-    query = query.offset((page - 1) * page_size).limit(page_size)
-    
-    result = await db.execute(query)
-    galleries = result.scalars().all()
+    galleries, next_cursor, has_more = await paginate_ranking(db, query, Gallery, page, page_size, cursor)
     
     return {
         "items": [
@@ -244,5 +290,7 @@ async def get_gallery_ranking(
                 "tag": "图集"
             }
             for g in galleries
-        ]
+        ],
+        "next_cursor": next_cursor,
+        "has_more": has_more
     }
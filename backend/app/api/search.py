@@ -0,0 +1,81 @@
+"""统一搜索API（视频/帖子/小说/图集）"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Optional
+
+from app.core.database import get_db
+from app.models.video import Video
+from app.models.community import Post, Novel, Gallery
+from app.services.search_index import SearchIndex, SOURCES
+
+router = APIRouter(prefix="/search", tags=["搜索"])
+
+# 搜索结果卡片需要的字段：类型 -> (模型, 封面列, 播放/浏览量列)
+CARD_COLUMNS = {
+    "video": (Video, Video.cover_url, Video.view_count),
+    "post": (Post, Post.images, Post.view_count),
+    "novel": (Novel, Novel.cover, Novel.view_count),
+    "gallery": (Gallery, Gallery.cover, Gallery.view_count),
+}
+
+
+async def load_cards(db: AsyncSession, hits):
+    """按类型批量补充封面和浏览量"""
+    ids_by_type = {}
+    for doc_type, doc_id, _, _ in hits:
+        ids_by_type.setdefault(doc_type, []).append(doc_id)
+    cards = {}
+    for doc_type, ids in ids_by_type.items():
+        model, cover_col, view_col = CARD_COLUMNS[doc_type]
+        result = await db.execute(select(model.id, cover_col, view_col).where(model.id.in_(ids)))
+        for doc_id, cover, views in result.all():
+            if isinstance(cover, list):  # 帖子取第一张图
+                cover = cover[0] if cover else None
+            cards[(doc_type, doc_id)] = (cover, views or 0)
+    return cards
+
+
+@router.get("")
+async def search(
+    q: str = Query(..., min_length=1, max_length=100, description="搜索词"),
+    type: Optional[str] = Query(None, description="video/post/novel/gallery，不传为全部"),
+    page: int = Query(1, ge=1, le=50),
+    page_size: int = Query(20, ge=1, le=50),
+    db: AsyncSession = Depends(get_db)
+):
+    """统一搜索：按相关度与热度综合排序"""
+    if type and type not in SOURCES:
+        raise HTTPException(status_code=400, detail="不支持的搜索类型")
+    hits = await SearchIndex.search(
+        db, q, doc_types=[type] if type else None,
+        limit=page_size + 1, offset=(page - 1) * page_size
+    )
+    has_more = len(hits) > page_size
+    hits = hits[:page_size]
+    cards = await load_cards(db, hits)
+
+    items = []
+    for doc_type, doc_id, title, score in hits:
+        if (doc_type, doc_id) not in cards:  # 源记录已删除，等待对账移除
+            continue
+        cover, views = cards[(doc_type, doc_id)]
+        items.append({
+            "type": doc_type,
+            "id": doc_id,
+            "title": title,
+            "cover": cover,
+            "view_count": views,
+            "score": round(score, 3),
+        })
+    return {"items": items, "page": page, "page_size": page_size, "has_more": has_more}
+
+
+@router.get("/suggest")
+async def suggest(
+    q: str = Query(..., min_length=1, max_length=100, description="输入前缀"),
+    limit: int = Query(10, ge=1, le=20),
+    db: AsyncSession = Depends(get_db)
+):
+    """搜索联想"""
+    return {"suggestions": await SearchIndex.suggest(db, q, limit)}
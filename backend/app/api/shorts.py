@@ -10,11 +10,15 @@ from pydantic import BaseModel
 from datetime import datetime
 
 from app.core.database import get_db
+from app.core.query_optimizer import QueryOptimizer, KeysetCursorError
 from app.models.video import Video, VideoStatus, ShortVideoCategory
 from app.models.user import User, UserVIP
 from app.models.social import VideoFavorite, VideoLike
 from app.models.coins import VideoPurchase
 from app.api.deps import get_current_user, get_current_user_optional
+from app.services.shuffle_pool import ShufflePool, hydrate_videos
+from app.services.ranking_service import RankingService
+from app.services.notification_inbox import NotificationInbox, NotificationCategory
 
 
 async def check_user_is_vip(db: AsyncSession, user_id: int) -> bool:
@@ -69,6 +73,7 @@ class ShortVideoListResponse(BaseModel):
     page: int
     limit: int
     has_more: bool
+    next_cursor: Optional[str] = None  # 推荐流游标，下一页原样传回
 
 
 @router.get("", response_model=ShortVideoListResponse)
@@ -78,56 +83,74 @@ async def get_short_videos(
     category_id: Optional[int] = None,  # 兼容旧参数名
     short_category_id: Optional[int] = None,  # 新参数名
     uploader_id: Optional[int] = None,  # 按上传者筛选
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor，保证推荐流翻页不重复"),
     db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user_optional)
 ):
-    """获取短视频列表（推荐流）- 优化版：添加缓存"""
+    """获取短视频列表（推荐流）- 优化版：添加缓存，随机推荐池"""
     from app.services.cache_service import CacheService, CacheTTL
     
     # 使用 short_category_id，兼容 category_id
     filter_category_id = short_category_id or category_id
     
-    # 未登录用户的热门短视频使用缓存
-    use_cache = not current_user and not uploader_id and page == 1
+    # 未登录用户的热门短视频使用缓存（并发未命中时只构建一次）
+    use_cache = not current_user and not uploader_id and page == 1 and not cursor
     if use_cache:
-        cache_key = f"shorts:list:{filter_category_id or 'all'}:{limit}"
-        cached = await CacheService.get(cache_key)
-        if cached:
-            return ShortVideoListResponse(**cached)
-    
-    # 构建查询
-    query = select(Video).where(
-        Video.is_short == True,
-        Video.status == VideoStatus.PUBLISHED
-    ).options(selectinload(Video.uploader))
-    
-    # 按上传者筛选
-    if uploader_id:
-        query = query.where(Video.uploader_id == uploader_id)
-    
-    # 分类筛选（优先使用 short_category_id 字段）
-    if filter_category_id:
-        query = query.where(Video.short_category_id == filter_category_id)
+        async def load():
+            response = await build_short_list(db, None, filter_category_id, None, page, limit, None)
+            return response.model_dump(mode="json")
+        
+        cached = await CacheService.get_or_load(
+            f"shorts:list:{filter_category_id or 'all'}:{limit}", load, CacheTTL.SHORT
+        )
+        return ShortVideoListResponse(**cached)
     
-    # 获取总数
-    count_base_query = select(Video).where(
-        Video.is_short == True,
-        Video.status == VideoStatus.PUBLISHED
-    )
+    return await build_short_list(db, current_user, filter_category_id, uploader_id, page, limit, cursor)
+
+
+async def build_short_list(
+    db: AsyncSession,
+    current_user: Optional[User],
+    filter_category_id: Optional[int],
+    uploader_id: Optional[int],
+    page: int,
+    limit: int,
+    cursor: Optional[str]
+) -> ShortVideoListResponse:
+    """构建短视频列表（含当前用户的点赞/收藏/关注/购买状态）"""
+    next_cursor = None
     if uploader_id:
-        count_base_query = count_base_query.where(Video.uploader_id == uploader_id)
-    if filter_category_id:
-        count_base_query = count_base_query.where(Video.short_category_id == filter_category_id)
-    
-    count_query = select(func.count()).select_from(count_base_query.subquery())
-    count_result = await db.execute(count_query)
-    total = count_result.scalar() or 0
-    
-    # 随机排序：每次刷新获取不同的视频顺序
-    query = query.order_by(func.random()).offset((page - 1) * limit).limit(limit)
-    
-    result = await db.execute(query)
-    videos = result.scalars().all()
+        # 单个上传者的短视频数量有限，直接随机排序
+        query = select(Video).where(
+            Video.is_short == True,
+            Video.status == VideoStatus.PUBLISHED,
+            Video.uploader_id == uploader_id
+        ).options(selectinload(Video.uploader))
+        
+        # 分类筛选（优先使用 short_category_id 字段）
+        if filter_category_id:
+            query = query.where(Video.short_category_id == filter_category_id)
+        
+        # 获取总数（缓存，翻页时不重复 COUNT）
+        total = await QueryOptimizer.cached_count(
+            db, query,
+            cache_key=f"shorts:count:{filter_category_id or ''}:{uploader_id}"
+        )
+        
+        query = query.order_by(func.random()).offset((page - 1) * limit).limit(limit)
+        result = await db.execute(query)
+        videos = result.scalars().all()
+        has_more = (page * limit) < total
+    else:
+        # 推荐流：从预计算的随机池取本页 ID，只回表加载这些视频
+        try:
+            page_ids, next_cursor, total = await ShufflePool.page(
+                db, ShufflePool.KIND_SHORTS, filter_category_id, limit, cursor, page
+            )
+        except KeysetCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        videos = await hydrate_videos(db, page_ids, selectinload(Video.uploader))
+        has_more = next_cursor is not None
     
     # 获取当前用户的点赞、收藏、关注和购买状态
     liked_ids = set()
@@ -222,53 +245,14 @@ async def get_short_videos(
             created_at=v.created_at
         ))
     
-    response = ShortVideoListResponse(
+    return ShortVideoListResponse(
         items=items,
         total=total,
         page=page,
         limit=limit,
-        has_more=(page * limit) < total
+        has_more=has_more,
+        next_cursor=next_cursor
     )
-    
-    # 缓存未登录用户的结果
-    if use_cache and items:
-        cache_data = {
-            "items": [
-                {
-                    "id": item.id,
-                    "title": item.title,
-                    "description": item.description,
-                    "cover_url": item.cover_url,
-                    "video_url": item.video_url,
-                    "hls_url": item.hls_url,
-                    "duration": item.duration,
-                    "view_count": item.view_count,
-                    "like_count": item.like_count,
-                    "favorite_count": item.favorite_count,
-                    "comment_count": item.comment_count,
-                    "share_count": item.share_count,
-                    "is_vip_only": item.is_vip_only,
-                    "coin_price": item.coin_price,
-                    "uploader_id": item.uploader_id,
-                    "uploader_nickname": item.uploader_nickname,
-                    "uploader_avatar": item.uploader_avatar,
-                    "is_liked": False,
-                    "is_favorited": False,
-                    "is_followed": False,
-                    "is_purchased": False,
-                    "trial_seconds": item.trial_seconds,
-                    "created_at": item.created_at.isoformat() if item.created_at else None
-                }
-                for item in items
-            ],
-            "total": total,
-            "page": page,
-            "limit": limit,
-            "has_more": (page * limit) < total
-        }
-        await CacheService.set(cache_key, cache_data, CacheTTL.SHORT)  # 1分钟缓存
-    
-    return response
 
 
 # ============== 短视频分类 API ==============
@@ -345,6 +329,7 @@ async def get_short_video(
     # 增加播放量
     video.view_count = (video.view_count or 0) + 1
     await db.commit()
+    await RankingService.record("shorts", video.id, video.created_at, views=1)
     
     # 检查点赞、收藏、关注和购买状态
     is_liked = False
@@ -455,16 +440,27 @@ async def like_short_video(
     
     if existing:
         # 取消点赞
+        await NotificationInbox.retract(db, 'video_like', existing.id)
         await db.delete(existing)
         video.like_count = max(0, (video.like_count or 0) - 1)
         await db.commit()
+        await RankingService.record("shorts", video.id, video.created_at, likes=-1)
         return {"liked": False, "like_count": video.like_count}
     else:
         # 点赞
         like = VideoLike(user_id=current_user.id, video_id=video_id)
         db.add(like)
         video.like_count = (video.like_count or 0) + 1
+        await db.flush()
+        await NotificationInbox.push(
+            db, user_id=video.uploader_id, actor_id=current_user.id,
+            category=NotificationCategory.LIKE, notification_type='like',
+            source_type='video_like', source_id=like.id,
+            target_type='short' if video.is_short else 'video', target_id=video.id,
+            target_title=video.title
+        )
         await db.commit()
+        await RankingService.record("shorts", video.id, video.created_at, likes=1)
         return {"liked": True, "like_count": video.like_count}
 
 
@@ -19,6 +19,7 @@ from app.models.social import (
 )
 from app.models.creator import UserFollow
 from app.models.coins import UserCoins, CoinTransaction
+from app.services.notification_inbox import NotificationInbox
 
 router = APIRouter(prefix="/social", tags=["社交功能"])
 
@@ -256,6 +257,7 @@ async def send_message(
             user2_unread=1 if current_user.id == user1_id else 0
         )
         db.add(conv)
+    await NotificationInbox.add_private_unread(db, data.receiver_id, 1)
     
     await db.commit()
     
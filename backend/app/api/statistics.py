@@ -15,8 +15,9 @@ from app.models.video import Video
 from app.models.coins import RechargeOrder, CoinTransaction
 from app.models.creator import Creator, VideoTip, CreatorWithdrawal
 from app.models.statistics import (
-    DailyRevenueReport, PlatformDailyStats, UserRetentionStats
+    DailyRevenueReport, PlatformDailyStats, HourlyStats
 )
+from app.services.stats_rollup import StatsRollup
 
 router = APIRouter(prefix="/admin/statistics", tags=["管理后台-数据统计"])
 
@@ -26,97 +27,98 @@ async def get_overview(
     db: AsyncSession = Depends(get_db),
     admin: User = Depends(get_admin_user)
 ):
-    """获取平台数据概览"""
-    today = date.today()
-    yesterday = today - timedelta(days=1)
-    week_ago = today - timedelta(days=7)
+    """获取平台数据概览（读取预聚合的日汇总，按 UTC 日期）"""
+    today = datetime.utcnow().date()
     month_ago = today - timedelta(days=30)
     
-    # 用户统计
-    total_users = await db.execute(select(func.count(User.id)))
-    today_users = await db.execute(
-        select(func.count(User.id)).where(
-            func.date(User.created_at) == today
-        )
-    )
-    
-    # 视频统计
-    total_videos = await db.execute(select(func.count(Video.id)))
-    
-    # 创作者统计
-    total_creators = await db.execute(select(func.count(Creator.id)))
-    
-    # 今日充值
-    today_recharge = await db.execute(
-        select(func.sum(RechargeOrder.amount)).where(
-            RechargeOrder.status == "paid",
-            func.date(RechargeOrder.paid_at) == today
-        )
+    latest = await StatsRollup.latest(db)
+    today_report = await db.scalar(
+        select(DailyRevenueReport).where(DailyRevenueReport.report_date == today)
     )
-    
-    # 本月充值
-    month_recharge = await db.execute(
-        select(func.sum(RechargeOrder.amount)).where(
-            RechargeOrder.status == "paid",
-            func.date(RechargeOrder.paid_at) >= month_ago
-        )
-    )
-    
-    # 今日打赏
-    today_tips = await db.execute(
-        select(func.sum(VideoTip.coins_amount)).where(
-            func.date(VideoTip.created_at) == today
+    month_recharge = await db.scalar(
+        select(func.sum(DailyRevenueReport.total_recharge)).where(
+            DailyRevenueReport.report_date >= month_ago
         )
     )
     
     return {
         "users": {
-            "total": total_users.scalar() or 0,
-            "today": today_users.scalar() or 0
+            "total": (latest.total_users if latest else 0) or 0,
+            "today": (latest.new_users if latest and latest.stat_date == today else 0) or 0
         },
         "videos": {
-            "total": total_videos.scalar() or 0
+            "total": (latest.total_videos if latest else 0) or 0
         },
         "creators": {
-            "total": total_creators.scalar() or 0
+            "total": (latest.total_creators if latest else 0) or 0
         },
         "revenue": {
-            "today_recharge": float(today_recharge.scalar() or 0),
-            "month_recharge": float(month_recharge.scalar() or 0),
-            "today_tips": today_tips.scalar() or 0
+            "today_recharge": float(today_report.total_recharge or 0) if today_report else 0.0,
+            "month_recharge": float(month_recharge or 0),
+            "today_tips": (today_report.total_tips if today_report else 0) or 0
         }
     }
 
 
+@router.get("/hourly")
+async def get_hourly_stats(
+    hours: int = Query(24, ge=1, le=168),
+    db: AsyncSession = Depends(get_db),
+    admin: User = Depends(get_admin_user)
+):
+    """获取最近N小时的小时汇总（UTC 整点）"""
+    end = datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    start = end - timedelta(hours=hours)
+    result = await db.execute(
+        select(HourlyStats).where(
+            HourlyStats.stat_hour >= start,
+            HourlyStats.stat_hour < end
+        ).order_by(HourlyStats.stat_hour)
+    )
+    return [
+        {
+            "hour": row.stat_hour.isoformat(),
+            "new_users": row.new_users or 0,
+            "active_users": row.active_users or 0,
+            "new_videos": row.new_videos or 0,
+            "new_comments": row.new_comments or 0,
+            "views": row.views or 0,
+            "recharge_amount": float(row.recharge_amount or 0),
+            "recharge_orders": row.recharge_orders or 0,
+            "payment_amount": float(row.payment_amount or 0),
+            "tip_coins": row.tip_coins or 0,
+            "purchase_coins": row.purchase_coins or 0
+        }
+        for row in result.scalars().all()
+    ]
+
+
+def _chart_days(days: int):
+    """图表的日期范围（含今天，UTC）"""
+    today = datetime.utcnow().date()
+    return [today - timedelta(days=i) for i in range(days, -1, -1)]
+
+
 @router.get("/revenue/chart")
 async def get_revenue_chart(
     days: int = Query(30, ge=7, le=90),
     db: AsyncSession = Depends(get_db),
     admin: User = Depends(get_admin_user)
 ):
-    """获取收入趋势图表数据"""
-    start_date = date.today() - timedelta(days=days)
-    
-    # 按日期分组查询充值数据
-    query = select(
-        func.date(RechargeOrder.paid_at).label("stat_date"),
-        func.sum(RechargeOrder.amount).label("amount"),
-        func.count(RechargeOrder.id).label("orders")
-    ).where(
-        RechargeOrder.status == "paid",
-        RechargeOrder.paid_at >= start_date
-    ).group_by(
-        func.date(RechargeOrder.paid_at)
-    ).order_by("stat_date")
-    
-    result = await db.execute(query)
+    """获取收入趋势图表数据（没有汇总的日期补 0）"""
+    chart_days = _chart_days(days)
+    reports = {
+        r.report_date: r
+        for r in await StatsRollup.daily(db, DailyRevenueReport, chart_days[0], chart_days[-1])
+    }
     
     chart_data = []
-    for row in result.all():
+    for day in chart_days:
+        report = reports.get(day)
         chart_data.append({
-            "date": str(row.stat_date),
-            "amount": float(row.amount or 0),
-            "orders": row.orders or 0
+            "date": str(day),
+            "amount": float(report.total_recharge or 0) if report else 0.0,
+            "orders": (report.recharge_orders if report else 0) or 0
         })
     
     return chart_data
@@ -128,23 +130,20 @@ async def get_users_chart(
     db: AsyncSession = Depends(get_db),
     admin: User = Depends(get_admin_user)
 ):
-    """获取用户增长趋势图表数据"""
-    start_date = date.today() - timedelta(days=days)
-    
-    query = select(
-        func.date(User.created_at).label("stat_date"),
-        func.count(User.id).label("new_users")
-    ).where(
-        User.created_at >= start_date
-    ).group_by(
-        func.date(User.created_at)
-    ).order_by("stat_date")
-    
-    result = await db.execute(query)
+    """获取用户增长趋势图表数据（没有汇总的日期补 0）"""
+    chart_days = _chart_days(days)
+    stats = {
+        s.stat_date: s
+        for s in await StatsRollup.daily(db, PlatformDailyStats, chart_days[0], chart_days[-1])
+    }
     
     return [
-        {"date": str(row.stat_date), "new_users": row.new_users}
-        for row in result.all()
+        {
+            "date": str(day),
+            "new_users": (stats[day].new_users if day in stats else 0) or 0,
+            "dau": (stats[day].dau if day in stats else 0) or 0
+        }
+        for day in chart_days
     ]
 
 
@@ -219,33 +218,20 @@ async def get_retention_data(
     db: AsyncSession = Depends(get_db),
     admin: User = Depends(get_admin_user)
 ):
-    """获取用户留存数据"""
-    # 简化版本：计算过去N天的用户次日留存
-    retention_data = []
+    """获取用户留存数据（按注册日期分群，第N天有活跃记录即为留存）"""
+    today = datetime.utcnow().date()
+    cohorts = await StatsRollup.retention(db, today - timedelta(days=days), today - timedelta(days=1))
     
-    for i in range(days):
-        cohort_date = date.today() - timedelta(days=i+1)
-        next_date = cohort_date + timedelta(days=1)
-        
-        # 该日注册用户数
-        cohort_count = await db.execute(
-            select(func.count(User.id)).where(
-                func.date(User.created_at) == cohort_date
-            )
-        )
-        cohort_size = cohort_count.scalar() or 0
-        
-        if cohort_size > 0:
-            # 次日活跃用户数 (简化:使用登录记录或其他活动)
-            # 这里简化处理,实际应该基于用户行为日志
-            retained = int(cohort_size * 0.3)  # 假设30%留存
-            
-            retention_data.append({
-                "date": str(cohort_date),
-                "cohort_size": cohort_size,
-                "day1_retained": retained,
-                "day1_rate": round(retained / cohort_size * 100, 1)
-            })
+    retention_data = []
+    for cohort_date, rows in cohorts.items():
+        cohort_size = max(row.total_users or 0 for row in rows.values())
+        if not cohort_size:
+            continue
+        item = {"date": str(cohort_date), "cohort_size": cohort_size}
+        for n, row in rows.items():
+            item[f"day{n}_retained"] = row.retained_users or 0
+            item[f"day{n}_rate"] = round((row.retention_rate or 0) * 100, 1)
+        retention_data.append(item)
     
     return retention_data
 
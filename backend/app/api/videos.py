@@ -13,15 +13,19 @@ import uuid
 
 from app.core.database import get_db
 from app.core.config import settings
+from app.core.query_optimizer import QueryOptimizer, KeysetOrder, KeysetCursorError
 from app.api.deps import get_current_user, get_current_user_optional, get_current_vip_user
 from app.models.user import User
-from app.models.video import Video, VideoCategory, VideoTag, VideoView, VideoStatus
+from app.models.video import Video, VideoCategory, VideoTag, VideoStatus
 from app.schemas.video import (
     VideoUpload, VideoUpdate, VideoResponse, 
     VideoListResponse, CategoryResponse, VideoProcessStatus
 )
 from app.services.video_processor import VideoProcessor
 from app.services.windows_transcode_service import WindowsTranscodeService
+from app.services.ranking_service import RankingService
+from app.services.notification_inbox import NotificationInbox, NotificationCategory
+from app.services.search_index import SearchIndex
 
 router = APIRouter()
 
@@ -763,10 +767,16 @@ async def list_videos(
     is_featured: Optional[bool] = None,
     sort_by: Optional[str] = Query(None, description="排序方式: hot, created_at, view_count, favorite_count"),
     time_range: Optional[str] = Query(None, description="时间范围: week, month, lastMonth"),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor，传入时忽略 page"),
     current_user: Optional[User] = Depends(get_current_user_optional),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取视频列表（排除短视频）"""
+    """获取视频列表（排除短视频）
+    
+    支持两种分页方式：
+    - page/page_size：页码分页（兼容旧客户端）
+    - cursor：游标分页，深翻页不再随 OFFSET 线性变慢
+    """
     query = select(Video).where(
         Video.status == VideoStatus.PUBLISHED,
         Video.is_short != True  # 排除短视频
@@ -803,38 +813,79 @@ async def list_videos(
     
     # 搜索
     if search:
-        query = query.where(Video.title.ilike(f"%{search}%"))
+        query = query.where(await SearchIndex.filter(db, "video", Video.id, Video.title, search))
     
     # 推荐筛选
     if is_featured is not None:
         query = query.where(Video.is_featured == is_featured)
     
-    # 统计总数
-    count_query = select(func.count()).select_from(query.subquery())
-    result = await db.execute(count_query)
-    total = result.scalar()
-    
-    # 排序
+    # 排序（最后一列为 id，保证游标分页顺序稳定）
     if sort_by == 'view_count':
-        query = query.order_by(desc(Video.view_count))
+        order = KeysetOrder.most_viewed(Video)
     elif sort_by == 'favorite_count':
-        query = query.order_by(desc(Video.like_count))  # 使用 like_count 作为收藏
+        order = KeysetOrder.most_liked(Video)  # 使用 like_count 作为收藏
     elif sort_by == 'hot':
         # 热门：综合播放量和时间
-        query = query.order_by(desc(Video.view_count), desc(Video.created_at))
+        order = KeysetOrder.of(Video, "view_count", "created_at", "id")
     elif sort_by == 'random':
-        # 随机排序
-        query = query.order_by(sql_func.random())
+        # 随机排序（cursor 为随机池游标）
+        order = None
     else:
         # 默认按创建时间排序
-        query = query.order_by(desc(Video.created_at))
+        order = KeysetOrder.newest(Video)
+    
+    # 无其他筛选条件的随机排序走预计算的随机池，总数由池给出
+    use_pool = order is None and not (uploader_id or search or time_range or is_featured is not None)
     
-    # 分页 + 预加载标签和上传者关系（解决N+1查询问题）
+    if not use_pool:
+        # 统计总数（缓存，翻页时不重复 COUNT）
+        count_key = "video:count:{}:{}:{}:{}:{}".format(
+            uploader_id or "", category_id or "", search or "",
+            "" if is_featured is None else int(is_featured), time_range or ""
+        )
+        total = await QueryOptimizer.cached_count(db, query, cache_key=count_key)
+    
+    # 预加载标签和上传者关系（解决N+1查询问题）
     query = query.options(selectinload(Video.tags), selectinload(Video.uploader))
-    query = query.offset((page - 1) * page_size).limit(page_size)
     
-    result = await db.execute(query)
-    videos = result.scalars().all()
+    next_cursor = None
+    has_more = False
+    if use_pool:
+        from app.services.shuffle_pool import ShufflePool, hydrate_videos
+        try:
+            page_ids, next_cursor, total = await ShufflePool.page(
+                db, ShufflePool.KIND_VIDEOS, category_id, page_size, cursor, page
+            )
+        except KeysetCursorError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        videos = await hydrate_videos(
+            db, page_ids, selectinload(Video.tags), selectinload(Video.uploader)
+        )
+        has_more = next_cursor is not None
+    elif order is None:
+        # 带其他筛选条件的随机排序，结果集较小，直接随机
+        query = query.order_by(sql_func.random())
+        query = query.offset((page - 1) * page_size).limit(page_size)
+        result = await db.execute(query)
+        videos = result.scalars().all()
+        has_more = page * page_size < total
+    elif cursor:
+        try:
+            videos, next_cursor, has_more = await QueryOptimizer.keyset_query(
+                db, query, order, cursor, page_size
+            )
+        except KeysetCursorError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    else:
+        query = query.order_by(*order.order_by())
+        query = query.offset((page - 1) * page_size).limit(page_size + 1)
+        result = await db.execute(query)
+        videos = list(result.scalars().all())
+        has_more = len(videos) > page_size
+        videos = videos[:page_size]
+        # 页码分页也返回游标，客户端可从任意一页切换到游标分页
+        if has_more:
+            next_cursor = order.encode(videos[-1])
     
     # 构建响应（上传者已预加载，无需额外查询）
     items = []
@@ -872,7 +923,9 @@ async def list_videos(
         items=items,
         total=total,
         page=page,
-        page_size=page_size
+        page_size=page_size,
+        next_cursor=next_cursor,
+        has_more=has_more
     )
 
 
@@ -1246,27 +1299,18 @@ async def record_view(
     current_user: Optional[User] = Depends(get_current_user_optional),
     db: AsyncSession = Depends(get_db)
 ):
-    """记录视频观看"""
-    result = await db.execute(select(Video).where(Video.id == video_id))
-    video = result.scalar_one_or_none()
+    """记录视频观看（写入缓冲，由定时任务批量刷入数据库）"""
+    from app.services.view_counter import ViewCounter
     
-    if not video:
+    # 只按主键检查存在性，不加载整行、不持有行锁
+    result = await db.execute(select(Video.id).where(Video.id == video_id))
+    if result.scalar_one_or_none() is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="视频不存在"
         )
     
-    # 创建观看记录
-    view = VideoView(
-        video_id=video_id,
-        user_id=current_user.id if current_user else None
-    )
-    db.add(view)
-    
-    # 更新观看次数
-    video.view_count += 1
-    
-    await db.commit()
+    await ViewCounter.record(video_id, current_user.id if current_user else None)
     
     return {"message": "已记录观看"}
 
@@ -1297,16 +1341,27 @@ async def like_video(
     
     if existing:
         # 取消点赞
+        await NotificationInbox.retract(db, 'video_like', existing.id)
         await db.delete(existing)
         video.like_count = max(0, (video.like_count or 0) - 1)
         await db.commit()
+        await RankingService.record("shorts" if video.is_short else "videos", video.id, video.created_at, likes=-1)
         return {"liked": False, "like_count": video.like_count}
     else:
         # 点赞
         like = VideoLike(user_id=current_user.id, video_id=video_id)
         db.add(like)
         video.like_count = (video.like_count or 0) + 1
+        await db.flush()
+        await NotificationInbox.push(
+            db, user_id=video.uploader_id, actor_id=current_user.id,
+            category=NotificationCategory.LIKE, notification_type='like',
+            source_type='video_like', source_id=like.id,
+            target_type='short' if video.is_short else 'video', target_id=video.id,
+            target_title=video.title
+        )
         await db.commit()
+        await RankingService.record("shorts" if video.is_short else "videos", video.id, video.created_at, likes=1)
         return {"liked": True, "like_count": video.like_count}
 
 
@@ -1755,40 +1810,34 @@ async def get_video_full_detail(
     
     async def get_recommend_videos():
         """获取推荐视频（带缓存）"""
-        cache_key = f"video_recommend:{video.category_id or 'all'}:{recommend_limit}"
-        cached = await CacheService.get(cache_key)
-        if cached:
-            # 过滤掉当前视频
-            return [v for v in cached if v["id"] != video_id][:recommend_limit]
+        async def load():
+            # 同分类共用一份缓存，多取几条以便过滤掉当前视频
+            query = select(Video).where(
+                Video.status == VideoStatus.PUBLISHED,
+                Video.is_short != True
+            )
+            
+            if video.category_id:
+                query = query.where(Video.category_id == video.category_id)
+            
+            query = query.order_by(Video.view_count.desc()).limit(recommend_limit + 5)
+            
+            result = await db.execute(query)
+            return [
+                {
+                    "id": v.id,
+                    "title": v.title,
+                    "cover_url": v.cover_url,
+                    "duration": v.duration or 0,
+                    "view_count": v.view_count or 0
+                }
+                for v in result.scalars().all()
+            ]
         
-        query = select(Video).where(
-            Video.status == VideoStatus.PUBLISHED,
-            Video.id != video_id,
-            Video.is_short != True
+        recommend_data = await CacheService.get_or_load(
+            f"video_recommend:{video.category_id or 'all'}:{recommend_limit}", load, CacheTTL.MEDIUM
         )
-        
-        if video.category_id:
-            query = query.where(Video.category_id == video.category_id)
-        
-        query = query.order_by(Video.view_count.desc()).limit(recommend_limit + 5)
-        
-        result = await db.execute(query)
-        videos = result.scalars().all()
-        
-        recommend_data = [
-            {
-                "id": v.id,
-                "title": v.title,
-                "cover_url": v.cover_url,
-                "duration": v.duration or 0,
-                "view_count": v.view_count or 0
-            }
-            for v in videos
-        ]
-        
-        # 缓存5分钟
-        await CacheService.set(cache_key, recommend_data, CacheTTL.MEDIUM)
-        
+        # 过滤掉当前视频
         return [v for v in recommend_data if v["id"] != video_id][:recommend_limit]
     
     # 并行执行所有查询
@@ -18,6 +18,7 @@ celery_app = Celery(
         "app.tasks.video_tasks",
         "app.tasks.notification_tasks",
         "app.tasks.cleanup_tasks",
+        "app.tasks.counter_tasks",
     ]
 )
 
@@ -75,6 +76,11 @@ celery_app.conf.update(
             "task": "app.tasks.cleanup_tasks.cleanup_temp_files",
             "schedule": 86400.0,
         },
+        # 每10秒刷入缓冲的视频观看计数
+        "flush-view-counts": {
+            "task": "app.tasks.counter_tasks.flush_view_counts",
+            "schedule": 10.0,
+        },
         # 每天检查VIP过期
         "check-vip-expiry": {
             "task": "app.tasks.notification_tasks.check_vip_expiry",
@@ -53,6 +53,8 @@ class Settings(BaseSettings):
     
     # FFmpeg配置
     FFMPEG_PATH: str = "ffmpeg"
+    # ffprobe 探测结果缓存（SQLite）
+    PROBE_CACHE_PATH: str = os.path.join(BASE_DIR, "data", "probe_cache.db")
     
     # AI配置 (OpenAI)
     OPENAI_API_KEY: Optional[str] = None
@@ -95,6 +97,10 @@ class Settings(BaseSettings):
     
     # 监控配置
     PROMETHEUS_PORT: int = 9090
+    PROMETHEUS_MULTIPROC_DIR: str = ""  # 多 worker 部署时各进程写指标快照的目录（部署/重启前清空）
+    METRICS_TOKEN: str = ""             # Prometheus 抓取导出接口用的 Bearer Token，为空时不开放导出
+    SQL_PROFILING: bool = False         # 逐请求记录 SQL 并检测 N+1（开发/预发环境，/admin/monitoring/sql 查看）
+    SQL_N_PLUS_ONE_THRESHOLD: int = 5   # 同一请求内同一 SQL 指纹执行达到该次数视为 N+1
     
     # 邮件配置 (SMTP)
     SMTP_HOST: str = "smtp.qq.com"
@@ -1,10 +1,27 @@
 """
 数据库连接管理
+
+SQL_PROFILING 开启时（开发/预发环境），逐请求记录每条 SQL 的耗时和归一化指纹：
+同一请求内同一指纹执行次数达到 SQL_N_PLUS_ONE_THRESHOLD 视为 N+1，
+按端点汇总后通过 /admin/monitoring/sql 查看；tests/query_budget.py 用同一套记录做查询预算检查。
 """
+import re
+import time
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 # 创建异步引擎 - SQLite 和 PostgreSQL 使用不同配置
 is_sqlite = settings.DATABASE_URL.startswith("sqlite")
 
@@ -68,3 +85,219 @@ async def init_db():
 
 
 
+
+
+# ==================== SQL 性能分析（开发/预发环境） ====================
+
+MAX_FINGERPRINTS_PER_ENDPOINT = 50  # 每个端点最多跟踪的指纹数
+SAMPLE_STATEMENT_LENGTH = 500
+
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:\?|%s|%\(\w+\)s|\$\d+|:\w+|'(?:[^']|'')*'|-?\d+(?:\.\d+)?)\s*,?)+\)", re.I)
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b-?\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    """SQL 归一化指纹：参数占位符、字面量统一为 ?，IN 列表统一为 IN (...)，合并空白"""
+    normalized = _IN_LIST.sub("IN (...)", statement)
+    normalized = _STRING.sub("?", normalized)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER.sub("?", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+class QueryRecord:
+    """一条执行过的 SQL"""
+
+    __slots__ = ("fingerprint", "statement", "duration")
+
+    def __init__(self, fingerprint: str, statement: str, duration: float):
+        self.fingerprint = fingerprint
+        self.statement = statement
+        self.duration = duration
+
+
+class QueryLog:
+    """一个请求（或一段代码）内执行的全部 SQL"""
+
+    def __init__(self):
+        self.queries: List[QueryRecord] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def total_time(self) -> float:
+        return sum(q.duration for q in self.queries)
+
+    def by_fingerprint(self) -> Dict[str, List[QueryRecord]]:
+        groups: Dict[str, List[QueryRecord]] = defaultdict(list)
+        for query in self.queries:
+            groups[query.fingerprint].append(query)
+        return groups
+
+    def repeated(self, threshold: Optional[int] = None) -> List[Tuple[str, List[QueryRecord]]]:
+        """执行次数达到阈值的指纹（疑似 N+1），按次数降序"""
+        threshold = threshold or settings.SQL_N_PLUS_ONE_THRESHOLD
+        groups = [(fp, records) for fp, records in self.by_fingerprint().items() if len(records) >= threshold]
+        return sorted(groups, key=lambda item: len(item[1]), reverse=True)
+
+    def report(self, limit: int = 20) -> str:
+        """按指纹汇总的文本报告（测试失败和日志用）"""
+        lines = [f"{self.count} 条 SQL，共 {self.total_time * 1000:.1f}ms"]
+        groups = sorted(self.by_fingerprint().items(), key=lambda item: len(item[1]), reverse=True)
+        for fp, records in groups[:limit]:
+            total_ms = sum(r.duration for r in records) * 1000
+            lines.append(f"  {len(records):>4}x {total_ms:>8.1f}ms  {fp[:SAMPLE_STATEMENT_LENGTH]}")
+        return "\n".join(lines)
+
+
+_query_log: ContextVar[Optional[QueryLog]] = ContextVar("sql_query_log", default=None)
+
+
+@contextmanager
+def profile_queries() -> Iterator[QueryLog]:
+    """记录块内执行的全部 SQL（需已调用 install_sql_profiler）"""
+    log = QueryLog()
+    token = _query_log.set(log)
+    try:
+        yield log
+    finally:
+        _query_log.reset(token)
+
+
+def _profile_before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _query_log.get() is not None:
+        conn.info.setdefault("sql_profile_start", []).append(time.perf_counter())
+
+
+def _profile_after_execute(conn, cursor, statement, parameters, context, executemany):
+    log = _query_log.get()
+    if log is None:
+        return
+    starts = conn.info.get("sql_profile_start")
+    duration = time.perf_counter() - starts.pop() if starts else 0.0
+    log.queries.append(QueryRecord(fingerprint(statement), statement, duration))
+
+
+def install_sql_profiler() -> None:
+    """在 Engine 类上注册执行事件（对所有引擎生效，含测试里自建的引擎）；不在记录范围内时只多一次 ContextVar 读取"""
+    if event.contains(Engine, "after_cursor_execute", _profile_after_execute):
+        return
+    event.listen(Engine, "before_cursor_execute", _profile_before_execute)
+    event.listen(Engine, "after_cursor_execute", _profile_after_execute)
+
+
+class EndpointSQLProfile:
+    """一个端点的 SQL 汇总"""
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.total_time = 0.0
+        self.n_plus_one_requests = 0
+        # 指纹 -> [执行次数, 总耗时, 单请求最多次数, 出现 N+1 的请求数, 示例语句]
+        self.fingerprints: Dict[str, list] = {}
+
+    def add(self, log: QueryLog, threshold: int) -> List[Tuple[str, int]]:
+        """计入一个请求，返回本请求内疑似 N+1 的 (指纹, 次数)"""
+        self.requests += 1
+        self.queries += log.count
+        self.max_queries = max(self.max_queries, log.count)
+        self.total_time += log.total_time
+        repeated = []
+        for fp, records in log.by_fingerprint().items():
+            stats = self.fingerprints.get(fp)
+            if stats is None:
+                if len(self.fingerprints) >= MAX_FINGERPRINTS_PER_ENDPOINT:
+                    continue
+                stats = self.fingerprints[fp] = [0, 0.0, 0, 0, records[0].statement[:SAMPLE_STATEMENT_LENGTH]]
+            stats[0] += len(records)
+            stats[1] += sum(r.duration for r in records)
+            stats[2] = max(stats[2], len(records))
+            if len(records) >= threshold:
+                stats[3] += 1
+                repeated.append((fp, len(records)))
+        if repeated:
+            self.n_plus_one_requests += 1
+        return repeated
+
+
+class SQLProfiler:
+    """按端点汇总请求内的 SQL，找出 N+1 和查询最多的语句"""
+
+    def __init__(self):
+        self.enabled = False
+        self.endpoints: Dict[Tuple[str, str], EndpointSQLProfile] = defaultdict(EndpointSQLProfile)
+        self.listeners: List[Callable[[str, str, QueryLog], None]] = []  # 每个请求结束时回调（查询预算插件用）
+        self._warned = set()
+
+    def enable(self) -> None:
+        install_sql_profiler()
+        self.enabled = True
+
+    def begin(self):
+        """请求开始：建立本请求的 SQL 记录，返回 ContextVar token"""
+        return _query_log.set(QueryLog())
+
+    def end(self, token, method: str, route: str) -> QueryLog:
+        """请求结束：汇总本请求的 SQL，疑似 N+1 的指纹首次出现时记警告日志"""
+        log = _query_log.get()
+        _query_log.reset(token)
+        repeated = self.endpoints[(method, route)].add(log, settings.SQL_N_PLUS_ONE_THRESHOLD)
+        for fp, times in repeated:
+            if (method, route, fp) not in self._warned:
+                self._warned.add((method, route, fp))
+                logger.warning(f"[SQL] 疑似 N+1: {method} {route} 同一请求内执行 {times} 次: {fp[:200]}")
+        for listener in list(self.listeners):
+            listener(method, route, log)
+        return log
+
+    def top_offenders(self, top_n: int = 20, statements: int = 5) -> list:
+        """端点排行：先按出现 N+1 的请求数，再按平均 SQL 条数"""
+        ranked = sorted(
+            self.endpoints.items(),
+            key=lambda item: (item[1].n_plus_one_requests, item[1].queries / item[1].requests),
+            reverse=True
+        )[:top_n]
+        result = []
+        for (method, route), profile in ranked:
+            top_statements = sorted(
+                profile.fingerprints.items(), key=lambda item: (item[1][3], item[1][0]), reverse=True
+            )[:statements]
+            result.append({
+                "endpoint": f"{method}:{route}",
+                "requests": profile.requests,
+                "avg_queries": round(profile.queries / profile.requests, 2),
+                "max_queries": profile.max_queries,
+                "avg_db_time_ms": round(profile.total_time / profile.requests * 1000, 2),
+                "n_plus_one_requests": profile.n_plus_one_requests,
+                "statements": [
+                    {
+                        "fingerprint": fp,
+                        "sample": sample,
+                        "executions": executions,
+                        "avg_per_request": round(executions / profile.requests, 2),
+                        "max_per_request": max_per_request,
+                        "total_time_ms": round(total_time * 1000, 2),
+                        "n_plus_one_requests": n_plus_one,
+                    }
+                    for fp, (executions, total_time, max_per_request, n_plus_one, sample) in top_statements
+                ],
+            })
+        return result
+
+    def reset(self) -> None:
+        self.endpoints.clear()
+        self._warned.clear()
+
+
+sql_profiler = SQLProfiler()
+
+if settings.SQL_PROFILING:
+    sql_profiler.enable()
@@ -1,15 +1,135 @@
 """
 数据库查询优化工具
 """
-from sqlalchemy import select, func
+from sqlalchemy import select, func, and_, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload, joinedload
-from typing import List, Optional, Type, TypeVar, Any
+from typing import List, Optional, Type, TypeVar, Any, Tuple
 from datetime import datetime
+import base64
+import hashlib
+import json
 
 T = TypeVar('T')
 
 
+class KeysetCursorError(ValueError):
+    """分页游标无效（被篡改、过期或与排序方式不匹配）"""
+
+
+# 可空排序列的 NULL 替代值：NULL 按最小值参与排序和比较（降序时排在最后）
+NULL_SORT_VALUES = {int: 0, float: 0.0, datetime: datetime(1970, 1, 1)}
+
+
+def _null_sort_value(column) -> Any:
+    if not column.nullable:
+        return None
+    try:
+        return NULL_SORT_VALUES.get(column.type.python_type)
+    except NotImplementedError:
+        return None
+
+
+class KeysetOrder:
+    """
+    键集（游标）分页的排序定义
+    
+    排序列的最后一列必须唯一（通常是 id），保证翻页不重复、不遗漏。
+    游标对客户端不透明，内容为排序名 + 最后一行的排序键值。
+    可空列按 COALESCE(列, 替代值) 排序，ORDER BY、翻页条件和游标取值一致，
+    否则游标行的值为 NULL 时 "< NULL" 条件不成立，后面的行全部丢失。
+    
+    用法:
+    order = KeysetOrder.newest(Video)
+    items, next_cursor, has_more = await QueryOptimizer.keyset_query(db, query, order, cursor, 20)
+    """
+    
+    def __init__(self, name: str, columns: list, descending: bool = True):
+        self.name = name
+        self.columns = columns
+        self.descending = descending
+        self.null_values = [_null_sort_value(c) for c in columns]
+        self.keys = [
+            func.coalesce(c, null) if null is not None else c
+            for c, null in zip(columns, self.null_values)
+        ]
+    
+    @classmethod
+    def of(cls, model, *fields: str, descending: bool = True) -> "KeysetOrder":
+        """按模型字段名构建排序，自动补充 id 作为唯一键"""
+        if fields[-1] != "id":
+            fields = fields + ("id",)
+        return cls(",".join(fields), [getattr(model, f) for f in fields], descending)
+    
+    @classmethod
+    def newest(cls, model) -> "KeysetOrder":
+        """(created_at, id) 最新"""
+        return cls.of(model, "created_at", "id")
+    
+    @classmethod
+    def most_viewed(cls, model) -> "KeysetOrder":
+        """(view_count, id) 播放最多"""
+        return cls.of(model, "view_count", "id")
+    
+    @classmethod
+    def most_liked(cls, model) -> "KeysetOrder":
+        """(like_count, id) 点赞最多"""
+        return cls.of(model, "like_count", "id")
+    
+    def order_by(self) -> list:
+        """ORDER BY 子句"""
+        return [k.desc() if self.descending else k.asc() for k in self.keys]
+    
+    def after(self, values: list):
+        """
+        位于给定键值之后的行的条件
+        
+        展开为 (a < x) OR (a = x AND b < y) OR ...，
+        不依赖行值比较语法，SQLite / PostgreSQL 通用
+        """
+        clauses = []
+        for i, key in enumerate(self.keys):
+            equals = [self.keys[j] == values[j] for j in range(i)]
+            step = key < values[i] if self.descending else key > values[i]
+            clauses.append(and_(*equals, step))
+        return or_(*clauses)
+    
+    def values_of(self, row) -> list:
+        """取出一行的排序键值"""
+        return [self._fill_null(getattr(row, c.key), i) for i, c in enumerate(self.columns)]
+    
+    def _fill_null(self, value, index: int):
+        return self.null_values[index] if value is None else value
+    
+    def encode(self, row) -> str:
+        """生成指向该行之后的游标"""
+        values = []
+        for value in self.values_of(row):
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            values.append(value)
+        raw = json.dumps({"o": self.name, "k": values}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+    
+    def decode(self, cursor: str) -> list:
+        """解析游标，返回排序键值"""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if data.get("o") != self.name or len(data["k"]) != len(self.columns):
+                raise KeysetCursorError("游标与排序方式不匹配")
+            values = []
+            for i, (column, value) in enumerate(zip(self.columns, data["k"])):
+                if value is not None and column.type.python_type is datetime:
+                    value = datetime.fromisoformat(value)
+                values.append(self._fill_null(value, i))
+            return values
+        except KeysetCursorError:
+            raise
+        except Exception:
+            raise KeysetCursorError("无效的分页游标")
+
+
 class QueryOptimizer:
     """查询优化器"""
     
@@ -55,6 +175,67 @@ class QueryOptimizer:
             items = items[:page_size]
         
         return items, total, has_more
+    
+    @staticmethod
+    async def keyset_query(
+        db: AsyncSession,
+        query,
+        order: KeysetOrder,
+        cursor: Optional[str] = None,
+        page_size: int = 20
+    ) -> Tuple[list, Optional[str], bool]:
+        """
+        键集（游标）分页查询，返回 (items, next_cursor, has_more)
+        
+        不使用 OFFSET，翻到任意深度都只扫描 page_size + 1 行。
+        游标无效时抛出 KeysetCursorError。
+        """
+        if cursor:
+            query = query.where(order.after(order.decode(cursor)))
+        
+        query = query.order_by(*order.order_by()).limit(page_size + 1)
+        result = await db.execute(query)
+        items = list(result.scalars().all())
+        
+        has_more = len(items) > page_size
+        if has_more:
+            items = items[:page_size]
+        
+        next_cursor = order.encode(items[-1]) if has_more else None
+        return items, next_cursor, has_more
+    
+    @staticmethod
+    async def cached_count(
+        db: AsyncSession,
+        query,
+        cache_key: Optional[str] = None,
+        ttl: int = 60
+    ) -> int:
+        """
+        带缓存的计数，列表总数只需近似值时使用
+        
+        未指定 cache_key 时按 SQL 和参数生成键；
+        缓存期内的翻页不再重复执行 COUNT(*)
+        """
+        from app.core.redis import RedisCache
+        
+        if cache_key is None:
+            compiled = query.compile()
+            digest = hashlib.md5(
+                (str(compiled) + repr(sorted(compiled.params.items(), key=lambda kv: kv[0]))).encode()
+            ).hexdigest()
+            cache_key = f"count:{digest}"
+        
+        cached = await RedisCache.get(cache_key)
+        if cached is not None:
+            try:
+                return int(cached)
+            except ValueError:
+                pass
+        
+        total = await QueryOptimizer.count(db, query)
+        await RedisCache.set(cache_key, str(total), ttl)
+        return total
 
 
 class VideoQueryBuilder:
@@ -96,7 +277,8 @@ class VideoQueryBuilder:
         """搜索"""
         if keyword:
             from app.models.video import Video
-            self._filters.append(Video.title.ilike(f"%{keyword}%"))
+            from app.services.search_index import SearchIndex
+            self._filters.append(SearchIndex.condition("video", Video.id, Video.title, keyword))
         return self
     
     def vip_only(self, is_vip: bool = True):
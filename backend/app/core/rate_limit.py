@@ -5,19 +5,13 @@ API 限流模块
 from fastapi import Request
 from fastapi.responses import JSONResponse
 from typing import Callable
-import time
-from collections import defaultdict
-import asyncio
 
 from app.core.config import settings
+from app.core.rate_limiter import limiter, get_client_ip
 
 
 class RateLimiter:
-    """简单的内存限流器（生产环境建议使用 Redis）"""
-    
-    def __init__(self):
-        self.requests = defaultdict(list)
-        self._lock = asyncio.Lock()
+    """按 '次数/周期' 配置限流，底层使用 core.rate_limiter 的限流引擎"""
     
     def _parse_limit(self, limit_str: str) -> tuple:
         """解析限流配置，如 '5/minute' -> (5, 60)"""
@@ -43,45 +37,16 @@ class RateLimiter:
             return True, -1, 0
         
         max_requests, period = self._parse_limit(limit_str)
-        now = time.time()
-        
-        async with self._lock:
-            # 清理过期记录
-            self.requests[key] = [
-                req_time for req_time in self.requests[key]
-                if now - req_time < period
-            ]
-            
-            current_count = len(self.requests[key])
-            
-            if current_count >= max_requests:
-                # 计算重置时间
-                oldest = min(self.requests[key]) if self.requests[key] else now
-                reset_time = int(oldest + period - now)
-                return False, 0, reset_time
-            
-            # 记录本次请求
-            self.requests[key].append(now)
-            remaining = max_requests - current_count - 1
-            
-            return True, remaining, period
+        result = await limiter.hit(f"rate_limit:{key}", max_requests, period)
+        if not result.allowed:
+            return False, 0, result.retry_after
+        return True, result.remaining, period
 
 
 # 全局限流器实例
 rate_limiter = RateLimiter()
 
 
-def get_client_ip(request: Request) -> str:
-    """获取客户端真实 IP"""
-    forwarded = request.headers.get("X-Forwarded-For")
-    if forwarded:
-        return forwarded.split(",")[0].strip()
-    real_ip = request.headers.get("X-Real-IP")
-    if real_ip:
-        return real_ip
-    return request.client.host if request.client else "unknown"
-
-
 def rate_limit(limit: str = None):
     """
     限流装饰器
@@ -1,15 +1,20 @@
 """
 API 限流中间件
+
+限流引擎（RateLimiter）：
+- Redis 可用时用 GCRA 算法，Lua 脚本一次往返原子完成，多进程/多机共享限额
+- Redis 不可用时退回进程内令牌桶，键数量有上限（LRU 淘汰）
 """
 from fastapi import Request, HTTPException, status
+from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
-from typing import Dict, Tuple
+from typing import Any, Dict, List, NamedTuple, Tuple
+from collections import OrderedDict
+import math
 import time
-import asyncio
-from collections import defaultdict
 
 from app.core.config import settings
-from app.core.redis import RedisCache
+from app.core.redis import RedisCache, report_failure
 
 
 class RateLimitConfig:
@@ -55,35 +60,165 @@ class RateLimitConfig:
     ]
 
 
-class InMemoryRateLimiter:
-    """内存限流器（Redis不可用时的备用方案）"""
+class PathRules:
+    """
+    预编译的路径规则
+    
+    白名单和限流规则按路径段建成前缀树，匹配时取最长前缀；
+    完整路径命中的结果缓存在字典中，重复请求 O(1)。
+    """
+    
+    WHITELISTED = "whitelist"
+    MAX_CACHED_PATHS = 10000
+    
+    def __init__(self, paths: Dict[str, Tuple[int, int]], whitelist: List[str], default: Tuple[int, int]):
+        self.default = default
+        self._root: dict = {}
+        for prefix in whitelist:
+            self._insert(prefix, self.WHITELISTED)
+        for prefix, rule in paths.items():
+            self._insert(prefix, rule)
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+    
+    @staticmethod
+    def _segments(path: str) -> List[str]:
+        return [seg for seg in path.split("/") if seg]
+    
+    def _insert(self, prefix: str, rule) -> None:
+        node = self._root
+        for seg in self._segments(prefix):
+            node = node.setdefault(seg, {})
+        node[None] = rule
+    
+    def _walk(self, path: str):
+        node, rule = self._root, self._root.get(None)
+        for seg in self._segments(path):
+            node = node.get(seg)
+            if node is None:
+                break
+            rule = node.get(None, rule)
+        return rule
+    
+    def match(self, path: str):
+        """返回 WHITELISTED 或 (次数, 时间窗口秒)"""
+        rule = self._cache.get(path)
+        if rule is None:
+            rule = self._walk(path) or self.default
+            self._cache[path] = rule
+            if len(self._cache) > self.MAX_CACHED_PATHS:
+                self._cache.popitem(last=False)
+        return rule
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: int
+
+
+# GCRA（通用信元速率算法）：每个键只存一个"理论到达时间"，一次往返内完成判断和更新
+# KEYS[1] 限流键；ARGV: 当前时间(ms) 发放间隔(ms) 突发容量(ms)
+_GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local tolerance = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local allow_at = tat - tolerance
+if now < allow_at then
+    return {0, 0, allow_at - now}
+end
+local new_tat = tat + interval
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {1, math.floor((now + tolerance - new_tat) / interval) + 1, 0}
+"""
+
+
+class TokenBucketLimiter:
+    """
+    进程内令牌桶（Redis不可用时的备用方案）
+    
+    每个键只保存 (剩余令牌, 上次更新时间) 两个数，超过 max_keys 时淘汰最久未访问的键。
+    判断过程中没有 await，在事件循环内天然原子，不需要加锁。
+    """
+    
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+    
+    def hit(self, key: str, limit: int, window: int) -> RateLimitResult:
+        now = time.monotonic()
+        rate = limit / window
+        tokens, last = self._buckets.pop(key, (float(limit), now))
+        tokens = min(float(limit), tokens + (now - last) * rate)
+        
+        if tokens >= 1:
+            tokens -= 1
+            result = RateLimitResult(True, int(tokens), 0)
+        else:
+            result = RateLimitResult(False, 0, max(1, math.ceil((1 - tokens) / rate)))
+        
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return result
+    
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """限流引擎：优先使用 Redis（集群内共享），不可用时退回进程内令牌桶"""
     
     def __init__(self):
-        self._requests: Dict[str, list] = defaultdict(list)
-        self._lock = asyncio.Lock()
-    
-    async def is_allowed(self, key: str, limit: int, window: int) -> Tuple[bool, int]:
-        """检查是否允许请求"""
-        async with self._lock:
-            now = time.time()
-            # 清理过期记录
-            self._requests[key] = [t for t in self._requests[key] if now - t < window]
-            
-            current_count = len(self._requests[key])
-            
-            if current_count >= limit:
-                # 计算重置时间
-                oldest = min(self._requests[key]) if self._requests[key] else now
-                retry_after = int(window - (now - oldest))
-                return False, max(1, retry_after)
-            
-            # 记录请求
-            self._requests[key].append(now)
-            return True, 0
-
-
-# 全局内存限流器实例
-_memory_limiter = InMemoryRateLimiter()
+        self.local = TokenBucketLimiter()
+        self._script = None
+    
+    async def hit(self, key: str, limit: int, window: int) -> RateLimitResult:
+        """记录一次请求并返回是否允许（limit 次 / window 秒）"""
+        try:
+            r = await RedisCache.get_client()
+            if r is not None:
+                if self._script is None or self._script.registered_client is not r:
+                    self._script = r.register_script(_GCRA_SCRIPT)
+                interval = window * 1000 / limit
+                allowed, remaining, retry_ms = await self._script(
+                    keys=[key],
+                    args=[int(time.time() * 1000), interval, interval * (limit - 1)]
+                )
+                return RateLimitResult(
+                    bool(allowed), int(remaining), max(1, math.ceil(float(retry_ms) / 1000)) if not allowed else 0
+                )
+        except Exception as e:
+            report_failure(e)
+        
+        return self.local.hit(key, limit, window)
+
+
+# 全局实例
+_path_rules = PathRules(RateLimitConfig.PATHS, RateLimitConfig.WHITELIST, RateLimitConfig.DEFAULT)
+limiter = RateLimiter()
+
+
+def get_client_ip(request: Request) -> str:
+    """获取客户端真实 IP"""
+    forwarded = request.headers.get("X-Forwarded-For")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    real_ip = request.headers.get("X-Real-IP")
+    if real_ip:
+        return real_ip
+    return request.client.host if request.client else "unknown"
+
+
+def _too_many_requests(retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"请求过于频繁，请 {retry_after} 秒后重试",
+        headers={"Retry-After": str(retry_after), "X-RateLimit-Remaining": "0"}
+    )
 
 
 async def check_rate_limit(request: Request) -> None:
@@ -92,75 +227,37 @@ async def check_rate_limit(request: Request) -> None:
         return
     
     path = request.url.path
+    rule = _path_rules.match(path)
     
     # 检查白名单
-    for whitelist_path in RateLimitConfig.WHITELIST:
-        if path.startswith(whitelist_path):
-            return
-    
-    # 获取客户端标识（IP + 用户ID）
-    client_ip = request.client.host if request.client else "unknown"
-    forwarded = request.headers.get("X-Forwarded-For")
-    if forwarded:
-        client_ip = forwarded.split(",")[0].strip()
+    if rule == PathRules.WHITELISTED:
+        return
     
-    # 尝试获取用户ID
+    # 获取客户端标识（用户ID，未登录用IP）
     user_id = None
     auth_header = request.headers.get("Authorization")
     if auth_header and auth_header.startswith("Bearer "):
-        from app.core.security import decode_token
+        from app.core.security import decode_request_token
         token = auth_header[7:]
-        payload = decode_token(token)
+        payload = decode_request_token(request, token)
         if payload:
             user_id = payload.get("sub")
     
-    # 构建限流键
-    identifier = f"{user_id or client_ip}"
-    
-    # 获取限流配置
-    limit, window = RateLimitConfig.DEFAULT
-    for config_path, config in RateLimitConfig.PATHS.items():
-        if path.startswith(config_path):
-            limit, window = config
-            break
-    
-    rate_key = f"rate_limit:{path}:{identifier}"
-    
-    # 尝试使用 Redis 限流
-    try:
-        redis = await RedisCache.get_client()
-        if redis:
-            # 使用 Redis 滑动窗口限流
-            current = await redis.incr(rate_key)
-            if current == 1:
-                await redis.expire(rate_key, window)
-            
-            if current > limit:
-                ttl = await redis.ttl(rate_key)
-                raise HTTPException(
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail=f"请求过于频繁，请 {ttl} 秒后重试",
-                    headers={"Retry-After": str(ttl)}
-                )
-            return
-    except HTTPException:
-        raise
-    except Exception:
-        pass
-    
-    # Redis 不可用，使用内存限流
-    allowed, retry_after = await _memory_limiter.is_allowed(rate_key, limit, window)
-    if not allowed:
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=f"请求过于频繁，请 {retry_after} 秒后重试",
-            headers={"Retry-After": str(retry_after)}
-        )
+    identifier = f"{user_id or get_client_ip(request)}"
+    limit, window = rule
+    
+    result = await limiter.hit(f"rate_limit:{path}:{identifier}", limit, window)
+    if not result.allowed:
+        raise _too_many_requests(result.retry_after)
 
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
     """限流中间件"""
     
     async def dispatch(self, request: Request, call_next):
-        await check_rate_limit(request)
+        try:
+            await check_rate_limit(request)
+        except HTTPException as e:
+            # 中间件里抛出的 HTTPException 不会经过路由的异常处理，直接转成响应
+            return JSONResponse(status_code=e.status_code, content={"detail": e.detail}, headers=e.headers)
         return await call_next(request)
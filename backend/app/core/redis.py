@@ -1,23 +1,46 @@
 """
 Redis 连接管理 - 带容错处理和内存备用缓存
+
+- 进程内复用一个长连接客户端（底层连接池），不再每次命令前 PING
+- 熔断：命令出现连接错误后断开熔断器，期间直接使用内存备用缓存；
+  到达重试时间后由健康探测任务（或下一次调用）PING 一次，成功即恢复
+- 批量接口 get_many / set_many / incr_many 用 MGET / pipeline 一次往返完成
 """
 import redis.asyncio as redis
 from app.core.config import settings
 import logging
+import time
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Iterable
 import asyncio
 
 logger = logging.getLogger(__name__)
 
-# Redis 连接池
+# Redis 连接池与长连接客户端
 redis_pool = None
-redis_available = True  # Redis可用性标志
+_client: Optional[redis.Redis] = None
+
+# 熔断状态：_healthy 为 False 时在 _retry_at 之前不访问 Redis
+_healthy = False
+_verified = False
+_retry_at = 0.0
+_backoff = 0.0
+_probe_lock = asyncio.Lock()
+_probe_task: Optional[asyncio.Task] = None
+
+# 熔断后的重试间隔（秒），每次失败翻倍
+RETRY_MIN_SECONDS = 1.0
+RETRY_MAX_SECONDS = 30.0
+# 健康探测间隔（秒）
+PROBE_INTERVAL = 5.0
 
 # 内存缓存（Redis不可用时的备用方案）
 _memory_cache: Dict[str, Dict[str, Any]] = {}
 _cache_lock = asyncio.Lock()
 
+# Redis 命令的连接类错误（触发熔断）
+_CONNECTION_ERRORS = (redis.ConnectionError, redis.TimeoutError, ConnectionError, OSError)
+
 
 async def _cleanup_expired_memory_cache():
     """清理过期的内存缓存"""
@@ -30,58 +53,174 @@ async def _cleanup_expired_memory_cache():
         del _memory_cache[key]
 
 
+def _trip(error: Exception) -> None:
+    """断开熔断器，一段时间内不再访问 Redis"""
+    global _healthy, _verified, _retry_at, _backoff
+    _backoff = min(RETRY_MAX_SECONDS, _backoff * 2) if _backoff else RETRY_MIN_SECONDS
+    _retry_at = time.monotonic() + _backoff
+    if _healthy or not _verified:
+        logger.warning(f"Redis连接失败，{_backoff:.0f}秒后重试: {error}")
+    _healthy = False
+    _verified = True
+
+
+def _reset_breaker() -> None:
+    global _healthy, _verified, _retry_at, _backoff
+    if not _healthy and _verified:
+        logger.info("Redis连接已恢复")
+    _healthy = True
+    _verified = True
+    _retry_at = 0.0
+    _backoff = 0.0
+
+
+def report_failure(error: Exception) -> None:
+    """调用方在直接使用客户端时遇到连接错误，可通过此函数触发熔断"""
+    if isinstance(error, _CONNECTION_ERRORS):
+        _trip(error)
+
+
+def _ensure_client() -> Optional[redis.Redis]:
+    global redis_pool, _client
+    if _client is None:
+        redis_pool = redis.ConnectionPool.from_url(
+            settings.REDIS_URL,
+            encoding="utf-8",
+            decode_responses=True,
+            socket_connect_timeout=2,  # 连接超时2秒
+            socket_timeout=2,  # 操作超时2秒
+            health_check_interval=30  # 空闲连接复用前检查
+        )
+        # 请求内的 Redis 往返次数计入性能监控
+        from app.services.monitoring_service import instrument_redis_pool
+        instrument_redis_pool(redis_pool)
+        _client = redis.Redis(connection_pool=redis_pool)
+    return _client
+
+
+async def _probe() -> bool:
+    """PING 一次，更新熔断状态"""
+    async with _probe_lock:
+        # 等锁期间其他协程可能已经完成探测
+        if _healthy:
+            return True
+        if _verified and time.monotonic() < _retry_at:
+            return False
+        try:
+            client = _ensure_client()
+            await client.ping()
+            _reset_breaker()
+            return True
+        except Exception as e:
+            _trip(e)
+            return False
+
+
 async def get_redis():
-    """获取Redis连接"""
-    global redis_pool, redis_available
-    
-    if not redis_available:
+    """获取Redis客户端，Redis 不可用（熔断中）时返回 None"""
+    if not settings.REDIS_ENABLED:
+        return None
+    if _healthy:
+        return _client
+    if _verified and time.monotonic() < _retry_at:
         return None
-        
-    if redis_pool is None:
+    # 首次使用或到达重试时间：探测一次
+    if await _probe():
+        return _client
+    return None
+
+
+async def _probe_loop():
+    while True:
+        await asyncio.sleep(PROBE_INTERVAL)
         try:
-            redis_pool = redis.ConnectionPool.from_url(
-                settings.REDIS_URL,
-                encoding="utf-8",
-                decode_responses=True,
-                socket_connect_timeout=2,  # 连接超时2秒
-                socket_timeout=2  # 操作超时2秒
-            )
+            if _healthy:
+                await _client.ping()
+            elif time.monotonic() >= _retry_at:
+                await _probe()
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.warning(f"Redis连接池创建失败: {e}")
-            redis_available = False
-            return None
-    
-    try:
-        r = redis.Redis(connection_pool=redis_pool)
-        # 测试连接
-        await r.ping()
-        return r
-    except Exception as e:
-        logger.warning(f"Redis连接失败: {e}")
-        redis_available = False
-        return None
+            _trip(e)
+
+
+def start_health_probe() -> None:
+    """启动后台健康探测（应用启动时调用）"""
+    global _probe_task
+    if settings.REDIS_ENABLED and (_probe_task is None or _probe_task.done()):
+        _probe_task = asyncio.create_task(_probe_loop())
+
+
+def redis_status() -> dict:
+    """当前连接状态（用于健康检查）"""
+    return {
+        "enabled": settings.REDIS_ENABLED,
+        "healthy": _healthy,
+        "retry_in": round(max(0.0, _retry_at - time.monotonic()), 1) if not _healthy else 0,
+    }
 
 
 async def close_redis():
     """关闭Redis连接"""
-    global redis_pool, redis_available
+    global redis_pool, _client, _probe_task, _healthy, _verified, _retry_at, _backoff
+    if _probe_task is not None:
+        _probe_task.cancel()
+        try:
+            await _probe_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _probe_task = None
+    if _client is not None:
+        try:
+            await _client.aclose()
+        except Exception:
+            pass
+        _client = None
     if redis_pool:
         try:
             await redis_pool.disconnect()
-        except:
+        except Exception:
             pass
         redis_pool = None
-    redis_available = True  # 重置标志，允许下次重试
+    # 重置状态，下次使用时重新连接
+    _healthy, _verified, _retry_at, _backoff = False, False, 0.0, 0.0
+
+
+# ========== 内存备用缓存 ==========
+
+def _memory_get(key: str) -> Optional[str]:
+    data = _memory_cache.get(key)
+    if data:
+        if data.get('expire_at') and data['expire_at'] < datetime.utcnow():
+            del _memory_cache[key]
+            return None
+        return data.get('value')
+    return None
+
+
+def _memory_set(key: str, value: str, expire: Optional[int]) -> None:
+    expire_at = datetime.utcnow() + timedelta(seconds=expire) if expire else None
+    _memory_cache[key] = {
+        'value': value,
+        'expire_at': expire_at
+    }
+
+
+def _memory_incr(key: str, amount: int = 1) -> int:
+    data = _memory_cache[key] if _memory_get(key) is not None else {'value': '0'}
+    new_value = int(data.get('value', 0)) + amount
+    _memory_cache[key] = {'value': str(new_value), 'expire_at': data.get('expire_at')}
+    return new_value
 
 
 class RedisCache:
     """Redis缓存工具类 - 带容错处理，Redis不可用时使用内存缓存"""
-    
+
     @staticmethod
     async def get_client():
         """获取Redis客户端实例（用于高级操作）"""
         return await get_redis()
-    
+
     @staticmethod
     async def get(key: str) -> Optional[str]:
         """获取缓存"""
@@ -90,19 +229,14 @@ class RedisCache:
             if r is not None:
                 return await r.get(key)
         except Exception as e:
+            report_failure(e)
             logger.debug(f"Redis get失败: {e}")
-        
+
         # Redis不可用，使用内存缓存
         async with _cache_lock:
             await _cleanup_expired_memory_cache()
-            data = _memory_cache.get(key)
-            if data:
-                if data.get('expire_at') and data['expire_at'] < datetime.utcnow():
-                    del _memory_cache[key]
-                    return None
-                return data.get('value')
-        return None
-    
+            return _memory_get(key)
+
     @staticmethod
     async def set(key: str, value: str, expire: int = 3600) -> bool:
         """设置缓存"""
@@ -112,18 +246,15 @@ class RedisCache:
                 await r.set(key, value, ex=expire)
                 return True
         except Exception as e:
+            report_failure(e)
             logger.debug(f"Redis set失败: {e}")
-        
+
         # Redis不可用，使用内存缓存
         async with _cache_lock:
-            expire_at = datetime.utcnow() + timedelta(seconds=expire) if expire else None
-            _memory_cache[key] = {
-                'value': value,
-                'expire_at': expire_at
-            }
+            _memory_set(key, value, expire)
             logger.debug(f"[MemoryCache] set: {key}, expire: {expire}s")
         return True
-    
+
     @staticmethod
     async def delete(key: str) -> bool:
         """删除缓存"""
@@ -133,14 +264,15 @@ class RedisCache:
                 await r.delete(key)
                 return True
         except Exception as e:
+            report_failure(e)
             logger.debug(f"Redis delete失败: {e}")
-        
+
         # Redis不可用，从内存缓存删除
         async with _cache_lock:
             if key in _memory_cache:
                 del _memory_cache[key]
         return True
-    
+
     @staticmethod
     async def incr(key: str) -> int:
         """自增"""
@@ -149,15 +281,13 @@ class RedisCache:
             if r is not None:
                 return await r.incr(key)
         except Exception as e:
+            report_failure(e)
             logger.debug(f"Redis incr失败: {e}")
-        
+
         # Redis不可用，使用内存缓存
         async with _cache_lock:
-            data = _memory_cache.get(key, {'value': '0'})
-            new_value = int(data.get('value', 0)) + 1
-            _memory_cache[key] = {'value': str(new_value), 'expire_at': data.get('expire_at')}
-            return new_value
-    
+            return _memory_incr(key)
+
     @staticmethod
     async def expire(key: str, seconds: int) -> bool:
         """设置过期时间"""
@@ -167,10 +297,83 @@ class RedisCache:
                 await r.expire(key, seconds)
                 return True
         except Exception as e:
+            report_failure(e)
             logger.debug(f"Redis expire失败: {e}")
-        
+
         # Redis不可用，更新内存缓存过期时间
         async with _cache_lock:
             if key in _memory_cache:
                 _memory_cache[key]['expire_at'] = datetime.utcnow() + timedelta(seconds=seconds)
-        return True
\ No newline at end of file
+        return True
+
+    # ========== 批量操作（一次往返） ==========
+
+    @staticmethod
+    async def get_many(keys: List[str]) -> List[Optional[str]]:
+        """批量获取（MGET），按 keys 顺序返回，不存在的为 None"""
+        if not keys:
+            return []
+        try:
+            r = await get_redis()
+            if r is not None:
+                return await r.mget(keys)
+        except Exception as e:
+            report_failure(e)
+            logger.debug(f"Redis mget失败: {e}")
+
+        async with _cache_lock:
+            return [_memory_get(key) for key in keys]
+
+    @staticmethod
+    async def set_many(mapping: Dict[str, str], expire: int = 3600) -> bool:
+        """批量设置（pipeline SET EX）"""
+        if not mapping:
+            return True
+        try:
+            r = await get_redis()
+            if r is not None:
+                pipe = r.pipeline(transaction=False)
+                for key, value in mapping.items():
+                    pipe.set(key, value, ex=expire)
+                await pipe.execute()
+                return True
+        except Exception as e:
+            report_failure(e)
+            logger.debug(f"Redis 批量set失败: {e}")
+
+        async with _cache_lock:
+            for key, value in mapping.items():
+                _memory_set(key, value, expire)
+        return True
+
+    @staticmethod
+    async def incr_many(keys: Iterable[str], amount: int = 1, expire: Optional[int] = None) -> List[int]:
+        """
+        批量自增（pipeline INCRBY），返回自增后的值
+
+        指定 expire 时同时刷新这些键的过期时间
+        """
+        keys = list(keys)
+        if not keys:
+            return []
+        try:
+            r = await get_redis()
+            if r is not None:
+                pipe = r.pipeline(transaction=False)
+                for key in keys:
+                    pipe.incrby(key, amount)
+                    if expire:
+                        pipe.expire(key, expire)
+                results = await pipe.execute()
+                return [int(v) for v in (results[::2] if expire else results)]
+        except Exception as e:
+            report_failure(e)
+            logger.debug(f"Redis 批量incr失败: {e}")
+
+        async with _cache_lock:
+            values = []
+            for key in keys:
+                values.append(_memory_incr(key, amount))
+                if expire:
+                    _memory_cache[key]['expire_at'] = datetime.utcnow() + timedelta(seconds=expire)
+            return values
@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from typing import Optional, Union
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from starlette.requests import Request
 from app.core.config import settings
 
 # 密码加密上下文
@@ -51,6 +52,16 @@ def decode_token(token: str) -> Optional[dict]:
         return None
 
 
+def decode_request_token(request: Request, token: str) -> Optional[dict]:
+    """解码请求携带的令牌，同一请求内只解码一次（结果缓存在 request.state，限流中间件和认证依赖共用）"""
+    cached = getattr(request.state, "token_payload", None)
+    if cached is not None and cached[0] == token:
+        return cached[1]
+    payload = decode_token(token)
+    request.state.token_payload = (token, payload)
+    return payload
+
+
 def generate_invite_code() -> str:
     """生成邀请码"""
     import secrets
@@ -2,7 +2,7 @@
 JWT令牌黑名单管理
 用于实现令牌撤销功能（登出、踢出设备等）
 """
-from typing import Optional
+from typing import Optional, Tuple
 from app.core.redis import RedisCache
 
 
@@ -82,6 +82,27 @@ class TokenBlacklist:
         except Exception:
             return False
     
+    @staticmethod
+    async def check(token: str, user_id: int) -> Tuple[bool, bool]:
+        """
+        一次往返同时检查令牌黑名单和用户黑名单
+        
+        Args:
+            token: JWT令牌
+            user_id: 用户ID
+        
+        Returns:
+            (令牌是否在黑名单中, 用户是否被全局黑名单)
+        """
+        try:
+            token_flag, user_flag = await RedisCache.get_many([
+                f"{TokenBlacklist.PREFIX}{token}",
+                f"{TokenBlacklist.PREFIX}user:{user_id}",
+            ])
+            return token_flag is not None, user_flag is not None
+        except Exception:
+            return False, False
+    
     @staticmethod
     async def remove_user_blacklist(user_id: int) -> bool:
         """
@@ -11,9 +11,10 @@ import time
 import logging
 
 from app.core.config import settings
-from app.core.database import init_db
-from app.core.redis import close_redis
+from app.core.database import engine, init_db
+from app.core.redis import close_redis, start_health_probe, redis_status
 from app.core.rate_limiter import RateLimitMiddleware
+from app.services.monitoring_service import MonitoringMiddleware, instrument_engine, monitor
 from app.api import api_router
 # 确保所有模型在init_db前被导入
 import app.models
@@ -35,46 +36,61 @@ async def lifespan(app: FastAPI):
     await init_db()
     logger.info("Database initialized")
     
-    # 缓存预热
+    # Redis 健康探测（熔断后自动恢复）
+    start_health_probe()
+    
+    # 缓存预热，并订阅其他 worker 的缓存失效消息
     await warm_up_cache()
+    from app.services.cache_service import CacheService
+    CacheService.start_listener()
+    
+    # 客服聊天：订阅其他 worker 投递的消息，续期在线状态
+    from app.api.chat import manager as chat_manager
+    chat_manager.start()
     
     # 启动定时任务
     from app.services.scheduled_tasks import ScheduledTasks
     await ScheduledTasks.start()
     logger.info("Scheduled tasks started")
     
+    # 多 worker 时定期写性能指标快照，供导出接口合并
+    monitor.start_exporter()
+    
     yield
     
     # 关闭时
     logger.info("Shutting down...")
     from app.services.scheduled_tasks import ScheduledTasks
     await ScheduledTasks.stop()
+    from app.services.cache_service import CacheService
+    await CacheService.stop_listener()
+    from app.api.chat import manager as chat_manager, message_batcher
+    await chat_manager.stop()
+    await message_batcher.close()
+    await monitor.stop_exporter()
     await close_redis()
     logger.info("Service closed")
 
 
 async def warm_up_cache():
     """缓存预热 - 启动时预加载常用数据"""
-    from app.core.database import AsyncSessionLocal
-    
     try:
-        async with AsyncSessionLocal() as db:
-            from app.api.home import (
-                get_cached_categories,
-                get_cached_func_entries,
-                get_cached_announcements,
-                get_cached_site_settings,
-                get_cached_banners
-            )
-            
-            # 预热首页静态数据
-            await get_cached_site_settings()
-            await get_cached_categories(db)
-            await get_cached_func_entries(db)
-            await get_cached_announcements(db)
-            await get_cached_banners(db, "home")
-            
-            logger.info("Cache warmed up successfully")
+        from app.api.home import (
+            get_cached_categories,
+            get_cached_func_entries,
+            get_cached_announcements,
+            get_cached_site_settings,
+            get_cached_banners
+        )
+        
+        # 预热首页静态数据
+        await get_cached_site_settings()
+        await get_cached_categories()
+        await get_cached_func_entries()
+        await get_cached_announcements()
+        await get_cached_banners("home")
+        
+        logger.info("Cache warmed up successfully")
     except Exception as e:
         # 缓存预热失败不影响启动
         logger.warning(f"Cache warm-up failed (non-critical): {e}")
@@ -98,7 +114,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
     allow_headers=["*"],
-    expose_headers=["X-Process-Time", "X-Request-ID"],
+    expose_headers=["X-Process-Time", "X-Request-ID", "X-Next-Cursor"],
 )
 
 # GZip 压缩中间件
@@ -148,6 +164,11 @@ async def add_security_headers(request: Request, call_next):
     return response
 
 
+# 性能监控中间件（最外层，按路由模板统计延迟、SQL 条数和 Redis 往返）
+app.add_middleware(MonitoringMiddleware)
+instrument_engine(engine)
+
+
 # 全局异常处理
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -188,7 +209,7 @@ async def root():
 @app.get("/api/health")
 async def health():
     """健康检查端点"""
-    return {"status": "healthy", "version": settings.APP_VERSION}
+    return {"status": "healthy", "version": settings.APP_VERSION, "redis": redis_status()}
 
 
 if __name__ == "__main__":
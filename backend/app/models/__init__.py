@@ -38,7 +38,8 @@ from app.models.referral import (
 )
 from app.models.statistics import (
     UserBehaviorLog, VideoDailyStats, DailyRevenueReport, 
-    UserRetentionStats, CreatorDailyStats, PlatformDailyStats
+    UserRetentionStats, CreatorDailyStats, PlatformDailyStats,
+    HourlyStats, UserDailyActivity
 )
 from app.models.report import Report, ReportCategory
 from app.models.watermark import WatermarkConfig as WatermarkConfigModel
@@ -48,6 +49,8 @@ from app.models.content import Banner, Notice, NoticeRead
 from app.models.vip import VipCard, VipPrivilege, VipPurchaseRecord
 from app.models.chat import ChatSession, ChatMessage, QuickReply
 from app.models.darkweb import DarkwebCategory, DarkwebTag, DarkwebVideo, DarkwebView
+from app.models.notification import NotificationInboxItem, NotificationCounter
+from app.models.search import SearchDocument, SearchPosting, SearchSuggestion
 
 __all__ = [
     "User", "UserVIP", "LoginQRToken", "TrustedDevice", "DeviceSwitchLog",
@@ -81,5 +84,9 @@ __all__ = [
     # 客服聊天
     "ChatSession", "ChatMessage", "QuickReply",
     # 暗网视频专区
-    "DarkwebCategory", "DarkwebTag", "DarkwebVideo", "DarkwebView"
+    "DarkwebCategory", "DarkwebTag", "DarkwebVideo", "DarkwebView",
+    # 通知收件箱
+    "NotificationInboxItem", "NotificationCounter",
+    # 全文搜索
+    "SearchDocument", "SearchPosting", "SearchSuggestion"
 ]
\ No newline at end of file
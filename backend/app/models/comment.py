@@ -16,6 +16,8 @@ class Comment(Base):
         Index('idx_comment_video_hidden', 'video_id', 'is_hidden'),
         Index('idx_comment_user_created', 'user_id', 'created_at'),
         Index('idx_comment_parent_id', 'parent_id'),
+        # 评论楼层：顶级评论按时间翻页
+        Index('idx_comment_thread', 'video_id', 'parent_id', 'created_at'),
     )
     
     id = Column(Integer, primary_key=True, index=True)
@@ -103,6 +103,7 @@ class PostComment(Base):
         Index('idx_comment_user_created', 'user_id', 'created_at'),
         Index('idx_comment_parent_id', 'parent_id'),
         Index('idx_comment_status', 'status'),
+        Index('idx_post_comment_thread', 'post_id', 'parent_id', 'created_at'),
     )
 
 
@@ -356,6 +357,11 @@ class GalleryComment(Base):
     gallery = relationship("Gallery", backref="comments")
     user = relationship("User", backref="gallery_comments")
     parent = relationship("GalleryComment", remote_side=[id], backref="replies")
+    
+    __table_args__ = (
+        Index('idx_gallery_comment_thread', 'gallery_id', 'parent_id', 'created_at'),
+        Index('idx_gallery_comment_parent', 'parent_id', 'created_at'),
+    )
 
 
 class GalleryLike(Base):
@@ -482,6 +488,11 @@ class NovelComment(Base):
     novel = relationship("Novel", backref="comments")
     user = relationship("User", backref="novel_comments")
     parent = relationship("NovelComment", remote_side=[id], backref="replies")
+    
+    __table_args__ = (
+        Index('idx_novel_comment_thread', 'novel_id', 'parent_id', 'created_at'),
+        Index('idx_novel_comment_parent', 'parent_id', 'created_at'),
+    )
 
 
 class NovelCommentLike(Base):
@@ -0,0 +1,54 @@
+"""
+通知收件箱数据模型（写时扇出）
+"""
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, UniqueConstraint
+
+from app.core.database import Base
+
+
+class NotificationInboxItem(Base):
+    """通知收件箱：评论/回复/点赞发生时写入接收者的收件箱，读取时按 (user_id, category, id) 倒序扫描"""
+    __tablename__ = "notification_inbox"
+    __table_args__ = (
+        # 收件箱列表（keyset 分页）
+        Index('idx_inbox_user_category_id', 'user_id', 'category', 'id'),
+        # 同一来源对同一接收者只通知一次；取消点赞/删除评论时按来源撤回
+        UniqueConstraint('source_type', 'source_id', 'user_id', name='uq_inbox_source_user'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)   # 接收者
+    actor_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)  # 触发者
+
+    category = Column(String(10), nullable=False)           # comment/like（对应两个通知列表）
+    notification_type = Column(String(10), nullable=False)  # comment/reply/like
+
+    source_type = Column(String(30), nullable=False)        # video_comment/post_like/... 产生通知的记录
+    source_id = Column(Integer, nullable=False)
+
+    target_type = Column(String(20))                        # video/short/post/gallery/video_comment/...
+    target_id = Column(Integer)
+    target_title = Column(String(200))
+    content = Column(String(100))                           # 评论内容摘要
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class NotificationCounter(Base):
+    """通知计数：写入/撤回/标记已读时增量维护，读取为主键查询"""
+    __tablename__ = "notification_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+
+    comment_total = Column(Integer, default=0, nullable=False)
+    comment_unread = Column(Integer, default=0, nullable=False)
+    comment_read_id = Column(Integer, default=0, nullable=False)   # 已读游标：收件箱 id 不大于它的视为已读
+
+    like_total = Column(Integer, default=0, nullable=False)
+    like_unread = Column(Integer, default=0, nullable=False)
+    like_read_id = Column(Integer, default=0, nullable=False)
+
+    private_unread = Column(Integer, default=0, nullable=False)    # 私信未读（各会话未读数之和）
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
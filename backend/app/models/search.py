@@ -0,0 +1,48 @@
+"""
+全文搜索倒排索引数据模型
+"""
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, ForeignKey, Index, UniqueConstraint
+
+from app.core.database import Base
+
+
+class SearchDocument(Base):
+    """已索引的文档（视频/帖子/小说/图集），只收录对外可见的内容"""
+    __tablename__ = "search_documents"
+    __table_args__ = (
+        UniqueConstraint('doc_type', 'doc_id', name='uq_search_document'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    doc_type = Column(String(20), nullable=False)   # video/post/novel/gallery
+    doc_id = Column(Integer, nullable=False)        # 源表主键
+    title = Column(String(200), nullable=False)
+
+    boost = Column(Float, default=1.0, nullable=False)  # 热度加权：1 + w * ln(1 + 热度)
+    keywords = Column(Text, nullable=True)          # 贡献给联想词表的关键词（换行分隔），撤销时按此扣减
+    content_hash = Column(String(40), nullable=True)  # 被索引内容（标题/标签/正文）的摘要，对账时判断是否需要重建倒排
+
+    source_updated_at = Column(DateTime, nullable=True)  # 索引时源记录的 updated_at，对账时比较
+    indexed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SearchPosting(Base):
+    """倒排表：词项 -> 文档，主键 (term, document_id) 即按词项聚簇的索引"""
+    __tablename__ = "search_postings"
+    __table_args__ = (
+        Index('idx_search_posting_document', 'document_id'),
+    )
+
+    term = Column(String(32), primary_key=True)
+    document_id = Column(Integer, ForeignKey("search_documents.id", ondelete="CASCADE"), primary_key=True)
+    weight = Column(Integer, nullable=False, default=1)  # 命中字段权重之和（标题 > 标签 > 简介）
+
+
+class SearchSuggestion(Base):
+    """搜索联想词：标题和标签归一化后的关键词，按前缀范围扫描主键"""
+    __tablename__ = "search_suggestions"
+
+    keyword = Column(String(100), primary_key=True)
+    doc_count = Column(Integer, nullable=False, default=0)  # 含该关键词的文档数
+    weight = Column(Float, nullable=False, default=0)       # 这些文档的 boost 之和，联想排序用
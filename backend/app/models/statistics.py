@@ -3,7 +3,7 @@
 """
 from datetime import datetime, date
 from decimal import Decimal
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Numeric, Text, JSON, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Numeric, Text, JSON, Float, Index
 from sqlalchemy.orm import relationship
 
 from app.core.database import Base
@@ -100,12 +100,13 @@ class UserRetentionStats(Base):
     day_n = Column(Integer, nullable=False)                # 第N天
     
     total_users = Column(Integer, default=0)               # 该群组总用户数
-    retained_users = Column(Integer, default=0)            # 留存用户数
+    retained_users = Column(Integer, default=0)            # 留存用户数（第N天有活跃记录）
     retention_rate = Column(Float)                         # 留存率
     
     created_at = Column(DateTime, default=datetime.utcnow)
     
     __table_args__ = (
+        Index('uq_retention_cohort_day', 'cohort_date', 'day_n', unique=True),
         {'sqlite_autoincrement': True},
     )
 
@@ -157,5 +158,49 @@ class PlatformDailyStats(Base):
     active_creators = Column(Integer, default=0)
     creator_payouts = Column(Integer, default=0)           # 创作者提现(金币)
     
+    # 当日快照（只在当天汇总时刷新）
+    vip_users = Column(Integer, default=0)                 # 有效VIP数
+    published_videos = Column(Integer, default=0)          # 已发布视频数
+    
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class HourlyStats(Base):
+    """平台每小时统计（可加和的指标，按 UTC 整点汇总）"""
+    __tablename__ = "hourly_stats"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    stat_hour = Column(DateTime, unique=True, nullable=False)  # 整点（UTC）
+    
+    new_users = Column(Integer, default=0)
+    active_users = Column(Integer, default=0)              # 该小时有活跃记录的用户数
+    new_videos = Column(Integer, default=0)
+    new_comments = Column(Integer, default=0)
+    views = Column(Integer, default=0)
+    
+    recharge_amount = Column(Numeric(12, 2), default=0)    # 充值金额
+    recharge_orders = Column(Integer, default=0)
+    payment_amount = Column(Numeric(12, 2), default=0)     # VIP支付金额
+    payment_orders = Column(Integer, default=0)
+    tip_coins = Column(Integer, default=0)                 # 打赏(金币)
+    tip_count = Column(Integer, default=0)
+    purchase_coins = Column(Integer, default=0)            # 视频购买(金币)
+    purchase_count = Column(Integer, default=0)
+    withdrawal_amount = Column(Numeric(12, 2), default=0)  # 创作者提现(元)
+    withdrawal_coins = Column(Integer, default=0)
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UserDailyActivity(Base):
+    """用户每日活跃记录（日活、月活和留存的依据）"""
+    __tablename__ = "user_daily_activity"
+    
+    activity_date = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    
+    __table_args__ = (
+        Index('idx_daily_activity_user', 'user_id', 'activity_date'),
+    )
 
@@ -49,6 +49,8 @@ class CommentListResponse(BaseModel):
     total: int
     page: int
     page_size: int
+    next_cursor: Optional[str] = None  # 下一页游标（无更多时为空）
+    has_more: bool = False
 
 
 
@@ -69,6 +69,8 @@ class VideoListResponse(BaseModel):
     total: int
     page: int
     page_size: int
+    next_cursor: Optional[str] = None  # 游标分页：下一页游标，没有更多时为空
+    has_more: bool = False
 
 
 # 分类
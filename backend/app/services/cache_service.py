@@ -1,14 +1,134 @@
 """
 缓存服务 - 提供高性能数据缓存
+
+两级缓存：
+- 一级：进程内 LRU/TTL 缓存（LocalCache），命中时不访问 Redis、不做 JSON 解析
+- 二级：Redis（RedisCache，不可用时为其内存备用缓存）
+
+get_or_load 额外提供：
+- 单飞（single-flight）：同一个冷键并发请求只执行一次加载，
+  跨进程通过 Redis 锁协调，其他进程等待结果写入 Redis
+- 过期后短时间内返回旧值并在后台刷新（stale-while-revalidate）
+
+写入/删除通过 Redis pub/sub 广播，其他 worker 收到后清除自己的一级缓存。
 """
+import asyncio
+import fnmatch
 import json
-from typing import Optional, List, Any, Callable
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, List, Any, Callable, Awaitable, Dict, Tuple
 from functools import wraps
 from datetime import datetime
 import hashlib
 
 from app.core.redis import RedisCache
 
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LocalCache:
+    """进程内 LRU/TTL 缓存，按条目数和估算字节数限制容量"""
+
+    def __init__(self, max_entries: int = 4096, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # 键 -> (值, 字节数, 新鲜截止时间, 可返回旧值的截止时间)
+        self._entries: "OrderedDict[str, Tuple[Any, int, float, float]]" = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Tuple[Any, bool]:
+        """返回 (值, 是否新鲜)，不存在或已超过旧值期限时返回 (_MISSING, False)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING, False
+        value, _, fresh_until, stale_until = entry
+        now = time.monotonic()
+        if now >= stale_until:
+            self.delete(key)
+            return _MISSING, False
+        self._entries.move_to_end(key)
+        return value, now < fresh_until
+
+    def set(self, key: str, value: Any, size: int, ttl: float, stale_ttl: float = 0) -> None:
+        if size > self.max_bytes:
+            return
+        self.delete(key)
+        now = time.monotonic()
+        self._entries[key] = (value, size, now + ttl, now + ttl + stale_ttl)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, old_size, _, _) = self._entries.popitem(last=False)
+            self.bytes -= old_size
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def delete_pattern(self, pattern: str) -> int:
+        keys = [k for k in self._entries if fnmatch.fnmatchcase(k, pattern)]
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+
+class CacheStats:
+    """缓存命中/耗时计数"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.local_hits = 0
+        self.remote_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.remote_time_ms = 0.0
+        self.load_time_ms = 0.0
+        self.max_load_ms = 0.0
+
+    def record_load(self, elapsed_ms: float) -> None:
+        self.loads += 1
+        self.load_time_ms += elapsed_ms
+        self.max_load_ms = max(self.max_load_ms, elapsed_ms)
+
+    def snapshot(self, local: LocalCache) -> dict:
+        lookups = self.local_hits + self.stale_hits + self.remote_hits + self.misses
+        remote_lookups = self.remote_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "stale_hits": self.stale_hits,
+            "remote_hits": self.remote_hits,
+            "misses": self.misses,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0,
+            "coalesced": self.coalesced,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "avg_remote_ms": round(self.remote_time_ms / remote_lookups, 3) if remote_lookups else 0,
+            "avg_load_ms": round(self.load_time_ms / self.loads, 3) if self.loads else 0,
+            "max_load_ms": round(self.max_load_ms, 3),
+            "local_entries": len(local),
+            "local_bytes": local.bytes,
+            "local_evictions": local.evictions,
+        }
+
 
 class CacheKeys:
     """缓存键定义"""
@@ -55,33 +175,91 @@ class CacheTTL:
 class CacheService:
     """缓存服务"""
     
-    @staticmethod
-    async def get(key: str) -> Optional[Any]:
-        """获取缓存数据"""
-        data = await RedisCache.get(key)
-        if data:
-            try:
-                return json.loads(data)
-            except json.JSONDecodeError:
-                return data
-        return None
+    # 一级缓存最长保留时间：pub/sub 失效消息丢失时，各 worker 最多读到这么久的旧数据
+    LOCAL_MAX_TTL = 30
+    # 失效广播频道
+    INVALIDATE_CHANNEL = "cache:invalidate"
+    # 跨进程加载锁的超时时间，以及等待其他进程加载结果的最长时间
+    LOAD_LOCK_TTL = 10
+    LOAD_WAIT_SECONDS = 2.0
+    
+    _local = LocalCache()
+    _stats = CacheStats()
+    _inflight: Dict[str, asyncio.Future] = {}
+    _background: set = set()
+    _origin = uuid.uuid4().hex
+    _listener: Optional[asyncio.Task] = None
+    
+    # ========== 基础读写 ==========
     
     @staticmethod
-    async def set(key: str, value: Any, ttl: int = CacheTTL.MEDIUM) -> bool:
+    def _decode(data: str) -> Any:
+        try:
+            return json.loads(data)
+        except (TypeError, json.JSONDecodeError):
+            return data
+    
+    @classmethod
+    def _remember(cls, key: str, value: Any, size: int, ttl: int, stale_ttl: int = 0) -> None:
+        cls._local.set(key, value, size, min(ttl, cls.LOCAL_MAX_TTL), stale_ttl)
+    
+    @classmethod
+    async def _get_remote(cls, key: str, stale_ttl: int = 0) -> Any:
+        """读取二级缓存并回填一级缓存，未命中返回 _MISSING"""
+        start = time.perf_counter()
+        data = await RedisCache.get(key)
+        cls._stats.remote_time_ms += (time.perf_counter() - start) * 1000
+        if not data:
+            return _MISSING
+        value = cls._decode(data)
+        cls._remember(key, value, len(data), cls.LOCAL_MAX_TTL, stale_ttl)
+        return value
+    
+    @classmethod
+    async def get(cls, key: str) -> Optional[Any]:
+        """
+        获取缓存数据
+        
+        一级缓存命中时返回的是共享对象，调用方不要原地修改
+        """
+        value, fresh = cls._local.get(key)
+        if value is not _MISSING and fresh:
+            cls._stats.local_hits += 1
+            return value
+        
+        value = await cls._get_remote(key)
+        if value is _MISSING:
+            cls._stats.misses += 1
+            return None
+        cls._stats.remote_hits += 1
+        return value
+    
+    @classmethod
+    async def set(cls, key: str, value: Any, ttl: int = CacheTTL.MEDIUM, stale_ttl: int = 0) -> bool:
         """设置缓存数据"""
+        data = value
         if isinstance(value, (dict, list)):
-            value = json.dumps(value, ensure_ascii=False, default=str)
-        return await RedisCache.set(key, value, ttl)
-    
-    @staticmethod
-    async def delete(key: str) -> bool:
+            data = json.dumps(value, ensure_ascii=False, default=str)
+        result = await RedisCache.set(key, data, ttl)
+        # 一级缓存保存反序列化后的副本，与从 Redis 读到的结果一致，且不受调用方后续修改影响
+        text = data if isinstance(data, str) else str(data)
+        cls._remember(key, cls._decode(text), len(text), ttl, stale_ttl)
+        await cls._publish(keys=[key])
+        return result
+    
+    @classmethod
+    async def delete(cls, key: str) -> bool:
         """删除缓存"""
-        return await RedisCache.delete(key)
+        cls._local.delete(key)
+        result = await RedisCache.delete(key)
+        await cls._publish(keys=[key])
+        return result
     
-    @staticmethod
-    async def delete_pattern(pattern: str) -> int:
+    @classmethod
+    async def delete_pattern(cls, pattern: str) -> int:
         """删除匹配模式的缓存（使用 SCAN + DEL）"""
-        from app.core.redis import RedisCache
+        cls._local.delete_pattern(pattern)
+        await cls._publish(patterns=[pattern])
         
         count = 0
         try:
@@ -103,6 +281,206 @@ class CacheService:
         
         return count
     
+    # ========== 单飞加载 ==========
+    
+    @classmethod
+    async def get_or_load(
+        cls,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: int = CacheTTL.MEDIUM,
+        stale_ttl: int = 0,
+        skip_none: bool = True
+    ) -> Any:
+        """
+        读取缓存，未命中时调用 loader 加载并写入
+        
+        - 同一个键并发未命中时只执行一次 loader，其余请求等待结果
+        - stale_ttl > 0 时，一级缓存过期后的 stale_ttl 秒内直接返回旧值并在后台刷新；
+          此时 loader 会在请求结束后执行，不能依赖请求内的数据库会话
+        """
+        value, fresh = cls._local.get(key)
+        if value is not _MISSING:
+            if fresh:
+                cls._stats.local_hits += 1
+                return value
+            if stale_ttl:
+                cls._stats.stale_hits += 1
+                cls._refresh_in_background(key, loader, ttl, stale_ttl, skip_none)
+                return value
+        
+        value = await cls._get_remote(key, stale_ttl)
+        if value is not _MISSING:
+            cls._stats.remote_hits += 1
+            return value
+        
+        cls._stats.misses += 1
+        return await cls._load_once(key, loader, ttl, stale_ttl, skip_none)
+    
+    @classmethod
+    async def _load_once(cls, key, loader, ttl, stale_ttl, skip_none) -> Any:
+        future = cls._inflight.get(key)
+        if future is not None:
+            cls._stats.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # 执行加载的请求被取消，由当前请求重新加载
+                return await cls._load_once(key, loader, ttl, stale_ttl, skip_none)
+        
+        future = asyncio.get_running_loop().create_future()
+        cls._inflight[key] = future
+        try:
+            value = await cls._load_shared(key, loader, ttl, stale_ttl, skip_none)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            cls._inflight.pop(key, None)
+    
+    @classmethod
+    async def _load_shared(cls, key, loader, ttl, stale_ttl, skip_none) -> Any:
+        """跨进程单飞：抢到 Redis 锁的进程加载，其他进程等待结果出现在 Redis 中"""
+        lock_key = f"lock:{key}"
+        r = None
+        try:
+            r = await RedisCache.get_client()
+            if r is not None and not await r.set(lock_key, cls._origin, nx=True, ex=cls.LOAD_LOCK_TTL):
+                deadline = time.monotonic() + cls.LOAD_WAIT_SECONDS
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                    value = await cls._get_remote(key)
+                    if value is not _MISSING:
+                        cls._stats.coalesced += 1
+                        return value
+                r = None  # 等待超时，自己加载（不持有锁）
+        except Exception as e:
+            logger.debug(f"缓存加载锁不可用: {e}")
+            r = None
+        
+        start = time.perf_counter()
+        try:
+            value = await loader()
+        except Exception:
+            cls._stats.load_errors += 1
+            raise
+        finally:
+            cls._stats.record_load((time.perf_counter() - start) * 1000)
+            if r is not None:
+                try:
+                    await r.delete(lock_key)
+                except Exception:
+                    pass
+        
+        if value is not None or not skip_none:
+            await cls.set(key, value, ttl, stale_ttl)
+        return value
+    
+    @classmethod
+    def _refresh_in_background(cls, key, loader, ttl, stale_ttl, skip_none) -> None:
+        if key in cls._inflight:
+            return
+        
+        async def refresh():
+            # 其他进程可能已经刷新过二级缓存
+            if await cls._get_remote(key, stale_ttl) is _MISSING:
+                await cls._load_once(key, loader, ttl, stale_ttl, skip_none)
+        
+        task = asyncio.create_task(refresh())
+        cls._background.add(task)
+        task.add_done_callback(cls._on_refresh_done)
+    
+    @classmethod
+    def _on_refresh_done(cls, task: asyncio.Task) -> None:
+        cls._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"缓存后台刷新失败: {task.exception()}")
+    
+    # ========== 跨进程失效 ==========
+    
+    @classmethod
+    async def _publish(cls, keys: Optional[List[str]] = None, patterns: Optional[List[str]] = None) -> None:
+        try:
+            r = await RedisCache.get_client()
+            if r is not None:
+                message = {"o": cls._origin, "k": keys or [], "p": patterns or []}
+                await r.publish(cls.INVALIDATE_CHANNEL, json.dumps(message))
+        except Exception as e:
+            logger.debug(f"缓存失效广播失败: {e}")
+    
+    @classmethod
+    def handle_invalidation(cls, raw: str) -> None:
+        """处理其他 worker 发来的失效消息"""
+        try:
+            message = json.loads(raw)
+        except (TypeError, ValueError):
+            return
+        if message.get("o") == cls._origin:
+            return
+        for key in message.get("k", []):
+            cls._local.delete(key)
+        for pattern in message.get("p", []):
+            cls._local.delete_pattern(pattern)
+    
+    @classmethod
+    async def _listen(cls) -> None:
+        while True:
+            try:
+                r = await RedisCache.get_client()
+                if r is None:
+                    await asyncio.sleep(30)
+                    continue
+                pubsub = r.pubsub()
+                await pubsub.subscribe(cls.INVALIDATE_CHANNEL)
+                try:
+                    # 订阅期间可能漏掉了失效消息
+                    cls._local.clear()
+                    async for message in pubsub.listen():
+                        if message.get("type") == "message":
+                            cls.handle_invalidation(message.get("data"))
+                finally:
+                    await pubsub.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"缓存失效订阅中断，稍后重连: {e}")
+                await asyncio.sleep(5)
+    
+    @classmethod
+    def start_listener(cls) -> None:
+        """启动失效消息订阅（应用启动时调用）"""
+        if cls._listener is None or cls._listener.done():
+            cls._listener = asyncio.create_task(cls._listen())
+    
+    @classmethod
+    async def stop_listener(cls) -> None:
+        if cls._listener is not None:
+            cls._listener.cancel()
+            try:
+                await cls._listener
+            except asyncio.CancelledError:
+                pass
+            cls._listener = None
+    
+    @classmethod
+    def get_stats(cls) -> dict:
+        """命中率、加载耗时、一级缓存占用"""
+        return cls._stats.snapshot(cls._local)
+    
+    @classmethod
+    def reset_stats(cls) -> None:
+        cls._stats.reset()
+    
     # ========== 视频缓存 ==========
     
     @staticmethod
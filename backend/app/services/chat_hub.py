@@ -0,0 +1,431 @@
+"""
+客服聊天消息分发（多 worker）
+
+WebSocket 连接只存在于接入它的 worker 进程内。消息投递分两步：
+- 本进程有目标连接时直接发送
+- 同时发布到 Redis 频道，其他 worker 订阅了自己持有连接的频道，收到后投递给本地连接
+  （chat:user:{id} / chat:agent:{id} 按接收者订阅，chat:agents 为全体客服广播）
+
+在线状态：Redis 有序集合 chat:presence:users / chat:presence:agents，成员为 id、分值为过期时间戳；
+本进程持有的连接每 PRESENCE_TTL/3 秒续期一次，worker 异常退出后其连接在 PRESENCE_TTL 秒内自动下线。
+
+消息持久化：MessageBatcher 合并同一时刻到达的消息，一个事务内批量插入并累加会话计数（组提交）。
+
+Redis 不可用（RedisCache 处于内存缓存模式）时退化为原来的单进程行为。
+"""
+import json
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Callable, Awaitable, Tuple
+
+from fastapi import WebSocket
+from sqlalchemy import update, case, or_
+
+from app.core.database import AsyncSessionLocal
+from app.core.redis import RedisCache, report_failure
+from app.models.chat import ChatSession, ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+class ChatChannels:
+    """Redis 键定义"""
+    AGENTS = "chat:agents"                   # 全体客服广播
+    PRESENCE_USERS = "chat:presence:users"   # ZSet: user_id -> 过期时间戳
+    PRESENCE_AGENTS = "chat:presence:agents"
+
+    @staticmethod
+    def user(user_id: int) -> str:
+        return f"chat:user:{user_id}"
+
+    @staticmethod
+    def agent(agent_id: int) -> str:
+        return f"chat:agent:{agent_id}"
+
+
+class ChatHub:
+    """WebSocket 连接管理 + 跨 worker 投递"""
+
+    # 在线状态有效期（秒）
+    PRESENCE_TTL = 60
+    # 订阅读取的轮询间隔（秒），期间可以增减订阅
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, redis_factory: Callable[[], Awaitable] = RedisCache.get_client):
+        self.redis_factory = redis_factory
+        # user_id -> WebSocket
+        self.user_connections: Dict[int, WebSocket] = {}
+        # agent_id -> WebSocket (客服)
+        self.agent_connections: Dict[int, WebSocket] = {}
+        self.origin = uuid.uuid4().hex
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        # Redis 不可用时的本进程在线状态：(kind, id) -> 过期时间戳
+        self._local_presence: Dict[Tuple[str, int], float] = {}
+
+    # ========== 连接 ==========
+
+    def _channels(self) -> List[str]:
+        channels = [ChatChannels.user(uid) for uid in self.user_connections]
+        channels += [ChatChannels.agent(aid) for aid in self.agent_connections]
+        if self.agent_connections:
+            channels.append(ChatChannels.AGENTS)
+        return channels
+
+    async def _subscribe(self, *channels: str) -> None:
+        if self._pubsub is not None and self._ready.is_set():
+            try:
+                await self._pubsub.subscribe(*channels)
+            except Exception as e:
+                logger.debug(f"聊天频道订阅失败（重连后补订）: {e}")
+
+    async def _unsubscribe(self, *channels: str) -> None:
+        if self._pubsub is not None and self._ready.is_set():
+            try:
+                await self._pubsub.unsubscribe(*channels)
+            except Exception as e:
+                logger.debug(f"聊天频道退订失败: {e}")
+
+    async def connect_user(self, websocket: WebSocket, user_id: int):
+        await websocket.accept()
+        self.user_connections[user_id] = websocket
+        await self._subscribe(ChatChannels.user(user_id))
+        await self.touch(users=[user_id])
+
+    async def connect_agent(self, websocket: WebSocket, agent_id: int):
+        await websocket.accept()
+        first_agent = not self.agent_connections
+        self.agent_connections[agent_id] = websocket
+        channels = [ChatChannels.agent(agent_id)]
+        if first_agent:
+            channels.append(ChatChannels.AGENTS)
+        await self._subscribe(*channels)
+        await self.touch(agents=[agent_id])
+
+    def disconnect_user(self, user_id: int):
+        if self.user_connections.pop(user_id, None) is not None:
+            self._spawn(self._leave("user", user_id))
+
+    def disconnect_agent(self, agent_id: int):
+        if self.agent_connections.pop(agent_id, None) is not None:
+            self._spawn(self._leave("agent", agent_id))
+
+    async def _leave(self, kind: str, member_id: int) -> None:
+        """退订并下线；期间同一 id 已重新接入本进程时不处理"""
+        if kind == "user":
+            if member_id in self.user_connections:
+                return
+            channels = [ChatChannels.user(member_id)]
+            presence_key = ChatChannels.PRESENCE_USERS
+        else:
+            if member_id in self.agent_connections:
+                return
+            channels = [ChatChannels.agent(member_id)]
+            if not self.agent_connections:
+                channels.append(ChatChannels.AGENTS)
+            presence_key = ChatChannels.PRESENCE_AGENTS
+        await self._unsubscribe(*channels)
+        self._local_presence.pop((kind, member_id), None)
+        try:
+            r = await self.redis_factory()
+            if r is not None:
+                await r.zrem(presence_key, member_id)
+        except Exception as e:
+            report_failure(e)
+
+    @staticmethod
+    def _spawn(coro) -> None:
+        try:
+            asyncio.get_running_loop().create_task(coro)
+        except RuntimeError:
+            coro.close()
+
+    # ========== 投递 ==========
+
+    async def _deliver(self, connections: Dict[int, WebSocket], member_id: int,
+                       message: dict, on_error: Callable[[int], None]) -> bool:
+        websocket = connections.get(member_id)
+        if websocket is None:
+            return False
+        try:
+            await websocket.send_json(message)
+            return True
+        except Exception:
+            on_error(member_id)
+            return False
+
+    async def _publish(self, channel: str, message: dict) -> None:
+        """发布给其他 worker（本进程的连接已直接投递，订阅端会忽略本进程发出的消息）"""
+        try:
+            r = await self.redis_factory()
+            if r is not None:
+                await r.publish(channel, json.dumps({"o": self.origin, "m": message}, default=str))
+        except Exception as e:
+            report_failure(e)
+            logger.debug(f"聊天消息发布失败: {e}")
+
+    async def send_to_user(self, user_id: int, message: dict):
+        await self._deliver(self.user_connections, user_id, message, self.disconnect_user)
+        await self._publish(ChatChannels.user(user_id), message)
+
+    async def send_to_agent(self, agent_id: int, message: dict):
+        await self._deliver(self.agent_connections, agent_id, message, self.disconnect_agent)
+        await self._publish(ChatChannels.agent(agent_id), message)
+
+    async def broadcast_to_agents(self, message: dict):
+        """广播消息给所有在线客服（所有 worker）"""
+        await self._broadcast_local(message)
+        await self._publish(ChatChannels.AGENTS, message)
+
+    async def _broadcast_local(self, message: dict):
+        for agent_id in list(self.agent_connections.keys()):
+            await self._deliver(self.agent_connections, agent_id, message, self.disconnect_agent)
+
+    async def handle_message(self, channel: str, raw: str) -> None:
+        """处理其他 worker 发布的消息"""
+        try:
+            envelope = json.loads(raw)
+        except (TypeError, ValueError):
+            return
+        if envelope.get("o") == self.origin:
+            return
+        message = envelope.get("m")
+        if channel == ChatChannels.AGENTS:
+            await self._broadcast_local(message)
+        elif channel.startswith("chat:user:"):
+            await self._deliver(self.user_connections, int(channel.rsplit(":", 1)[1]), message,
+                                self.disconnect_user)
+        elif channel.startswith("chat:agent:"):
+            await self._deliver(self.agent_connections, int(channel.rsplit(":", 1)[1]), message,
+                                self.disconnect_agent)
+
+    # ========== 订阅 ==========
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                r = await self.redis_factory()
+                if r is None:
+                    await asyncio.sleep(30)
+                    continue
+                self._pubsub = r.pubsub(ignore_subscribe_messages=True)
+                # 本进程专用频道保证连接始终处于订阅状态
+                await self._pubsub.subscribe(f"chat:worker:{self.origin}", *self._channels())
+                self._ready.set()
+                try:
+                    while True:
+                        message = await self._pubsub.get_message(timeout=self.POLL_INTERVAL)
+                        if message and message.get("type") == "message":
+                            await self.handle_message(message["channel"], message["data"])
+                finally:
+                    self._ready.clear()
+                    pubsub, self._pubsub = self._pubsub, None
+                    await pubsub.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                report_failure(e)
+                logger.warning(f"聊天消息订阅中断，稍后重连: {e}")
+                await asyncio.sleep(5)
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.PRESENCE_TTL / 3)
+            try:
+                await self.touch(users=list(self.user_connections), agents=list(self.agent_connections))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"在线状态续期失败: {e}")
+
+    def start(self) -> None:
+        """启动订阅与在线状态续期（应用启动时调用）"""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def wait_ready(self, timeout: float = 5.0) -> bool:
+        """等待订阅建立（测试/压测用）"""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self) -> None:
+        for task in (self._listener, self._heartbeat):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._listener = self._heartbeat = None
+
+    # ========== 在线状态 ==========
+
+    async def touch(self, users: List[int] = (), agents: List[int] = ()) -> None:
+        """续期在线状态（连接建立、心跳时调用）"""
+        if not users and not agents:
+            return
+        now = time.time()
+        expires = now + self.PRESENCE_TTL
+        for kind, ids in (("user", users), ("agent", agents)):
+            for member_id in ids:
+                self._local_presence[(kind, member_id)] = expires
+        try:
+            r = await self.redis_factory()
+            if r is None:
+                return
+            pipe = r.pipeline(transaction=False)
+            for key, ids in ((ChatChannels.PRESENCE_USERS, users), (ChatChannels.PRESENCE_AGENTS, agents)):
+                if ids:
+                    pipe.zadd(key, {str(member_id): expires for member_id in ids})
+                    pipe.zremrangebyscore(key, "-inf", now)
+            await pipe.execute()
+        except Exception as e:
+            report_failure(e)
+
+    async def _online(self, key: str, kind: str, ids: Optional[List[int]]) -> Set[int]:
+        now = time.time()
+        try:
+            r = await self.redis_factory()
+            if r is not None:
+                if ids is None:
+                    members = await r.zrangebyscore(key, now, "+inf")
+                    return {int(m) for m in members}
+                if not ids:
+                    return set()
+                scores = await r.zmscore(key, [str(i) for i in ids])
+                return {i for i, score in zip(ids, scores) if score is not None and score > now}
+        except Exception as e:
+            report_failure(e)
+        return {
+            member_id for (k, member_id), expires in self._local_presence.items()
+            if k == kind and expires > now and (ids is None or member_id in ids)
+        }
+
+    async def online_agents(self) -> Set[int]:
+        """所有 worker 上在线的客服"""
+        return await self._online(ChatChannels.PRESENCE_AGENTS, "agent", None)
+
+    async def online_users(self, user_ids: List[int]) -> Set[int]:
+        """给定用户中在线的（任意 worker）"""
+        return await self._online(ChatChannels.PRESENCE_USERS, "user", list(user_ids))
+
+
+class MessageBatcher:
+    """
+    聊天消息组提交：同一时刻到达的消息合并到一个事务里插入，并按会话累加未读数
+    空闲时第一条消息立即写入；写入期间到达的消息排队，等上一批提交后一起写
+    整批写入失败时逐条重试，一条坏消息不会连累同批的其他消息
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, max_batch: int = 200):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._busy = False
+        self.batches = 0
+
+    async def save(self, session_id: int, sender_id: int, is_from_user: bool, content: str,
+                   message_type: str = "text") -> ChatMessage:
+        """写入一条消息，返回已提交的 ChatMessage（含 id、created_at）"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(({
+            "session_id": session_id,
+            "sender_id": sender_id,
+            "is_from_user": is_from_user,
+            "content": content,
+            "message_type": message_type,
+        }, future))
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            if not self._pending:
+                self._wakeup.clear()
+            if batch:
+                self._busy = True
+                try:
+                    await self._flush(batch)
+                finally:
+                    self._busy = False
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]) -> None:
+        try:
+            messages = await self._write([fields for fields, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"聊天消息写入失败: {e}")
+                _, future = batch[0]
+                if not future.done():
+                    future.set_exception(e)
+                return
+            # 整批回滚后逐条重写，只有出错的那条消息返回异常
+            logger.warning(f"聊天消息批量写入失败，逐条重试 {len(batch)} 条: {e}")
+            for item in batch:
+                await self._flush([item])
+            return
+
+        for message, (_, future) in zip(messages, batch):
+            if not future.done():
+                future.set_result(message)
+
+    async def _write(self, rows: List[dict]) -> List[ChatMessage]:
+        """在一个事务里插入消息并累加会话未读数，返回已提交的消息"""
+        # 会话 -> [用户消息数, 客服消息数, 用户第一条消息（用作标题）]
+        sessions: Dict[int, list] = {}
+        for fields in rows:
+            counts = sessions.setdefault(fields["session_id"], [0, 0, None])
+            if fields["is_from_user"]:
+                counts[0] += 1
+                counts[2] = counts[2] or (fields["content"] or "")[:50] or None
+            else:
+                counts[1] += 1
+
+        async with self.session_factory() as db:
+            messages = [ChatMessage(**fields) for fields in rows]
+            db.add_all(messages)
+            now = datetime.utcnow()
+            for session_id, (from_user, from_agent, title) in sessions.items():
+                values = {
+                    "updated_at": now,
+                    "unread_count": ChatSession.unread_count + from_user,
+                    "user_unread_count": ChatSession.user_unread_count + from_agent,
+                }
+                if title:
+                    values["title"] = case(
+                        (or_(ChatSession.title.is_(None), ChatSession.title == ""), title),
+                        else_=ChatSession.title,
+                    )
+                await db.execute(update(ChatSession).where(ChatSession.id == session_id).values(**values))
+            await db.commit()
+        self.batches += 1
+        return messages
+
+    async def close(self) -> None:
+        """等待排队的消息写完后停止"""
+        while self._pending or self._busy:
+            await asyncio.sleep(0.01)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
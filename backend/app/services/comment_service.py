@@ -5,13 +5,12 @@
 from typing import Optional, List, Dict, Set, Any
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select
 
 from app.models.user import User, UserVIP
 from app.models.comment import Comment, CommentLike
-from app.models.video import Video
 from app.schemas.comment import CommentResponse
+from app.services.comment_threads import CommentThreads
 
 
 class CommentService:
@@ -210,109 +209,48 @@ class CommentService:
             current_user_id: 当前用户ID（用于判断点赞状态）
             
         Returns:
-            {"items": [...], "total": int, "page": int, "page_size": int}
+            {"items": [...], "total": int, "page": int, "page_size": int, "next_cursor": str|None}
         """
-        from sqlalchemy import desc
-        
-        # 基础查询：只获取顶级评论，预加载用户关系
-        query = select(Comment).where(
-            Comment.video_id == video_id,
-            Comment.parent_id == None,
-            Comment.is_hidden == False
-        ).options(selectinload(Comment.user))
-        
-        # 统计总数
-        count_query = select(func.count()).select_from(
-            select(Comment.id).where(
-                Comment.video_id == video_id,
-                Comment.parent_id == None,
-                Comment.is_hidden == False
-            ).subquery()
+        # 总数读视频上冗余的评论数；回复一次查询批量取出
+        total = await CommentThreads.comment_count(db, "video", video_id)
+        thread = await CommentThreads.load(
+            db, "video", video_id, sort=sort_by, page=page, page_size=page_size
         )
-        result = await db.execute(count_query)
-        total = result.scalar()
-        
-        # 排序
-        if sort_by == "hottest":
-            query = query.order_by(
-                desc(Comment.is_pinned), 
-                desc(Comment.like_count), 
-                desc(Comment.created_at)
-            )
-        else:
-            query = query.order_by(
-                desc(Comment.is_pinned), 
-                desc(Comment.created_at)
-            )
-        
-        # 分页
-        query = query.offset((page - 1) * page_size).limit(page_size)
-        
-        result = await db.execute(query)
-        comments = result.scalars().all()
         
-        if not comments:
+        if not thread.comments:
             return {"items": [], "total": total, "page": page, "page_size": page_size}
         
-        # 收集所有需要查询的用户ID和评论ID
-        user_ids = set(c.user_id for c in comments)
-        comment_ids = [c.id for c in comments]
-        
-        # 获取有回复的评论的回复（限制3条）
-        reply_map: Dict[int, List[Comment]] = {}
-        comments_with_replies = [c for c in comments if c.reply_count > 0]
-        
-        if comments_with_replies:
-            for parent_id in [c.id for c in comments_with_replies]:
-                reply_result = await db.execute(
-                    select(Comment)
-                    .where(Comment.parent_id == parent_id, Comment.is_hidden == False)
-                    .options(selectinload(Comment.user))
-                    .order_by(Comment.created_at)
-                    .limit(3)
-                )
-                replies = reply_result.scalars().all()
-                reply_map[parent_id] = replies
-                for r in replies:
-                    user_ids.add(r.user_id)
-                    comment_ids.append(r.id)
-        
-        # 批量查询VIP等级
-        vip_map = await CommentService.batch_get_user_vip_levels(db, list(user_ids))
-        
-        # 批量查询点赞状态
+        # 批量查询用户、VIP等级、点赞状态
+        user_ids = thread.user_ids
+        users_result = await db.execute(select(User).where(User.id.in_(user_ids)))
+        users_map = {u.id: u for u in users_result.scalars().all()}
+        vip_map = await CommentService.batch_get_user_vip_levels(db, user_ids)
         liked_ids = set()
         if current_user_id:
             liked_ids = await CommentService.batch_get_liked_comment_ids(
-                db, comment_ids, current_user_id
+                db, thread.comment_ids, current_user_id
             )
         
-        # 构建响应
-        items = []
-        for comment in comments:
-            replies_response = []
-            if comment.id in reply_map:
-                for reply in reply_map[comment.id]:
-                    replies_response.append(CommentService.build_comment_response(
-                        comment=reply,
-                        user=reply.user,
-                        vip_level=vip_map.get(reply.user_id, 0),
-                        is_liked=reply.id in liked_ids
-                    ))
-            
-            items.append(CommentService.build_comment_response(
+        def build(comment: Comment, replies: List[CommentResponse] = None) -> CommentResponse:
+            return CommentService.build_comment_response(
                 comment=comment,
-                user=comment.user,
+                user=users_map.get(comment.user_id),
                 vip_level=vip_map.get(comment.user_id, 0),
                 is_liked=comment.id in liked_ids,
-                replies=replies_response
-            ))
+                replies=replies
+            )
+        
+        items = [
+            build(comment, [build(reply) for reply in thread.replies.get(comment.id, [])])
+            for comment in thread.comments
+        ]
         
         return {
             "items": items,
             "total": total,
             "page": page,
-            "page_size": page_size
+            "page_size": page_size,
+            "next_cursor": thread.next_cursor
         }
     
     # ========== 评论操作方法 ==========
@@ -387,14 +325,9 @@ class CommentService:
         
         comment.is_hidden = True
         
-        # 更新视频评论数
-        if comment.video_id:
-            video_result = await db.execute(
-                select(Video).where(Video.id == comment.video_id)
-            )
-            video = video_result.scalar_one_or_none()
-            if video:
-                video.comment_count = max(0, video.comment_count - 1)
+        # 重新核对视频评论数和父评论回复数
+        await db.flush()
+        await CommentThreads.recount(db, "video", [comment.video_id])
         
         await db.commit()
         return True
@@ -0,0 +1,299 @@
+"""
+评论楼层加载 - 视频/帖子/图集/小说评论共用
+
+- 顶级评论按 最新（created_at, id）/ 最热（like_count, id）键集分页，翻到任意深度都只扫描一页的行；
+  第一页先单独取置顶评论，其余页只在未置顶评论里翻
+- 每条顶级评论的前 K 条回复用一条 ROW_NUMBER() OVER (PARTITION BY parent_id) 查询批量取出，
+  不再按父评论逐条查询
+- 评论总数直接读被评论对象上冗余的 comment_count（回复数读 reply_count），不再每次 COUNT(*)；
+  发表评论时增量维护，管理端隐藏/删除后和定时任务用 recount 按可见评论重新核对
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update, or_, func, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from app.core.query_optimizer import QueryOptimizer, KeysetOrder
+from app.models.comment import Comment
+from app.models.community import Post, PostComment, Gallery, GalleryComment, Novel, NovelComment
+from app.models.video import Video
+
+SORT_NEWEST = "newest"
+SORT_HOTTEST = "hottest"
+REPLY_PREVIEW = 3
+NEXT_CURSOR_HEADER = "X-Next-Cursor"  # 返回列表的接口通过响应头给出下一页游标
+
+
+class CommentKind:
+    """一种评论的表结构"""
+
+    def __init__(self, name: str, model, target, target_column: str, pinned_column: str, visible: Callable):
+        self.name = name
+        self.model = model
+        self.target = target                # 被评论对象（带冗余的 comment_count）
+        self.target_column = target_column  # 评论表上指向被评论对象的列
+        self.pinned_column = pinned_column
+        self.visible = visible              # 评论实体（或别名） -> SQL 条件：对外可见
+
+    def target_id(self, entity=None):
+        return getattr(entity if entity is not None else self.model, self.target_column)
+
+    @property
+    def pinned(self):
+        return getattr(self.model, self.pinned_column)
+
+    def order(self, sort: str) -> KeysetOrder:
+        if sort == SORT_HOTTEST:
+            return KeysetOrder.most_liked(self.model)
+        return KeysetOrder.newest(self.model)
+
+    def reply_order(self) -> KeysetOrder:
+        """回复按时间正序"""
+        return KeysetOrder.of(self.model, "created_at", "id", descending=False)
+
+
+KINDS: Dict[str, CommentKind] = {
+    kind.name: kind for kind in (
+        CommentKind("video", Comment, Video, "video_id", "is_pinned", lambda c: c.is_hidden == False),
+        CommentKind("post", PostComment, Post, "post_id", "is_top", lambda c: c.status == "visible"),
+        CommentKind("gallery", GalleryComment, Gallery, "gallery_id", "is_pinned", lambda c: c.is_hidden == False),
+        CommentKind("novel", NovelComment, Novel, "novel_id", "is_pinned", lambda c: c.is_hidden == False),
+    )
+}
+
+
+class CommentThread:
+    """一页评论：顶级评论（或某条评论的回复）、每条的前几条回复、下一页游标"""
+
+    def __init__(self, comments: list, replies: Dict[int, list], next_cursor: Optional[str], has_more: bool):
+        self.comments = comments
+        self.replies = replies
+        self.next_cursor = next_cursor
+        self.has_more = has_more
+
+    def all_comments(self) -> list:
+        """本页出现的全部评论（含回复），用于批量查询用户和点赞状态"""
+        return self.comments + [reply for replies in self.replies.values() for reply in replies]
+
+    @property
+    def user_ids(self) -> List[int]:
+        return list({c.user_id for c in self.all_comments()})
+
+    @property
+    def comment_ids(self) -> List[int]:
+        return [c.id for c in self.all_comments()]
+
+
+class CommentThreads:
+    """评论楼层的分页加载与计数核对"""
+
+    # ==================== 加载 ====================
+
+    @classmethod
+    async def load(
+        cls,
+        db: AsyncSession,
+        kind: str,
+        target_id: int,
+        sort: str = SORT_NEWEST,
+        cursor: Optional[str] = None,
+        page: int = 1,
+        page_size: int = 20,
+        reply_limit: int = REPLY_PREVIEW,
+    ) -> CommentThread:
+        """
+        顶级评论分页 + 每条的前 reply_limit 条回复
+
+        传 cursor 时按游标翻页；否则按页码（第一页走置顶 + 键集，其余页为兼容旧客户端的 OFFSET 分页，
+        同样返回游标）。游标无效时抛出 KeysetCursorError。
+        """
+        spec = KINDS[kind]
+        model = spec.model
+        order = spec.order(sort)
+        query = select(model).where(
+            spec.target_id() == target_id,
+            model.parent_id.is_(None),
+            spec.visible(model),
+        )
+        unpinned = or_(spec.pinned == False, spec.pinned.is_(None))
+
+        if cursor:
+            comments, next_cursor, has_more = await QueryOptimizer.keyset_query(
+                db, query.where(unpinned), order, cursor, page_size
+            )
+        elif page == 1:
+            result = await db.execute(
+                query.where(spec.pinned == True).order_by(*order.order_by()).limit(page_size)
+            )
+            pinned = list(result.scalars().all())
+            comments, next_cursor, has_more = [], None, False
+            if len(pinned) < page_size:
+                comments, next_cursor, has_more = await QueryOptimizer.keyset_query(
+                    db, query.where(unpinned), order, None, page_size - len(pinned)
+                )
+            comments = pinned + comments
+        else:
+            result = await db.execute(
+                query.order_by(spec.pinned.desc(), *order.order_by())
+                .offset((page - 1) * page_size).limit(page_size + 1)
+            )
+            comments = list(result.scalars().all())
+            has_more = len(comments) > page_size
+            comments = comments[:page_size]
+            next_cursor = None
+            if has_more and not getattr(comments[-1], spec.pinned_column):
+                next_cursor = order.encode(comments[-1])
+
+        parent_ids = [c.id for c in comments if (c.reply_count or 0) > 0]
+        replies = await cls.top_replies(db, kind, parent_ids, reply_limit)
+        return CommentThread(comments, replies, next_cursor, has_more)
+
+    @classmethod
+    async def top_replies(
+        cls,
+        db: AsyncSession,
+        kind: str,
+        parent_ids: Iterable[int],
+        limit: int = REPLY_PREVIEW,
+    ) -> Dict[int, list]:
+        """一次查询取出每条父评论最早的 limit 条可见回复，返回 {parent_id: [回复]}"""
+        parent_ids = list(parent_ids)
+        if not parent_ids or limit <= 0:
+            return {}
+        spec = KINDS[kind]
+        model = spec.model
+        rank = func.row_number().over(
+            partition_by=model.parent_id,
+            order_by=(model.created_at, model.id),
+        ).label("reply_rank")
+        ranked = (
+            select(model.id.label("id"), rank)
+            .where(model.parent_id.in_(parent_ids), spec.visible(model))
+            .subquery()
+        )
+        result = await db.execute(
+            select(model)
+            .join(ranked, ranked.c.id == model.id)
+            .where(ranked.c.reply_rank <= limit)
+            .order_by(model.parent_id, ranked.c.reply_rank)
+        )
+        replies: Dict[int, list] = {}
+        for reply in result.scalars().all():
+            replies.setdefault(reply.parent_id, []).append(reply)
+        return replies
+
+    @classmethod
+    async def load_replies(
+        cls,
+        db: AsyncSession,
+        kind: str,
+        parent_id: int,
+        cursor: Optional[str] = None,
+        page: int = 1,
+        page_size: int = 20,
+    ) -> CommentThread:
+        """某条评论的回复分页（时间正序）"""
+        spec = KINDS[kind]
+        model = spec.model
+        order = spec.reply_order()
+        query = select(model).where(model.parent_id == parent_id, spec.visible(model))
+        if cursor or page == 1:
+            replies, next_cursor, has_more = await QueryOptimizer.keyset_query(
+                db, query, order, cursor, page_size
+            )
+        else:
+            result = await db.execute(
+                query.order_by(*order.order_by()).offset((page - 1) * page_size).limit(page_size + 1)
+            )
+            replies = list(result.scalars().all())
+            has_more = len(replies) > page_size
+            replies = replies[:page_size]
+            next_cursor = order.encode(replies[-1]) if has_more else None
+        return CommentThread(replies, {}, next_cursor, has_more)
+
+    @classmethod
+    async def comment_count(cls, db: AsyncSession, kind: str, target_id: int) -> int:
+        """被评论对象的可见评论数（冗余字段）"""
+        target = KINDS[kind].target
+        return await db.scalar(select(target.comment_count).where(target.id == target_id)) or 0
+
+    # ==================== 计数核对 ====================
+
+    @classmethod
+    async def recount(cls, db: AsyncSession, kind: str, target_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        按可见评论重新核对 comment_count（被评论对象，含回复）和 reply_count（顶级评论）
+
+        target_ids 为空时核对全表。只更新不一致的行，不提交事务，返回修正的行数。
+        """
+        if target_ids is not None:
+            target_ids = list(set(target_ids))
+            if not target_ids:
+                return 0
+        spec = KINDS[kind]
+        model, target = spec.model, spec.target
+
+        counts = select(spec.target_id().label("target_id"), func.count().label("n")).where(spec.visible(model))
+        if target_ids is not None:
+            counts = counts.where(spec.target_id().in_(target_ids))
+        counts = counts.group_by(spec.target_id()).subquery()
+        actual = func.coalesce(counts.c.n, 0)
+        query = (
+            select(target.id, actual)
+            .outerjoin(counts, counts.c.target_id == target.id)
+            .where(func.coalesce(target.comment_count, -1) != actual)
+        )
+        if target_ids is not None:
+            query = query.where(target.id.in_(target_ids))
+        target_rows = (await db.execute(query)).all()
+
+        reply = aliased(model)
+        reply_counts = select(reply.parent_id.label("parent_id"), func.count().label("n")).where(
+            reply.parent_id.isnot(None), spec.visible(reply)
+        )
+        if target_ids is not None:
+            reply_counts = reply_counts.where(spec.target_id(reply).in_(target_ids))
+        reply_counts = reply_counts.group_by(reply.parent_id).subquery()
+        actual = func.coalesce(reply_counts.c.n, 0)
+        query = (
+            select(model.id, actual)
+            .outerjoin(reply_counts, reply_counts.c.parent_id == model.id)
+            .where(model.parent_id.is_(None), func.coalesce(model.reply_count, -1) != actual)
+        )
+        if target_ids is not None:
+            query = query.where(spec.target_id().in_(target_ids))
+        comment_rows = (await db.execute(query)).all()
+
+        await cls._apply(db, target, "comment_count", target_rows)
+        await cls._apply(db, model, "reply_count", comment_rows)
+        return len(target_rows) + len(comment_rows)
+
+    @staticmethod
+    async def _apply(db: AsyncSession, model, column: str, rows: List[Tuple[int, int]]):
+        if not rows:
+            return
+        table = model.__table__
+        values = {column: bindparam("value")}
+        if "updated_at" in table.c:
+            values["updated_at"] = table.c.updated_at  # 计数核对不算内容更新
+        await db.execute(
+            update(table).where(table.c.id == bindparam("row_id")).values(values),
+            [{"row_id": row_id, "value": value} for row_id, value in rows],
+        )
+        # 会话里已加载的对象同步为核对后的值（不标记为脏）
+        for row_id, value in rows:
+            obj = db.identity_map.get(identity_key(model, row_id))
+            if obj is not None:
+                set_committed_value(obj, column, value)
+
+    @classmethod
+    async def recount_all(cls, db: AsyncSession) -> int:
+        """核对所有评论类型的计数并提交"""
+        total = 0
+        for kind in KINDS:
+            total += await cls.recount(db, kind)
+            await db.commit()
+        return total
@@ -0,0 +1,251 @@
+"""
+媒体信息探测（单次 ffprobe + SQLite 持久缓存）
+
+一次 ffprobe -show_format -show_streams（附带前 30 秒的视频包信息用于计算关键帧间隔）
+解析出 MediaInfo；结果按 (路径, 文件大小, 修改时间) 缓存在 SQLite 中，
+重复扫描、任务重试以及封面/预览等后续步骤不再重复启动 ffprobe。
+
+本模块只依赖标准库，后端（app/services/media_probe.py）与转码服务
+（transcode_service/media_probe.py）使用同一份代码。
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+import subprocess
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Optional, List
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    """媒体元数据"""
+    duration: float = 0.0           # 时长（秒）
+    width: int = 0                  # 编码宽度
+    height: int = 0                 # 编码高度
+    fps: float = 0.0                # 平均帧率
+    video_codec: str = ""
+    audio_codec: str = ""           # 无音频时为空
+    bitrate: int = 0                # 总码率（bps）
+    keyframe_interval: float = 0.0  # 平均关键帧间隔（秒），无法判断时为 0
+    rotation: int = 0               # 顺时针旋转角度：0/90/180/270
+
+    @property
+    def has_audio(self) -> bool:
+        return bool(self.audio_codec)
+
+    @property
+    def display_width(self) -> int:
+        """旋转后的显示宽度"""
+        return self.height if self.rotation in (90, 270) else self.width
+
+    @property
+    def display_height(self) -> int:
+        """旋转后的显示高度"""
+        return self.width if self.rotation in (90, 270) else self.height
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _ratio(value: Optional[str]) -> float:
+    """解析 '30000/1001' 形式的帧率"""
+    try:
+        if value and "/" in value:
+            num, den = value.split("/", 1)
+            return float(num) / float(den) if float(den) else 0.0
+        return float(value or 0)
+    except ValueError:
+        return 0.0
+
+
+def _float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_probe_output(data: dict) -> MediaInfo:
+    """把 ffprobe JSON 输出解析为 MediaInfo"""
+    streams = data.get("streams", [])
+    fmt = data.get("format", {})
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+
+    fps = _ratio(video.get("avg_frame_rate")) or _ratio(video.get("r_frame_rate"))
+
+    # 时长：容器时长 -> 视频流时长 -> 帧数/帧率
+    duration = _float(fmt.get("duration")) or _float(video.get("duration"))
+    if duration <= 0 and fps > 0 and str(video.get("nb_frames", "")).isdigit():
+        duration = int(video["nb_frames"]) / fps
+
+    # 旋转：旧版 ffprobe 在 tags.rotate，新版在 side_data_list（逆时针为正）
+    rotation = int(_float(video.get("tags", {}).get("rotate")))
+    for side_data in video.get("side_data_list", []):
+        if "rotation" in side_data:
+            rotation = -int(_float(side_data["rotation"]))
+    rotation %= 360
+
+    # 关键帧间隔：前 30 秒内视频关键帧时间差的平均值
+    video_index = video.get("index")
+    keyframes = [
+        _float(p.get("pts_time")) for p in data.get("packets", [])
+        if p.get("stream_index") == video_index and "K" in p.get("flags", "")
+        and p.get("pts_time") not in (None, "N/A")
+    ]
+    keyframe_interval = 0.0
+    if len(keyframes) >= 2:
+        keyframes.sort()
+        keyframe_interval = (keyframes[-1] - keyframes[0]) / (len(keyframes) - 1)
+
+    return MediaInfo(
+        duration=duration,
+        width=int(video.get("width") or 0),
+        height=int(video.get("height") or 0),
+        fps=round(fps, 3),
+        video_codec=video.get("codec_name", ""),
+        audio_codec=audio.get("codec_name", ""),
+        bitrate=int(_float(fmt.get("bit_rate"))),
+        keyframe_interval=round(keyframe_interval, 3),
+        rotation=rotation,
+    )
+
+
+class ProbeCache:
+    """探测结果缓存（SQLite），文件大小或修改时间变化即失效"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS probe_cache (
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    info TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (path, size, mtime_ns)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, path: str, size: int, mtime_ns: int) -> Optional[MediaInfo]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT info FROM probe_cache WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, size, mtime_ns)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return MediaInfo(**json.loads(row[0]))
+        except (TypeError, ValueError):
+            return None
+
+    def set(self, path: str, size: int, mtime_ns: int, info: MediaInfo) -> None:
+        with self._lock, self._connect() as conn:
+            # 同一路径只保留最新版本
+            conn.execute("DELETE FROM probe_cache WHERE path = ?", (path,))
+            conn.execute(
+                "INSERT INTO probe_cache (path, size, mtime_ns, info, created_at) VALUES (?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, json.dumps(info.to_dict()), time.time())
+            )
+
+    def cleanup(self, max_age_days: int = 30) -> int:
+        """清理过期记录，返回删除条数"""
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM probe_cache WHERE created_at < ?",
+                (time.time() - max_age_days * 86400,)
+            )
+            return cursor.rowcount
+
+
+class MediaProbe:
+    """媒体信息探测器"""
+
+    # 读取前多少秒的视频包用于计算关键帧间隔
+    KEYFRAME_WINDOW = 30
+
+    def __init__(self, cache_path: Optional[str] = None, timeout: int = 60):
+        self.timeout = timeout
+        self.cache_path = cache_path
+        self._cache: Optional[ProbeCache] = None
+        self._cache_checked = False
+
+    @property
+    def cache(self) -> Optional[ProbeCache]:
+        """首次使用时打开缓存库，打不开则不使用缓存"""
+        if not self._cache_checked:
+            self._cache_checked = True
+            if self.cache_path:
+                try:
+                    self._cache = ProbeCache(self.cache_path)
+                except Exception as e:
+                    print(f"[MediaProbe] 探测缓存不可用: {e}")
+        return self._cache
+
+    def _command(self, path: str) -> List[str]:
+        return [
+            "ffprobe", "-v", "error",
+            "-read_intervals", f"%+{self.KEYFRAME_WINDOW}",
+            "-show_format", "-show_streams",
+            "-show_entries", "packet=stream_index,pts_time,flags",
+            "-of", "json",
+            path
+        ]
+
+    def _run(self, path: str) -> Optional[MediaInfo]:
+        try:
+            result = subprocess.run(
+                self._command(path), capture_output=True, timeout=self.timeout
+            )
+        except Exception as e:
+            print(f"[MediaProbe] ffprobe 执行失败: {e}")
+            return None
+        if result.returncode != 0:
+            print(f"[MediaProbe] ffprobe 错误: {result.stderr.decode('utf-8', errors='ignore')[:200]}")
+            return None
+        try:
+            return parse_probe_output(json.loads(result.stdout.decode("utf-8", errors="ignore")))
+        except ValueError as e:
+            print(f"[MediaProbe] 解析 ffprobe 输出失败: {e}")
+            return None
+
+    def probe(self, path: str, refresh: bool = False) -> MediaInfo:
+        """
+        获取媒体信息（优先读缓存）
+
+        探测失败返回全零的 MediaInfo，且不写入缓存
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return MediaInfo()
+
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        cache = self.cache
+        if cache is not None and not refresh:
+            cached = cache.get(*key)
+            if cached is not None:
+                return cached
+
+        info = self._run(path)
+        if info is None:
+            return MediaInfo()
+        if cache is not None and info.duration > 0:
+            cache.set(*key, info)
+        return info
@@ -1,129 +1,284 @@
 """
 性能监控服务
 提供应用性能指标收集和监控功能
+
+- 按路由模板（/api/v1/videos/{video_id}，而不是原始路径）统计，每个路由一个固定分桶的延迟直方图，
+  可估算 p50/p95/p99，内存只随路由数增长；未匹配路由的请求归到同一个标签
+- 请求内的数据库查询次数/耗时（SQLAlchemy 引擎事件）和 Redis 往返次数/等待耗时（连接层）
+  通过 ContextVar 归到当前请求
+- 热路径只做几次整数累加，不加锁（单线程事件循环）
+- SQL_PROFILING 开启时，中间件同时逐请求记录 SQL 指纹，交给 app.core.database.sql_profiler 检测 N+1
+- 多个 uvicorn worker：各进程定期把快照写到 PROMETHEUS_MULTIPROC_DIR，
+  查询接口和 Prometheus 导出合并所有 worker 的快照
 """
+import os
+import json
+import glob
 import time
 import logging
 import psutil
 import asyncio
-from typing import Dict, Any, Optional, Callable
-from datetime import datetime, timedelta
-from functools import wraps
-from collections import defaultdict
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextvars import ContextVar
 from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache, wraps
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from app.core.database import sql_profiler
 
 logger = logging.getLogger(__name__)
 
+# 延迟分桶上界（秒），最后还有一个 +Inf 桶
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25,
+    0.4, 0.6, 1.0, 1.5, 2.5, 5.0, 10.0, 30.0,
+)
+UNMATCHED_ROUTE = "<unmatched>"  # 没有匹配到路由的请求（404 扫描等），避免原始路径撑爆标签
+SNAPSHOT_PREFIX = "perf-"
+SNAPSHOT_INTERVAL = 5  # 多 worker 时写快照的间隔（秒）
+
+
+class LatencyHistogram:
+    """固定分桶的延迟直方图"""
+
+    __slots__ = ("counts", "sum", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        """估算分位数：在目标所在的桶内线性插值（用实际的最小/最大值收紧首尾桶）"""
+        total = self.count
+        if total == 0:
+            return 0.0
+        target = q * total
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= target:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (target - seen) / n
+            seen += n
+        return self.max
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "counts": list(self.counts), "sum": self.sum,
+            "min": self.min if self.min != float('inf') else None, "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        histogram = cls()
+        histogram.counts = list(data["counts"])
+        histogram.sum = data["sum"]
+        histogram.min = data["min"] if data["min"] is not None else float('inf')
+        histogram.max = data["max"]
+        return histogram
+
 
 @dataclass
 class RequestMetrics:
     """请求指标"""
     total_requests: int = 0
     total_errors: int = 0
-    total_response_time: float = 0.0
-    min_response_time: float = float('inf')
-    max_response_time: float = 0.0
     status_codes: Dict[int, int] = field(default_factory=lambda: defaultdict(int))
-    
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    db_queries: int = 0
+    db_time: float = 0.0
+    redis_calls: int = 0
+    redis_time: float = 0.0
+
+    @property
+    def total_response_time(self) -> float:
+        return self.latency.sum
+
+    @property
+    def min_response_time(self) -> float:
+        return self.latency.min
+
+    @property
+    def max_response_time(self) -> float:
+        return self.latency.max
+
     @property
     def avg_response_time(self) -> float:
         if self.total_requests == 0:
             return 0.0
         return self.total_response_time / self.total_requests
-    
+
     @property
     def error_rate(self) -> float:
         if self.total_requests == 0:
             return 0.0
         return self.total_errors / self.total_requests * 100
 
+    def merge(self, other: "RequestMetrics") -> None:
+        self.total_requests += other.total_requests
+        self.total_errors += other.total_errors
+        for code, n in other.status_codes.items():
+            self.status_codes[code] += n
+        self.latency.merge(other.latency)
+        self.db_queries += other.db_queries
+        self.db_time += other.db_time
+        self.redis_calls += other.redis_calls
+        self.redis_time += other.redis_time
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.total_requests, "errors": self.total_errors,
+            "status": dict(self.status_codes), "latency": self.latency.to_dict(),
+            "db_queries": self.db_queries, "db_time": self.db_time,
+            "redis_calls": self.redis_calls, "redis_time": self.redis_time,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RequestMetrics":
+        metrics = cls(
+            total_requests=data["requests"], total_errors=data["errors"],
+            latency=LatencyHistogram.from_dict(data["latency"]),
+            db_queries=data["db_queries"], db_time=data["db_time"],
+            redis_calls=data["redis_calls"], redis_time=data["redis_time"],
+        )
+        for code, n in data["status"].items():
+            metrics.status_codes[int(code)] = n
+        return metrics
+
+
+class RequestStats:
+    """单个请求内的数据库/Redis 调用统计（由 MonitoringMiddleware 放进 ContextVar）"""
+
+    __slots__ = ("db_queries", "db_time", "redis_calls", "redis_time")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.redis_calls = 0
+        self.redis_time = 0.0
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("monitoring_request", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    """当前请求的调用统计（不在请求内时为 None）"""
+    return _current_request.get()
+
 
 class PerformanceMonitor:
     """性能监控器"""
-    
+
     _instance = None
-    
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance._initialized = False
         return cls._instance
-    
+
     def __init__(self):
         if self._initialized:
             return
-        
+
         self._initialized = True
         self.start_time = datetime.utcnow()
-        self.endpoint_metrics: Dict[str, RequestMetrics] = defaultdict(RequestMetrics)
-        self.slow_requests: list = []
+        self.endpoint_metrics: Dict[Tuple[str, str], RequestMetrics] = defaultdict(RequestMetrics)
         self.slow_threshold = 1.0  # 慢请求阈值（秒）
         self.max_slow_requests = 100  # 最多保留的慢请求记录
-    
+        self.slow_requests: deque = deque(maxlen=self.max_slow_requests)
+        self.snapshot_dir: Optional[str] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+
     def record_request(
         self,
         endpoint: str,
         method: str,
         status_code: int,
         response_time: float,
-        error: Optional[str] = None
+        error: Optional[str] = None,
+        stats: Optional[RequestStats] = None
     ) -> None:
         """
         记录请求指标
-        
+
         Args:
-            endpoint: API端点
+            endpoint: API端点（路由模板）
             method: HTTP方法
             status_code: 响应状态码
             response_time: 响应时间（秒）
             error: 错误信息
+            stats: 请求内的数据库/Redis 调用统计
         """
-        key = f"{method}:{endpoint}"
-        metrics = self.endpoint_metrics[key]
-        
+        metrics = self.endpoint_metrics[(method, endpoint)]
+
         metrics.total_requests += 1
-        metrics.total_response_time += response_time
         metrics.status_codes[status_code] += 1
-        
-        if response_time < metrics.min_response_time:
-            metrics.min_response_time = response_time
-        if response_time > metrics.max_response_time:
-            metrics.max_response_time = response_time
-        
+        metrics.latency.observe(response_time)
+
         if status_code >= 400:
             metrics.total_errors += 1
-        
+
+        if stats is not None:
+            metrics.db_queries += stats.db_queries
+            metrics.db_time += stats.db_time
+            metrics.redis_calls += stats.redis_calls
+            metrics.redis_time += stats.redis_time
+
         # 记录慢请求
         if response_time > self.slow_threshold:
-            self._record_slow_request(endpoint, method, response_time, error)
-    
+            self._record_slow_request(endpoint, method, response_time, error, stats)
+
     def _record_slow_request(
         self,
         endpoint: str,
         method: str,
         response_time: float,
-        error: Optional[str]
+        error: Optional[str],
+        stats: Optional[RequestStats] = None
     ) -> None:
-        """记录慢请求"""
+        """记录慢请求（deque 自动丢弃最早的记录）"""
         self.slow_requests.append({
             "endpoint": endpoint,
             "method": method,
             "response_time": response_time,
+            "db_queries": stats.db_queries if stats else None,
+            "redis_calls": stats.redis_calls if stats else None,
             "error": error,
             "timestamp": datetime.utcnow().isoformat()
         })
-        
-        # 保持列表大小
-        if len(self.slow_requests) > self.max_slow_requests:
-            self.slow_requests = self.slow_requests[-self.max_slow_requests:]
-    
+
     def get_system_metrics(self) -> Dict[str, Any]:
         """获取系统指标"""
         try:
             cpu_percent = psutil.cpu_percent(interval=0.1)
             memory = psutil.virtual_memory()
             disk = psutil.disk_usage('/')
-            
+
             return {
                 "cpu": {
                     "percent": cpu_percent,
@@ -143,47 +298,139 @@ class PerformanceMonitor:
         except Exception as e:
             logger.error(f"获取系统指标失败: {e}")
             return {}
-    
+
+    # ==================== 多进程快照 ====================
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前进程的指标快照（可 JSON 序列化）"""
+        return {
+            "pid": os.getpid(),
+            "buckets": list(LATENCY_BUCKETS),
+            "start_time": self.start_time.isoformat(),
+            "endpoints": [
+                {"method": method, "route": route, **metrics.to_dict()}
+                for (method, route), metrics in list(self.endpoint_metrics.items())
+            ]
+        }
+
+    def _snapshot_path(self, directory: str) -> str:
+        return os.path.join(directory, f"{SNAPSHOT_PREFIX}{os.getpid()}.json")
+
+    def write_snapshot(self, data: Optional[Dict[str, Any]] = None) -> None:
+        """把快照写到共享目录（先写临时文件再改名，读取方不会读到半个文件）"""
+        if not self.snapshot_dir:
+            return
+        data = data or self.snapshot()
+        path = self._snapshot_path(self.snapshot_dir)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def collect(self) -> Dict[Tuple[str, str], RequestMetrics]:
+        """合并本进程的实时指标和其他 worker 的快照，返回 {(方法, 路由): 指标}"""
+        merged: Dict[Tuple[str, str], RequestMetrics] = defaultdict(RequestMetrics)
+        for key, metrics in list(self.endpoint_metrics.items()):
+            merged[key].merge(metrics)
+        if not self.snapshot_dir:
+            return merged
+        own = self._snapshot_path(self.snapshot_dir)
+        for path in glob.glob(os.path.join(self.snapshot_dir, f"{SNAPSHOT_PREFIX}*.json")):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取监控快照失败 {path}: {e}")
+                continue
+            if data.get("buckets") != list(LATENCY_BUCKETS):
+                continue  # 分桶不同的旧版本快照
+            for item in data["endpoints"]:
+                merged[(item["method"], item["route"])].merge(RequestMetrics.from_dict(item))
+        return merged
+
+    def start_exporter(self, directory: Optional[str] = None) -> None:
+        """配置了快照目录时，启动定期写快照的任务"""
+        if directory is None:
+            from app.core.config import settings
+            directory = settings.PROMETHEUS_MULTIPROC_DIR
+        if not directory or self._snapshot_task is not None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_dir = directory
+        self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+    async def stop_exporter(self) -> None:
+        """停止写快照任务，并写最后一次"""
+        if self._snapshot_task is None:
+            return
+        self._snapshot_task.cancel()
+        try:
+            await self._snapshot_task
+        except asyncio.CancelledError:
+            pass
+        self._snapshot_task = None
+        self.write_snapshot()
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            try:
+                # 快照在事件循环内生成，写文件放到线程里
+                await asyncio.to_thread(self.write_snapshot, self.snapshot())
+            except Exception as e:
+                logger.warning(f"写入监控快照失败: {e}")
+
+    # ==================== 查询与导出 ====================
+
     def get_application_metrics(self) -> Dict[str, Any]:
-        """获取应用指标"""
+        """获取应用指标（合并所有 worker）"""
         uptime = datetime.utcnow() - self.start_time
-        
-        total_requests = sum(m.total_requests for m in self.endpoint_metrics.values())
-        total_errors = sum(m.total_errors for m in self.endpoint_metrics.values())
-        
+        endpoint_metrics = self.collect()
+
+        total_requests = sum(m.total_requests for m in endpoint_metrics.values())
+        total_errors = sum(m.total_errors for m in endpoint_metrics.values())
+
         return {
             "uptime_seconds": int(uptime.total_seconds()),
             "uptime_human": str(uptime).split('.')[0],
             "total_requests": total_requests,
             "total_errors": total_errors,
             "error_rate": round(total_errors / total_requests * 100, 2) if total_requests > 0 else 0,
-            "endpoints_count": len(self.endpoint_metrics)
+            "endpoints_count": len(endpoint_metrics)
         }
-    
+
     def get_endpoint_metrics(self, top_n: int = 10) -> list:
-        """获取端点指标（按请求数排序）"""
+        """获取端点指标（按请求数排序，合并所有 worker）"""
         sorted_endpoints = sorted(
-            self.endpoint_metrics.items(),
+            self.collect().items(),
             key=lambda x: x[1].total_requests,
             reverse=True
         )[:top_n]
-        
+
         return [
             {
-                "endpoint": endpoint,
+                "endpoint": f"{method}:{route}",
                 "total_requests": metrics.total_requests,
                 "avg_response_time_ms": round(metrics.avg_response_time * 1000, 2),
                 "min_response_time_ms": round(metrics.min_response_time * 1000, 2) if metrics.min_response_time != float('inf') else 0,
                 "max_response_time_ms": round(metrics.max_response_time * 1000, 2),
+                "p50_response_time_ms": round(metrics.latency.quantile(0.5) * 1000, 2),
+                "p95_response_time_ms": round(metrics.latency.quantile(0.95) * 1000, 2),
+                "p99_response_time_ms": round(metrics.latency.quantile(0.99) * 1000, 2),
+                "avg_db_queries": round(metrics.db_queries / metrics.total_requests, 2) if metrics.total_requests else 0,
+                "avg_db_time_ms": round(metrics.db_time / metrics.total_requests * 1000, 2) if metrics.total_requests else 0,
+                "avg_redis_calls": round(metrics.redis_calls / metrics.total_requests, 2) if metrics.total_requests else 0,
                 "error_rate": round(metrics.error_rate, 2)
             }
-            for endpoint, metrics in sorted_endpoints
+            for (method, route), metrics in sorted_endpoints
         ]
-    
+
     def get_slow_requests(self, limit: int = 20) -> list:
-        """获取慢请求列表"""
-        return self.slow_requests[-limit:]
-    
+        """获取慢请求列表（当前 worker）"""
+        return list(self.slow_requests)[-limit:]
+
     def get_full_report(self) -> Dict[str, Any]:
         """获取完整监控报告"""
         return {
@@ -193,22 +440,129 @@ class PerformanceMonitor:
             "top_endpoints": self.get_endpoint_metrics(),
             "slow_requests": self.get_slow_requests()
         }
-    
+
+    def render_prometheus(self) -> bytes:
+        """Prometheus 文本格式（合并所有 worker）"""
+        from prometheus_client import CollectorRegistry, generate_latest
+
+        registry = CollectorRegistry(auto_describe=False)
+        registry.register(_MetricsCollector(self.collect()))
+        return generate_latest(registry)
+
     def reset_metrics(self) -> None:
-        """重置所有指标"""
+        """重置当前 worker 的所有指标"""
         self.endpoint_metrics.clear()
         self.slow_requests.clear()
         self.start_time = datetime.utcnow()
+        if self.snapshot_dir:
+            self.write_snapshot()
+
+
+class _MetricsCollector:
+    """把合并后的端点指标转换为 Prometheus 指标族"""
+
+    def __init__(self, endpoint_metrics: Dict[Tuple[str, str], RequestMetrics]):
+        self.endpoint_metrics = endpoint_metrics
+
+    def collect(self):
+        from prometheus_client.core import HistogramMetricFamily, CounterMetricFamily
+
+        labels = ["method", "route"]
+        duration = HistogramMetricFamily(
+            "http_request_duration_seconds", "HTTP 请求耗时（按路由模板）", labels=labels
+        )
+        requests = CounterMetricFamily(
+            "http_requests", "HTTP 请求数（按状态码）", labels=labels + ["status"]
+        )
+        db_queries = CounterMetricFamily("http_request_db_queries", "请求内执行的 SQL 条数", labels=labels)
+        db_seconds = CounterMetricFamily("http_request_db_seconds", "请求内 SQL 执行耗时", labels=labels)
+        redis_calls = CounterMetricFamily("http_request_redis_roundtrips", "请求内 Redis 往返次数", labels=labels)
+        redis_seconds = CounterMetricFamily("http_request_redis_seconds", "请求内等待 Redis 响应的耗时", labels=labels)
+
+        for (method, route), metrics in sorted(self.endpoint_metrics.items()):
+            values = [method, route]
+            buckets, cumulative = [], 0
+            for bound, n in zip(LATENCY_BUCKETS, metrics.latency.counts):
+                cumulative += n
+                buckets.append((repr(bound), cumulative))
+            buckets.append(("+Inf", metrics.latency.count))
+            duration.add_metric(values, buckets, metrics.latency.sum)
+            for status, n in sorted(metrics.status_codes.items()):
+                requests.add_metric(values + [str(status)], n)
+            db_queries.add_metric(values, metrics.db_queries)
+            db_seconds.add_metric(values, metrics.db_time)
+            redis_calls.add_metric(values, metrics.redis_calls)
+            redis_seconds.add_metric(values, metrics.redis_time)
+
+        yield from (duration, requests, db_queries, db_seconds, redis_calls, redis_seconds)
 
 
 # 全局监控器实例
 monitor = PerformanceMonitor()
 
 
+# ==================== 数据库 / Redis 埋点 ====================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_request.get() is not None:
+        conn.info["monitoring_query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_request.get()
+    if stats is None:
+        return
+    start = conn.info.pop("monitoring_query_start", None)
+    stats.db_queries += 1
+    if start is not None:
+        stats.db_time += time.perf_counter() - start
+
+
+def instrument_engine(engine) -> None:
+    """在引擎上注册 SQL 执行事件，把查询次数/耗时记到当前请求（重复调用只注册一次）"""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@lru_cache(maxsize=None)
+def _instrumented_connection_class(base):
+    """Redis 连接类的埋点子类：每次发送算一次往返（pipeline 整批发送只算一次），并累计等待响应的时间"""
+
+    class InstrumentedConnection(base):
+        async def send_packed_command(self, command, *args, **kwargs):
+            stats = _current_request.get()
+            if stats is not None:
+                stats.redis_calls += 1
+            return await super().send_packed_command(command, *args, **kwargs)
+
+        async def read_response(self, *args, **kwargs):
+            stats = _current_request.get()
+            if stats is None:
+                return await super().read_response(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await super().read_response(*args, **kwargs)
+            finally:
+                stats.redis_time += time.perf_counter() - start
+
+    InstrumentedConnection.__name__ = InstrumentedConnection.__qualname__ = f"Instrumented{base.__name__}"
+    return InstrumentedConnection
+
+
+def instrument_redis_pool(pool) -> None:
+    """替换 Redis 连接池的连接类（只影响之后新建的连接，创建连接池后立即调用）"""
+    pool.connection_class = _instrumented_connection_class(pool.connection_class)
+
+
 def track_performance(endpoint_name: str = None):
     """
     性能追踪装饰器
-    
+
     用法:
     @track_performance("get_videos")
     async def get_videos():
@@ -217,10 +571,10 @@ def track_performance(endpoint_name: str = None):
     def decorator(func: Callable):
         @wraps(func)
         async def async_wrapper(*args, **kwargs):
-            start_time = time.time()
+            start_time = time.perf_counter()
             error = None
             status_code = 200
-            
+
             try:
                 result = await func(*args, **kwargs)
                 return result
@@ -229,7 +583,7 @@ def track_performance(endpoint_name: str = None):
                 status_code = 500
                 raise
             finally:
-                response_time = time.time() - start_time
+                response_time = time.perf_counter() - start_time
                 name = endpoint_name or func.__name__
                 monitor.record_request(
                     endpoint=name,
@@ -238,13 +592,13 @@ def track_performance(endpoint_name: str = None):
                     response_time=response_time,
                     error=error
                 )
-        
+
         @wraps(func)
         def sync_wrapper(*args, **kwargs):
-            start_time = time.time()
+            start_time = time.perf_counter()
             error = None
             status_code = 200
-            
+
             try:
                 result = func(*args, **kwargs)
                 return result
@@ -253,7 +607,7 @@ def track_performance(endpoint_name: str = None):
                 status_code = 500
                 raise
             finally:
-                response_time = time.time() - start_time
+                response_time = time.perf_counter() - start_time
                 name = endpoint_name or func.__name__
                 monitor.record_request(
                     endpoint=name,
@@ -262,52 +616,66 @@ def track_performance(endpoint_name: str = None):
                     response_time=response_time,
                     error=error
                 )
-        
+
         if asyncio.iscoroutinefunction(func):
             return async_wrapper
         return sync_wrapper
-    
+
     return decorator
 
 
+def route_template(scope) -> str:
+    """请求匹配到的路由模板；挂载的静态目录用挂载路径；都没有时归为 UNMATCHED_ROUTE"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if "app_root_path" in scope and scope.get("root_path"):
+        return scope["root_path"]
+    return UNMATCHED_ROUTE
+
+
 class MonitoringMiddleware:
     """
-    FastAPI 监控中间件
-    
+    FastAPI 监控中间件（纯 ASGI）
+
     用法:
     from app.services.monitoring_service import MonitoringMiddleware
     app.add_middleware(MonitoringMiddleware)
     """
-    
-    def __init__(self, app):
+
+    def __init__(self, app, exclude_prefixes: Tuple[str, ...] = ("/api/health",)):
         self.app = app
-    
+        self.exclude_prefixes = exclude_prefixes
+
     async def __call__(self, scope, receive, send):
-        if scope["type"] != "http":
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_prefixes):
             await self.app(scope, receive, send)
             return
-        
-        start_time = time.time()
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        profile_token = sql_profiler.begin() if sql_profiler.enabled else None
         status_code = 500
-        
+
         async def send_wrapper(message):
             nonlocal status_code
             if message["type"] == "http.response.start":
                 status_code = message["status"]
             await send(message)
-        
+
+        start_time = time.perf_counter()
         try:
             await self.app(scope, receive, send_wrapper)
         finally:
-            response_time = time.time() - start_time
-            path = scope.get("path", "unknown")
-            method = scope.get("method", "unknown")
-            
-            # 排除健康检查等端点
-            if not path.startswith("/api/health"):
-                monitor.record_request(
-                    endpoint=path,
-                    method=method,
-                    status_code=status_code,
-                    response_time=response_time
-                )
+            response_time = time.perf_counter() - start_time
+            _current_request.reset(token)
+            endpoint = route_template(scope)
+            if profile_token is not None:
+                sql_profiler.end(profile_token, scope["method"], endpoint)
+            monitor.record_request(
+                endpoint=endpoint,
+                method=scope["method"],
+                status_code=status_code,
+                response_time=response_time,
+                stats=stats
+            )
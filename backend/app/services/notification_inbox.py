@@ -0,0 +1,259 @@
+"""
+通知收件箱服务（写时扇出）
+
+评论/回复/点赞发生时，在同一事务内向接收者的收件箱写入一条记录并增量更新计数：
+- 通知列表：按 (user_id, category, id) 索引倒序的 keyset 扫描，与历史数据量无关
+- 未读数：notification_counters 主键查询，不再逐表 COUNT
+- 取消点赞/隐藏评论时按来源撤回，计数同步扣减
+- 已读用每个分类的收件箱 id 游标表示，标记已读是一次 UPDATE
+
+push/retract 只 flush 不 commit，由调用方随业务数据一起提交。
+"""
+import logging
+from typing import Optional, List, Tuple
+
+from sqlalchemy import select, update, delete, func, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.notification import NotificationInboxItem, NotificationCounter
+from app.models.user import User
+from app.models.comment import CommentLike
+from app.models.community import PostCommentLike, GalleryCommentLike
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationCategory:
+    """收件箱分类（对应 /notifications/comments 与 /notifications/likes）"""
+    COMMENT = "comment"
+    LIKE = "like"
+    ALL = (COMMENT, LIKE)
+
+
+def _columns(category: str):
+    """分类对应的计数列：(总数, 未读数, 已读游标)"""
+    if category not in NotificationCategory.ALL:
+        raise ValueError(f"未知通知分类: {category}")
+    return (
+        getattr(NotificationCounter, f"{category}_total"),
+        getattr(NotificationCounter, f"{category}_unread"),
+        getattr(NotificationCounter, f"{category}_read_id"),
+    )
+
+
+class NotificationInbox:
+    """通知收件箱"""
+
+    # 评论摘要长度（与原聚合接口一致）
+    CONTENT_LENGTH = 50
+    TITLE_LENGTH = 200
+
+    # 评论类型 -> (评论通知来源, 评论点赞通知来源, 点赞模型)
+    COMMENT_SOURCES = {
+        "video": ("video_comment", "video_comment_like", CommentLike),
+        "post": ("post_comment", "post_comment_like", PostCommentLike),
+        "gallery": ("gallery_comment", "gallery_comment_like", GalleryCommentLike),
+    }
+
+    @staticmethod
+    async def _bump(db: AsyncSession, user_id: int, **values) -> None:
+        """更新计数行，不存在时先创建（并发创建冲突时回退为 UPDATE）"""
+        stmt = update(NotificationCounter).where(NotificationCounter.user_id == user_id).values(**values)
+        result = await db.execute(stmt)
+        if result.rowcount:
+            return
+        try:
+            async with db.begin_nested():
+                db.add(NotificationCounter(user_id=user_id))
+        except IntegrityError:
+            pass
+        await db.execute(stmt)
+
+    @classmethod
+    async def push(
+        cls,
+        db: AsyncSession,
+        *,
+        user_id: Optional[int],
+        actor_id: int,
+        category: str,
+        notification_type: str,
+        source_type: str,
+        source_id: int,
+        target_type: str,
+        target_id: Optional[int],
+        target_title: Optional[str] = None,
+        content: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        向 user_id 的收件箱写入一条通知，返回收件箱记录 id
+        自己触发的、接收者为空的、同一来源重复写入的都忽略（返回 None）
+        """
+        if not user_id or user_id == actor_id:
+            return None
+        total_col, unread_col, _ = _columns(category)
+
+        item = NotificationInboxItem(
+            user_id=user_id,
+            actor_id=actor_id,
+            category=category,
+            notification_type=notification_type,
+            source_type=source_type,
+            source_id=source_id,
+            target_type=target_type,
+            target_id=target_id,
+            target_title=(target_title or None) and target_title[:cls.TITLE_LENGTH],
+            content=(content or None) and content[:cls.CONTENT_LENGTH],
+        )
+        try:
+            async with db.begin_nested():
+                db.add(item)
+                await db.flush()
+        except IntegrityError:
+            return None
+
+        await cls._bump(db, user_id, **{
+            total_col.key: total_col + 1,
+            unread_col.key: unread_col + 1,
+        })
+        return item.id
+
+    @classmethod
+    async def retract(cls, db: AsyncSession, source_type: str, source_id: int) -> int:
+        """撤回某个来源产生的全部通知（取消点赞、评论被隐藏/删除），返回撤回条数"""
+        return await cls._retract(db, source_type, [source_id])
+
+    @classmethod
+    async def retract_comment(cls, db: AsyncSession, kind: str, comment_id: int) -> int:
+        """评论被隐藏/删除：撤回评论本身以及它收到的点赞产生的通知，kind 为 video/short/post/gallery"""
+        sources = cls.COMMENT_SOURCES.get("video" if kind == "short" else kind)
+        if not sources:
+            return 0
+        comment_source, like_source, like_model = sources
+        like_ids = (await db.execute(
+            select(like_model.id).where(like_model.comment_id == comment_id)
+        )).scalars().all()
+        return (await cls._retract(db, comment_source, [comment_id])
+                + await cls._retract(db, like_source, like_ids))
+
+    @classmethod
+    async def _retract(cls, db: AsyncSession, source_type: str, source_ids: List[int]) -> int:
+        if not source_ids:
+            return 0
+        result = await db.execute(
+            select(NotificationInboxItem.id, NotificationInboxItem.user_id, NotificationInboxItem.category)
+            .where(
+                NotificationInboxItem.source_type == source_type,
+                NotificationInboxItem.source_id.in_(source_ids),
+            )
+        )
+        rows = result.all()
+        if not rows:
+            return 0
+
+        await db.execute(
+            delete(NotificationInboxItem).where(NotificationInboxItem.id.in_([r.id for r in rows]))
+        )
+        for item_id, user_id, category in rows:
+            total_col, unread_col, read_col = _columns(category)
+            await db.execute(
+                update(NotificationCounter)
+                .where(NotificationCounter.user_id == user_id)
+                .values(**{
+                    total_col.key: case((total_col > 0, total_col - 1), else_=0),
+                    # 只有已读游标之后的记录才计入未读
+                    unread_col.key: case(
+                        ((read_col < item_id) & (unread_col > 0), unread_col - 1),
+                        else_=unread_col,
+                    ),
+                })
+            )
+        return len(rows)
+
+    @staticmethod
+    async def fetch(
+        db: AsyncSession,
+        user_id: int,
+        category: str,
+        limit: int = 20,
+        before_id: Optional[int] = None,
+        offset: int = 0,
+    ) -> List[Tuple[NotificationInboxItem, User]]:
+        """
+        倒序读取收件箱（含触发者），before_id 为上一页最后一条的 id
+        offset 仅用于兼容旧的页码分页
+        """
+        _columns(category)
+        query = (
+            select(NotificationInboxItem, User)
+            .join(User, NotificationInboxItem.actor_id == User.id)
+            .where(
+                NotificationInboxItem.user_id == user_id,
+                NotificationInboxItem.category == category,
+            )
+        )
+        if before_id:
+            query = query.where(NotificationInboxItem.id < before_id)
+        query = query.order_by(NotificationInboxItem.id.desc()).limit(limit)
+        if offset and not before_id:
+            query = query.offset(offset)
+        result = await db.execute(query)
+        return result.all()
+
+    @staticmethod
+    async def counts(db: AsyncSession, user_id: int) -> Optional[NotificationCounter]:
+        """读取计数行（没有任何通知的用户返回 None）"""
+        return await db.get(NotificationCounter, user_id)
+
+    @classmethod
+    async def mark_read(cls, db: AsyncSession, user_id: int, category: str) -> None:
+        """把分类的已读游标移到当前最新一条，未读清零"""
+        _, unread_col, read_col = _columns(category)
+        latest = await db.scalar(
+            select(func.max(NotificationInboxItem.id)).where(
+                NotificationInboxItem.user_id == user_id,
+                NotificationInboxItem.category == category,
+            )
+        )
+        if latest is None:
+            return
+        await db.execute(
+            update(NotificationCounter)
+            .where(NotificationCounter.user_id == user_id)
+            .values(**{
+                unread_col.key: 0,
+                read_col.key: case((read_col < latest, latest), else_=read_col),
+            })
+        )
+
+    @classmethod
+    async def add_private_unread(cls, db: AsyncSession, user_id: int, delta: int) -> None:
+        """私信未读数增减（发送私信 +1，标记会话已读时减去该会话的未读数）"""
+        if not delta:
+            return
+        col = NotificationCounter.private_unread
+        await cls._bump(db, user_id, private_unread=case((col + delta > 0, col + delta), else_=0))
+
+    @classmethod
+    async def rebuild(cls, db: AsyncSession, user_id: int) -> None:
+        """按收件箱和已读游标重新计算计数（数据迁移/修复用，私信未读不变）"""
+        counter = await db.get(NotificationCounter, user_id)
+        if counter is None:
+            counter = NotificationCounter(user_id=user_id, private_unread=0,
+                                          comment_read_id=0, like_read_id=0)
+            db.add(counter)
+        for category in NotificationCategory.ALL:
+            read_id = getattr(counter, f"{category}_read_id") or 0
+            total, unread = (await db.execute(
+                select(
+                    func.count(NotificationInboxItem.id),
+                    func.count(case((NotificationInboxItem.id > read_id, 1))),
+                ).where(
+                    NotificationInboxItem.user_id == user_id,
+                    NotificationInboxItem.category == category,
+                )
+            )).one()
+            setattr(counter, f"{category}_total", total)
+            setattr(counter, f"{category}_unread", unread)
+        await db.flush()
@@ -0,0 +1,235 @@
+"""
+认证主体缓存（Principal Cache）
+
+每个认证请求原来都要 SELECT users（VIP 接口再查一次 user_vips），
+这里把 API 需要的用户字段 + VIP 状态做成短 TTL 快照存 Redis：
+- 快照带版本号：principal:ver:{user_id} 为版本计数，快照中记录写入时读到的版本，
+  两者不一致即视为失效（避免"失效后又被并发请求写回旧快照"）
+- 令牌黑名单、用户黑名单、快照、版本号四个键一次 MGET 取回
+- users / user_vips 行在任意会话中 flush 并提交后自动递增版本号（ORM 事件）
+- 命中时用 merge(load=False) 把快照挂到当前会话，不发 SQL，
+  接口里修改 current_user 后提交仍然会正常 UPDATE
+
+快照不包含 hashed_password。
+"""
+import json
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple, Iterable, Set
+
+from sqlalchemy import select, event, DateTime, Enum
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.redis import RedisCache
+from app.core.token_blacklist import TokenBlacklist
+from app.models.user import User, UserVIP
+
+logger = logging.getLogger(__name__)
+
+# 快照中不缓存的字段
+_EXCLUDED_FIELDS = {"hashed_password"}
+_COLUMNS = [
+    attr for attr in User.__mapper__.column_attrs
+    if attr.key not in _EXCLUDED_FIELDS
+]
+
+
+@dataclass
+class Principal:
+    """当前认证主体：用户对象 + VIP 状态"""
+    user: User
+    vip_level: int = 0
+    vip_active: bool = False
+    vip_expire: Optional[datetime] = None
+
+    @property
+    def is_vip(self) -> bool:
+        return bool(self.vip_active and self.vip_expire and self.vip_expire > datetime.utcnow())
+
+
+class PrincipalCache:
+    """认证主体缓存"""
+
+    PREFIX = "principal:"
+    VERSION_PREFIX = "principal:ver:"
+    # 快照有效期（秒），兜底未经 ORM 的修改
+    TTL = 60
+    # 版本号有效期必须长于快照有效期
+    VERSION_TTL = 86400
+
+    # 提交后递增版本号的后台任务（保持引用）
+    _pending: Set[asyncio.Task] = set()
+
+    # ========== 序列化 ==========
+
+    @staticmethod
+    def _encode(principal: Principal, version: str) -> str:
+        fields = {}
+        for attr in _COLUMNS:
+            value = getattr(principal.user, attr.key)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            elif hasattr(value, "value"):
+                value = value.value
+            fields[attr.key] = value
+        return json.dumps({
+            "v": version,
+            "user": fields,
+            "vip": [
+                principal.vip_level,
+                principal.vip_active,
+                principal.vip_expire.isoformat() if principal.vip_expire else None,
+            ],
+        })
+
+    @staticmethod
+    def _decode(raw: Optional[str], version: str) -> Optional[Principal]:
+        """解析快照，版本不一致或格式错误时返回 None"""
+        if not raw:
+            return None
+        try:
+            data = json.loads(raw)
+            if data.get("v") != version:
+                return None
+            fields = {}
+            for attr in _COLUMNS:
+                value = data["user"].get(attr.key)
+                column_type = attr.columns[0].type
+                if value is not None:
+                    if isinstance(column_type, DateTime):
+                        value = datetime.fromisoformat(value)
+                    elif isinstance(column_type, Enum) and column_type.enum_class is not None:
+                        value = column_type.enum_class(value)
+                fields[attr.key] = value
+            user = User(**fields)
+            # 标记为已持久化的脱离对象（无修改记录），之后可 merge(load=False)
+            make_transient_to_detached(user)
+            vip_level, vip_active, vip_expire = data["vip"]
+            return Principal(
+                user=user,
+                vip_level=vip_level or 0,
+                vip_active=bool(vip_active),
+                vip_expire=datetime.fromisoformat(vip_expire) if vip_expire else None,
+            )
+        except Exception as e:
+            logger.debug(f"认证主体快照解析失败: {e}")
+            return None
+
+    # ========== 读取 ==========
+
+    @staticmethod
+    async def _load(db: AsyncSession, user_id: int) -> Optional[Principal]:
+        """一次查询加载用户和 VIP 信息"""
+        result = await db.execute(
+            select(User, UserVIP)
+            .outerjoin(UserVIP, UserVIP.user_id == User.id)
+            .where(User.id == user_id)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        user, vip = row
+        if vip is None:
+            return Principal(user=user)
+        return Principal(
+            user=user,
+            vip_level=vip.vip_level or 0,
+            vip_active=bool(vip.is_active),
+            vip_expire=vip.expire_date,
+        )
+
+    @classmethod
+    async def resolve(
+        cls,
+        db: AsyncSession,
+        token: str,
+        user_id: int
+    ) -> Tuple[bool, bool, Optional[Principal]]:
+        """
+        检查黑名单并获取认证主体
+
+        Returns:
+            (令牌是否在黑名单中, 用户是否被全局黑名单, 认证主体；用户不存在或在黑名单中时为 None)
+        """
+        try:
+            token_flag, user_flag, raw, version = await RedisCache.get_many([
+                f"{TokenBlacklist.PREFIX}{token}",
+                f"{TokenBlacklist.PREFIX}user:{user_id}",
+                f"{cls.PREFIX}{user_id}",
+                f"{cls.VERSION_PREFIX}{user_id}",
+            ])
+        except Exception:
+            token_flag = user_flag = raw = version = None
+
+        if token_flag is not None or user_flag is not None:
+            return token_flag is not None, user_flag is not None, None
+
+        version = version or "0"
+        principal = cls._decode(raw, version)
+        if principal is not None:
+            principal.user = await db.merge(principal.user, load=False)
+            return False, False, principal
+
+        principal = await cls._load(db, user_id)
+        if principal is not None:
+            try:
+                await RedisCache.set(f"{cls.PREFIX}{user_id}", cls._encode(principal, version), cls.TTL)
+            except Exception as e:
+                logger.debug(f"写入认证主体快照失败: {e}")
+        return False, False, principal
+
+    # ========== 失效 ==========
+
+    @classmethod
+    async def invalidate(cls, user_ids: Iterable[int]) -> None:
+        """递增版本号，使这些用户的快照失效"""
+        keys = [f"{cls.VERSION_PREFIX}{user_id}" for user_id in set(user_ids)]
+        if not keys:
+            return
+        try:
+            await RedisCache.incr_many(keys, expire=cls.VERSION_TTL)
+        except Exception as e:
+            logger.warning(f"认证主体缓存失效失败: {e}")
+
+    @classmethod
+    def _schedule_invalidate(cls, user_ids: Set[int]) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 无事件循环（同步脚本），由快照 TTL 兜底
+            return
+        task = loop.create_task(cls.invalidate(user_ids))
+        cls._pending.add(task)
+        task.add_done_callback(cls._pending.discard)
+
+    @classmethod
+    async def wait_pending(cls) -> None:
+        """等待已提交事务的失效操作完成（测试和关闭时使用）"""
+        if cls._pending:
+            await asyncio.gather(*list(cls._pending), return_exceptions=True)
+
+
+_SESSION_KEY = "principal_dirty_users"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session: Session, flush_context) -> None:
+    """记录本事务中修改过的用户"""
+    changed = session.info.setdefault(_SESSION_KEY, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, User):
+            if obj.id is not None:
+                changed.add(obj.id)
+        elif isinstance(obj, UserVIP):
+            if obj.user_id is not None:
+                changed.add(obj.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session: Session) -> None:
+    changed = session.info.pop(_SESSION_KEY, None)
+    if changed:
+        PrincipalCache._schedule_invalidate(changed)
@@ -0,0 +1,487 @@
+"""
+排行榜服务 - Redis 有序集合物化榜单
+
+每个榜单（内容类型 × 时间范围）是一个有序集合，只保留前 MAX_SIZE 名：
+- 定时任务（ScheduledTasks）全量重建
+- 播放/点赞事件增量更新已在榜上的条目（ZINCRBY）
+- 接口只读取一段排名 + 批量读取卡片缓存，耗时与表大小无关
+
+分数编码为 view_count * SCORE_BASE + like_count，
+与原接口的 ORDER BY view_count DESC, like_count DESC 一致；
+成员为补零的 ID，同分时按 ID 倒序。
+
+榜单缺失时当前请求回退数据库查询，同时在后台重建一次（进程内去重 + Redis 锁跨进程去重）。
+
+Redis 不可用时榜单保存在进程内存中。
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, desc
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.core.database import AsyncSessionLocal
+from app.core.query_optimizer import KeysetOrder, KeysetCursorError
+from app.core.redis import RedisCache
+from app.models.video import Video, VideoStatus
+from app.models.community import Post, Novel, Gallery
+
+logger = logging.getLogger(__name__)
+
+# 仅对已在榜单上的成员加分（不在榜上的等下次重建再进入）
+_INCR_IF_PRESENT = """
+for i = 1, #KEYS do
+    if redis.call('ZSCORE', KEYS[i], ARGV[1]) then
+        redis.call('ZINCRBY', KEYS[i], ARGV[2], ARGV[1])
+    end
+end
+return 1
+"""
+
+
+class RankingService:
+    """排行榜服务"""
+
+    KINDS = ("videos", "shorts", "posts", "novels", "galleries")
+    RANGES = {"week": 7, "month": 30, "season": 90, "total": None}
+
+    # 每个榜单保留的条目数，超出部分的翻页回退到数据库查询
+    MAX_SIZE = 1000
+    SCORE_BASE = 1000000
+    CARD_TTL = 86400
+
+    # 内存备用：榜单键 -> [(id, score)]（已排序），类型 -> {id: 卡片}
+    _boards: Dict[str, List[Tuple[int, int]]] = {}
+    _cards: Dict[str, Dict[int, dict]] = {}
+
+    # 后台重建：使用的会话工厂、本进程正在重建的榜单键、跨进程锁超时
+    session_factory = AsyncSessionLocal
+    _rebuilding: set = set()
+    _background: set = set()
+    REBUILD_LOCK_TTL = 60
+
+    # ========== 基础 ==========
+
+    @staticmethod
+    def board_key(kind: str, time_range: str) -> str:
+        return f"rank:{kind}:{time_range}"
+
+    @staticmethod
+    def _member(item_id: int) -> str:
+        return f"{item_id:012d}"
+
+    @classmethod
+    def encode_score(cls, view_count: int, like_count: int) -> int:
+        return (view_count or 0) * cls.SCORE_BASE + min(max(like_count or 0, 0), cls.SCORE_BASE - 1)
+
+    @classmethod
+    def decode_score(cls, score) -> Tuple[int, int]:
+        score = int(score)
+        return score // cls.SCORE_BASE, score % cls.SCORE_BASE
+
+    @staticmethod
+    def model_of(kind: str):
+        return {"videos": Video, "shorts": Video, "posts": Post, "novels": Novel, "galleries": Gallery}[kind]
+
+    @staticmethod
+    def _filters(kind: str) -> list:
+        if kind == "videos":
+            return [Video.status == VideoStatus.PUBLISHED, Video.is_short != True]
+        if kind == "shorts":
+            return [Video.status == VideoStatus.PUBLISHED, Video.is_short == True]
+        if kind == "posts":
+            return [Post.status == "published"]
+        if kind == "novels":
+            return [Novel.is_active == True]
+        return [Gallery.is_active == True]
+
+    @classmethod
+    def ranges_for(cls, created_at: Optional[datetime], now: Optional[datetime] = None) -> List[str]:
+        """内容创建时间落在哪些时间范围内"""
+        now = now or datetime.utcnow()
+        ranges = []
+        for name, days in cls.RANGES.items():
+            if days is None or (created_at and (now - created_at).days < days):
+                ranges.append(name)
+        return ranges
+
+    @classmethod
+    def keyset_order(cls, kind: str) -> KeysetOrder:
+        """与原数据库分页一致的排序（游标可在榜单与数据库之间通用）"""
+        return KeysetOrder.of(cls.model_of(kind), "view_count", "like_count", "id")
+
+    # ========== 卡片数据 ==========
+
+    @classmethod
+    async def load_cards(cls, db: AsyncSession, kind: str, ids: List[int]) -> Dict[int, dict]:
+        """从数据库批量构建卡片数据"""
+        if not ids:
+            return {}
+        model = cls.model_of(kind)
+        query = select(model).where(model.id.in_(ids))
+        if kind == "videos":
+            query = query.options(selectinload(Video.category), selectinload(Video.tags))
+        elif kind == "shorts":
+            query = query.options(selectinload(Video.tags))
+        elif kind == "posts":
+            query = query.options(selectinload(Post.user))
+        rows = (await db.execute(query)).scalars().all()
+
+        cards = {}
+        if kind in ("videos", "shorts"):
+            for v in rows:
+                card = {
+                    "id": v.id,
+                    "title": v.title,
+                    "cover_url": v.cover_url,
+                    "duration": v.duration or 0,
+                    "view_count": v.view_count or 0,
+                    "like_count": v.like_count or 0,
+                }
+                if kind == "videos":
+                    card["category_name"] = v.category.name if v.category else None
+                card["tags"] = [t.name for t in v.tags] if v.tags else []
+                cards[v.id] = card
+        elif kind == "posts":
+            # 批量查询话题
+            all_topic_ids = set()
+            for p in rows:
+                if p.topic_ids:
+                    all_topic_ids.update(p.topic_ids)
+            topics_map = {}
+            if all_topic_ids:
+                from app.models.community import Topic
+                topic_result = await db.execute(select(Topic).where(Topic.id.in_(all_topic_ids)))
+                for t in topic_result.scalars().all():
+                    topics_map[t.id] = {"id": t.id, "name": t.name}
+            for p in rows:
+                cards[p.id] = {
+                    "id": p.id,
+                    "title": p.content[:50] if p.content else "",
+                    "content": p.content,
+                    "cover_url": p.images[0] if p.images else None,
+                    "images": p.images or [],
+                    "view_count": p.view_count or 0,
+                    "like_count": p.like_count or 0,
+                    "comment_count": p.comment_count or 0,
+                    "created_at": p.created_at.isoformat() if p.created_at else None,
+                    "user": {
+                        "id": p.user.id,
+                        "username": p.user.username,
+                        "nickname": p.user.nickname,
+                        "avatar": p.user.avatar,
+                        "is_vip": getattr(p.user, 'is_vip', False),
+                        "vip_level": getattr(p.user, 'vip_level', 0)
+                    } if p.user else None,
+                    "topics": [topics_map[tid] for tid in (p.topic_ids or []) if tid in topics_map]
+                }
+        elif kind == "novels":
+            for n in rows:
+                cards[n.id] = {
+                    "id": n.id,
+                    "title": n.title,
+                    "cover": n.cover,
+                    "cover_url": n.cover,
+                    "novel_type": n.novel_type,
+                    "view_count": n.view_count or 0,
+                    "like_count": n.like_count or 0,
+                    "tag": n.author or "小说"
+                }
+        else:
+            for g in rows:
+                cards[g.id] = {
+                    "id": g.id,
+                    "title": g.title,
+                    "cover": g.cover,
+                    "cover_url": g.cover,
+                    "view_count": g.view_count or 0,
+                    "like_count": g.like_count or 0,
+                    "tag": "图集"
+                }
+        return cards
+
+    @classmethod
+    async def _save_cards(cls, kind: str, cards: Dict[int, dict]) -> None:
+        if not cards:
+            return
+        r = await RedisCache.get_client()
+        if r is not None:
+            key = f"rank:cards:{kind}"
+            pipe = r.pipeline(transaction=False)
+            pipe.hset(key, mapping={
+                str(i): json.dumps(c, ensure_ascii=False, default=str) for i, c in cards.items()
+            })
+            pipe.expire(key, cls.CARD_TTL)
+            await pipe.execute()
+        else:
+            cls._cards.setdefault(kind, {}).update(cards)
+
+    @classmethod
+    async def get_cards(cls, db: AsyncSession, kind: str, ids: List[int]) -> Dict[int, dict]:
+        """批量读取卡片缓存，未命中的回表加载并写回"""
+        cards: Dict[int, dict] = {}
+        r = await RedisCache.get_client()
+        if r is not None:
+            raw = await r.hmget(f"rank:cards:{kind}", [str(i) for i in ids]) if ids else []
+            for item_id, value in zip(ids, raw):
+                if value:
+                    cards[item_id] = json.loads(value)
+        else:
+            local = cls._cards.get(kind, {})
+            cards = {i: local[i] for i in ids if i in local}
+
+        missing = [i for i in ids if i not in cards]
+        if missing:
+            loaded = await cls.load_cards(db, kind, missing)
+            await cls._save_cards(kind, loaded)
+            cards.update(loaded)
+        return cards
+
+    # ========== 榜单存取 ==========
+
+    @classmethod
+    async def _store_board(cls, key: str, entries: List[Tuple[int, int]]) -> None:
+        """整体替换榜单（Redis 中先写临时键再 RENAME，读者不会看到半成品）"""
+        r = await RedisCache.get_client()
+        if r is not None:
+            tmp = f"{key}:building"
+            pipe = r.pipeline(transaction=True)
+            pipe.delete(tmp)
+            if entries:
+                pipe.zadd(tmp, {cls._member(i): s for i, s in entries})
+                pipe.rename(tmp, key)
+            else:
+                pipe.delete(key)
+            await pipe.execute()
+        else:
+            cls._boards[key] = sorted(entries, key=lambda e: (-e[1], -e[0]))
+
+    @classmethod
+    async def _board_size(cls, key: str) -> Optional[int]:
+        """榜单条目数，榜单不存在时返回 None"""
+        r = await RedisCache.get_client()
+        if r is not None:
+            pipe = r.pipeline(transaction=False)
+            pipe.exists(key)
+            pipe.zcard(key)
+            exists, size = await pipe.execute()
+            return size if exists else None
+        board = cls._boards.get(key)
+        return None if board is None else len(board)
+
+    @classmethod
+    async def _board_slice(cls, key: str, start: int, stop: int) -> List[Tuple[int, int]]:
+        """取排名 [start, stop) 的条目"""
+        if stop <= start:
+            return []
+        r = await RedisCache.get_client()
+        if r is not None:
+            rows = await r.zrevrange(key, start, stop - 1, withscores=True)
+            return [(int(m), int(s)) for m, s in rows]
+        return list(cls._boards.get(key, [])[start:stop])
+
+    @classmethod
+    async def _board_offset_after(cls, key: str, score: int, item_id: int) -> int:
+        """游标所指条目之后的第一个排名"""
+        r = await RedisCache.get_client()
+        if r is not None:
+            higher = await r.zcount(key, f"({score}", "+inf")
+            ties = await r.zrevrangebyscore(key, score, score)
+            member = cls._member(item_id)
+            return higher + sum(1 for m in ties if m >= member)
+        board = cls._boards.get(key, [])
+        return sum(1 for i, s in board if s > score or (s == score and i >= item_id))
+
+    # ========== 重建与增量更新 ==========
+
+    @classmethod
+    async def rebuild(cls, db: AsyncSession, kind: str, time_range: str) -> int:
+        """全量重建单个榜单，返回条目数"""
+        model = cls.model_of(kind)
+        query = select(model.id, model.view_count, model.like_count).where(*cls._filters(kind))
+        days = cls.RANGES[time_range]
+        if days is not None:
+            query = query.where(model.created_at >= datetime.utcnow() - timedelta(days=days))
+        query = query.order_by(
+            desc(model.view_count), desc(model.like_count), desc(model.id)
+        ).limit(cls.MAX_SIZE)
+
+        rows = (await db.execute(query)).all()
+        entries = [(row[0], cls.encode_score(row[1], row[2])) for row in rows]
+        await cls._store_board(cls.board_key(kind, time_range), entries)
+        return len(entries)
+
+    @classmethod
+    async def _schedule_rebuild(cls, kind: str, time_range: str) -> None:
+        """
+        在后台重建缺失的榜单，同一榜单同时只重建一次：
+        本进程内按键去重，跨进程用 Redis 锁（{key}:rebuilding），没抢到锁说明其他进程正在重建
+        """
+        key = cls.board_key(kind, time_range)
+        if key in cls._rebuilding:
+            return
+        cls._rebuilding.add(key)
+        lock_key = f"{key}:rebuilding"
+        try:
+            r = await RedisCache.get_client()
+            if r is not None and not await r.set(lock_key, "1", nx=True, ex=cls.REBUILD_LOCK_TTL):
+                cls._rebuilding.discard(key)
+                return
+        except Exception as e:
+            logger.debug(f"排行榜重建锁不可用: {e}")
+            r = None
+
+        async def run():
+            try:
+                async with cls.session_factory() as db:
+                    await cls.rebuild(db, kind, time_range)
+            finally:
+                cls._rebuilding.discard(key)
+                if r is not None:
+                    try:
+                        await r.delete(lock_key)
+                    except Exception:
+                        pass
+
+        task = asyncio.create_task(run())
+        cls._background.add(task)
+        task.add_done_callback(cls._on_rebuild_done)
+
+    @classmethod
+    def _on_rebuild_done(cls, task: asyncio.Task) -> None:
+        cls._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"排行榜后台重建失败: {task.exception()}")
+
+    @classmethod
+    async def rebuild_all(cls, db: AsyncSession) -> int:
+        """重建全部榜单并刷新卡片缓存，返回榜单条目总数"""
+        total = 0
+        for kind in cls.KINDS:
+            for time_range in cls.RANGES:
+                total += await cls.rebuild(db, kind, time_range)
+            # 全量榜包含了其他时间范围之外的条目，这里按全部榜单成员刷新卡片
+            ids = set()
+            for time_range in cls.RANGES:
+                size = await cls._board_size(cls.board_key(kind, time_range)) or 0
+                ids.update(i for i, _ in await cls._board_slice(cls.board_key(kind, time_range), 0, size))
+            await cls._save_cards(kind, await cls.load_cards(db, kind, list(ids)))
+        return total
+
+    @classmethod
+    async def record(
+        cls,
+        kind: str,
+        item_id: int,
+        created_at: Optional[datetime],
+        views: int = 0,
+        likes: int = 0
+    ) -> None:
+        """记录播放/点赞增量（只更新已在榜单上的条目，失败不影响业务）"""
+        await cls.record_many(kind, [(item_id, created_at, views, likes)])
+
+    @classmethod
+    async def record_many(cls, kind: str, events: List[Tuple[int, Optional[datetime], int, int]]) -> None:
+        """批量记录 (id, created_at, views, likes) 增量"""
+        try:
+            now = datetime.utcnow()
+            r = await RedisCache.get_client()
+            if r is not None:
+                pipe = r.pipeline(transaction=False)
+                for item_id, created_at, views, likes in events:
+                    delta = (views or 0) * cls.SCORE_BASE + (likes or 0)
+                    if not delta:
+                        continue
+                    keys = [cls.board_key(kind, t) for t in cls.ranges_for(created_at, now)]
+                    pipe.eval(_INCR_IF_PRESENT, len(keys), *keys, cls._member(item_id), delta)
+                await pipe.execute()
+                return
+
+            for item_id, created_at, views, likes in events:
+                delta = (views or 0) * cls.SCORE_BASE + (likes or 0)
+                if not delta:
+                    continue
+                for t in cls.ranges_for(created_at, now):
+                    board = cls._boards.get(cls.board_key(kind, t))
+                    if not board:
+                        continue
+                    for index, (i, s) in enumerate(board):
+                        if i == item_id:
+                            board[index] = (i, s + delta)
+                            board.sort(key=lambda e: (-e[1], -e[0]))
+                            break
+        except Exception as e:
+            logger.warning(f"排行榜增量更新失败: {e}")
+
+    # ========== 读取 ==========
+
+    @classmethod
+    async def get_page(
+        cls,
+        db: AsyncSession,
+        kind: str,
+        time_range: str,
+        page: int = 1,
+        page_size: int = 20,
+        cursor: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        从物化榜单读取一页
+
+        返回 None 表示需要回退到数据库查询（榜单不可用或尚未建好，或翻页超出榜单保留的前 MAX_SIZE 名）
+        """
+        if time_range not in cls.RANGES:
+            time_range = "total"
+        key = cls.board_key(kind, time_range)
+        order = cls.keyset_order(kind)
+
+        try:
+            size = await cls._board_size(key)
+            if size is None:
+                # 不在请求内重建，避免榜单过期时所有请求同时全表排序
+                await cls._schedule_rebuild(kind, time_range)
+                return None
+
+            if cursor:
+                view_count, like_count, item_id = order.decode(cursor)
+                start = await cls._board_offset_after(key, cls.encode_score(view_count, like_count), item_id)
+            else:
+                start = (page - 1) * page_size
+
+            # 榜单被截断且请求超出保留范围时交给数据库
+            truncated = size >= cls.MAX_SIZE
+            if truncated and start + page_size >= size:
+                return None
+
+            entries = await cls._board_slice(key, start, start + page_size + 1)
+        except KeysetCursorError:
+            raise
+        except Exception as e:
+            logger.warning(f"读取排行榜失败，回退数据库: {e}")
+            return None
+
+        has_more = len(entries) > page_size
+        entries = entries[:page_size]
+        cards = await cls.get_cards(db, kind, [i for i, _ in entries])
+
+        items = []
+        for item_id, score in entries:
+            card = cards.get(item_id)
+            if card is None:
+                # 已删除/下架，等下次重建移出榜单
+                continue
+            view_count, like_count = cls.decode_score(score)
+            items.append({**card, "view_count": view_count, "like_count": like_count})
+
+        next_cursor = None
+        if has_more and entries:
+            item_id, score = entries[-1]
+            view_count, like_count = cls.decode_score(score)
+            next_cursor = order.encode(SimpleNamespace(view_count=view_count, like_count=like_count, id=item_id))
+
+        return {"items": items, "next_cursor": next_cursor, "has_more": has_more}
@@ -37,6 +37,8 @@ class ScheduledTasks:
                 await cls._task
             except asyncio.CancelledError:
                 pass
+        # 退出前刷入本进程缓冲的观看计数
+        await cls.flush_view_counts()
         print("[ScheduledTasks] Stopped")
     
     @classmethod
@@ -47,10 +49,22 @@ class ScheduledTasks:
                 # 每分钟执行一次检查
                 await cls.cancel_expired_orders()
                 await cls.cancel_expired_recharge_orders()
+                await cls.flush_view_counts()
+                
+                # 每10分钟重建随机推荐池
+                if datetime.utcnow().minute % 10 == 0:
+                    await cls.rebuild_shuffle_pools()
+                
+                # 每5分钟重建排行榜、对账搜索索引
+                if datetime.utcnow().minute % 5 == 0:
+                    await cls.rebuild_rankings()
+                    await cls.reconcile_search_index()
+                    await cls.rollup_statistics()
                 
                 # 每小时执行一次的任务（检查是否是整点）
                 if datetime.utcnow().minute == 0:
                     await cls.cleanup_old_temp_files()
+                    await cls.recount_comments()
                 
             except Exception as e:
                 print(f"[ScheduledTasks] 任务执行出错: {e}")
@@ -114,6 +128,82 @@ class ScheduledTasks:
                 await db.rollback()
                 print(f"[ScheduledTasks] 取消过期充值订单失败: {e}")
     
+    @classmethod
+    async def flush_view_counts(cls):
+        """刷入缓冲的视频观看计数（Celery beat 未运行或 Redis 不可用时的兜底）"""
+        from app.services.view_counter import ViewCounter
+        
+        try:
+            result = await ViewCounter.flush()
+            if result["views"] > 0:
+                print(f"[ScheduledTasks] 已刷入 {result['views']} 次观看（{result['videos']} 个视频）")
+        except Exception as e:
+            print(f"[ScheduledTasks] 刷入观看计数失败: {e}")
+    
+    @classmethod
+    async def rebuild_shuffle_pools(cls):
+        """重建短视频/视频随机推荐池"""
+        from app.services.shuffle_pool import ShufflePool
+        
+        async with AsyncSessionLocal() as db:
+            try:
+                count = await ShufflePool.rebuild_all(db)
+                print(f"[ScheduledTasks] 已重建 {count} 个随机推荐池")
+            except Exception as e:
+                print(f"[ScheduledTasks] 重建随机推荐池失败: {e}")
+    
+    @classmethod
+    async def rebuild_rankings(cls):
+        """重建物化排行榜"""
+        from app.services.ranking_service import RankingService
+        
+        async with AsyncSessionLocal() as db:
+            try:
+                total = await RankingService.rebuild_all(db)
+                print(f"[ScheduledTasks] 已重建排行榜（{total} 条）")
+            except Exception as e:
+                print(f"[ScheduledTasks] 重建排行榜失败: {e}")
+    
+    @classmethod
+    async def reconcile_search_index(cls):
+        """搜索索引对账（Core 批量更新、热度变化、删除）"""
+        from app.services.search_index import SearchIndex
+        
+        async with AsyncSessionLocal() as db:
+            try:
+                count = await SearchIndex.reconcile(db)
+                if count > 0:
+                    print(f"[ScheduledTasks] 搜索索引已对账 {count} 个文档")
+            except Exception as e:
+                await db.rollback()
+                print(f"[ScheduledTasks] 搜索索引对账失败: {e}")
+    
+    @classmethod
+    async def recount_comments(cls):
+        """核对冗余的评论数/回复数（兜底未经 recount 的隐藏、删除）"""
+        from app.services.comment_threads import CommentThreads
+        
+        async with AsyncSessionLocal() as db:
+            try:
+                count = await CommentThreads.recount_all(db)
+                if count > 0:
+                    print(f"[ScheduledTasks] 已修正 {count} 条评论计数")
+            except Exception as e:
+                await db.rollback()
+                print(f"[ScheduledTasks] 核对评论计数失败: {e}")
+    
+    @classmethod
+    async def rollup_statistics(cls):
+        """增量刷新数据看板的小时/日汇总和留存"""
+        from app.services.stats_rollup import StatsRollup
+        
+        async with AsyncSessionLocal() as db:
+            try:
+                await StatsRollup.run(db)
+            except Exception as e:
+                await db.rollback()
+                print(f"[ScheduledTasks] 统计汇总失败: {e}")
+    
     @classmethod
     async def cleanup_old_temp_files(cls):
         """清理旧的临时文件"""
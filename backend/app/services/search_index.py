@@ -0,0 +1,568 @@
+"""
+全文搜索：CJK 二元分词的倒排索引
+
+替代各列表接口里的 title ILIKE '%词%'。前导通配符用不上 title 上的 B-tree 索引，每次搜索都是全表扫描，
+中文标题也没有分词。倒排表存在业务库里（search_documents / search_postings / search_suggestions），
+SQLite、PostgreSQL、MySQL 同一套实现，不依赖 pg_trgm 等扩展。
+
+分词：
+- 文本 NFKC 归一化并转小写
+- 中日韩字符连续段切成二元组（"小猫咪" -> 小猫 / 猫咪），段尾单字也收录，这样单个汉字可以按前缀检索
+- 字母数字按词切分
+查询时所有词项都须命中（AND）；单个汉字和最后一个字母数字词按前缀匹配词项（输入到一半的 "vlo" 能命中 "vlog"）。
+列表接口的筛选条件（condition / filter）只匹配标题词项，与原 title ILIKE 的范围一致；统一搜索匹配标题、标签和简介。
+
+排序：相关度（命中字段权重之和：标题 4 / 标签 2 / 简介 1）× 热度加权 boost（1 + 0.1 * ln(1 + 热度)）。
+
+索引维护：
+- 会话事件：ORM 新增/删除文档或修改了被索引字段时，在同一事务提交前重建这些文档的索引
+- ScheduledTasks 定期对账（reconcile）：源表 updated_at 比索引新的文档按内容摘要区分——
+  只有计数变了（观看数刷入等 Core 批量更新也会刷新 updated_at）的只刷新 boost，被索引内容变了的才重建倒排；
+  源记录已删除或不再可见的移除
+- 全量重建：scripts/migrations/build_search_index.py
+"""
+import hashlib
+import math
+import operator
+import re
+import unicodedata
+import weakref
+from datetime import datetime
+from functools import reduce
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, delete, insert, and_, or_, func, distinct, case, literal, inspect, event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased, selectinload
+
+from app.models.search import SearchDocument, SearchPosting, SearchSuggestion
+from app.models.video import Video, VideoStatus
+from app.models.community import Post, Novel, Gallery
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"  # 假名、汉字、谚文
+_TOKEN_RE = re.compile(f"([{_CJK}]+)|([0-9a-z\u00c0-\u024f]+)")
+_TAG_SPLIT_RE = re.compile(r"[,，;；|#、\n]+")
+_MAX_CHAR = "\uffff"  # 前缀范围扫描的上界
+
+MAX_TERM_LENGTH = 32
+MAX_QUERY_TERMS = 12
+MAX_BODY_LENGTH = 2000   # 简介/正文只索引前 2000 字
+MAX_KEYWORD_LENGTH = 100
+
+TITLE_WEIGHT = 4
+TAG_WEIGHT = 2
+BODY_WEIGHT = 1
+POPULARITY_WEIGHT = 0.1
+
+
+def normalize(text: Optional[str]) -> str:
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """切分为索引词项（可重复）"""
+    terms = []
+    for cjk, word in _TOKEN_RE.findall(normalize(text)):
+        if cjk:
+            terms.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            terms.append(cjk[-1])
+        else:
+            terms.append(word[:MAX_TERM_LENGTH])
+    return terms
+
+
+def parse_query(text: Optional[str]) -> List[Tuple[str, bool]]:
+    """切分查询词，返回 [(词项, 是否前缀匹配)]"""
+    groups: Dict[str, bool] = {}
+    last_word = None
+    for cjk, word in _TOKEN_RE.findall(normalize(text)):
+        if not cjk:
+            last_word = word[:MAX_TERM_LENGTH]
+            groups.setdefault(last_word, False)
+        elif len(cjk) == 1:
+            groups.setdefault(cjk, True)
+        else:
+            for i in range(len(cjk) - 1):
+                groups.setdefault(cjk[i:i + 2], False)
+    if last_word is not None:
+        groups[last_word] = True  # 可能还没输入完
+    return list(groups.items())[:MAX_QUERY_TERMS]
+
+
+def normalize_keyword(text: Optional[str]) -> str:
+    return " ".join(normalize(text).split())[:MAX_KEYWORD_LENGTH]
+
+
+def split_tags(raw) -> List[str]:
+    """ai_tags 等标签字段：列表或逗号/顿号分隔的字符串"""
+    if not raw:
+        return []
+    if isinstance(raw, (list, tuple)):
+        return [str(tag).strip() for tag in raw if str(tag).strip()]
+    return [tag.strip() for tag in _TAG_SPLIT_RE.split(str(raw)) if tag.strip()]
+
+
+class SearchSource:
+    """一种可搜索内容的索引规则"""
+
+    def __init__(
+        self,
+        doc_type: str,
+        model,
+        visible: Callable,
+        watched: Sequence[str],
+        extract: Callable,
+        popularity: Callable,
+        load: Callable = lambda: (),
+    ):
+        self.doc_type = doc_type
+        self.model = model
+        self.visible = visible        # () -> SQL 条件：对外可见才收录
+        self.watched = watched        # 这些属性变化时重建索引
+        self.extract = extract        # obj -> (标题, 标签列表, 正文)
+        self.popularity = popularity  # obj -> 热度
+        self.load = load              # () -> 加载选项
+
+    def changed(self, obj) -> bool:
+        attrs = inspect(obj).attrs
+        return any(attrs[name].history.has_changes() for name in self.watched)
+
+
+def _video_extract(video: Video):
+    tags = [tag.name for tag in video.tags] + split_tags(video.ai_tags)
+    return video.title, tags, video.description
+
+
+def _post_extract(post: Post):
+    content = post.content or ""
+    return content.split("\n", 1)[0][:200], [], content
+
+
+SOURCES: Dict[str, SearchSource] = {
+    source.doc_type: source for source in (
+        SearchSource(
+            "video", Video,
+            visible=lambda: Video.status == VideoStatus.PUBLISHED,
+            watched=("title", "description", "ai_tags", "status", "tags"),
+            extract=_video_extract,
+            popularity=lambda v: (v.view_count or 0) + 5 * ((v.like_count or 0) + (v.favorite_count or 0)),
+            load=lambda: (selectinload(Video.tags),),
+        ),
+        SearchSource(
+            "post", Post,
+            visible=lambda: and_(Post.status == "published", Post.visibility == "public"),
+            watched=("content", "status", "visibility"),
+            extract=_post_extract,
+            popularity=lambda p: (p.view_count or 0) + 5 * ((p.like_count or 0) + (p.collect_count or 0)),
+        ),
+        SearchSource(
+            "novel", Novel,
+            visible=lambda: Novel.is_active == True,
+            watched=("title", "author", "description", "is_active"),
+            extract=lambda n: (n.title, [n.author] if n.author else [], n.description),
+            popularity=lambda n: (n.view_count or 0) + 5 * ((n.like_count or 0) + (n.collect_count or 0)),
+        ),
+        SearchSource(
+            "gallery", Gallery,
+            visible=lambda: Gallery.is_active == True,
+            watched=("title", "description", "is_active"),
+            extract=lambda g: (g.title, [], g.description),
+            popularity=lambda g: (g.view_count or 0) + 5 * ((g.like_count or 0) + (g.collect_count or 0)),
+        ),
+    )
+}
+_SOURCE_BY_MODEL = {source.model: source for source in SOURCES.values()}
+
+
+class SearchIndex:
+    """倒排索引的维护与查询"""
+
+    BATCH_SIZE = 500
+    DF_PROBE_LIMIT = 1000
+
+    # 引擎 -> 搜索表是否存在（未建表的库里跳过索引维护，不影响业务提交）
+    _available: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    # ==================== 查询 ====================
+
+    @staticmethod
+    def _match(groups: List[Tuple[str, bool]], title_only: bool = False):
+        """命中全部词项的文档：(document_id, relevance)
+
+        title_only 时只算出现在标题里的词项（权重含标题权重；标签 + 简介加起来也小于标题权重）
+        """
+        P = SearchPosting
+        if not any(prefix for _, prefix in groups):
+            # 精确词项：倒排表自连接求交集，每一跳都是主键 (term, document_id) 点查，
+            # 由数据库选择最短的倒排链驱动，不必扫描所有词项倒排链的并集
+            postings = [aliased(P) for _ in groups]
+            first = postings[0]
+            relevance = reduce(operator.add, [posting.weight for posting in postings])
+            query = select(first.document_id, relevance.label("relevance"))
+            for posting, (term, _) in zip(postings[1:], groups[1:]):
+                query = query.join(posting, and_(posting.term == term, posting.document_id == first.document_id))
+            query = query.where(first.term == groups[0][0])
+            if title_only:
+                query = query.where(*[posting.weight >= TITLE_WEIGHT for posting in postings])
+            return query
+        # 含前缀词项：范围扫描后按文档分组，命中的词项组数须等于查询词项数
+        conditions = [
+            and_(P.term >= term, P.term < term + _MAX_CHAR) if prefix else P.term == term
+            for term, prefix in groups
+        ]
+        if title_only:
+            conditions = [and_(cond, P.weight >= TITLE_WEIGHT) for cond in conditions]
+        matched_groups = func.count(distinct(case(*[(cond, i) for i, cond in enumerate(conditions)])))
+        return (
+            select(P.document_id, func.sum(P.weight).label("relevance"))
+            .where(or_(*conditions))
+            .group_by(P.document_id)
+            .having(matched_groups == len(groups))
+        )
+
+    @classmethod
+    async def _order_terms(cls, db: AsyncSession, groups: List[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
+        """精确词项按倒排链长度升序排列，最短的作为自连接的驱动表
+
+        每个词项最多数 DF_PROBE_LIMIT 条，一次查询完成；超过上限的视为同样高频。
+        """
+        if len(groups) < 2 or any(prefix for _, prefix in groups):
+            return groups
+        probes = [
+            select(func.count()).select_from(
+                select(literal(1)).where(SearchPosting.term == term).limit(cls.DF_PROBE_LIMIT).subquery()
+            ).scalar_subquery()
+            for term, _ in groups
+        ]
+        counts = (await db.execute(select(*probes))).one()
+        return [group for _, group in sorted(zip(counts, groups), key=lambda item: item[0])]
+
+    @classmethod
+    def condition(cls, doc_type: str, id_column, title_column, keyword: str,
+                  groups: Optional[List[Tuple[str, bool]]] = None):
+        """搜索条件：替代 title_column.ilike(f"%{keyword}%")，只匹配标题
+
+        查询里没有可用词项（如只有标点）时退回 ILIKE。
+        """
+        groups = parse_query(keyword) if groups is None else groups
+        if not groups:
+            return title_column.ilike(f"%{keyword}%")
+        matched = cls._match(groups, title_only=True).subquery()
+        doc_ids = (
+            select(SearchDocument.doc_id)
+            .join(matched, matched.c.document_id == SearchDocument.id)
+            .where(SearchDocument.doc_type == doc_type)
+        )
+        return id_column.in_(doc_ids)
+
+    @classmethod
+    async def filter(cls, db: AsyncSession, doc_type: str, id_column, title_column, keyword: str):
+        """列表接口的搜索条件（先按倒排链长度排好词项）"""
+        groups = await cls._order_terms(db, parse_query(keyword))
+        return cls.condition(doc_type, id_column, title_column, keyword, groups)
+
+    @classmethod
+    async def search(
+        cls,
+        db: AsyncSession,
+        keyword: str,
+        doc_types: Optional[Iterable[str]] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> List[Tuple[str, int, str, float]]:
+        """统一搜索，按 相关度 × boost 倒序，返回 [(doc_type, doc_id, title, score)]"""
+        groups = await cls._order_terms(db, parse_query(keyword))
+        if not groups:
+            return []
+        matched = cls._match(groups).subquery()
+        score = (matched.c.relevance * SearchDocument.boost).label("score")
+        query = (
+            select(SearchDocument.doc_type, SearchDocument.doc_id, SearchDocument.title, score)
+            .join(matched, matched.c.document_id == SearchDocument.id)
+        )
+        if doc_types:
+            query = query.where(SearchDocument.doc_type.in_(list(doc_types)))
+        query = query.order_by(score.desc(), SearchDocument.id.desc()).offset(offset).limit(limit)
+        return [tuple(row) for row in (await db.execute(query)).all()]
+
+    @classmethod
+    async def suggest(cls, db: AsyncSession, prefix: str, limit: int = 10) -> List[str]:
+        """前缀联想：联想词主键上的范围扫描，按 boost 之和排序"""
+        key = normalize_keyword(prefix)
+        if not key:
+            return []
+        result = await db.execute(
+            select(SearchSuggestion.keyword)
+            .where(SearchSuggestion.keyword >= key, SearchSuggestion.keyword < key + _MAX_CHAR)
+            .order_by(SearchSuggestion.weight.desc(), SearchSuggestion.keyword)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+    # ==================== 维护 ====================
+
+    @classmethod
+    def _enabled(cls, session: Session) -> bool:
+        connection = session.connection()
+        engine = connection.engine
+        if engine not in cls._available:
+            cls._available[engine] = connection.dialect.has_table(connection, SearchDocument.__tablename__)
+        return cls._available[engine]
+
+    @staticmethod
+    def _document_terms(title: str, tags: List[str], body: Optional[str]) -> Dict[str, int]:
+        weights: Dict[str, int] = {}
+        for weight, text in ((TITLE_WEIGHT, title), (TAG_WEIGHT, " ".join(tags)),
+                             (BODY_WEIGHT, (body or "")[:MAX_BODY_LENGTH])):
+            for term in set(tokenize(text)):
+                weights[term] = weights.get(term, 0) + weight
+        return weights
+
+    @staticmethod
+    def _content_hash(title: str, tags: List[str], body: Optional[str]) -> str:
+        content = "\x1f".join((title, "\x1e".join(tags), (body or "")[:MAX_BODY_LENGTH]))
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _boost(source: SearchSource, obj) -> float:
+        return 1 + POPULARITY_WEIGHT * math.log1p(max(source.popularity(obj), 0))
+
+    @staticmethod
+    def _adjust(deltas: Dict[str, List[float]], keywords: Optional[str], sign: int, boost: float) -> None:
+        for keyword in (keywords or "").split("\n"):
+            if keyword:
+                delta = deltas.setdefault(keyword, [0, 0.0])
+                delta[0] += sign
+                delta[1] += sign * boost
+
+    @staticmethod
+    def _apply_suggestions(session: Session, deltas: Dict[str, List[float]]) -> None:
+        """按增量累加联想词计数（各方言的 upsert），计数归零的删除"""
+        rows = [
+            {"keyword": keyword, "doc_count": count, "weight": weight}
+            for keyword, (count, weight) in sorted(deltas.items())  # 固定加锁顺序
+            if count or weight
+        ]
+        if not rows:
+            return
+        table = SearchSuggestion.__table__
+        dialect = session.get_bind().dialect.name
+        if dialect == "mysql":
+            from sqlalchemy.dialects.mysql import insert as upsert
+            stmt = upsert(table)
+            stmt = stmt.on_duplicate_key_update(
+                doc_count=table.c.doc_count + stmt.inserted.doc_count,
+                weight=table.c.weight + stmt.inserted.weight,
+            )
+        else:
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as upsert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as upsert
+            stmt = upsert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.keyword],
+                set_={
+                    "doc_count": table.c.doc_count + stmt.excluded.doc_count,
+                    "weight": table.c.weight + stmt.excluded.weight,
+                },
+            )
+        session.execute(stmt, rows)
+        session.execute(
+            delete(SearchSuggestion).where(
+                SearchSuggestion.keyword.in_([row["keyword"] for row in rows]),
+                SearchSuggestion.doc_count <= 0,
+            )
+        )
+
+    @classmethod
+    def _reindex(cls, session: Session, doc_type: str, ids: Iterable[int]) -> int:
+        """重建一批文档的索引（同步，在会话事件或 run_sync 中执行），不可见或已删除的移除，返回收录数"""
+        source = SOURCES[doc_type]
+        ids = sorted(set(ids))
+        if not ids:
+            return 0
+        model = source.model
+        objects = session.execute(
+            select(model).where(model.id.in_(ids), source.visible()).options(*source.load())
+        ).scalars().all()
+        documents = {
+            doc.doc_id: doc for doc in session.execute(
+                select(SearchDocument).where(SearchDocument.doc_type == doc_type, SearchDocument.doc_id.in_(ids))
+            ).scalars()
+        }
+
+        deltas: Dict[str, List[float]] = {}
+        for doc in documents.values():
+            cls._adjust(deltas, doc.keywords, -1, doc.boost)
+        if documents:
+            session.execute(delete(SearchPosting).where(
+                SearchPosting.document_id.in_([doc.id for doc in documents.values()])
+            ))
+
+        now = datetime.utcnow()
+        indexed = []
+        for obj in objects:
+            title, tags, body = source.extract(obj)
+            title = (title or "")[:200]
+            keywords = dict.fromkeys(k for k in map(normalize_keyword, [title] + tags) if k)
+            doc = documents.pop(obj.id, None)
+            if doc is None:
+                doc = SearchDocument(doc_type=doc_type, doc_id=obj.id)
+                session.add(doc)
+            doc.title = title
+            doc.boost = cls._boost(source, obj)
+            doc.keywords = "\n".join(keywords)
+            doc.content_hash = cls._content_hash(title, tags, body)
+            doc.source_updated_at = getattr(obj, "updated_at", None)
+            doc.indexed_at = now
+            cls._adjust(deltas, doc.keywords, 1, doc.boost)
+            indexed.append((doc, cls._document_terms(title, tags, body)))
+
+        for doc in documents.values():  # 已删除或不再可见
+            session.delete(doc)
+        session.flush()
+
+        postings = [
+            {"term": term, "document_id": doc.id, "weight": weight}
+            for doc, terms in indexed for term, weight in terms.items()
+        ]
+        if postings:
+            session.execute(insert(SearchPosting.__table__), postings)
+        cls._apply_suggestions(session, deltas)
+        return len(indexed)
+
+    @classmethod
+    def _refresh(cls, session: Session, doc_type: str, ids: Iterable[int]) -> int:
+        """对账一批源记录比索引新的文档：被索引内容没变的只刷新 boost，其余重建索引，返回重建数"""
+        source = SOURCES[doc_type]
+        ids = sorted(set(ids))
+        if not ids:
+            return 0
+        model = source.model
+        objects = {
+            obj.id: obj for obj in session.execute(
+                select(model).where(model.id.in_(ids), source.visible()).options(*source.load())
+            ).scalars()
+        }
+        documents = session.execute(
+            select(SearchDocument).where(SearchDocument.doc_type == doc_type, SearchDocument.doc_id.in_(ids))
+        ).scalars().all()
+
+        deltas: Dict[str, List[float]] = {}
+        unchanged = set()
+        for doc in documents:
+            obj = objects.get(doc.doc_id)
+            if obj is None:
+                continue
+            title, tags, body = source.extract(obj)
+            if doc.content_hash != cls._content_hash((title or "")[:200], tags, body):
+                continue
+            boost = cls._boost(source, obj)
+            if boost != doc.boost:
+                cls._adjust(deltas, doc.keywords, -1, doc.boost)
+                cls._adjust(deltas, doc.keywords, 1, boost)
+                doc.boost = boost
+            doc.source_updated_at = getattr(obj, "updated_at", None)
+            unchanged.add(doc.doc_id)
+        session.flush()
+        cls._apply_suggestions(session, deltas)
+
+        stale = [doc_id for doc_id in ids if doc_id not in unchanged]
+        cls._reindex(session, doc_type, stale)
+        return len(stale)
+
+    @classmethod
+    async def reindex(cls, db: AsyncSession, doc_type: str, ids: Iterable[int]) -> int:
+        """重建指定文档的索引（调用方提交）"""
+        ids = list(ids)
+        return await db.run_sync(lambda session: cls._reindex(session, doc_type, ids))
+
+    @classmethod
+    async def _reindex_batches(cls, db: AsyncSession, doc_type: str, ids: List[int]) -> int:
+        total = 0
+        for i in range(0, len(ids), cls.BATCH_SIZE):
+            total += await cls.reindex(db, doc_type, ids[i:i + cls.BATCH_SIZE])
+            await db.commit()
+        return total
+
+    @classmethod
+    async def reconcile(cls, db: AsyncSession) -> int:
+        """对账：刷新源记录比索引新的文档（只变了热度的不重建倒排），补齐未收录的，移除已删除/不可见的，返回处理的文档数"""
+        processed = 0
+        for doc_type, source in SOURCES.items():
+            model = source.model
+            on = and_(SearchDocument.doc_type == doc_type, SearchDocument.doc_id == model.id)
+            changed = (await db.execute(
+                select(model.id).outerjoin(SearchDocument, on).where(
+                    source.visible(),
+                    or_(SearchDocument.id.is_(None), model.updated_at > SearchDocument.source_updated_at),
+                )
+            )).scalars().all()
+            removed = (await db.execute(
+                select(SearchDocument.doc_id)
+                .outerjoin(model, and_(model.id == SearchDocument.doc_id, source.visible()))
+                .where(SearchDocument.doc_type == doc_type, model.id.is_(None))
+            )).scalars().all()
+            ids = sorted(set(changed) | set(removed))
+            for i in range(0, len(ids), cls.BATCH_SIZE):
+                batch = ids[i:i + cls.BATCH_SIZE]
+                await db.run_sync(lambda session: cls._refresh(session, doc_type, batch))
+                await db.commit()
+            processed += len(ids)
+        return processed
+
+    @classmethod
+    async def rebuild(cls, db: AsyncSession) -> Dict[str, int]:
+        """清空并全量重建索引，返回各类型收录数"""
+        await db.execute(delete(SearchPosting))
+        await db.execute(delete(SearchDocument))
+        await db.execute(delete(SearchSuggestion))
+        await db.commit()
+        counts = {}
+        for doc_type, source in SOURCES.items():
+            ids = (await db.execute(
+                select(source.model.id).where(source.visible()).order_by(source.model.id)
+            )).scalars().all()
+            counts[doc_type] = await cls._reindex_batches(db, doc_type, list(ids))
+        return counts
+
+
+# ==================== 会话事件：随业务事务增量维护 ====================
+
+_SESSION_KEY = "search_dirty_documents"
+
+
+def _has_source_changes(session: Session) -> bool:
+    return any(type(obj) in _SOURCE_BY_MODEL for obj in (*session.new, *session.dirty, *session.deleted))
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_documents(session: Session, flush_context) -> None:
+    """记录本事务中新增、删除或修改了被索引字段的文档"""
+    dirty = session.dirty
+    for obj in (*session.new, *dirty, *session.deleted):
+        source = _SOURCE_BY_MODEL.get(type(obj))
+        if source is None or obj.id is None:
+            continue
+        if obj in dirty and not source.changed(obj):
+            continue  # 只改了计数等字段，热度由对账刷新
+        session.info.setdefault(_SESSION_KEY, {}).setdefault(source.doc_type, set()).add(obj.id)
+
+
+@event.listens_for(Session, "before_commit")
+def _index_changed_documents(session: Session) -> None:
+    """提交前在同一事务内重建改动文档的索引"""
+    if _has_source_changes(session):
+        session.flush()  # 提交时的 flush 在此事件之后，先 flush 以收集全部改动
+    pending = session.info.pop(_SESSION_KEY, None)
+    if not pending or not SearchIndex._enabled(session):
+        return
+    for doc_type, ids in pending.items():
+        SearchIndex._reindex(session, doc_type, ids)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changed_documents(session: Session, previous_transaction) -> None:
+    if previous_transaction.parent is None:
+        session.info.pop(_SESSION_KEY, None)
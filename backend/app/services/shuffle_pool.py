@@ -0,0 +1,317 @@
+"""
+随机推荐池服务（Shuffle Pool）
+
+替代 ORDER BY random()：
+- 定时把每个分类下已发布视频的 ID 物化为一个"池"（存 Redis，各进程本地缓存一份）
+- 每个会话拿到一个带随机种子的游标，按种子对池做伪随机置换，逐页取 ID
+  （同一游标链内翻页不会重复）
+- 只对当前页的 ID 回表加载详情
+
+置换使用 Feistel 网络 + cycle walking，取第 i 个元素是 O(1)，不需要在内存里真正打乱整个池。
+池缺失（Redis 过期或清空）时按请求重建，同一个池同时只重建一次，其余请求等待结果。
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import random
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.query_optimizer import KeysetCursorError
+from app.core.redis import RedisCache
+from app.models.video import Video, VideoStatus, VideoCategory, ShortVideoCategory
+
+logger = logging.getLogger(__name__)
+
+_MASK64 = (1 << 64) - 1
+
+
+class ShufflePermutation:
+    """[0, n) 上由种子决定的伪随机置换"""
+
+    ROUNDS = 4
+
+    def __init__(self, n: int, seed: int):
+        self.n = n
+        bits = max(2, (n - 1).bit_length())
+        if bits % 2:
+            bits += 1
+        self.half = bits // 2
+        self.mask = (1 << self.half) - 1
+        digest = hashlib.blake2b(str(seed).encode(), digest_size=8 * self.ROUNDS).digest()
+        self.keys = [int.from_bytes(digest[i * 8:(i + 1) * 8], "little") for i in range(self.ROUNDS)]
+
+    def _round(self, r: int, key: int) -> int:
+        # splitmix64 混合
+        z = (r + key) & _MASK64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+        return (z ^ (z >> 31)) & self.mask
+
+    def __getitem__(self, i: int) -> int:
+        x = i
+        while True:
+            left, right = x >> self.half, x & self.mask
+            for key in self.keys:
+                left, right = right, left ^ self._round(right, key)
+            x = (left << self.half) | right
+            # cycle walking：落在 [n, 2^bits) 时继续置换，直到回到 [0, n)
+            if x < self.n:
+                return x
+
+
+class ShufflePool:
+    """随机推荐池"""
+
+    KIND_SHORTS = "shorts"
+    KIND_VIDEOS = "videos"
+
+    # Redis 中池的保留时间（重建后旧版本仍保留一段时间，供旧游标继续翻页）
+    POOL_TTL = 7200
+
+    # 本进程缓存：池名 -> {版本: ID数组}
+    _local: Dict[str, Dict[int, array]] = {}
+
+    # 本进程内正在重建的池：池名 -> Future
+    _building: Dict[str, asyncio.Future] = {}
+    # 跨进程重建锁的超时时间，以及等待其他进程重建结果的最长时间
+    BUILD_LOCK_TTL = 30
+    BUILD_WAIT_SECONDS = 3.0
+
+    @staticmethod
+    def pool_name(kind: str, category_id: Optional[int]) -> str:
+        return f"{kind}:{category_id or 'all'}"
+
+    @staticmethod
+    def _id_query(kind: str, category_id: Optional[int]):
+        query = select(Video.id).where(Video.status == VideoStatus.PUBLISHED)
+        if kind == ShufflePool.KIND_SHORTS:
+            query = query.where(Video.is_short == True)
+            if category_id:
+                query = query.where(Video.short_category_id == category_id)
+        else:
+            query = query.where(Video.is_short != True)
+            if category_id:
+                query = query.where(Video.category_id == category_id)
+        return query.order_by(Video.id)
+
+    @classmethod
+    def _remember(cls, name: str, version: int, ids: array) -> None:
+        versions = cls._local.setdefault(name, {})
+        versions[version] = ids
+        # 每个池只保留最近两个版本
+        for old in sorted(versions)[:-2]:
+            del versions[old]
+
+    @classmethod
+    async def build(cls, db: AsyncSession, kind: str, category_id: Optional[int] = None) -> Tuple[int, array]:
+        """从数据库重建池并发布到 Redis"""
+        name = cls.pool_name(kind, category_id)
+        result = await db.execute(cls._id_query(kind, category_id))
+        ids = array("q", result.scalars().all())
+        version = int(time.time() * 1000)
+
+        await RedisCache.set(f"pool:{name}:{version}", ",".join(map(str, ids)), cls.POOL_TTL)
+        await RedisCache.set(f"pool:{name}:version", str(version), cls.POOL_TTL)
+        cls._remember(name, version, ids)
+        return version, ids
+
+    @classmethod
+    async def _build_once(cls, db: AsyncSession, kind: str, category_id: Optional[int] = None) -> Tuple[int, array]:
+        """
+        池缺失时重建，避免每个请求都回源全表扫描：
+        同一进程内并发请求共享一次重建，跨进程用 Redis 锁（同 CacheService 单飞）
+        """
+        name = cls.pool_name(kind, category_id)
+        future = cls._building.get(name)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # 执行重建的请求被取消，由当前请求重新重建
+                return await cls._build_once(db, kind, category_id)
+
+        future = asyncio.get_running_loop().create_future()
+        cls._building[name] = future
+        try:
+            result = await cls._build_shared(db, kind, category_id)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            cls._building.pop(name, None)
+
+    @classmethod
+    async def _build_shared(cls, db: AsyncSession, kind: str, category_id: Optional[int]) -> Tuple[int, array]:
+        """抢到 Redis 锁的进程重建，其他进程等待新版本出现在 Redis 中，超时则自己重建"""
+        name = cls.pool_name(kind, category_id)
+        lock_key = f"lock:pool:{name}"
+        r = None
+        try:
+            r = await RedisCache.get_client()
+            if r is not None and not await r.set(lock_key, "1", nx=True, ex=cls.BUILD_LOCK_TTL):
+                deadline = time.monotonic() + cls.BUILD_WAIT_SECONDS
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                    current = await RedisCache.get(f"pool:{name}:version")
+                    if current is None:
+                        continue
+                    raw = await RedisCache.get(f"pool:{name}:{current}")
+                    if raw is not None:
+                        ids = cls._parse(raw)
+                        cls._remember(name, int(current), ids)
+                        return int(current), ids
+                r = None  # 等待超时，自己重建（不持有锁）
+        except Exception as e:
+            logger.debug(f"推荐池重建锁不可用: {e}")
+            r = None
+
+        try:
+            return await cls.build(db, kind, category_id)
+        finally:
+            if r is not None:
+                try:
+                    await r.delete(lock_key)
+                except Exception:
+                    pass
+
+    @staticmethod
+    def _parse(raw: str) -> array:
+        return array("q", (int(x) for x in raw.split(",") if x))
+
+    @classmethod
+    async def get(
+        cls,
+        db: AsyncSession,
+        kind: str,
+        category_id: Optional[int] = None,
+        version: Optional[int] = None
+    ) -> Tuple[int, array]:
+        """
+        获取池，返回 (版本, ID数组)
+
+        指定 version 时优先返回该版本（旧游标继续翻页），已过期则返回当前版本
+        """
+        name = cls.pool_name(kind, category_id)
+        requested = version
+
+        if version is None:
+            current = await RedisCache.get(f"pool:{name}:version")
+            if current is None:
+                return await cls._build_once(db, kind, category_id)
+            version = int(current)
+
+        local = cls._local.get(name, {})
+        if version in local:
+            return version, local[version]
+
+        raw = await RedisCache.get(f"pool:{name}:{version}")
+        if raw is None:
+            if requested is not None:
+                # 游标引用的旧版本已过期，改用当前版本（可能与之前的页少量重复）
+                return await cls.get(db, kind, category_id)
+            return await cls._build_once(db, kind, category_id)
+
+        ids = cls._parse(raw)
+        cls._remember(name, version, ids)
+        return version, ids
+
+    @staticmethod
+    def encode_cursor(kind: str, category_id: Optional[int], version: int, seed: int, offset: int) -> str:
+        raw = json.dumps(
+            {"k": kind, "c": category_id, "v": version, "s": seed, "o": offset},
+            separators=(",", ":")
+        )
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str, kind: str, category_id: Optional[int]) -> Tuple[int, int, int]:
+        """解析游标，返回 (版本, 种子, 偏移)"""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if data["k"] != kind or data["c"] != category_id:
+                raise KeysetCursorError("游标与当前列表不匹配")
+            return int(data["v"]), int(data["s"]), int(data["o"])
+        except KeysetCursorError:
+            raise
+        except Exception:
+            raise KeysetCursorError("无效的分页游标")
+
+    @classmethod
+    async def page(
+        cls,
+        db: AsyncSession,
+        kind: str,
+        category_id: Optional[int] = None,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        page: int = 1
+    ) -> Tuple[List[int], Optional[str], int]:
+        """
+        取一页随机 ID，返回 (ids, next_cursor, total)
+
+        没有游标时生成新种子（相当于一次新的"刷新"），page 用于兼容页码分页
+        """
+        if cursor:
+            version, seed, offset = cls.decode_cursor(cursor, kind, category_id)
+            version, ids = await cls.get(db, kind, category_id, version)
+        else:
+            version, ids = await cls.get(db, kind, category_id)
+            seed = random.getrandbits(48)
+            offset = (page - 1) * limit
+
+        total = len(ids)
+        if offset >= total:
+            return [], None, total
+
+        perm = ShufflePermutation(total, seed)
+        end = min(offset + limit, total)
+        page_ids = [ids[perm[i]] for i in range(offset, end)]
+
+        next_cursor = cls.encode_cursor(kind, category_id, version, seed, end) if end < total else None
+        return page_ids, next_cursor, total
+
+    @classmethod
+    async def rebuild_all(cls, db: AsyncSession) -> int:
+        """重建全部池（全站 + 各分类），返回重建的池数量"""
+        count = 0
+
+        await cls.build(db, cls.KIND_SHORTS)
+        result = await db.execute(select(ShortVideoCategory.id).where(ShortVideoCategory.is_active == True))
+        for category_id in result.scalars().all():
+            await cls.build(db, cls.KIND_SHORTS, category_id)
+            count += 1
+
+        await cls.build(db, cls.KIND_VIDEOS)
+        result = await db.execute(select(VideoCategory.id).where(VideoCategory.is_active == True))
+        for category_id in result.scalars().all():
+            await cls.build(db, cls.KIND_VIDEOS, category_id)
+            count += 1
+
+        return count + 2
+
+
+async def hydrate_videos(db: AsyncSession, ids: List[int], *options) -> List[Video]:
+    """按给定 ID 顺序加载视频，跳过已下架/删除的"""
+    if not ids:
+        return []
+    # 只按主键过滤（状态在内存中判断），避免优化器改走 status 索引扫描大量行
+    result = await db.execute(select(Video).where(Video.id.in_(ids)).options(*options))
+    by_id = {v.id: v for v in result.scalars().all() if v.status == VideoStatus.PUBLISHED}
+    return [by_id[i] for i in ids if i in by_id]
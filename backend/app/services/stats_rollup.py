@@ -0,0 +1,464 @@
+"""
+统计汇总 - 管理后台数据看板的预聚合表
+
+看板接口原来每次请求都实时扫描业务表（func.date(created_at) == today 用不上索引、全表 count、
+按天循环逐日查询），数据越多越慢。现在由定时任务增量汇总，接口只读汇总表：
+
+- HourlyStats：每小时可加和的指标（注册、新视频、评论、播放、充值、VIP支付、打赏、购买、提现）
+  以及该小时的活跃用户数
+- UserDailyActivity：(日期, 用户) 活跃记录，来源为观看、登录、注册、评论、购买、打赏、充值、支付
+- PlatformDailyStats / DailyRevenueReport：每日汇总，可加和指标由当天的小时汇总相加，
+  日活/月活/付费用户等去重指标从活跃记录和订单计算
+- UserRetentionStats：按注册日期分群，第 N 天有活跃记录的用户占比
+
+时间一律按 UTC 划分。增量任务（ScheduledTasks 每 5 分钟）重算当前和上一个整点（覆盖延迟写入的
+观看记录等），以及被标记为脏的更早整点（观看缓冲积压后刷入的记录按原观看时间写入，刷入时通过
+mark_dirty 登记），再刷新涉及日期的日汇总和留存；历史数据用
+scripts/migrations/backfill_stats_rollup.py 回填。汇总结果可重复计算，重跑不会重复累加。
+
+登录只记录最后一次时间（User.last_login），历史登录无法回溯，回填的活跃度以其他行为为主。
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select, delete, insert, func, distinct, union
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.redis import RedisCache
+from app.models.comment import Comment
+from app.models.coins import RechargeOrder, VideoPurchase
+from app.models.creator import Creator, CreatorWithdrawal, VideoTip
+from app.models.payment import PaymentOrder, PaymentStatus
+from app.models.statistics import (
+    HourlyStats, UserDailyActivity, PlatformDailyStats, DailyRevenueReport, UserRetentionStats
+)
+from app.models.user import User, UserVIP
+from app.models.video import Video, VideoStatus, VideoView
+
+logger = logging.getLogger(__name__)
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+RETENTION_DAYS = (1, 3, 7, 14, 30)
+MAU_WINDOW = 30
+
+
+class HourlyMetric:
+    """一张业务表按小时汇总出的指标"""
+
+    def __init__(self, time_column, aggregates: Dict[str, object], where: Tuple = ()):
+        self.time_column = time_column
+        self.aggregates = aggregates  # HourlyStats 列名 -> 聚合表达式
+        self.where = where
+
+
+class ActivitySource:
+    """一种算作活跃的用户行为"""
+
+    def __init__(self, user_column, time_column, where: Tuple = ()):
+        self.user_column = user_column
+        self.time_column = time_column
+        self.where = where
+
+
+HOURLY_METRICS: List[HourlyMetric] = [
+    HourlyMetric(User.created_at, {"new_users": func.count()}),
+    HourlyMetric(Video.created_at, {"new_videos": func.count()}),
+    HourlyMetric(Comment.created_at, {"new_comments": func.count()}),
+    HourlyMetric(VideoView.created_at, {"views": func.count()}),
+    HourlyMetric(
+        RechargeOrder.paid_at,
+        {"recharge_amount": func.sum(RechargeOrder.amount), "recharge_orders": func.count()},
+        (RechargeOrder.status == "paid",),
+    ),
+    HourlyMetric(
+        PaymentOrder.paid_at,
+        {"payment_amount": func.sum(PaymentOrder.amount), "payment_orders": func.count()},
+        (PaymentOrder.status == PaymentStatus.SUCCESS,),
+    ),
+    HourlyMetric(VideoTip.created_at, {"tip_coins": func.sum(VideoTip.coins_amount), "tip_count": func.count()}),
+    HourlyMetric(
+        VideoPurchase.created_at,
+        {"purchase_coins": func.sum(VideoPurchase.coins_paid), "purchase_count": func.count()},
+    ),
+    HourlyMetric(
+        CreatorWithdrawal.processed_at,
+        {"withdrawal_amount": func.sum(CreatorWithdrawal.cash_amount),
+         "withdrawal_coins": func.sum(CreatorWithdrawal.coins_amount)},
+        (CreatorWithdrawal.status == "completed",),
+    ),
+]
+
+ACTIVITY_SOURCES: List[ActivitySource] = [
+    ActivitySource(VideoView.user_id, VideoView.created_at),
+    ActivitySource(User.id, User.last_login),
+    ActivitySource(User.id, User.created_at),
+    ActivitySource(Comment.user_id, Comment.created_at),
+    ActivitySource(VideoPurchase.user_id, VideoPurchase.created_at),
+    ActivitySource(VideoTip.user_id, VideoTip.created_at),
+    ActivitySource(RechargeOrder.user_id, RechargeOrder.paid_at, (RechargeOrder.status == "paid",)),
+    ActivitySource(PaymentOrder.user_id, PaymentOrder.paid_at, (PaymentOrder.status == PaymentStatus.SUCCESS,)),
+]
+
+HOURLY_COLUMNS = [name for metric in HOURLY_METRICS for name in metric.aggregates]
+
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def floor_hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _hour_bucket(column, dialect: str):
+    """按小时截断的分组表达式（范围条件仍然作用在原列上，可走索引）"""
+    if dialect == "postgresql":
+        return func.date_trunc("hour", column)
+    if dialect == "mysql":
+        return func.date_format(column, "%Y-%m-%d %H:00:00")
+    return func.strftime("%Y-%m-%d %H:00:00", column)
+
+
+def _as_hour(value) -> datetime:
+    if isinstance(value, str):
+        return datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S")
+    return floor_hour(value)
+
+
+def _number(value):
+    return value if value is not None else 0
+
+
+def _hour_ranges(hours: Iterable[datetime]) -> List[Tuple[datetime, datetime]]:
+    """把整点集合合并成连续的 [start, end) 区间"""
+    ranges: List[List[datetime]] = []
+    for hour in sorted(hours):
+        if ranges and ranges[-1][1] == hour:
+            ranges[-1][1] = hour + HOUR
+        else:
+            ranges.append([hour, hour + HOUR])
+    return [(start, end) for start, end in ranges]
+
+
+class StatsRollup:
+    """统计汇总的增量计算、回填与读取"""
+
+    DIRTY_HOURS_KEY = "stats:dirty_hours"  # Set: 待重算的整点（%Y-%m-%d %H:00:00）
+
+    # 内存备用（Redis 不可用时）
+    _local_dirty: Set[datetime] = set()
+
+    # ==================== 脏整点 ====================
+
+    @classmethod
+    async def mark_dirty(cls, moments: Iterable[datetime]) -> None:
+        """登记有延迟写入数据的整点，下次增量任务一并重算（当前和上一个整点本来就会重算，不登记）"""
+        recent = floor_hour(datetime.utcnow()) - HOUR
+        hours = {floor_hour(moment) for moment in moments if moment is not None}
+        hours = {hour for hour in hours if hour < recent}
+        if not hours:
+            return
+        try:
+            r = await RedisCache.get_client()
+            if r is not None:
+                await r.sadd(cls.DIRTY_HOURS_KEY, *[f"{hour:%Y-%m-%d %H:00:00}" for hour in hours])
+                return
+        except Exception as e:
+            logger.debug(f"登记待重算整点到Redis失败，使用内存: {e}")
+        cls._local_dirty.update(hours)
+
+    @classmethod
+    async def _take_dirty(cls) -> Set[datetime]:
+        """取出并清空待重算的整点"""
+        hours, cls._local_dirty = cls._local_dirty, set()
+        try:
+            r = await RedisCache.get_client()
+            if r is not None:
+                pipe = r.pipeline(transaction=True)
+                pipe.smembers(cls.DIRTY_HOURS_KEY)
+                pipe.delete(cls.DIRTY_HOURS_KEY)
+                raw, _ = await pipe.execute()
+                for value in raw or ():
+                    if isinstance(value, bytes):
+                        value = value.decode()
+                    hours.add(_as_hour(value))
+        except Exception as e:
+            logger.warning(f"读取待重算整点失败: {e}")
+        return hours
+
+    # ==================== 小时汇总与活跃记录 ====================
+
+    @classmethod
+    async def rollup_hours(cls, db: AsyncSession, start: datetime, end: datetime) -> int:
+        """重算 [start, end) 内每个整点的小时汇总，并补记活跃记录，返回小时数"""
+        start, end = floor_hour(start), floor_hour(end)
+        dialect = db.get_bind().dialect.name
+        hours = []
+        cursor = start
+        while cursor < end:
+            hours.append(cursor)
+            cursor += HOUR
+        if not hours:
+            return 0
+        values: Dict[datetime, Dict[str, object]] = {hour: dict.fromkeys(HOURLY_COLUMNS, 0) for hour in hours}
+
+        for metric in HOURLY_METRICS:
+            bucket = _hour_bucket(metric.time_column, dialect).label("bucket")
+            names = list(metric.aggregates)
+            result = await db.execute(
+                select(bucket, *[metric.aggregates[name].label(name) for name in names])
+                .where(metric.time_column >= start, metric.time_column < end, *metric.where)
+                .group_by(bucket)
+            )
+            for row in result.all():
+                hour = _as_hour(row.bucket)
+                if hour in values:
+                    for name in names:
+                        values[hour][name] = _number(getattr(row, name))
+
+        activity = await cls._collect_activity(db, start, end, dialect)
+        active_per_hour = Counter(hour for hour, _ in activity)
+
+        await db.execute(delete(HourlyStats).where(HourlyStats.stat_hour >= start, HourlyStats.stat_hour < end))
+        now = datetime.utcnow()
+        await db.execute(insert(HourlyStats), [
+            {"stat_hour": hour, "active_users": active_per_hour.get(hour, 0), "updated_at": now, **values[hour]}
+            for hour in hours
+        ])
+        await cls._record_activity(db, {(hour.date(), user_id) for hour, user_id in activity})
+        return len(hours)
+
+    @staticmethod
+    async def _collect_activity(
+        db: AsyncSession, start: datetime, end: datetime, dialect: str
+    ) -> Set[Tuple[datetime, int]]:
+        """各来源在 [start, end) 内的 (整点, 用户) 去重集合"""
+        activity: Set[Tuple[datetime, int]] = set()
+        for source in ACTIVITY_SOURCES:
+            bucket = _hour_bucket(source.time_column, dialect)
+            result = await db.execute(
+                select(bucket, source.user_column)
+                .where(
+                    source.time_column >= start, source.time_column < end,
+                    source.user_column.isnot(None), *source.where,
+                )
+                .distinct()
+            )
+            activity.update((_as_hour(hour), user_id) for hour, user_id in result.all())
+        return activity
+
+    @staticmethod
+    async def _record_activity(db: AsyncSession, rows: Set[Tuple[date, int]]) -> None:
+        """写入活跃记录（已存在的忽略）"""
+        if not rows:
+            return
+        table = UserDailyActivity.__table__
+        dialect = db.get_bind().dialect.name
+        if dialect == "mysql":
+            stmt = insert(table).prefix_with("IGNORE")
+        else:
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as upsert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as upsert
+            stmt = upsert(table).on_conflict_do_nothing(index_elements=[table.c.activity_date, table.c.user_id])
+        await db.execute(stmt, [
+            {"activity_date": activity_date, "user_id": user_id}
+            for activity_date, user_id in sorted(rows)
+        ])
+
+    # ==================== 日汇总与留存 ====================
+
+    @classmethod
+    async def rollup_day(cls, db: AsyncSession, day: date, today: Optional[date] = None) -> PlatformDailyStats:
+        """由小时汇总和活跃记录重算某天的 PlatformDailyStats / DailyRevenueReport"""
+        today = today or datetime.utcnow().date()
+        start, end = day_start(day), day_start(day + DAY)
+
+        sums = (await db.execute(
+            select(*[func.coalesce(func.sum(getattr(HourlyStats, name)), 0).label(name) for name in HOURLY_COLUMNS])
+            .where(HourlyStats.stat_hour >= start, HourlyStats.stat_hour < end)
+        )).one()._mapping
+
+        dau = await db.scalar(
+            select(func.count()).select_from(UserDailyActivity).where(UserDailyActivity.activity_date == day)
+        ) or 0
+        mau = await db.scalar(
+            select(func.count(distinct(UserDailyActivity.user_id))).where(
+                UserDailyActivity.activity_date > day - timedelta(days=MAU_WINDOW),
+                UserDailyActivity.activity_date <= day,
+            )
+        ) or 0
+        recharge_users = select(RechargeOrder.user_id).where(
+            RechargeOrder.status == "paid", RechargeOrder.paid_at >= start, RechargeOrder.paid_at < end
+        )
+        payment_users = select(PaymentOrder.user_id).where(
+            PaymentOrder.status == PaymentStatus.SUCCESS, PaymentOrder.paid_at >= start, PaymentOrder.paid_at < end
+        )
+        recharge_user_count = await db.scalar(
+            select(func.count()).select_from(recharge_users.distinct().subquery())
+        ) or 0
+        paying_users = await db.scalar(
+            select(func.count()).select_from(union(recharge_users, payment_users).subquery())
+        ) or 0
+        active_creators = await db.scalar(
+            select(func.count(distinct(Video.uploader_id))).where(Video.created_at >= start, Video.created_at < end)
+        ) or 0
+
+        # 累计值：前一天的累计 + 当天新增；没有前一天的汇总时直接统计
+        previous = await db.scalar(select(PlatformDailyStats).where(PlatformDailyStats.stat_date == day - DAY))
+        if previous is not None:
+            total_users = (previous.total_users or 0) + sums["new_users"]
+            total_videos = (previous.total_videos or 0) + sums["new_videos"]
+        else:
+            total_users = await db.scalar(select(func.count(User.id)).where(User.created_at < end)) or 0
+            total_videos = await db.scalar(select(func.count(Video.id)).where(Video.created_at < end)) or 0
+
+        stats = await db.scalar(select(PlatformDailyStats).where(PlatformDailyStats.stat_date == day))
+        if stats is None:
+            stats = PlatformDailyStats(stat_date=day)
+            db.add(stats)
+        stats.total_users = total_users
+        stats.new_users = sums["new_users"]
+        stats.dau = dau
+        stats.mau = mau
+        stats.total_videos = total_videos
+        stats.new_videos = sums["new_videos"]
+        stats.total_views = sums["views"]
+        stats.total_comments = sums["new_comments"]
+        stats.total_recharge = sums["recharge_amount"]
+        stats.total_consumption = sums["tip_coins"] + sums["purchase_coins"]
+        stats.platform_revenue = Decimal(str(sums["recharge_amount"])) + Decimal(str(sums["payment_amount"]))
+        stats.active_creators = active_creators
+        stats.creator_payouts = sums["withdrawal_coins"]
+        if day == today:
+            now = datetime.utcnow()
+            stats.vip_users = await db.scalar(
+                select(func.count()).select_from(UserVIP).where(UserVIP.is_active == True, UserVIP.expire_date > now)
+            ) or 0
+            stats.published_videos = await db.scalar(
+                select(func.count()).select_from(Video).where(Video.status == VideoStatus.PUBLISHED)
+            ) or 0
+            stats.total_creators = await db.scalar(select(func.count(Creator.id))) or 0
+        elif previous is not None and stats.published_videos is None:
+            stats.vip_users = previous.vip_users
+            stats.published_videos = previous.published_videos
+            stats.total_creators = previous.total_creators
+
+        income = Decimal(str(sums["recharge_amount"])) + Decimal(str(sums["payment_amount"]))
+        report = await db.scalar(select(DailyRevenueReport).where(DailyRevenueReport.report_date == day))
+        if report is None:
+            report = DailyRevenueReport(report_date=day)
+            db.add(report)
+        report.total_recharge = sums["recharge_amount"]
+        report.recharge_orders = sums["recharge_orders"]
+        report.recharge_users = recharge_user_count
+        report.total_video_sales = sums["purchase_coins"]
+        report.total_tips = sums["tip_coins"]
+        report.total_vip_sales = sums["payment_amount"]
+        report.total_withdrawals = sums["withdrawal_amount"]
+        report.new_users = sums["new_users"]
+        report.active_users = dau
+        report.paying_users = paying_users
+        report.arpu = round(income / dau, 2) if dau else None
+        report.arppu = round(income / paying_users, 2) if paying_users else None
+        report.pay_rate = round(paying_users / dau, 4) if dau else None
+
+        await db.flush()
+        return stats
+
+    @classmethod
+    async def rollup_retention(cls, db: AsyncSession, day: date) -> None:
+        """以 day 为第 N 天，刷新各注册群组的留存（第 N 天有活跃记录即为留存）"""
+        for n in RETENTION_DAYS:
+            cohort = day - timedelta(days=n)
+            start, end = day_start(cohort), day_start(cohort + DAY)
+            cohort_users = select(User.id).where(User.created_at >= start, User.created_at < end)
+            total = await db.scalar(select(func.count()).select_from(cohort_users.subquery())) or 0
+            if not total:
+                continue
+            retained = await db.scalar(
+                select(func.count()).select_from(UserDailyActivity).where(
+                    UserDailyActivity.activity_date == day,
+                    UserDailyActivity.user_id.in_(cohort_users),
+                )
+            ) or 0
+            row = await db.scalar(select(UserRetentionStats).where(
+                UserRetentionStats.cohort_date == cohort, UserRetentionStats.day_n == n
+            ))
+            if row is None:
+                row = UserRetentionStats(cohort_date=cohort, day_n=n)
+                db.add(row)
+            row.total_users = total
+            row.retained_users = retained
+            row.retention_rate = round(retained / total, 4)
+        await db.flush()
+
+    # ==================== 任务入口 ====================
+
+    @classmethod
+    async def run(cls, db: AsyncSession, now: Optional[datetime] = None) -> List[date]:
+        """增量汇总：重算当前和上一个整点及登记的脏整点，再刷新涉及日期的日汇总和留存，提交事务"""
+        now = now or datetime.utcnow()
+        current = floor_hour(now)
+        dirty = await cls._take_dirty()
+        hours = dirty | {current - HOUR, current}
+        try:
+            for start, end in _hour_ranges(hours):
+                await cls.rollup_hours(db, start, end)
+            days = sorted({hour.date() for hour in hours})
+            for day in days:  # 按日期升序，累计值从前一天接续
+                await cls.rollup_day(db, day, today=now.date())
+                await cls.rollup_retention(db, day)
+            await db.commit()
+        except Exception:
+            await cls.mark_dirty(dirty)
+            raise
+        return days
+
+    @classmethod
+    async def backfill(cls, db: AsyncSession, since: date, until: Optional[date] = None) -> int:
+        """按天回填 [since, until] 的全部汇总（逐天提交），返回天数"""
+        today = datetime.utcnow().date()
+        until = until or today
+        day = since
+        count = 0
+        while day <= until:
+            await cls.rollup_hours(db, day_start(day), day_start(day + DAY))
+            await cls.rollup_day(db, day, today=today)
+            await cls.rollup_retention(db, day)
+            await db.commit()
+            count += 1
+            day += DAY
+        return count
+
+    # ==================== 读取 ====================
+
+    @staticmethod
+    async def daily(db: AsyncSession, model, start: date, end: date) -> list:
+        """读取 [start, end] 的日汇总行（PlatformDailyStats 或 DailyRevenueReport），按日期升序"""
+        column = model.stat_date if model is PlatformDailyStats else model.report_date
+        result = await db.execute(select(model).where(column >= start, column <= end).order_by(column))
+        return list(result.scalars().all())
+
+    @staticmethod
+    async def latest(db: AsyncSession) -> Optional[PlatformDailyStats]:
+        """最近一天的平台汇总（累计值与快照取这一行）"""
+        return await db.scalar(select(PlatformDailyStats).order_by(PlatformDailyStats.stat_date.desc()).limit(1))
+
+    @staticmethod
+    async def retention(db: AsyncSession, start: date, end: date) -> Dict[date, Dict[int, UserRetentionStats]]:
+        """[start, end] 注册群组的留存：{注册日期: {N: 行}}"""
+        result = await db.execute(
+            select(UserRetentionStats)
+            .where(UserRetentionStats.cohort_date >= start, UserRetentionStats.cohort_date <= end)
+            .order_by(UserRetentionStats.cohort_date.desc(), UserRetentionStats.day_n)
+        )
+        cohorts: Dict[date, Dict[int, UserRetentionStats]] = defaultdict(dict)
+        for row in result.scalars().all():
+            cohorts[row.cohort_date][row.day_n] = row
+        return cohorts
@@ -5,7 +5,6 @@
 """
 import os
 import subprocess
-import json
 import asyncio
 from typing import Optional
 from datetime import datetime
@@ -17,6 +16,7 @@ from app.core.database import AsyncSessionLocal
 from app.models.video import Video, VideoStatus, VideoQuality
 from app.core.redis import RedisCache
 from app.services.ai_service import AIService
+from app.services.media_probe import MediaProbe
 
 # 线程池用于执行阻塞的FFmpeg操作
 # 动态设置：根据CPU核心数调整，最小2，最大8
@@ -28,6 +28,9 @@ _executor = ThreadPoolExecutor(max_workers=_max_workers)
 # 最多同时处理2个视频（转码是CPU密集型操作）
 _processing_semaphore = asyncio.Semaphore(2)
 
+# 媒体信息探测（单次 ffprobe，结果按文件大小/修改时间缓存）
+media_probe = MediaProbe(settings.PROBE_CACHE_PATH)
+
 
 class VideoProcessor:
     """视频处理器"""
@@ -185,43 +188,8 @@ class VideoProcessor:
     
     @staticmethod
     def _run_ffprobe(file_path: str) -> dict:
-        """同步执行ffprobe（在线程池中运行）"""
-        cmd = [
-            "ffprobe",
-            "-v", "quiet",
-            "-print_format", "json",
-            "-show_format",
-            "-show_streams",
-            file_path
-        ]
-        
-        try:
-            result = subprocess.run(cmd, capture_output=True, timeout=60)
-            if result.returncode != 0:
-                print(f"ffprobe错误: {result.stderr.decode('utf-8', errors='ignore')}")
-                return {"duration": 0, "width": 0, "height": 0}
-            
-            info = json.loads(result.stdout.decode('utf-8', errors='ignore'))
-            
-            duration = float(info.get("format", {}).get("duration", 0))
-            
-            video_stream = None
-            for stream in info.get("streams", []):
-                if stream.get("codec_type") == "video":
-                    video_stream = stream
-                    break
-            
-            width = video_stream.get("width", 0) if video_stream else 0
-            height = video_stream.get("height", 0) if video_stream else 0
-            
-            return {
-                "duration": duration,
-                "width": width,
-                "height": height
-            }
-        except Exception as e:
-            print(f"获取视频信息失败: {e}")
-            return {"duration": 0, "width": 0, "height": 0}
+        """同步执行ffprobe（在线程池中运行，命中探测缓存时不启动 ffprobe）"""
+        return media_probe.probe(file_path).to_dict()
     
     @staticmethod
     async def get_video_info(file_path: str) -> dict:
@@ -246,64 +214,31 @@ class VideoProcessor:
             return VideoQuality.SD
     
     @staticmethod
-    def _analyze_frame_quality(image_path: str) -> dict:
+    def _analyze_frame_quality(image_paths: list) -> list:
         """
-        使用OpenCV分析帧质量
-        返回: {score, sharpness, colorfulness, brightness, has_face}
+        批量分析帧质量（frame_scoring，一次计算所有候选帧）
+        返回与 image_paths 顺序一致的列表: [{score, sharpness, colorfulness, brightness, is_blank, duplicate_of, has_face}]
+        人脸检测为加分项（安装了 opencv 时生效）
+        读取失败的帧为 {"score": 0}
         """
         try:
-            import cv2
-            import numpy as np
-            
-            img = cv2.imread(image_path)
-            if img is None:
-                return {"score": 0}
-            
-            # 1. 清晰度评分 (Laplacian方差)
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
-            
-            # 2. 色彩丰富度 (颜色标准差)
-            hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-            colorfulness = np.std(hsv[:,:,0]) + np.std(hsv[:,:,1])
-            
-            # 3. 亮度适中度 (偏离128的程度，越小越好)
-            brightness = np.mean(gray)
-            brightness_score = 100 - abs(brightness - 128) * 0.5
-            
-            # 4. 避免纯黑/纯白帧
-            if brightness < 20 or brightness > 235:
-                return {"score": 0, "reason": "太暗或太亮"}
-            
-            # 5. 人脸检测 (可选，加分项)
-            has_face = False
-            try:
-                face_cascade = cv2.CascadeClassifier(
-                    cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-                )
-                faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-                has_face = len(faces) > 0
-            except:
-                pass
-            
-            # 综合评分
-            score = (
-                sharpness * 0.4 +           # 清晰度权重40%
-                colorfulness * 0.3 +         # 色彩权重30%
-                brightness_score * 0.2 +     # 亮度权重20%
-                (50 if has_face else 0)      # 人脸加分50
-            )
-            
-            return {
-                "score": score,
-                "sharpness": sharpness,
-                "colorfulness": colorfulness,
-                "brightness": brightness,
-                "has_face": has_face
-            }
+            from app.services.frame_scoring import score_frames
+            
+            results = [{"score": 0} for _ in image_paths]
+            for frame in score_frames(image_paths, faces=True):
+                results[frame.index] = {
+                    "score": frame.score,
+                    "sharpness": frame.sharpness,
+                    "colorfulness": frame.colorfulness,
+                    "brightness": frame.brightness,
+                    "is_blank": frame.is_blank,
+                    "duplicate_of": frame.duplicate_of,
+                    "has_face": frame.has_face,
+                }
+            return results
         except Exception as e:
             print(f"帧分析失败: {e}")
-            return {"score": 0}
+            return [{"score": 0} for _ in image_paths]
     
     @staticmethod
     def _run_thumbnail(video_id: int, file_path: str, thumbnail_path: str, duration: float = 0) -> str:
@@ -362,27 +297,10 @@ class VideoProcessor:
                 
                 result = subprocess.run(cmd, capture_output=True, timeout=30)
                 if result.returncode == 0 and os.path.exists(temp_path):
-                    # AI美学评分（高级版）
-                    try:
-                        from app.services.aesthetic_scorer import analyze_aesthetic
-                        analysis = analyze_aesthetic(temp_path)
-                        score = analysis.get("aesthetic_score", 0)
-                    except ImportError:
-                        # 回退到基础分析
-                        analysis = VideoProcessor._analyze_frame_quality(temp_path)
-                        score = analysis.get("score", 0)
-                    
                     candidates.append({
                         "path": temp_path,
                         "time": time_point,
-                        "score": score,
-                        "analysis": analysis
                     })
-                    
-                    # 显示评分详情
-                    comp = analysis.get("composition_score", 0)
-                    color = analysis.get("color_harmony", 0)
-                    print(f"  [Thumb] {time_str}: 美学={score:.1f} 构图={comp:.1f} 色彩={color:.1f}")
             
             if not candidates:
                 print("[FAIL] 智能采样失败，回退到第1秒")
@@ -394,11 +312,23 @@ class VideoProcessor:
                 subprocess.run(cmd, capture_output=True, timeout=30)
                 return f"/uploads/thumbnails/{video_id}.jpg" if os.path.exists(thumbnail_path) else ""
             
-            # 选择AI评分最高的帧
-            best = max(candidates, key=lambda x: x["score"])
+            # 批量初筛 + AI美学评分（高级版）
+            try:
+                from app.services.aesthetic_scorer import get_best_frame
+                best_path, analysis = get_best_frame([c["path"] for c in candidates])
+                best = next(c for c in candidates if c["path"] == best_path)
+                best["score"] = analysis.get("aesthetic_score", 0)
+            except ImportError:
+                # 回退到基础分析
+                analyses = VideoProcessor._analyze_frame_quality([c["path"] for c in candidates])
+                for candidate, analysis in zip(candidates, analyses):
+                    candidate["score"] = analysis.get("score", 0)
+                    candidate["analysis"] = analysis
+                best = max(candidates, key=lambda x: x["score"])
+                analysis = best["analysis"]
+            
             shutil.copy(best["path"], thumbnail_path)
             
-            analysis = best["analysis"]
             print(f"[OK] AI智能缩略图生成成功!")
             print(f"   🏆 选择时间点: {best['time']:.1f}秒")
             print(f"   📊 美学评分: {best['score']:.1f}/100")
@@ -474,36 +404,22 @@ class VideoProcessor:
                 
                 result = subprocess.run(cmd, capture_output=True, timeout=30)
                 if result.returncode == 0 and os.path.exists(temp_path):
-                    # 简单评分：基于文件大小和基础分析
-                    try:
-                        import cv2
-                        img = cv2.imread(temp_path)
-                        if img is not None:
-                            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                            sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
-                            brightness = gray.mean()
-                            
-                            # 避免过暗或过亮
-                            if brightness < 20 or brightness > 235:
-                                score = 0
-                            else:
-                                score = min(100, sharpness / 10 + img.std() / 2)
-                        else:
-                            score = os.path.getsize(temp_path) / 5000
-                    except:
-                        score = os.path.getsize(temp_path) / 5000
-                    
                     candidates.append({
                         "path": temp_path,
                         "time": time_point,
-                        "score": score
+                        "time_str": time_str,
                     })
-                    print(f"  [Thumb] WebP {time_str}: 评分={score:.1f}")
             
             if not candidates:
                 print("[FAIL] WebP智能采样失败")
                 return ""
             
+            # 批量评分（黑屏/纯色帧和重复帧降权），失败时按文件大小
+            analyses = VideoProcessor._analyze_frame_quality([c["path"] for c in candidates])
+            for candidate, analysis in zip(candidates, analyses):
+                candidate["score"] = analysis.get("score", 0) or os.path.getsize(candidate["path"]) / 5000
+                print(f"  [Thumb] WebP {candidate['time_str']}: 评分={candidate['score']:.1f}")
+            
             # 选择评分最高的帧
             best = max(candidates, key=lambda x: x["score"])
             shutil.copy(best["path"], thumbnail_path)
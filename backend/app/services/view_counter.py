@@ -0,0 +1,238 @@
+"""
+视频观看计数缓冲服务（Write-Behind）
+
+播放请求只写 Redis（HINCRBY 计数 + 观看事件队列），
+由定时任务批量刷入数据库：
+- 每个视频一条 UPDATE videos SET view_count = view_count + delta
+- VideoView 观看记录批量 INSERT
+
+Redis 不可用（RedisCache 处于内存缓存模式）时，计数缓冲在进程内存中，
+由本进程的 ScheduledTasks 定期刷入数据库。
+"""
+import json
+import time
+import logging
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple
+
+from sqlalchemy import select, update, insert, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.redis import RedisCache
+from app.models.video import Video, VideoView
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounterKeys:
+    """Redis 键定义"""
+    PENDING_COUNTS = "video:views:pending"   # Hash: video_id -> 待刷入的增量
+    PENDING_EVENTS = "video:views:events"    # List: JSON 观看事件
+
+
+class ViewCounter:
+    """视频观看计数缓冲"""
+
+    # 每次刷入的最大事件数
+    FLUSH_BATCH_SIZE = 5000
+    # 事件队列上限，超出后丢弃最旧的事件（计数仍然准确）
+    MAX_BUFFERED_EVENTS = 500000
+
+    # 内存备用缓冲（Redis 不可用时）
+    _local_counts: Dict[int, int] = {}
+    _local_events: List[dict] = []
+
+    @staticmethod
+    def _make_event(video_id: int, user_id: Optional[int]) -> dict:
+        return {"v": video_id, "u": user_id, "t": time.time()}
+
+    @classmethod
+    async def record(cls, video_id: int, user_id: Optional[int] = None) -> None:
+        """记录一次观看（不访问数据库）"""
+        event = cls._make_event(video_id, user_id)
+
+        try:
+            r = await RedisCache.get_client()
+            if r is not None:
+                pipe = r.pipeline(transaction=False)
+                pipe.hincrby(ViewCounterKeys.PENDING_COUNTS, str(video_id), 1)
+                pipe.rpush(ViewCounterKeys.PENDING_EVENTS, json.dumps(event))
+                pipe.ltrim(ViewCounterKeys.PENDING_EVENTS, -cls.MAX_BUFFERED_EVENTS, -1)
+                await pipe.execute()
+                return
+        except Exception as e:
+            logger.debug(f"观看计数写入Redis失败，使用内存缓冲: {e}")
+
+        cls._record_local(event)
+
+    @classmethod
+    def _record_local(cls, event: dict) -> None:
+        video_id = event["v"]
+        cls._local_counts[video_id] = cls._local_counts.get(video_id, 0) + 1
+        cls._local_events.append(event)
+        if len(cls._local_events) > cls.MAX_BUFFERED_EVENTS:
+            del cls._local_events[:len(cls._local_events) - cls.MAX_BUFFERED_EVENTS]
+
+    @classmethod
+    def _drain_local(cls) -> Tuple[Dict[int, int], List[dict]]:
+        """取出内存缓冲（同步交换引用，无需加锁）"""
+        counts, events = cls._local_counts, cls._local_events
+        cls._local_counts, cls._local_events = {}, []
+        return counts, events
+
+    @classmethod
+    async def _drain_redis(cls) -> Tuple[Dict[int, int], List[dict]]:
+        """原子取出 Redis 缓冲（MULTI/EXEC）"""
+        r = await RedisCache.get_client()
+        if r is None:
+            return {}, []
+
+        pipe = r.pipeline(transaction=True)
+        pipe.hgetall(ViewCounterKeys.PENDING_COUNTS)
+        pipe.delete(ViewCounterKeys.PENDING_COUNTS)
+        pipe.lrange(ViewCounterKeys.PENDING_EVENTS, 0, cls.FLUSH_BATCH_SIZE - 1)
+        pipe.ltrim(ViewCounterKeys.PENDING_EVENTS, cls.FLUSH_BATCH_SIZE, -1)
+        raw_counts, _, raw_events, _ = await pipe.execute()
+
+        counts = {int(k): int(v) for k, v in (raw_counts or {}).items()}
+        events = []
+        for raw in raw_events or []:
+            try:
+                events.append(json.loads(raw))
+            except (TypeError, ValueError):
+                continue
+        return counts, events
+
+    @classmethod
+    async def _restore(cls, counts: Dict[int, int], events: List[dict]) -> None:
+        """刷入失败时把数据放回缓冲，避免丢失计数"""
+        try:
+            r = await RedisCache.get_client()
+            if r is not None:
+                pipe = r.pipeline(transaction=False)
+                for video_id, delta in counts.items():
+                    pipe.hincrby(ViewCounterKeys.PENDING_COUNTS, str(video_id), delta)
+                if events:
+                    pipe.lpush(ViewCounterKeys.PENDING_EVENTS, *[json.dumps(e) for e in reversed(events)])
+                await pipe.execute()
+                return
+        except Exception as e:
+            logger.warning(f"观看计数回写Redis失败，保留在内存: {e}")
+
+        for video_id, delta in counts.items():
+            cls._local_counts[video_id] = cls._local_counts.get(video_id, 0) + delta
+        cls._local_events[:0] = events
+
+    @staticmethod
+    async def _apply(db: AsyncSession, counts: Dict[int, int], events: List[dict]) -> int:
+        """将增量和观看记录写入数据库，返回写入的记录数"""
+        video_ids = set(counts) | {e["v"] for e in events}
+        if not video_ids:
+            return 0
+
+        # 过滤掉缓冲期间已被删除的视频
+        result = await db.execute(
+            select(Video.id, Video.is_short, Video.created_at).where(Video.id.in_(video_ids))
+        )
+        meta = {row[0]: row for row in result.all()}
+        existing = set(meta)
+
+        # 按ID排序更新，避免多个刷入任务并发时死锁
+        params = [
+            {"b_id": video_id, "b_delta": delta}
+            for video_id, delta in sorted(counts.items())
+            if video_id in existing and delta
+        ]
+        if params:
+            table = Video.__table__
+            await db.execute(
+                update(table)
+                .where(table.c.id == bindparam("b_id"))
+                .values(view_count=table.c.view_count + bindparam("b_delta")),
+                params
+            )
+
+        rows = [
+            {
+                "video_id": e["v"],
+                "user_id": e.get("u"),
+                "created_at": datetime.utcfromtimestamp(e.get("t") or time.time()),
+            }
+            for e in events
+            if e["v"] in existing
+        ]
+        if rows:
+            await db.execute(insert(VideoView), rows)
+
+        await db.commit()
+
+        # 积压的观看记录按原时间写入，登记这些整点由统计汇总重算
+        from app.services.stats_rollup import StatsRollup
+        await StatsRollup.mark_dirty(row["created_at"] for row in rows)
+
+        # 增量更新排行榜
+        from app.services.ranking_service import RankingService
+        for kind, is_short in (("videos", False), ("shorts", True)):
+            await RankingService.record_many(kind, [
+                (video_id, meta[video_id][2], delta, 0)
+                for video_id, delta in counts.items()
+                if video_id in existing and bool(meta[video_id][1]) == is_short
+            ])
+        return len(rows)
+
+    @classmethod
+    async def flush(cls, db: Optional[AsyncSession] = None) -> dict:
+        """
+        将缓冲的观看数据刷入数据库
+
+        同时处理 Redis 缓冲和本进程的内存缓冲，多个进程并发调用是安全的
+        （每次取出的数据互不重叠）。
+        """
+        try:
+            redis_counts, redis_events = await cls._drain_redis()
+        except Exception as e:
+            logger.warning(f"读取Redis观看缓冲失败: {e}")
+            redis_counts, redis_events = {}, []
+
+        local_counts, local_events = cls._drain_local()
+
+        counts = dict(redis_counts)
+        for video_id, delta in local_counts.items():
+            counts[video_id] = counts.get(video_id, 0) + delta
+        events = redis_events + local_events
+
+        if not counts and not events:
+            return {"videos": 0, "views": 0, "events": 0}
+
+        try:
+            if db is not None:
+                inserted = await cls._apply(db, counts, events)
+            else:
+                from app.core.database import AsyncSessionLocal
+                async with AsyncSessionLocal() as session:
+                    inserted = await cls._apply(session, counts, events)
+        except Exception as e:
+            logger.error(f"观看计数刷入数据库失败: {e}")
+            if db is not None:
+                await db.rollback()
+            await cls._restore(counts, events)
+            raise
+
+        return {
+            "videos": len(counts),
+            "views": sum(counts.values()),
+            "events": inserted,
+        }
+
+    @classmethod
+    async def get_pending(cls, video_id: int) -> int:
+        """获取某视频尚未刷入数据库的观看增量"""
+        pending = cls._local_counts.get(video_id, 0)
+        try:
+            r = await RedisCache.get_client()
+            if r is not None:
+                value = await r.hget(ViewCounterKeys.PENDING_COUNTS, str(video_id))
+                pending += int(value or 0)
+        except Exception as e:
+            logger.debug(f"读取待刷入观看数失败: {e}")
+        return pending
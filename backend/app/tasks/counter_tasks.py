@@ -0,0 +1,48 @@
+"""
+计数器相关异步任务
+"""
+import asyncio
+import logging
+
+from app.core.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+
+async def _flush_view_counts() -> dict:
+    """在独立事件循环中刷入观看计数"""
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import NullPool
+    from app.core.config import settings
+    from app.core.redis import close_redis
+    from app.services.view_counter import ViewCounter
+
+    # 每次任务都运行在新的事件循环中，不能复用 Web 进程的连接池
+    engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+    try:
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            return await ViewCounter.flush(db)
+    finally:
+        await engine.dispose()
+        await close_redis()
+
+
+@celery_app.task(bind=True)
+def flush_view_counts(self) -> dict:
+    """
+    将 Redis 中缓冲的视频观看计数批量刷入数据库
+    
+    每10秒执行一次
+    """
+    try:
+        result = asyncio.run(_flush_view_counts())
+        if result.get("views"):
+            logger.info(
+                f"观看计数刷入完成: {result['videos']} 个视频, "
+                f"{result['views']} 次观看, {result['events']} 条记录"
+            )
+        return {"success": True, **result}
+        
+    except Exception as e:
+        logger.error(f"观看计数刷入失败: {e}")
+        return {"success": False, "error": str(e)}
@@ -147,39 +147,20 @@ def extract_video_info_task(self, video_path: str) -> dict:
         视频信息（时长、分辨率等）
     """
     try:
-        import json
+        from app.core.config import settings
+        from app.services.media_probe import MediaProbe
         
-        cmd = [
-            "ffprobe",
-            "-v", "quiet",
-            "-print_format", "json",
-            "-show_format",
-            "-show_streams",
-            video_path
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        
-        if result.returncode != 0:
-            raise Exception(f"FFprobe error: {result.stderr}")
-        
-        info = json.loads(result.stdout)
-        
-        # 提取关键信息
-        duration = float(info.get("format", {}).get("duration", 0))
-        
-        video_stream = next(
-            (s for s in info.get("streams", []) if s.get("codec_type") == "video"),
-            {}
-        )
+        info = MediaProbe(settings.PROBE_CACHE_PATH).probe(video_path)
+        if not info.video_codec:
+            raise Exception(f"FFprobe error: {video_path}")
         
         return {
             "success": True,
-            "duration": duration,
-            "width": video_stream.get("width", 0),
-            "height": video_stream.get("height", 0),
-            "codec": video_stream.get("codec_name", ""),
-            "bitrate": int(info.get("format", {}).get("bit_rate", 0))
+            "duration": info.duration,
+            "width": info.width,
+            "height": info.height,
+            "codec": info.video_codec,
+            "bitrate": info.bitrate
         }
         
     except Exception as e:
@@ -0,0 +1,154 @@
+"""认证请求压测：每个请求的数据库查询数（每次 SELECT users vs 认证主体快照）
+
+用法（在 backend 目录下运行）:
+    python scripts/benchmarks/bench_auth_queries.py [--users 200] [--requests 5000] [--concurrency 50]
+
+用临时 SQLite 文件库和一个只挂认证依赖的 FastAPI 应用，分别压测：
+- legacy：原 get_current_user（每次 SELECT users，VIP 接口再查 user_vips）
+- cached：当前的 get_current_user / get_current_vip_user
+未连接 Redis 时快照保存在进程内存缓存。
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+sys.path.insert(0, '.')
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.api.deps import security, get_current_user, get_current_vip_user
+from app.core.database import Base, get_db
+from app.core.security import create_access_token, decode_token
+from app.core.token_blacklist import TokenBlacklist
+from app.models.user import User, UserVIP
+
+
+async def legacy_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """原实现：黑名单 MGET + SELECT users"""
+    token = credentials.credentials
+    payload = decode_token(token)
+    user_id = int(payload["sub"])
+    (token_flag, user_flag), result = await asyncio.gather(
+        TokenBlacklist.check(token, user_id),
+        db.execute(select(User).where(User.id == user_id)),
+    )
+    user = result.scalar_one_or_none()
+    if token_flag or user_flag or user is None or not user.is_active:
+        raise HTTPException(status_code=401)
+    return user
+
+
+async def legacy_vip_user(
+    current_user: User = Depends(legacy_current_user),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """原实现：再查一次 user_vips"""
+    result = await db.execute(select(UserVIP).where(
+        UserVIP.user_id == current_user.id,
+        UserVIP.is_active == True,
+        UserVIP.expire_date > datetime.utcnow()
+    ))
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=403)
+    return current_user
+
+
+def build_app(session_factory) -> FastAPI:
+    app = FastAPI()
+
+    async def override_get_db():
+        async with session_factory() as session:
+            yield session
+            await session.commit()
+
+    app.dependency_overrides[get_db] = override_get_db
+
+    @app.get("/legacy/me")
+    async def legacy_me(user: User = Depends(legacy_current_user)):
+        return {"id": user.id}
+
+    @app.get("/legacy/vip")
+    async def legacy_vip(user: User = Depends(legacy_vip_user)):
+        return {"id": user.id}
+
+    @app.get("/cached/me")
+    async def cached_me(user: User = Depends(get_current_user)):
+        return {"id": user.id}
+
+    @app.get("/cached/vip")
+    async def cached_vip(user: User = Depends(get_current_vip_user)):
+        return {"id": user.id}
+
+    return app
+
+
+async def run(client: httpx.AsyncClient, path: str, tokens, requests: int, concurrency: int, counter: list):
+    rng = random.Random(7)
+    plan = [rng.choice(tokens) for _ in range(requests)]
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(token):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(path, headers={"Authorization": f"Bearer {token}"})
+            samples.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.text
+
+    before = counter[0]
+    wall = time.perf_counter()
+    await asyncio.gather(*(one(t) for t in plan))
+    wall = time.perf_counter() - wall
+    samples.sort()
+    return (counter[0] - before) / requests, statistics.median(samples), samples[int(0.99 * (len(samples) - 1))], requests / wall
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'auth.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[User.__table__, UserVIP.__table__])
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with session_factory() as db:
+            for i in range(1, args.users + 1):
+                db.add(User(id=i, username=f"u{i}", email=f"u{i}@example.com", hashed_password="x"))
+                db.add(UserVIP(user_id=i, vip_level=1, is_active=True, expire_date=datetime.utcnow() + timedelta(days=30)))
+            await db.commit()
+
+        counter = [0]
+
+        def count(*_):
+            counter[0] += 1
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        tokens = [create_access_token({"sub": str(i)}) for i in range(1, args.users + 1)]
+
+        print(f"{'endpoint':>12} | {'queries/req':>11} | {'p50':>8} {'p99':>8} | {'req/s':>7}")
+        transport = httpx.ASGITransport(app=build_app(session_factory))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for path in ("/legacy/me", "/cached/me", "/legacy/vip", "/cached/vip"):
+                queries, p50, p99, rps = await run(client, path, tokens, args.requests, args.concurrency, counter)
+                print(f"{path:>12} | {queries:>11.3f} | {p50:>6.2f}ms {p99:>6.2f}ms | {rps:>7.0f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
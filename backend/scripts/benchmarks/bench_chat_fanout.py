@@ -0,0 +1,119 @@
+"""客服聊天多 worker 投递基准：进程内字典（原 ConnectionManager）vs Redis pub/sub 分发
+
+用法（在 backend 目录下运行）:
+    python scripts/benchmarks/bench_chat_fanout.py [--workers 4] [--users 50] [--messages 200]
+
+启动本地 Redis 替身（tests/redis_standin.py）和 --workers 个独立进程，每个进程模拟一个
+uvicorn worker：持有 --users 个用户连接，然后向随机用户（可能连在任意 worker 上）发送
+--messages 条消息。统计送达率和端到端延迟。
+local 模式下 ChatHub 不连接 Redis，即原来的单进程字典行为，只有目标恰好在同一进程时才能送达。
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import socket
+import subprocess
+import sys
+import time
+sys.path.insert(0, '.')
+
+
+class TimedWebSocket:
+    def __init__(self, received: list):
+        self.received = received
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        self.received.append(time.perf_counter() - message["sent_at"])
+
+
+async def run_worker(index: int, args, port: int, barrier, results) -> None:
+    import redis.asyncio as redis
+    from app.services.chat_hub import ChatHub
+
+    client = redis.Redis(host="127.0.0.1", port=port, decode_responses=True) if port else None
+
+    async def factory():
+        return client
+
+    hub = ChatHub(redis_factory=factory)
+    hub.POLL_INTERVAL = 0.05
+    if client is not None:
+        hub.start()
+        await hub.wait_ready()
+
+    received = []
+    first = index * args.users
+    for user_id in range(first, first + args.users):
+        await hub.connect_user(TimedWebSocket(received), user_id)
+
+    total_users = args.workers * args.users
+    rng = random.Random(index)
+    await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+    for _ in range(args.messages):
+        await hub.send_to_user(rng.randrange(total_users), {"type": "new_message", "sent_at": time.perf_counter()})
+    await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+    await asyncio.sleep(0.5)  # 等待在途消息
+
+    results.put(received)
+    await hub.stop()
+    if client is not None:
+        await client.aclose()
+
+
+def worker_main(index, args, port, barrier, results):
+    asyncio.run(run_worker(index, args, port, barrier, results))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_mode(args, port: int):
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(args.workers)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker_main, args=(i, args, port, barrier, results))
+                 for i in range(args.workers)]
+    for p in processes:
+        p.start()
+    latencies = []
+    for _ in processes:
+        latencies.extend(results.get())
+    for p in processes:
+        p.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "tests.redis_standin", "--port", str(port)],
+                              stdout=subprocess.PIPE)
+    server.stdout.readline()
+    try:
+        sent = args.workers * args.messages
+        print(f"{args.workers} workers x {args.users} users, {sent} messages")
+        print(f"{'mode':>6} | {'delivered':>9} | {'p50':>7} | {'p99':>7}")
+        for name, mode_port in (("local", 0), ("redis", port)):
+            latencies = sorted(run_mode(args, mode_port))
+            p50 = latencies[len(latencies) // 2] * 1e3 if latencies else 0
+            p99 = latencies[int(len(latencies) * 0.99)] * 1e3 if latencies else 0
+            print(f"{name:>6} | {len(latencies) / sent:>8.1%} | {p50:>5.2f}ms | {p99:>5.2f}ms")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""候选帧评分微基准：逐帧全分辨率分析 vs frame_scoring 批量分析
+
+用法（在 backend 目录下运行）:
+    python scripts/benchmarks/bench_frame_scoring.py [--sizes 10 50 200] [--width 640] [--runs 3]
+
+在临时目录生成带色块的合成 JPEG 候选帧，分别用两种方式评分：
+- legacy：原转码服务封面选择的逐帧实现（PIL 全分辨率解码 + 每项指标单独一次 float 运算）
+- batched：app.services.frame_scoring.rank_frames（缩小解码后整批计算 + 感知哈希去重）
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, '.')
+
+import numpy as np
+from PIL import Image
+
+from app.services.frame_scoring import rank_frames
+
+
+def make_frames(directory: str, count: int, width: int):
+    height = width * 9 // 16
+    rng = np.random.default_rng(42)
+    paths = []
+    for i in range(count):
+        img = np.empty((height, width, 3), dtype=np.uint8)
+        img[:] = rng.integers(40, 200, 3)
+        for _ in range(20):
+            x, y = rng.integers(0, width * 3 // 4), rng.integers(0, height * 3 // 4)
+            img[y:y + height // 4, x:x + width // 5] = rng.integers(0, 255, 3)
+        path = os.path.join(directory, f"frame_{i}.jpg")
+        Image.fromarray(img).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def legacy_best(paths):
+    """原实现：每帧单独解码、全分辨率 float 拷贝、逐项计算"""
+    scores = {}
+    for i, path in enumerate(paths):
+        img = Image.open(path)
+        img_array = np.array(img.convert('RGB'))
+        gray = np.array(img.convert('L'))
+        dx = np.diff(gray.astype(float), axis=1)
+        dy = np.diff(gray.astype(float), axis=0)
+        sharpness = np.var(dx) + np.var(dy)
+        contrast = np.std(gray)
+        brightness = np.mean(gray)
+        brightness_score = max(0, 100 - abs(brightness - 130) * 0.8)
+        color_var = np.var(img_array[:, :, 0]) + np.var(img_array[:, :, 1]) + np.var(img_array[:, :, 2])
+        score = (sharpness * 0.35 + contrast * 10 * 0.20 + brightness_score * 10 * 0.15
+                 + color_var * 0.001 * 0.20 + 100 * 0.10)
+        if contrast < 15 or brightness < 30 or brightness > 230:
+            score *= 0.3
+        scores[i] = score
+    return max(scores, key=scores.get)
+
+
+def timed(func, paths, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(paths)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_frames(tmp, max(args.sizes), args.width)
+        print(f"frame: {args.width}x{args.width * 9 // 16} jpg, best of {args.runs} runs")
+        print(f"{'candidates':>10} | {'legacy':>9} | {'batched':>9} | {'speedup':>7}")
+        for size in args.sizes:
+            legacy = timed(legacy_best, paths[:size], args.runs)
+            batched = timed(rank_frames, paths[:size], args.runs)
+            print(f"{size:>10} | {legacy * 1000:>7.1f}ms | {batched * 1000:>7.1f}ms | {legacy / batched:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""性能监控埋点的单次开销微基准
+
+用法（在 backend 目录下运行）:
+    python scripts/benchmarks/bench_monitoring.py [--n 200000]
+
+分别测量：
+- record_request：直方图分桶 + 计数（200 个路由模板轮流记录）
+- 中间件：空 ASGI 应用套上 MonitoringMiddleware 前后每个请求的耗时差
+  （含 ContextVar 设置/恢复、路由模板解析、状态码捕获）
+- SQL 埋点：before/after_cursor_execute 两个事件回调（请求内）
+- Redis 埋点：埋点连接类相对原连接类每次往返（发送 + 读取）多出的耗时
+"""
+import argparse
+import asyncio
+import sys
+import time
+sys.path.insert(0, '.')
+
+from app.services.monitoring_service import (
+    monitor, MonitoringMiddleware, RequestStats, _current_request,
+    _before_cursor_execute, _after_cursor_execute, _instrumented_connection_class,
+)
+
+
+class FakeRoute:
+    def __init__(self, path):
+        self.path = path
+
+
+class FakeConnection:
+    def __init__(self):
+        self.info = {}
+
+
+class BareRedisConnection:
+    async def send_packed_command(self, command, check_health=True):
+        return None
+
+    async def read_response(self, disable_decoding=False):
+        return "OK"
+
+
+def per_call_ns(elapsed: float, n: int) -> float:
+    return elapsed / n * 1e9
+
+
+def bench_record(n: int) -> float:
+    routes = [f"/api/v1/route{i}/{{item_id}}" for i in range(200)]
+    stats = RequestStats()
+    start = time.perf_counter()
+    for i in range(n):
+        monitor.record_request(routes[i % 200], "GET", 200, (i % 1000) / 10000, stats=stats)
+    return per_call_ns(time.perf_counter() - start, n)
+
+
+async def bench_middleware(n: int) -> float:
+    routes = [FakeRoute(f"/api/v1/route{i}/{{item_id}}") for i in range(200)]
+    start_message = {"type": "http.response.start", "status": 200, "headers": []}
+    body_message = {"type": "http.response.body", "body": b""}
+
+    async def app(scope, receive, send):
+        scope["route"] = routes[scope["i"] % 200]
+        await send(start_message)
+        await send(body_message)
+
+    async def send(message):
+        pass
+
+    async def run(asgi):
+        scope = {"type": "http", "method": "GET", "path": "/api/v1/x"}
+        start = time.perf_counter()
+        for i in range(n):
+            scope["i"] = i
+            await asgi(scope, None, send)
+        return time.perf_counter() - start
+
+    bare = await run(app)
+    wrapped = await run(MonitoringMiddleware(app))
+    return per_call_ns(wrapped - bare, n)
+
+
+def bench_sql_hooks(n: int) -> float:
+    conn = FakeConnection()
+    token = _current_request.set(RequestStats())
+    try:
+        start = time.perf_counter()
+        for _ in range(n):
+            _before_cursor_execute(conn, None, "SELECT 1", None, None, False)
+            _after_cursor_execute(conn, None, "SELECT 1", None, None, False)
+        return per_call_ns(time.perf_counter() - start, n)
+    finally:
+        _current_request.reset(token)
+
+
+async def bench_redis_hooks(n: int) -> float:
+    async def run(connection):
+        start = time.perf_counter()
+        for _ in range(n):
+            await connection.send_packed_command(b"PING")
+            await connection.read_response()
+        return time.perf_counter() - start
+
+    token = _current_request.set(RequestStats())
+    try:
+        bare = await run(BareRedisConnection())
+        instrumented = await run(_instrumented_connection_class(BareRedisConnection)())
+    finally:
+        _current_request.reset(token)
+    return per_call_ns(instrumented - bare, n)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200000)
+    args = parser.parse_args()
+
+    monitor.reset_metrics()
+    print(f"record_request         {bench_record(args.n):>8.0f} ns/request")
+    monitor.reset_metrics()
+    print(f"middleware overhead    {await bench_middleware(args.n):>8.0f} ns/request")
+    print(f"SQL hooks              {bench_sql_hooks(args.n):>8.0f} ns/query")
+    print(f"Redis hooks            {await bench_redis_hooks(args.n):>8.0f} ns/round-trip")
+    monitor.reset_metrics()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
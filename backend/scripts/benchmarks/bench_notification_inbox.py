@@ -0,0 +1,227 @@
+"""通知读取基准：按请求聚合（原 /notifications 接口）vs 写时扇出收件箱
+
+用法（在 backend 目录下运行）:
+    python scripts/benchmarks/bench_notification_inbox.py [--items 5000] [--contents 200] [--rounds 20]
+
+使用临时 SQLite 文件库。一个作者拥有 --contents 个视频和帖子，其他用户对这些内容
+各产生 --items 条评论、回复和点赞。对比作者打开通知页（评论列表 + 点赞列表 + 未读数）
+的耗时和 SQL 条数，以及收件箱写入的单条开销。
+原接口的聚合查询在这里按原逻辑复现（视频与帖子部分；图集部分结构相同，省略）。
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+sys.path.insert(0, '.')
+
+from sqlalchemy import select, desc, func, and_, event, insert, text
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from app.core.database import Base
+from app.models.user import User
+from app.models.video import Video
+from app.models.comment import Comment, CommentLike
+from app.models.social import VideoLike, MessageConversation
+from app.models.community import Post, PostComment, PostLike, PostCommentLike
+from app.models.notification import NotificationInboxItem, NotificationCounter
+from app.services.notification_inbox import NotificationInbox, NotificationCategory
+
+AUTHOR = 1
+TABLES = [User, Video, Comment, CommentLike, VideoLike, MessageConversation,
+          Post, PostComment, PostLike, PostCommentLike, NotificationInboxItem, NotificationCounter]
+
+
+def create_tables(conn):
+    Base.metadata.create_all(conn, tables=[m.__table__ for m in TABLES if m is not PostComment])
+    # comments 与 post_comments 有同名索引（SQLite 索引名全局唯一），帖子评论表的索引加后缀创建
+    table = PostComment.__table__
+    conn.execute(CreateTable(table))
+    for index in table.indexes:
+        columns = ", ".join(c.name for c in index.columns)
+        conn.execute(text(f"CREATE INDEX {index.name}_post ON {table.name} ({columns})"))
+
+
+async def setup_db(path: str, args):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(create_tables)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    rng = random.Random(1)
+    fans = list(range(2, 202))
+    now = datetime.utcnow()
+    stamp = lambda: now - timedelta(seconds=rng.randint(0, 30 * 86400))
+    async with session_factory() as db:
+        await db.execute(insert(User), [
+            {"id": i, "username": f"u{i}", "email": f"u{i}@example.com", "hashed_password": "x"}
+            for i in [AUTHOR] + fans
+        ])
+        await db.execute(insert(Video), [
+            {"id": i, "title": f"video {i}", "uploader_id": AUTHOR} for i in range(1, args.contents + 1)
+        ])
+        await db.execute(insert(Post), [
+            {"id": i, "user_id": AUTHOR, "content": f"post {i}"} for i in range(1, args.contents + 1)
+        ])
+        # 作者自己的评论（用于回复和评论点赞）
+        await db.execute(insert(Comment), [
+            {"id": i, "video_id": i, "user_id": AUTHOR, "content": "author"} for i in range(1, args.contents + 1)
+        ])
+        await db.execute(insert(PostComment), [
+            {"id": i, "post_id": i, "user_id": AUTHOR, "content": "author"} for i in range(1, args.contents + 1)
+        ])
+        base = args.contents + 1
+        events = []
+        comments, post_comments = [], []
+        for i in range(args.items):
+            content_id = rng.randint(1, args.contents)
+            parent = content_id if rng.random() < 0.3 else None
+            comments.append({"id": base + i, "video_id": content_id, "user_id": rng.choice(fans),
+                             "parent_id": parent, "content": f"comment {i}", "created_at": stamp()})
+            post_comments.append({"id": base + i, "post_id": content_id, "user_id": rng.choice(fans),
+                                  "parent_id": parent, "content": f"comment {i}", "created_at": stamp()})
+        await db.execute(insert(Comment), comments)
+        await db.execute(insert(PostComment), post_comments)
+        pairs = rng.sample([(f, c) for f in fans for c in range(1, args.contents + 1)], args.items)
+        video_likes = [{"id": i + 1, "user_id": f, "video_id": c, "created_at": stamp()} for i, (f, c) in enumerate(pairs)]
+        post_likes = [{"id": i + 1, "user_id": f, "post_id": c, "created_at": stamp()} for i, (f, c) in enumerate(pairs)]
+        comment_likes = [{"id": i + 1, "user_id": f, "comment_id": c, "created_at": stamp()} for i, (f, c) in enumerate(pairs)]
+        await db.execute(insert(VideoLike), video_likes)
+        await db.execute(insert(PostLike), post_likes)
+        await db.execute(insert(CommentLike), comment_likes)
+        await db.execute(insert(PostCommentLike), comment_likes)
+        await db.commit()
+
+        # 按时间顺序回放为收件箱写入
+        for row in comments:
+            events.append((row["created_at"], "video_comment", row))
+        for row in post_comments:
+            events.append((row["created_at"], "post_comment", row))
+        for kind, rows in (("video_like", video_likes), ("post_like", post_likes),
+                           ("video_comment_like", comment_likes), ("post_comment_like", comment_likes)):
+            events.extend((row["created_at"], kind, row) for row in rows)
+        events.sort(key=lambda e: e[0])
+    return engine, session_factory, events
+
+
+async def fan_out(session_factory, events) -> float:
+    """把历史事件写入收件箱，返回单条写入的平均耗时（秒）"""
+    start = time.perf_counter()
+    async with session_factory() as db:
+        for _, kind, row in events:
+            actor = row["user_id"]
+            if kind in ("video_comment", "post_comment"):
+                target_type = "video" if kind == "video_comment" else "post"
+                target_id = row["video_id"] if kind == "video_comment" else row["post_id"]
+                if row["parent_id"]:
+                    await NotificationInbox.push(
+                        db, user_id=AUTHOR, actor_id=actor, category=NotificationCategory.COMMENT,
+                        notification_type="reply", source_type=kind, source_id=row["id"],
+                        target_type=target_type, target_id=target_id, content=row["content"])
+                await NotificationInbox.push(
+                    db, user_id=AUTHOR, actor_id=actor, category=NotificationCategory.COMMENT,
+                    notification_type="comment", source_type=kind, source_id=row["id"],
+                    target_type=target_type, target_id=target_id, content=row["content"])
+            else:
+                await NotificationInbox.push(
+                    db, user_id=AUTHOR, actor_id=actor, category=NotificationCategory.LIKE,
+                    notification_type="like", source_type=kind, source_id=row["id"],
+                    target_type=kind.rsplit("_", 1)[0], target_id=row.get("video_id") or row.get("post_id"))
+        await db.commit()
+    return (time.perf_counter() - start) / len(events)
+
+
+async def legacy_open(db):
+    """原接口：评论列表 + 点赞列表 + 未读数，每次请求都从源表聚合"""
+    uid = AUTHOR
+    video_ids = [r[0] for r in (await db.execute(select(Video.id).where(Video.uploader_id == uid))).all()]
+    my_comment_ids = [r[0] for r in (await db.execute(select(Comment.id).where(Comment.user_id == uid))).all()]
+    post_ids = [r[0] for r in (await db.execute(select(Post.id).where(Post.user_id == uid))).all()]
+    my_post_comment_ids = [r[0] for r in (await db.execute(select(PostComment.id).where(PostComment.user_id == uid))).all()]
+
+    items = []
+    for model, user_col, filter_col, ids, extra in (
+        (Comment, Comment.user_id, Comment.video_id, video_ids, Comment.is_hidden == False),
+        (Comment, Comment.user_id, Comment.parent_id, my_comment_ids, Comment.is_hidden == False),
+        (PostComment, PostComment.user_id, PostComment.post_id, post_ids, PostComment.status == 'visible'),
+        (PostComment, PostComment.user_id, PostComment.parent_id, my_post_comment_ids, PostComment.status == 'visible'),
+        (VideoLike, VideoLike.user_id, VideoLike.video_id, video_ids, True),
+        (CommentLike, CommentLike.user_id, CommentLike.comment_id, my_comment_ids, True),
+        (PostLike, PostLike.user_id, PostLike.post_id, post_ids, True),
+        (PostCommentLike, PostCommentLike.user_id, PostCommentLike.comment_id, my_post_comment_ids, True),
+    ):
+        result = await db.execute(
+            select(model, User).join(User, user_col == User.id)
+            .where(and_(filter_col.in_(ids), user_col != uid, extra))
+            .order_by(desc(model.created_at)).limit(50)
+        )
+        items.extend(result.all())
+
+    since = datetime.utcnow() - timedelta(hours=24)
+    (await db.execute(select(MessageConversation).where(MessageConversation.user1_id == uid))).all()
+    for model, filter_col, ids in ((PostComment, PostComment.post_id, post_ids),
+                                   (PostComment, PostComment.parent_id, my_post_comment_ids),
+                                   (PostLike, PostLike.post_id, post_ids),
+                                   (PostCommentLike, PostCommentLike.comment_id, my_post_comment_ids)):
+        await db.scalar(select(func.count(model.id)).where(filter_col.in_(ids), model.created_at > since))
+    return len(items)
+
+
+async def inbox_open(db):
+    """收件箱：两次 keyset 扫描 + 一次计数行主键查询"""
+    comments = await NotificationInbox.fetch(db, AUTHOR, NotificationCategory.COMMENT, limit=20)
+    likes = await NotificationInbox.fetch(db, AUTHOR, NotificationCategory.LIKE, limit=20)
+    db.expunge_all()
+    await NotificationInbox.counts(db, AUTHOR)
+    return len(comments) + len(likes)
+
+
+async def measure(engine, session_factory, open_page, rounds: int):
+    statements = [0]
+
+    def count(*_):
+        statements[0] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        timings = []
+        async with session_factory() as db:
+            for _ in range(rounds):
+                start = time.perf_counter()
+                await open_page(db)
+                timings.append(time.perf_counter() - start)
+                db.expunge_all()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+    timings.sort()
+    return timings[len(timings) // 2], statements[0] / rounds
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--contents", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, session_factory, events = await setup_db(os.path.join(tmp, "bench.db"), args)
+        per_push = await fan_out(session_factory, events)
+        async with session_factory() as db:
+            inbox_rows = await db.scalar(select(func.count(NotificationInboxItem.id)))
+            counter = await NotificationInbox.counts(db, AUTHOR)
+        print(f"{len(events)} events -> {inbox_rows} inbox rows, fan-out {per_push * 1e3:.2f}ms/event "
+              f"(comment total {counter.comment_total}, like total {counter.like_total})")
+        print(f"{'mode':>9} | {'p50':>8} | {'queries':>7}")
+        for name, open_page in (("aggregate", legacy_open), ("inbox", inbox_open)):
+            p50, queries = await measure(engine, session_factory, open_page, args.rounds)
+            print(f"{name:>9} | {p50 * 1e3:>6.1f}ms | {queries:>7.0f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""视频排行榜基准测试：数据库排序分页 vs 物化榜单
+
+用法（在 backend 目录下运行）:
+    python scripts/benchmarks/bench_ranking.py [--sizes 10000,100000,1000000] [--iterations 30] [--page-size 20]
+
+使用临时 SQLite 文件库；未连接 Redis 时榜单只保存在本进程。
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+sys.path.insert(0, '.')
+
+from sqlalchemy import select, func, insert
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.core.database import Base
+from app.core.query_optimizer import QueryOptimizer
+from app.models.user import User
+from app.models.video import Video, VideoStatus, VideoCategory, VideoTag, video_tags
+from app.services.ranking_service import RankingService
+
+
+async def setup_db(path: str, size: int):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all,
+            tables=[User.__table__, VideoCategory.__table__, Video.__table__, VideoTag.__table__, video_tags]
+        )
+    async with AsyncSession(engine) as db:
+        db.add(User(id=1, username="bench", email="bench@example.com", hashed_password="x"))
+        await db.commit()
+        rng = random.Random(42)
+        batch = 20000
+        for start in range(1, size + 1, batch):
+            rows = [
+                {
+                    "id": i, "title": f"video {i}", "uploader_id": 1, "is_short": False,
+                    "status": VideoStatus.PUBLISHED,
+                    "view_count": rng.randint(0, 1000000), "like_count": rng.randint(0, 10000),
+                }
+                for i in range(start, min(start + batch, size + 1))
+            ]
+            await db.execute(insert(Video), rows)
+        await db.commit()
+    return engine
+
+
+async def legacy_page(db: AsyncSession, page: int, page_size: int):
+    """原 get_video_ranking 逻辑：COUNT + ORDER BY view_count, like_count"""
+    query = select(Video).options(selectinload(Video.category), selectinload(Video.tags)).where(
+        Video.status == VideoStatus.PUBLISHED, Video.is_short != True
+    )
+    await db.execute(select(func.count()).select_from(query.subquery()))
+    query = query.order_by(Video.view_count.desc(), Video.like_count.desc())
+    query = QueryOptimizer.paginate(query, page, page_size)
+    return (await db.execute(query)).scalars().all()
+
+
+async def board_page(db: AsyncSession, page: int, page_size: int):
+    return await RankingService.get_page(db, "videos", "total", page, page_size)
+
+
+async def measure(fn, db, page_size: int, iterations: int):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        await fn(db, i % 5 + 1, page_size)
+        samples.append((time.perf_counter() - start) * 1000)
+        db.expunge_all()
+    samples.sort()
+    p99_index = min(len(samples) - 1, int(round(0.99 * (len(samples) - 1))))
+    return statistics.median(samples), samples[p99_index]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--page-size", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'videos':>9} | {'db p50':>9} {'p99':>9} | {'board p50':>9} {'p99':>9} | {'rebuild':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            engine = await setup_db(os.path.join(tmp, f"ranking_{size}.db"), size)
+            async with AsyncSession(engine) as db:
+                legacy_p50, legacy_p99 = await measure(legacy_page, db, args.page_size, args.iterations)
+
+                RankingService._boards.clear()
+                RankingService._cards.clear()
+                build_start = time.perf_counter()
+                await RankingService.rebuild(db, "videos", "total")
+                build_ms = (time.perf_counter() - build_start) * 1000
+
+                board_p50, board_p99 = await measure(board_page, db, args.page_size, args.iterations)
+            await engine.dispose()
+
+            print(
+                f"{size:>9} | {legacy_p50:>7.2f}ms {legacy_p99:>7.2f}ms | "
+                f"{board_p50:>7.2f}ms {board_p99:>7.2f}ms | {build_ms:>6.0f}ms"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""认证请求的 Redis 往返次数基准：每次 PING + 两次 GET vs 长连接 + MGET
+
+用法（在 backend 目录下运行）:
+    python scripts/benchmarks/bench_redis_roundtrips.py [--requests 2000] [--latency-ms 0.5]
+
+脚本内置一个最小的 RESP 服务端（只实现 PING/GET/MGET/SET），统计每个请求收到的命令数，
+--latency-ms 模拟每次往返的网络延迟。
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+sys.path.insert(0, '.')
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+
+
+class FakeRedisServer:
+    """统计命令数的最小 RESP 服务端"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.commands = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                args = []
+                for _ in range(int(header[1:])):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2].decode())
+                self.commands += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                name = args[0].upper()
+                if name == "PING":
+                    writer.write(b"+PONG\r\n")
+                elif name == "GET":
+                    writer.write(b"$-1\r\n")
+                elif name == "MGET":
+                    writer.write(f"*{len(args) - 1}\r\n".encode() + b"$-1\r\n" * (len(args) - 1))
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def legacy_request(pool, token: str, user_id: int):
+    """原实现：get_redis() 每次新建客户端并 PING，两个黑名单键分别 GET"""
+    async def get(key):
+        r = redis.Redis(connection_pool=pool)
+        await r.ping()
+        return await r.get(key)
+
+    return await asyncio.gather(
+        get(f"token_blacklist:{token}"),
+        get(f"token_blacklist:user:{user_id}"),
+    )
+
+
+async def new_request(token: str, user_id: int):
+    from app.core.token_blacklist import TokenBlacklist
+    return await TokenBlacklist.check(token, user_id)
+
+
+async def measure(server: FakeRedisServer, fn, requests: int):
+    samples = []
+    before = server.commands
+    for i in range(requests):
+        start = time.perf_counter()
+        await fn(f"token-{i}", i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return (server.commands - before) / requests, statistics.median(samples), samples[int(0.99 * (len(samples) - 1))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    server = FakeRedisServer(args.latency_ms / 1000)
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    url = f"redis://127.0.0.1:{port}/0"
+
+    pool = redis.ConnectionPool.from_url(url, decode_responses=True)
+    legacy = await measure(server, lambda t, u: legacy_request(pool, t, u), args.requests)
+    await pool.disconnect()
+
+    from app.core import redis as redis_module
+    settings.REDIS_URL = url
+    await new_request("warmup", 0)  # 首次使用时的 PING
+    new = await measure(server, new_request, args.requests)
+    await redis_module.close_redis()
+
+    listener.close()
+    await listener.wait_closed()
+
+    print(f"{'path':>8} | {'cmds/req':>8} | {'p50':>8} {'p99':>8}")
+    for name, (cmds, p50, p99) in (("legacy", legacy), ("pooled", new)):
+        print(f"{name:>8} | {cmds:>8.2f} | {p50:>6.3f}ms {p99:>6.3f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
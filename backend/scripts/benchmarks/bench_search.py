@@ -0,0 +1,186 @@
+"""搜索基准：title ILIKE '%词%' vs 倒排索引
+
+用法（在 backend 目录下运行）:
+    python scripts/benchmarks/bench_search.py [--docs 100000] [--rounds 5] [--db PATH]
+
+生成合成视频语料（3 万词的词表按 Zipf 词频拼接标题、简介、AI 标签，热度服从帕累托分布）。
+在临时 SQLite 文件库上建立倒排索引，然后对比几类查询的耗时：
+高频词、低频词、多词组合、单字（前缀匹配）、英文词，以及前缀联想。
+ILIKE 只查标题（原接口行为），索引同时覆盖标题、简介和标签并按相关度×热度排序。
+--db 指定已生成的库文件时跳过造数和建索引，可重复测量。
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import List
+sys.path.insert(0, '.')
+
+from sqlalchemy import select, insert, func
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from app.core.database import Base
+from app.models.user import User
+from app.models.video import Video, VideoStatus, VideoTag, video_tags
+from app.models.community import Post, Novel, Gallery
+from app.models.search import SearchDocument, SearchPosting, SearchSuggestion
+from app.services.search_index import SearchIndex
+
+WORDS = (
+    "可爱 小猫 猫咪 狗狗 宠物 日常 搞笑 合集 教程 入门 进阶 旅行 美食 探店 海边 风景 城市 夜景 "
+    "音乐 现场 翻唱 舞蹈 健身 减肥 瑜伽 跑步 篮球 足球 游戏 实况 攻略 解说 电影 剪辑 混剪 预告 "
+    "动漫 二次元 手工 绘画 摄影 技巧 穿搭 化妆 护肤 开箱 测评 数码 手机 电脑 汽车 科普 历史 "
+    "故事 读书 学习 英语 编程 生活 记录 情侣 家庭 宝宝 成长 农村 钓鱼 露营 徒步 雪山 草原 沙漠 "
+    "森林 日出 日落 星空 烟花 雨天 夏日 冬日 春天 秋天 温柔 治愈 热血 感动 经典 怀旧 高清 原创 "
+    "独家 首发 完整版 精选 第一集 第二集 番外 花絮 幕后 直播 回放 挑战 实验 对比 推荐 排行 盘点"
+).split()
+LATIN = "vlog asmr diy mv live cover remix tutorial review unboxing 4k hdr".split()
+QUERIES = [
+    ("高频词", "合集"),
+    ("低频词", "沙漠"),
+    ("多词", "小猫 日常"),
+    ("长词", "可爱的小猫咪合集"),
+    ("单字", "猫"),
+    ("英文", "vlog"),
+]
+PREFIXES = ["小", "海边", "v"]
+
+
+def build_vocabulary(rng: random.Random, size: int = 30000) -> List[str]:
+    """词表：由 3000 个汉字随机组成的 2~3 字词，常用词表中的词依次放在第 20、40、60... 位
+    （最高频的位置留给合成词，查询用的词在 0.1%~7% 的文档中出现）"""
+    chars = [chr(0x4e00 + i) for i in rng.sample(range(0x5000), 3000)]
+    seen = set(WORDS)
+    synthetic = []
+    while len(synthetic) < size - len(WORDS):
+        word = "".join(rng.choices(chars, k=rng.choice((2, 2, 3))))
+        if word not in seen:
+            seen.add(word)
+            synthetic.append(word)
+    for i, word in enumerate(WORDS):
+        synthetic.insert(20 * (i + 1), word)
+    return synthetic
+
+
+def generate_corpus(count: int, seed: int = 1):
+    """生成合成视频语料，逐条产出 Video 插入参数（词频服从 Zipf 分布）"""
+    rng = random.Random(seed)
+    vocabulary = build_vocabulary(rng)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+    def words(k):
+        return rng.choices(vocabulary, cum_weights=cum_weights, k=k)
+
+    for doc_id in range(1, count + 1):
+        title_words = words(rng.randint(2, 5))
+        if rng.random() < 0.2:
+            title_words.insert(rng.randrange(len(title_words) + 1), rng.choice(LATIN))
+        sep = rng.choice(["", " ", "的", "|"])
+        description = "，".join("".join(words(rng.randint(2, 4))) for _ in range(rng.randint(2, 6)))
+        yield {
+            "id": doc_id,
+            "title": sep.join(title_words)[:200],
+            "description": description,
+            "ai_tags": ",".join(words(rng.randint(1, 3))),
+            "status": VideoStatus.PUBLISHED,
+            "uploader_id": 1,
+            "view_count": int(rng.paretovariate(1.2) * 10),
+            "like_count": int(rng.paretovariate(1.5)),
+        }
+
+
+async def build(session_factory, args):
+    async with session_factory() as db:
+        await db.execute(insert(User), [{"id": 1, "username": "u", "email": "u@example.com", "hashed_password": "x"}])
+        batch = []
+        for row in generate_corpus(args.docs):
+            batch.append(row)
+            if len(batch) == 5000:
+                await db.execute(insert(Video), batch)
+                batch = []
+        if batch:
+            await db.execute(insert(Video), batch)
+        await db.commit()
+
+        SearchIndex.BATCH_SIZE = 1000
+        start = time.perf_counter()
+        await SearchIndex.rebuild(db)
+        elapsed = time.perf_counter() - start
+        postings = await db.scalar(select(func.count()).select_from(SearchPosting))
+        suggestions = await db.scalar(select(func.count()).select_from(SearchSuggestion))
+    print(f"indexed {args.docs} docs in {elapsed:.1f}s ({args.docs / elapsed:.0f} docs/s), "
+          f"{postings} postings, {suggestions} suggestions")
+
+
+async def timed(run, rounds: int):
+    timings, result = [], None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = await run()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1e3, result
+
+
+async def measure(session_factory, rounds: int):
+    async with session_factory() as db:
+        print(f"{'query':>8} {'':<16} | {'ILIKE':>9} {'hits':>6} | {'index':>9} {'hits':>6}")
+        for label, keyword in QUERIES:
+            async def like():
+                result = await db.execute(
+                    select(Video.id).where(Video.status == VideoStatus.PUBLISHED, Video.title.ilike(f"%{keyword}%"))
+                    .order_by(Video.view_count.desc()).limit(20)
+                )
+                return result.scalars().all()
+
+            async def indexed():
+                return await SearchIndex.search(db, keyword, ["video"], limit=20)
+
+            async def like_count():
+                return await db.scalar(select(func.count(Video.id)).where(Video.title.ilike(f"%{keyword}%")))
+
+            async def index_count():
+                condition = await SearchIndex.filter(db, "video", Video.id, Video.title, keyword)
+                return await db.scalar(select(func.count(Video.id)).where(condition))
+
+            like_ms, _ = await timed(like, rounds)
+            index_ms, _ = await timed(indexed, rounds)
+            _, like_hits = await timed(like_count, 1)
+            _, index_hits = await timed(index_count, 1)
+            print(f"{label:>8} {keyword:<16} | {like_ms:>7.1f}ms {like_hits:>6} | {index_ms:>7.1f}ms {index_hits:>6}")
+
+        for prefix in PREFIXES:
+            suggest_ms, suggestions = await timed(lambda: SearchIndex.suggest(db, prefix), rounds)
+            print(f"{'联想':>8} {prefix:<16} | {'':>16} | {suggest_ms:>7.1f}ms  {suggestions[:3]}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--db", help="复用的库文件（不存在时生成）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "bench.db")
+        exists = os.path.exists(path)
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        if not exists:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all, tables=[
+                    User.__table__, Video.__table__, VideoTag.__table__, video_tags, Post.__table__, Novel.__table__, Gallery.__table__,
+                    SearchDocument.__table__, SearchPosting.__table__, SearchSuggestion.__table__,
+                ])
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        if not exists:
+            await build(session_factory, args)
+        await measure(session_factory, args.rounds)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
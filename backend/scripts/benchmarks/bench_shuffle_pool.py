@@ -0,0 +1,103 @@
+"""短视频推荐流基准测试：ORDER BY random() vs 随机推荐池
+
+用法（在 backend 目录下运行）:
+    python scripts/benchmarks/bench_shuffle_pool.py [--sizes 10000,100000,1000000] [--iterations 30] [--limit 10]
+
+使用临时 SQLite 文件库；未连接 Redis 时随机池只缓存在本进程。
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+sys.path.insert(0, '.')
+
+from sqlalchemy import select, func, insert
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.core.database import Base
+from app.models.user import User
+from app.models.video import Video, VideoStatus
+from app.services.shuffle_pool import ShufflePool, hydrate_videos
+
+
+async def setup_db(path: str, size: int):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[User.__table__, Video.__table__])
+    async with AsyncSession(engine) as db:
+        db.add(User(id=1, username="bench", email="bench@example.com", hashed_password="x"))
+        await db.commit()
+        batch = 20000
+        for start in range(1, size + 1, batch):
+            rows = [
+                {
+                    "id": i, "title": f"short {i}", "uploader_id": 1, "is_short": True,
+                    "status": VideoStatus.PUBLISHED, "short_category_id": i % 8 + 1,
+                }
+                for i in range(start, min(start + batch, size + 1))
+            ]
+            await db.execute(insert(Video), rows)
+        await db.commit()
+    return engine
+
+
+async def legacy_page(db: AsyncSession, limit: int):
+    """原 get_short_videos 逻辑：COUNT + ORDER BY random()"""
+    base = select(Video).where(Video.is_short == True, Video.status == VideoStatus.PUBLISHED)
+    await db.execute(select(func.count()).select_from(base.subquery()))
+    query = base.options(selectinload(Video.uploader)).order_by(func.random()).limit(limit)
+    return (await db.execute(query)).scalars().all()
+
+
+async def pool_page(db: AsyncSession, limit: int):
+    """新逻辑：随机池取 ID + 按 ID 回表"""
+    ids, _, _ = await ShufflePool.page(db, ShufflePool.KIND_SHORTS, None, limit)
+    return await hydrate_videos(db, ids, selectinload(Video.uploader))
+
+
+async def measure(fn, db, limit: int, iterations: int):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn(db, limit)
+        samples.append((time.perf_counter() - start) * 1000)
+        db.expunge_all()
+    samples.sort()
+    p99_index = min(len(samples) - 1, int(round(0.99 * (len(samples) - 1))))
+    return statistics.median(samples), samples[p99_index]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'shorts':>9} | {'random() p50':>12} {'p99':>9} | {'pool p50':>9} {'p99':>9} | {'pool build':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            engine = await setup_db(os.path.join(tmp, f"shorts_{size}.db"), size)
+            async with AsyncSession(engine) as db:
+                legacy_p50, legacy_p99 = await measure(legacy_page, db, args.limit, args.iterations)
+
+                ShufflePool._local.clear()
+                build_start = time.perf_counter()
+                await ShufflePool.build(db, ShufflePool.KIND_SHORTS)
+                build_ms = (time.perf_counter() - build_start) * 1000
+
+                pool_p50, pool_p99 = await measure(pool_page, db, args.limit, args.iterations)
+            await engine.dispose()
+
+            print(
+                f"{size:>9} | {legacy_p50:>10.2f}ms {legacy_p99:>7.2f}ms | "
+                f"{pool_p50:>7.2f}ms {pool_p99:>7.2f}ms | {build_ms:>8.0f}ms"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
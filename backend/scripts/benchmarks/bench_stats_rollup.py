@@ -0,0 +1,214 @@
+"""数据看板基准：实时扫描业务表 vs 读取预聚合汇总
+
+用法（在 backend 目录下运行）:
+    python scripts/benchmarks/bench_stats_rollup.py [--users 200000] [--views 1000000] [--days 90] [--rounds 5]
+
+在临时 SQLite 文件库上生成 --days 天的用户、播放、充值、VIP支付、打赏数据（时间均匀分布），
+对比原仪表盘/概览/用户趋势/留存接口的实时查询与汇总表读取的耗时，
+并给出增量任务（重算两个整点 + 当天日汇总和留存）和单天回填的耗时。
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+sys.path.insert(0, '.')
+
+from sqlalchemy import select, insert, func
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from app.core.database import Base
+from app.models.user import User, UserVIP
+from app.models.video import Video, VideoStatus, VideoView
+from app.models.comment import Comment
+from app.models.coins import RechargeOrder, VideoPurchase
+from app.models.payment import PaymentOrder, PaymentStatus, OrderType
+from app.models.creator import Creator, CreatorWithdrawal, VideoTip
+from app.models.statistics import (
+    HourlyStats, UserDailyActivity, PlatformDailyStats, DailyRevenueReport, UserRetentionStats
+)
+from app.services.stats_rollup import StatsRollup, day_start
+
+BATCH = 20000
+
+
+async def insert_rows(db, model, rows):
+    for i in range(0, len(rows), BATCH):
+        await db.execute(insert(model), rows[i:i + BATCH])
+
+
+async def build(session_factory, args, now: datetime):
+    rng = random.Random(1)
+    start = now - timedelta(days=args.days)
+    span = int((now - start).total_seconds())
+
+    def moment():
+        return start + timedelta(seconds=rng.randrange(span))
+
+    async with session_factory() as db:
+        users = [
+            {"id": i, "username": f"u{i}", "email": f"u{i}@example.com", "hashed_password": "x",
+             "created_at": moment(), "last_login": moment()}
+            for i in range(1, args.users + 1)
+        ]
+        await insert_rows(db, User, users)
+        await insert_rows(db, UserVIP, [
+            {"user_id": i, "is_active": True, "expire_date": now + timedelta(days=30)}
+            for i in rng.sample(range(1, args.users + 1), args.users // 20)
+        ])
+        videos = args.users // 20
+        await insert_rows(db, Video, [
+            {"id": i, "title": f"v{i}", "uploader_id": rng.randint(1, 2000), "status": VideoStatus.PUBLISHED.name,
+             "created_at": moment()}
+            for i in range(1, videos + 1)
+        ])
+        await insert_rows(db, VideoView, [
+            {"video_id": rng.randint(1, videos), "user_id": rng.choice((None, rng.randint(1, args.users))),
+             "created_at": moment()}
+            for _ in range(args.views)
+        ])
+        await insert_rows(db, Comment, [
+            {"video_id": rng.randint(1, videos), "user_id": rng.randint(1, args.users), "content": "c",
+             "created_at": moment()}
+            for _ in range(args.views // 20)
+        ])
+        orders = args.users // 2
+        await insert_rows(db, RechargeOrder, [
+            {"order_no": f"r{i}", "user_id": rng.randint(1, args.users), "coins": 100,
+             "amount": Decimal(rng.choice((6, 30, 98))), "status": "paid" if i % 5 else "pending",
+             "paid_at": moment()}
+            for i in range(orders)
+        ])
+        await insert_rows(db, PaymentOrder, [
+            {"order_no": f"p{i}", "user_id": rng.randint(1, args.users), "order_type": OrderType.VIP_MONTHLY.name,
+             "amount": Decimal("30.00"), "status": PaymentStatus.SUCCESS.name, "paid_at": moment()}
+            for i in range(orders // 4)
+        ])
+        await insert_rows(db, VideoTip, [
+            {"video_id": rng.randint(1, videos), "user_id": rng.randint(1, args.users), "creator_id": 1,
+             "coins_amount": rng.randint(1, 100), "created_at": moment()}
+            for _ in range(orders // 4)
+        ])
+        await insert_rows(db, VideoPurchase, [
+            {"video_id": rng.randint(1, videos), "user_id": rng.randint(1, args.users), "coins_paid": 20,
+             "created_at": moment()}
+            for _ in range(orders // 4)
+        ])
+        await insert_rows(db, Creator, [{"id": i, "user_id": i} for i in range(1, 2001)])
+        await db.commit()
+
+    elapsed = time.perf_counter()
+    async with session_factory() as db:
+        await StatsRollup.backfill(db, start.date(), now.date())
+    elapsed = time.perf_counter() - elapsed
+    print(f"generated {args.users} users / {args.views} views over {args.days} days, "
+          f"backfilled {args.days + 1} days in {elapsed:.1f}s ({elapsed / (args.days + 1) * 1e3:.0f}ms/day)")
+
+
+async def timed(run, rounds: int):
+    timings, result = [], None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = await run()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1e3, result
+
+
+async def live_dashboard(db):
+    """原 /admin/dashboard：7 次实时 count/sum"""
+    today_start = day_start(datetime.utcnow().date())
+    return [
+        await db.scalar(select(func.count()).select_from(User)),
+        await db.scalar(select(func.count()).select_from(UserVIP).where(
+            UserVIP.is_active == True, UserVIP.expire_date > datetime.utcnow())),
+        await db.scalar(select(func.count()).select_from(Video).where(Video.status == VideoStatus.PUBLISHED)),
+        await db.scalar(select(func.sum(PaymentOrder.amount)).where(PaymentOrder.status == PaymentStatus.SUCCESS)),
+        await db.scalar(select(func.count()).select_from(User).where(User.created_at >= today_start)),
+        await db.scalar(select(func.count()).select_from(Video).where(Video.created_at >= today_start)),
+        await db.scalar(select(func.count()).select_from(User).where(User.last_login >= today_start)),
+    ]
+
+
+async def rollup_dashboard(db):
+    return [
+        await StatsRollup.latest(db),
+        await db.scalar(select(func.sum(DailyRevenueReport.total_vip_sales))),
+    ]
+
+
+async def live_users_chart(db, days: int = 30):
+    """原 /admin/statistics/users/chart：按 func.date 分组"""
+    start = datetime.utcnow().date() - timedelta(days=days)
+    result = await db.execute(
+        select(func.date(User.created_at), func.count(User.id))
+        .where(User.created_at >= start).group_by(func.date(User.created_at))
+    )
+    return result.all()
+
+
+async def rollup_users_chart(db, days: int = 30):
+    today = datetime.utcnow().date()
+    return await StatsRollup.daily(db, PlatformDailyStats, today - timedelta(days=days), today)
+
+
+async def live_retention(db, days: int = 7):
+    """原 /admin/statistics/retention：逐天 func.date(created_at) == 日期（留存率为估算值）"""
+    today = datetime.utcnow().date()
+    return [
+        await db.scalar(select(func.count(User.id)).where(func.date(User.created_at) == today - timedelta(days=i + 1)))
+        for i in range(days)
+    ]
+
+
+async def rollup_retention(db, days: int = 7):
+    today = datetime.utcnow().date()
+    return await StatsRollup.retention(db, today - timedelta(days=days), today - timedelta(days=1))
+
+
+async def measure(session_factory, rounds: int):
+    async with session_factory() as db:
+        print(f"{'endpoint':<12} | {'live':>9} | {'rollup':>9}")
+        for label, live, rollup in (
+            ("dashboard", live_dashboard, rollup_dashboard),
+            ("users/chart", live_users_chart, rollup_users_chart),
+            ("retention", live_retention, rollup_retention),
+        ):
+            live_ms, _ = await timed(lambda: live(db), rounds)
+            rollup_ms, _ = await timed(lambda: rollup(db), rounds)
+            print(f"{label:<12} | {live_ms:>7.1f}ms | {rollup_ms:>7.1f}ms")
+
+        run_ms, _ = await timed(lambda: StatsRollup.run(db), rounds)
+        print(f"incremental run (2 hours + day + retention): {run_ms:.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--views", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[
+                User.__table__, UserVIP.__table__, Video.__table__, VideoView.__table__, Comment.__table__,
+                RechargeOrder.__table__, VideoPurchase.__table__, PaymentOrder.__table__,
+                Creator.__table__, CreatorWithdrawal.__table__, VideoTip.__table__,
+                HourlyStats.__table__, UserDailyActivity.__table__, PlatformDailyStats.__table__,
+                DailyRevenueReport.__table__, UserRetentionStats.__table__,
+            ])
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        await build(session_factory, args, datetime.utcnow())
+        await measure(session_factory, args.rounds)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""观看计数写入基准测试：逐条提交 vs 缓冲批量刷入
+
+用法（在 backend 目录下运行）:
+    python scripts/benchmarks/bench_view_counter.py [--views 5000] [--concurrency 50] [--videos 20]
+
+使用临时 SQLite 文件库；未连接 Redis 时 ViewCounter 走内存缓冲路径。
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.insert(0, '.')
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from app.core.database import Base
+from app.models.user import User
+from app.models.video import Video, VideoView
+from app.services.view_counter import ViewCounter
+
+
+async def setup_db(path: str, video_count: int):
+    # 旧路径在并发提交时会争用写锁，放宽锁等待时间以便跑完
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"timeout": 60})
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all,
+            tables=[User.__table__, Video.__table__, VideoView.__table__]
+        )
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="x")
+        db.add(user)
+        await db.flush()
+        db.add_all([
+            Video(id=i, title=f"video {i}", uploader_id=user.id, view_count=0)
+            for i in range(1, video_count + 1)
+        ])
+        await db.commit()
+    return engine, session_factory
+
+
+async def legacy_record_view(session_factory, video_id: int):
+    """原 record_view 逻辑：加载整行 + 插入记录 + view_count += 1 + 提交"""
+    async with session_factory() as db:
+        result = await db.execute(select(Video).where(Video.id == video_id))
+        video = result.scalar_one_or_none()
+        db.add(VideoView(video_id=video_id, user_id=None))
+        video.view_count += 1
+        await db.commit()
+
+
+async def buffered_record_view(session_factory, video_id: int):
+    """新 record_view 逻辑：主键存在性检查 + 写入缓冲"""
+    async with session_factory() as db:
+        result = await db.execute(select(Video.id).where(Video.id == video_id))
+        result.scalar_one_or_none()
+    await ViewCounter.record(video_id, None)
+
+
+async def run(record, session_factory, video_ids, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(vid):
+        async with sem:
+            await record(session_factory, vid)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(v) for v in video_ids))
+    return time.perf_counter() - start
+
+
+async def total_views(session_factory) -> int:
+    async with session_factory() as db:
+        return (await db.execute(select(func.sum(Video.view_count)))).scalar() or 0
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--views", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--videos", type=int, default=20)
+    args = parser.parse_args()
+
+    # 热门视频集中：80% 的播放落在前 20% 的视频上
+    hot = max(1, args.videos // 5)
+    video_ids = [
+        random.randint(1, hot) if random.random() < 0.8 else random.randint(1, args.videos)
+        for _ in range(args.views)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, factory = await setup_db(os.path.join(tmp, "legacy.db"), args.videos)
+        legacy_time = await run(legacy_record_view, factory, video_ids, args.concurrency)
+        legacy_total = await total_views(factory)
+        await engine.dispose()
+
+        engine, factory = await setup_db(os.path.join(tmp, "buffered.db"), args.videos)
+        buffered_time = await run(buffered_record_view, factory, video_ids, args.concurrency)
+        flush_start = time.perf_counter()
+        async with factory() as db:
+            await ViewCounter.flush(db)
+        flush_time = time.perf_counter() - flush_start
+        buffered_total = await total_views(factory)
+        await engine.dispose()
+
+    print(f"views={args.views} concurrency={args.concurrency} videos={args.videos}")
+    print(f"legacy   : {args.views / legacy_time:10.0f} views/s  (view_count total {legacy_total})")
+    print(f"buffered : {args.views / buffered_time:10.0f} views/s  (view_count total {buffered_total})")
+    print(f"flush    : {flush_time * 1000:10.1f} ms for {args.views} buffered views")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
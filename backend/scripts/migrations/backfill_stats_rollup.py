@@ -0,0 +1,74 @@
+"""
+数据看板预聚合：创建小时汇总/活跃记录表，补齐日汇总新增的列，并按天回填历史汇总
+
+用法（在 backend 目录下运行）:
+    python scripts/migrations/backfill_stats_rollup.py [--days 90 | --since 2024-01-01]
+
+默认回填最近 90 天（UTC 日期，含今天）。重复运行会重算覆盖，不会重复累加。
+"""
+import sys
+import time
+import asyncio
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import inspect, text
+
+from app.core.database import engine, Base, AsyncSessionLocal
+from app.models.statistics import (
+    HourlyStats, UserDailyActivity, PlatformDailyStats, DailyRevenueReport, UserRetentionStats
+)
+from app.services.stats_rollup import StatsRollup
+
+NEW_COLUMNS = {
+    "platform_daily_stats": {
+        "vip_users": "INTEGER DEFAULT 0",
+        "published_videos": "INTEGER DEFAULT 0",
+        "updated_at": "TIMESTAMP",
+    },
+}
+
+
+def _arg(name: str):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return None
+
+
+async def migrate(since: date):
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all,
+            tables=[HourlyStats.__table__, UserDailyActivity.__table__, PlatformDailyStats.__table__,
+                    DailyRevenueReport.__table__, UserRetentionStats.__table__]
+        )
+        for table, columns in NEW_COLUMNS.items():
+            existing = await conn.run_sync(
+                lambda sync_conn, table=table: {c["name"] for c in inspect(sync_conn).get_columns(table)}
+            )
+            for column, ddl in columns.items():
+                if column not in existing:
+                    await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                    print(f"已添加列 {table}.{column}")
+
+    # 留存按 (群组日期, 第N天) 唯一，回填靠它覆盖旧行
+    async with engine.begin() as conn:
+        for index in UserRetentionStats.__table__.indexes:
+            try:
+                await conn.run_sync(lambda sync_conn, index=index: index.create(sync_conn, checkfirst=True))
+                print(f"索引 {index.name} 已就绪")
+            except Exception as e:
+                print(f"索引 {index.name} 创建失败（请先清理重复的留存行）: {e}")
+
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        days = await StatsRollup.backfill(db, since)
+    print(f"已回填 {since} 起 {days} 天的统计汇总，耗时 {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    since = _arg("--since")
+    if since:
+        since = datetime.strptime(since, "%Y-%m-%d").date()
+    else:
+        since = datetime.utcnow().date() - timedelta(days=int(_arg("--days") or 90) - 1)
+    asyncio.run(migrate(since))
@@ -0,0 +1,48 @@
+"""
+创建全文搜索索引表，并对现有视频/帖子/小说/图集建立索引
+
+用法（在 backend 目录下运行）:
+    python scripts/migrations/build_search_index.py [--force]
+
+索引已有数据时只做一次对账（补齐未收录和已变更的文档），--force 清空后全量重建。
+"""
+import sys
+import time
+import asyncio
+
+from sqlalchemy import select, func, inspect, text
+
+from app.core.database import engine, Base, AsyncSessionLocal
+from app.models.search import SearchDocument, SearchPosting, SearchSuggestion
+from app.services.search_index import SearchIndex
+
+
+async def migrate(force: bool = False):
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all,
+            tables=[SearchDocument.__table__, SearchPosting.__table__, SearchSuggestion.__table__]
+        )
+        # 早期建的表没有 content_hash 列；为空的文档下次对账到时整体重建一次索引
+        columns = await conn.run_sync(
+            lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns(SearchDocument.__tablename__)}
+        )
+        if "content_hash" not in columns:
+            await conn.execute(text("ALTER TABLE search_documents ADD COLUMN content_hash VARCHAR(40)"))
+            print("Added content_hash column to search_documents")
+
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        existing = await db.scalar(select(func.count(SearchDocument.id)))
+        if existing and not force:
+            count = await SearchIndex.reconcile(db)
+            print(f"索引已有 {existing} 个文档，对账处理 {count} 个（--force 全量重建）")
+            return
+        counts = await SearchIndex.rebuild(db)
+        postings = await db.scalar(select(func.count()).select_from(SearchPosting))
+    summary = ", ".join(f"{doc_type} {count}" for doc_type, count in counts.items())
+    print(f"已建立索引：{summary}；倒排记录 {postings} 条，耗时 {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate(force="--force" in sys.argv))
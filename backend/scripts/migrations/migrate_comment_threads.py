@@ -0,0 +1,40 @@
+"""
+评论楼层：补建游标分页用的复合索引，并按可见评论核对冗余的评论数/回复数
+
+用法（在 backend 目录下运行）:
+    python scripts/migrations/migrate_comment_threads.py
+"""
+import asyncio
+
+from app.core.database import engine, AsyncSessionLocal
+from app.models.comment import Comment
+from app.models.community import PostComment, GalleryComment, NovelComment
+from app.services.comment_threads import CommentThreads, KINDS
+
+INDEXES = [
+    "idx_comment_thread",
+    "idx_post_comment_thread",
+    "idx_gallery_comment_thread",
+    "idx_gallery_comment_parent",
+    "idx_novel_comment_thread",
+    "idx_novel_comment_parent",
+]
+
+
+async def migrate():
+    async with engine.begin() as conn:
+        for model in (Comment, PostComment, GalleryComment, NovelComment):
+            for index in model.__table__.indexes:
+                if index.name in INDEXES:
+                    await conn.run_sync(lambda sync_conn, index=index: index.create(sync_conn, checkfirst=True))
+                    print(f"索引 {index.name} 已就绪")
+
+    async with AsyncSessionLocal() as db:
+        for kind in KINDS:
+            fixed = await CommentThreads.recount(db, kind)
+            await db.commit()
+            print(f"{kind} 评论计数已核对，修正 {fixed} 行")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,203 @@
+"""
+创建通知收件箱表，并用历史评论/回复/点赞回填收件箱和计数
+
+用法（在 backend 目录下运行）:
+    python scripts/migrations/migrate_notification_inbox.py [--force]
+
+收件箱已有数据时跳过，--force 清空后重新回填。
+回填规则与原聚合接口一致（隐藏/删除的评论不回填）；
+users.last_notification_read 之前的记录视为已读，没有该时间的用户以 24 小时前为界。
+私信未读数取各会话未读数之和。
+"""
+import sys
+import asyncio
+from datetime import datetime, timedelta
+from collections import defaultdict
+
+from sqlalchemy import select, delete, func, insert
+
+from app.core.database import engine, Base, AsyncSessionLocal
+from app.models.user import User
+from app.models.video import Video
+from app.models.comment import Comment, CommentLike
+from app.models.social import VideoLike, MessageConversation
+from app.models.community import (
+    Post, PostComment, PostLike, PostCommentLike, Gallery, GalleryComment, GalleryCommentLike
+)
+from app.models.notification import NotificationInboxItem, NotificationCounter
+
+BATCH_SIZE = 5000
+
+
+def _post_title(post: Post) -> str:
+    return post.content[:20] if post.content else '帖子'
+
+
+async def collect(db):
+    """按原聚合接口的口径收集全部历史通知"""
+    rows = []
+
+    def add(created_at, user_id, actor_id, category, notification_type, source_type, source_id,
+            target_type, target_id, target_title=None, content=None):
+        if user_id and user_id != actor_id:
+            rows.append({
+                'created_at': created_at or datetime.utcnow(), 'user_id': user_id, 'actor_id': actor_id,
+                'category': category, 'notification_type': notification_type,
+                'source_type': source_type, 'source_id': source_id,
+                'target_type': target_type, 'target_id': target_id,
+                'target_title': (target_title or None) and target_title[:200],
+                'content': (content or None) and content[:50],
+            })
+
+    # 视频评论与回复
+    Parent = Comment.__table__.alias('parent')
+    result = await db.execute(
+        select(Comment, Video, Parent.c.user_id)
+        .join(Video, Comment.video_id == Video.id)
+        .outerjoin(Parent, Comment.parent_id == Parent.c.id)
+        .where(Comment.is_hidden == False)
+    )
+    for comment, video, parent_user_id in result.all():
+        target_type = 'short' if video.is_short else 'video'
+        add(comment.created_at, parent_user_id, comment.user_id, 'comment', 'reply', 'video_comment',
+            comment.id, target_type, video.id, video.title, comment.content)
+        add(comment.created_at, video.uploader_id, comment.user_id, 'comment', 'comment', 'video_comment',
+            comment.id, target_type, video.id, video.title, comment.content)
+
+    # 视频点赞
+    result = await db.execute(select(VideoLike, Video).join(Video, VideoLike.video_id == Video.id))
+    for like, video in result.all():
+        add(like.created_at, video.uploader_id, like.user_id, 'like', 'like', 'video_like', like.id,
+            'short' if video.is_short else 'video', video.id, video.title)
+
+    # 视频评论点赞
+    result = await db.execute(
+        select(CommentLike, Comment).join(Comment, CommentLike.comment_id == Comment.id)
+        .where(Comment.is_hidden == False)
+    )
+    for like, comment in result.all():
+        add(like.created_at, comment.user_id, like.user_id, 'like', 'like', 'video_comment_like', like.id,
+            'video_comment', comment.video_id, None, comment.content)
+
+    # 帖子评论与回复
+    Parent = PostComment.__table__.alias('parent')
+    result = await db.execute(
+        select(PostComment, Post, Parent.c.user_id)
+        .join(Post, PostComment.post_id == Post.id)
+        .outerjoin(Parent, PostComment.parent_id == Parent.c.id)
+        .where(PostComment.status == 'visible')
+    )
+    for comment, post, parent_user_id in result.all():
+        add(comment.created_at, parent_user_id, comment.user_id, 'comment', 'reply', 'post_comment',
+            comment.id, 'post', post.id, _post_title(post), comment.content)
+        add(comment.created_at, post.user_id, comment.user_id, 'comment', 'comment', 'post_comment',
+            comment.id, 'post', post.id, _post_title(post), comment.content)
+
+    # 帖子点赞
+    result = await db.execute(select(PostLike, Post).join(Post, PostLike.post_id == Post.id))
+    for like, post in result.all():
+        add(like.created_at, post.user_id, like.user_id, 'like', 'like', 'post_like', like.id,
+            'post', post.id, _post_title(post))
+
+    # 帖子评论点赞
+    result = await db.execute(
+        select(PostCommentLike, PostComment).join(PostComment, PostCommentLike.comment_id == PostComment.id)
+        .where(PostComment.status == 'visible')
+    )
+    for like, comment in result.all():
+        add(like.created_at, comment.user_id, like.user_id, 'like', 'like', 'post_comment_like', like.id,
+            'post_comment', comment.post_id, None, comment.content)
+
+    # 图集评论回复
+    Parent = GalleryComment.__table__.alias('parent')
+    result = await db.execute(
+        select(GalleryComment, Gallery, Parent.c.user_id)
+        .join(Gallery, GalleryComment.gallery_id == Gallery.id)
+        .join(Parent, GalleryComment.parent_id == Parent.c.id)
+        .where(GalleryComment.is_hidden == False)
+    )
+    for comment, gallery, parent_user_id in result.all():
+        add(comment.created_at, parent_user_id, comment.user_id, 'comment', 'reply', 'gallery_comment',
+            comment.id, 'gallery', gallery.id, gallery.title, comment.content)
+
+    # 图集评论点赞
+    result = await db.execute(
+        select(GalleryCommentLike, GalleryComment)
+        .join(GalleryComment, GalleryCommentLike.comment_id == GalleryComment.id)
+        .where(GalleryComment.is_hidden == False)
+    )
+    for like, comment in result.all():
+        add(like.created_at, comment.user_id, like.user_id, 'like', 'like', 'gallery_comment_like', like.id,
+            'gallery_comment', comment.gallery_id, None, comment.content)
+
+    # 按时间排序，收件箱 id 与时间同序；同一来源对同一接收者只保留第一条（回复优先于评论）
+    rows.sort(key=lambda r: r['created_at'])
+    seen = set()
+    unique = []
+    for row in rows:
+        key = (row['source_type'], row['source_id'], row['user_id'])
+        if key not in seen:
+            seen.add(key)
+            unique.append(row)
+    return unique
+
+
+async def migrate(force: bool = False):
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all,
+            tables=[NotificationInboxItem.__table__, NotificationCounter.__table__]
+        )
+
+    async with AsyncSessionLocal() as db:
+        existing = await db.scalar(select(func.count(NotificationInboxItem.id)))
+        if existing and not force:
+            print(f"收件箱已有 {existing} 条记录，跳过（--force 重新回填）")
+            return
+        await db.execute(delete(NotificationInboxItem))
+        await db.execute(delete(NotificationCounter))
+
+        rows = await collect(db)
+        for i in range(0, len(rows), BATCH_SIZE):
+            await db.execute(insert(NotificationInboxItem), rows[i:i + BATCH_SIZE])
+        print(f"回填通知 {len(rows)} 条")
+
+        # 计数：已读游标取 last_notification_read 之前的最后一条
+        default_read_time = datetime.utcnow() - timedelta(hours=24)
+        read_times = dict((await db.execute(select(User.id, User.last_notification_read))).all())
+        counters = defaultdict(lambda: {
+            'comment_total': 0, 'comment_unread': 0, 'comment_read_id': 0,
+            'like_total': 0, 'like_unread': 0, 'like_read_id': 0, 'private_unread': 0,
+        })
+        result = await db.execute(
+            select(NotificationInboxItem.id, NotificationInboxItem.user_id,
+                   NotificationInboxItem.category, NotificationInboxItem.created_at)
+            .order_by(NotificationInboxItem.id)
+        )
+        for item_id, user_id, category, created_at in result.all():
+            counter = counters[user_id]
+            counter[f'{category}_total'] += 1
+            if created_at > (read_times.get(user_id) or default_read_time):
+                counter[f'{category}_unread'] += 1
+            else:
+                counter[f'{category}_read_id'] = item_id
+
+        result = await db.execute(select(
+            MessageConversation.user1_id, MessageConversation.user1_unread,
+            MessageConversation.user2_id, MessageConversation.user2_unread
+        ))
+        for user1_id, user1_unread, user2_id, user2_unread in result.all():
+            if user1_unread:
+                counters[user1_id]['private_unread'] += user1_unread
+            if user2_unread:
+                counters[user2_id]['private_unread'] += user2_unread
+
+        values = [{'user_id': user_id, **counter} for user_id, counter in counters.items()]
+        for i in range(0, len(values), BATCH_SIZE):
+            await db.execute(insert(NotificationCounter), values[i:i + BATCH_SIZE])
+        await db.commit()
+        print(f"回填计数 {len(values)} 个用户")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate(force="--force" in sys.argv))
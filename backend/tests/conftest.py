@@ -2,6 +2,7 @@
 Pytest 配置和 fixtures
 """
 import pytest
+import pytest_asyncio
 import asyncio
 from typing import AsyncGenerator, Generator
 from httpx import AsyncClient
@@ -15,6 +16,9 @@ os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///:memory:"
 from app.main import app
 from app.core.database import Base, get_db
 
+# 查询预算插件（query_budget fixture / marker）
+pytest_plugins = ["tests.query_budget"]
+
 
 # 测试数据库引擎
 test_engine = create_async_engine(
@@ -59,6 +63,34 @@ async def test_db() -> AsyncGenerator[AsyncSession, None]:
         await conn.run_sync(Base.metadata.drop_all)
 
 
+@pytest_asyncio.fixture
+async def make_db():
+    """
+    独立内存数据库工厂：engine, db = await make_db(User, Video, ...)
+
+    只创建传入的模型（或 Table）对应的表，不传时只创建引擎；会话 expire_on_commit=False，
+    需要多个会话时用 async_sessionmaker(engine, ...)。测试结束时统一关闭会话、释放引擎。
+    """
+    opened = []
+
+    async def factory(*models):
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        if models:
+            async with engine.begin() as conn:
+                await conn.run_sync(
+                    Base.metadata.create_all,
+                    tables=[getattr(model, "__table__", model) for model in models]
+                )
+        db = AsyncSession(engine, expire_on_commit=False)
+        opened.append((engine, db))
+        return engine, db
+
+    yield factory
+    for engine, db in reversed(opened):
+        await db.close()
+        await engine.dispose()
+
+
 @pytest.fixture(scope="function")
 async def client(test_db: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
     """
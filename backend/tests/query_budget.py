@@ -0,0 +1,87 @@
+"""
+pytest 查询预算插件：超过声明的 SQL 条数或出现 N+1 时让测试失败
+
+在 conftest.py 中通过 pytest_plugins 启用。两种用法：
+
+    async def test_list(query_budget):
+        with query_budget(7):                       # 块内最多 7 条 SQL，且同一指纹不得达到 N+1 阈值
+            await list_video_comments(...)
+
+    @pytest.mark.query_budget(10)                   # 经过 MonitoringMiddleware 的每个请求最多 10 条 SQL
+    async def test_api(client):
+        await client.get("/api/v1/videos")
+
+allow_repeats=True 时只检查条数，不检查 N+1（确实需要按条执行的写入等）。
+"""
+from contextlib import contextmanager
+from typing import List, Optional
+
+import pytest
+
+from app.core.database import QueryLog, install_sql_profiler, profile_queries, sql_profiler
+
+
+def budget_problems(log: QueryLog, max_queries: int, allow_repeats: bool = False) -> List[str]:
+    """SQL 记录超出预算的原因，没有问题时为空列表"""
+    problems = []
+    if log.count > max_queries:
+        problems.append(f"执行了 {log.count} 条 SQL，预算 {max_queries} 条")
+    if not allow_repeats:
+        for fp, records in log.repeated():
+            problems.append(f"疑似 N+1：同一语句执行 {len(records)} 次：{fp[:200]}")
+    return problems
+
+
+def _failure_message(label: str, problems: List[str], log: QueryLog) -> str:
+    return f"{label} 超出查询预算：\n  " + "\n  ".join(problems) + "\n" + log.report()
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "query_budget(max_queries, allow_repeats=False): 经过 MonitoringMiddleware 的每个请求的 SQL 预算"
+    )
+    install_sql_profiler()
+
+
+@pytest.fixture
+def query_budget():
+    """返回上下文管理器 query_budget(max_queries, allow_repeats=False, label=None)"""
+
+    @contextmanager
+    def budget(max_queries: int, allow_repeats: bool = False, label: Optional[str] = None):
+        with profile_queries() as log:
+            yield log
+        problems = budget_problems(log, max_queries, allow_repeats)
+        if problems:
+            pytest.fail(_failure_message(label or "代码块", problems, log), pytrace=False)
+
+    return budget
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker("query_budget")
+    if marker is None:
+        return (yield)
+
+    max_queries = marker.args[0] if marker.args else marker.kwargs["max_queries"]
+    allow_repeats = marker.kwargs.get("allow_repeats", False)
+    failures = []
+
+    def check(method: str, route: str, log: QueryLog):
+        problems = budget_problems(log, max_queries, allow_repeats)
+        if problems:
+            failures.append(_failure_message(f"{method} {route}", problems, log))
+
+    was_enabled = sql_profiler.enabled
+    sql_profiler.enabled = True
+    sql_profiler.listeners.append(check)
+    try:
+        result = yield
+    finally:
+        sql_profiler.listeners.remove(check)
+        sql_profiler.enabled = was_enabled
+    if failures:
+        pytest.fail("\n\n".join(failures), pytrace=False)
+    return result
@@ -0,0 +1,170 @@
+"""
+本地 Redis 替身：实现聊天分发用到的 RESP 命令子集，供测试和多进程压测使用
+
+支持 PING / PUBLISH / SUBSCRIBE / UNSUBSCRIBE / ZADD / ZREM / ZSCORE / ZMSCORE /
+ZRANGEBYSCORE / ZREMRANGEBYSCORE / DEL / FLUSHALL，CLIENT / SELECT 直接返回 OK。
+
+    server = RedisStandIn()
+    port = await server.start()      # 同一事件循环内使用
+    ...
+    await server.stop()
+
+或在独立进程中运行：python -m tests.redis_standin --port 6399
+"""
+import argparse
+import asyncio
+from typing import Dict, Set, Optional
+
+
+def _encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, Exception):
+        return f"-ERR {value}\r\n".encode()
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(v) for v in value)
+    if isinstance(value, float):
+        value = repr(value)
+    data = value if isinstance(value, bytes) else str(value).encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def _score(raw: str, inclusive_default: bool = True):
+    if raw in ("-inf", "+inf", "inf"):
+        return float(raw.replace("+", "")), True
+    if raw.startswith("("):
+        return float(raw[1:]), False
+    return float(raw), inclusive_default
+
+
+class RedisStandIn:
+    def __init__(self):
+        self.zsets: Dict[str, Dict[str, float]] = {}
+        self.channels: Dict[str, Set[asyncio.StreamWriter]] = {}
+        self.published = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.decode().split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2].decode())
+        return args
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        subscribed: Set[str] = set()
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                writer.write(self._execute(args, writer, subscribed))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscribed:
+                self.channels.get(channel, set()).discard(writer)
+            writer.close()
+
+    def _execute(self, args, writer, subscribed: Set[str]) -> bytes:
+        name = args[0].upper()
+        try:
+            if name == "PING":
+                if subscribed:
+                    return _encode(["pong", args[1] if len(args) > 1 else ""])
+                return _encode(args[1]) if len(args) > 1 else b"+PONG\r\n"
+            if name in ("CLIENT", "SELECT"):
+                return b"+OK\r\n"
+            if name == "FLUSHALL":
+                self.zsets.clear()
+                return b"+OK\r\n"
+            if name == "DEL":
+                return _encode(sum(1 for key in args[1:] if self.zsets.pop(key, None) is not None))
+            if name == "PUBLISH":
+                channel, data = args[1], args[2]
+                receivers = list(self.channels.get(channel, ()))
+                for subscriber in receivers:
+                    subscriber.write(_encode(["message", channel, data]))
+                self.published += 1
+                return _encode(len(receivers))
+            if name == "SUBSCRIBE":
+                out = b""
+                for channel in args[1:]:
+                    subscribed.add(channel)
+                    self.channels.setdefault(channel, set()).add(writer)
+                    out += _encode(["subscribe", channel, len(subscribed)])
+                return out
+            if name == "UNSUBSCRIBE":
+                out = b""
+                for channel in (args[1:] or list(subscribed)):
+                    subscribed.discard(channel)
+                    self.channels.get(channel, set()).discard(writer)
+                    out += _encode(["unsubscribe", channel, len(subscribed)])
+                return out
+            return self._zset_command(name, args)
+        except Exception as e:
+            return _encode(e)
+
+    def _zset_command(self, name: str, args) -> bytes:
+        key = args[1]
+        zset = self.zsets.setdefault(key, {})
+        if name == "ZADD":
+            added = 0
+            for i in range(2, len(args), 2):
+                added += args[i + 1] not in zset
+                zset[args[i + 1]] = float(args[i])
+            return _encode(added)
+        if name == "ZREM":
+            return _encode(sum(1 for member in args[2:] if zset.pop(member, None) is not None))
+        if name == "ZSCORE":
+            score = zset.get(args[2])
+            return _encode(None if score is None else repr(score))
+        if name == "ZMSCORE":
+            return _encode([None if zset.get(m) is None else repr(zset[m]) for m in args[2:]])
+        if name in ("ZRANGEBYSCORE", "ZREMRANGEBYSCORE"):
+            low, low_inclusive = _score(args[2])
+            high, high_inclusive = _score(args[3])
+            members = [
+                m for m, s in sorted(zset.items(), key=lambda item: item[1])
+                if (s >= low if low_inclusive else s > low) and (s <= high if high_inclusive else s < high)
+            ]
+            if name == "ZRANGEBYSCORE":
+                return _encode(members)
+            for member in members:
+                del zset[member]
+            return _encode(len(members))
+        raise ValueError(f"unknown command '{name}'")
+
+
+async def _serve(port: int) -> None:
+    server = RedisStandIn()
+    await server.start(port=port)
+    print(f"redis stand-in listening on 127.0.0.1:{port}", flush=True)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=6399)
+    asyncio.run(_serve(parser.parse_args().port))
@@ -110,3 +110,129 @@ class TestCacheDecorator:
                 assert result == {"result": "abc"}
                 # 函数不应该被再次调用
                 assert call_count == 1
+
+
+class TestLocalCache:
+    """一级缓存测试"""
+    
+    def test_lru_eviction_by_count_and_bytes(self):
+        """测试按条目数和字节数淘汰最久未使用的条目"""
+        from app.services.cache_service import LocalCache, _MISSING
+        
+        cache = LocalCache(max_entries=3, max_bytes=100)
+        cache.set("a", 1, 10, ttl=60)
+        cache.set("b", 2, 10, ttl=60)
+        cache.set("c", 3, 10, ttl=60)
+        cache.get("a")  # a 变为最近使用
+        cache.set("d", 4, 10, ttl=60)
+        assert cache.get("b")[0] is _MISSING
+        assert cache.get("a") == (1, True)
+        
+        cache.set("big", 5, 90, ttl=60)
+        assert cache.bytes <= 100
+        assert cache.get("big") == (5, True)
+        assert cache.evictions >= 2
+    
+    def test_stale_window(self):
+        """测试过期后在 stale 窗口内返回旧值"""
+        from app.services.cache_service import LocalCache, _MISSING
+        
+        cache = LocalCache()
+        cache.set("k", "v", 1, ttl=0, stale_ttl=60)
+        assert cache.get("k") == ("v", False)
+        cache.set("gone", "v", 1, ttl=0, stale_ttl=0)
+        assert cache.get("gone")[0] is _MISSING
+    
+    def test_invalidation_message(self):
+        """测试其他 worker 的失效消息会清除一级缓存，自己发出的消息被忽略"""
+        import json
+        from app.services.cache_service import CacheService, _MISSING
+        
+        CacheService._local.set("home:categories", [1], 3, ttl=60)
+        CacheService._local.set("banners:home", [2], 3, ttl=60)
+        CacheService.handle_invalidation(json.dumps({"o": CacheService._origin, "k": ["home:categories"], "p": []}))
+        assert CacheService._local.get("home:categories")[0] == [1]
+        
+        CacheService.handle_invalidation(json.dumps({"o": "other", "k": ["home:categories"], "p": ["banners:*"]}))
+        assert CacheService._local.get("home:categories")[0] is _MISSING
+        assert CacheService._local.get("banners:home")[0] is _MISSING
+
+
+class TestGetOrLoad:
+    """单飞加载测试（Redis 不可用，二级缓存为内存缓存）"""
+    
+    @pytest.mark.asyncio
+    async def test_single_flight(self):
+        """测试并发未命中只加载一次"""
+        import asyncio
+        from app.core.redis import RedisCache
+        from app.services.cache_service import CacheService
+        
+        calls = 0
+        
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return {"n": 1}
+        
+        with patch.object(RedisCache, "get_client", new_callable=AsyncMock) as mock_client:
+            mock_client.return_value = None
+            await CacheService.delete("test:single_flight")
+            results = await asyncio.gather(*[
+                CacheService.get_or_load("test:single_flight", loader, ttl=60) for _ in range(20)
+            ])
+            assert calls == 1
+            assert all(r == {"n": 1} for r in results)
+            
+            # 之后直接命中一级缓存
+            assert await CacheService.get_or_load("test:single_flight", loader, ttl=60) == {"n": 1}
+            assert calls == 1
+            await CacheService.delete("test:single_flight")
+    
+    @pytest.mark.asyncio
+    async def test_loader_error_propagates_to_waiters(self):
+        """测试加载失败时所有等待者都收到异常，且不写入缓存"""
+        import asyncio
+        from app.core.redis import RedisCache
+        from app.services.cache_service import CacheService
+        
+        async def loader():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("db down")
+        
+        with patch.object(RedisCache, "get_client", new_callable=AsyncMock) as mock_client:
+            mock_client.return_value = None
+            results = await asyncio.gather(*[
+                CacheService.get_or_load("test:error", loader) for _ in range(3)
+            ], return_exceptions=True)
+            assert all(isinstance(r, RuntimeError) for r in results)
+            assert await CacheService.get("test:error") is None
+    
+    @pytest.mark.asyncio
+    async def test_stale_while_revalidate(self):
+        """测试过期后先返回旧值，后台刷新后返回新值"""
+        import asyncio
+        from app.core.redis import RedisCache
+        from app.services.cache_service import CacheService
+        
+        version = 0
+        
+        async def loader():
+            nonlocal version
+            version += 1
+            return {"v": version}
+        
+        with patch.object(RedisCache, "get_client", new_callable=AsyncMock) as mock_client:
+            mock_client.return_value = None
+            await CacheService.delete("test:swr")
+            assert await CacheService.get_or_load("test:swr", loader, ttl=60, stale_ttl=60) == {"v": 1}
+            
+            # 模拟一级、二级缓存都已过期，但仍在 stale 窗口内
+            CacheService._local.set("test:swr", {"v": 1}, 7, ttl=0, stale_ttl=60)
+            await RedisCache.delete("test:swr")
+            assert await CacheService.get_or_load("test:swr", loader, ttl=60, stale_ttl=60) == {"v": 1}
+            
+            await asyncio.gather(*CacheService._background)
+            assert await CacheService.get_or_load("test:swr", loader, ttl=60, stale_ttl=60) == {"v": 2}
+            await CacheService.delete("test:swr")
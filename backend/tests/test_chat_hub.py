@@ -0,0 +1,208 @@
+"""
+客服聊天跨 worker 分发测试（本地 Redis 替身）
+"""
+import asyncio
+import pytest
+import redis.asyncio as redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+from tests.redis_standin import RedisStandIn
+
+
+class FakeWebSocket:
+    """记录收到的消息"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+
+async def _wait_for(predicate, timeout: float = 2.0) -> bool:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(0.01)
+    return predicate()
+
+
+async def _make_workers(count: int):
+    """启动 Redis 替身和 count 个各自连接的 ChatHub（模拟多个 worker）"""
+    from app.services.chat_hub import ChatHub
+
+    server = RedisStandIn()
+    port = await server.start()
+    clients, hubs = [], []
+    for _ in range(count):
+        client = redis.Redis(host="127.0.0.1", port=port, decode_responses=True)
+
+        async def factory(client=client):
+            return client
+
+        hub = ChatHub(redis_factory=factory)
+        hub.POLL_INTERVAL = 0.05
+        hub.start()
+        assert await hub.wait_ready()
+        clients.append(client)
+        hubs.append(hub)
+    return server, clients, hubs
+
+
+async def _shutdown(server, clients, hubs):
+    for hub in hubs:
+        await hub.stop()
+    for client in clients:
+        await client.aclose()
+    await server.stop()
+
+
+class TestChatHub:
+    """跨 worker 投递与在线状态"""
+
+    @pytest.mark.asyncio
+    async def test_cross_worker_delivery(self):
+        """测试用户和客服连在不同 worker 上时双向送达，且不重复投递"""
+        server, clients, (worker_a, worker_b) = await _make_workers(2)
+        try:
+            user_ws, agent_ws, other_agent_ws = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+            await worker_a.connect_user(user_ws, 1)
+            await worker_b.connect_agent(agent_ws, 100)
+            await worker_a.connect_agent(other_agent_ws, 101)
+
+            await worker_a.broadcast_to_agents({"type": "new_session", "n": 1})
+            assert await _wait_for(lambda: agent_ws.sent and other_agent_ws.sent)
+
+            await worker_b.send_to_user(1, {"type": "new_message", "n": 2})
+            assert await _wait_for(lambda: user_ws.sent)
+
+            await asyncio.sleep(0.1)
+            assert agent_ws.sent == [{"type": "new_session", "n": 1}]
+            assert other_agent_ws.sent == [{"type": "new_session", "n": 1}]
+            assert user_ws.sent == [{"type": "new_message", "n": 2}]
+
+            # 断开后退订，其他 worker 的消息不再投递到这里
+            worker_a.disconnect_user(1)
+            await asyncio.sleep(0.05)
+            await worker_b.send_to_user(1, {"type": "new_message", "n": 3})
+            await asyncio.sleep(0.1)
+            assert len(user_ws.sent) == 1
+        finally:
+            await _shutdown(server, clients, [worker_a, worker_b])
+
+    @pytest.mark.asyncio
+    async def test_presence_across_workers_and_expiry(self):
+        """测试在线状态跨 worker 可见，未续期的连接到期下线"""
+        server, clients, (worker_a, worker_b) = await _make_workers(2)
+        try:
+            await worker_a.connect_agent(FakeWebSocket(), 100)
+            await worker_b.connect_user(FakeWebSocket(), 1)
+            assert await worker_b.online_agents() == {100}
+            assert await worker_a.online_users([1, 2]) == {1}
+
+            worker_a.disconnect_agent(100)
+            assert await _wait_for(lambda: not server.zsets.get("chat:presence:agents"))
+            assert await worker_b.online_agents() == set()
+
+            # worker_b 异常退出（不再续期）：TTL 到期后视为离线
+            worker_b.PRESENCE_TTL = 0.2
+            await worker_b.touch(users=[1])
+            assert await worker_a.online_users([1]) == {1}
+            await asyncio.sleep(0.3)
+            assert await worker_a.online_users([1]) == set()
+        finally:
+            await _shutdown(server, clients, [worker_a, worker_b])
+
+    @pytest.mark.asyncio
+    async def test_local_fallback_without_redis(self):
+        """测试 Redis 不可用时按单进程方式投递"""
+        from app.services.chat_hub import ChatHub
+
+        async def no_redis():
+            return None
+
+        hub = ChatHub(redis_factory=no_redis)
+        user_ws, agent_ws = FakeWebSocket(), FakeWebSocket()
+        await hub.connect_user(user_ws, 1)
+        await hub.connect_agent(agent_ws, 100)
+        await hub.send_to_user(1, {"n": 1})
+        await hub.broadcast_to_agents({"n": 2})
+        assert user_ws.sent == [{"n": 1}]
+        assert agent_ws.sent == [{"n": 2}]
+        assert await hub.online_agents() == {100}
+        assert await hub.online_users([1, 2]) == {1}
+
+
+class TestMessageBatcher:
+    """聊天消息组提交"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_messages_share_commits(self, make_db):
+        """测试并发消息合并提交，会话计数与标题正确"""
+        from app.models.user import User
+        from app.models.chat import ChatSession, ChatMessage
+        from app.services.chat_hub import MessageBatcher
+
+        engine, _ = await make_db(User, ChatSession, ChatMessage)
+        factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with factory() as db:
+            db.add(User(id=1, username="u", email="u@example.com", hashed_password="x"))
+            db.add_all([ChatSession(id=1, user_id=1, unread_count=0, user_unread_count=0),
+                        ChatSession(id=2, user_id=1, unread_count=0, user_unread_count=0, title="keep")])
+            await db.commit()
+
+        batcher = MessageBatcher(session_factory=factory)
+        try:
+            saves = [batcher.save(1, 1, True, f"hello {i}") for i in range(20)]
+            saves += [batcher.save(2, 9, False, "reply") for _ in range(5)]
+            saves.append(batcher.save(2, 1, True, "second title"))
+            messages = await asyncio.gather(*saves)
+
+            assert len({m.id for m in messages}) == 26
+            assert all(m.created_at is not None for m in messages)
+            assert batcher.batches < 26
+
+            async with factory() as db:
+                s1, s2 = (await db.execute(select(ChatSession).order_by(ChatSession.id))).scalars().all()
+            assert (s1.unread_count, s1.user_unread_count, s1.title) == (20, 0, "hello 0")
+            assert (s2.unread_count, s2.user_unread_count, s2.title) == (1, 5, "keep")
+        finally:
+            await batcher.close()
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_retried_row_by_row(self, make_db):
+        """测试一批里有坏消息时逐条重试，只有那一条报错，其余消息和计数照常写入"""
+        from sqlalchemy.exc import IntegrityError
+        from app.models.user import User
+        from app.models.chat import ChatSession, ChatMessage
+        from app.services.chat_hub import MessageBatcher
+
+        engine, _ = await make_db(User, ChatSession, ChatMessage)
+        factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with factory() as db:
+            db.add(User(id=1, username="u", email="u@example.com", hashed_password="x"))
+            db.add(ChatSession(id=1, user_id=1, unread_count=0, user_unread_count=0))
+            await db.commit()
+
+        batcher = MessageBatcher(session_factory=factory)
+        try:
+            saves = [batcher.save(1, 1, True, f"hello {i}") for i in range(4)]
+            saves.insert(2, batcher.save(1, None, False, "no sender"))  # sender_id 不能为空
+            results = await asyncio.gather(*saves, return_exceptions=True)
+
+            assert isinstance(results[2], IntegrityError)
+            saved = [r for i, r in enumerate(results) if i != 2]
+            assert all(isinstance(m, ChatMessage) and m.id for m in saved)
+
+            async with factory() as db:
+                session = await db.get(ChatSession, 1)
+                count = len((await db.execute(select(ChatMessage))).scalars().all())
+            assert count == 4
+            assert (session.unread_count, session.user_unread_count) == (4, 0)
+        finally:
+            await batcher.close()
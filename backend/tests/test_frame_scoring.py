@@ -0,0 +1,100 @@
+"""
+候选帧批量评分测试
+"""
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+
+def _save(path, array):
+    Image.fromarray(array.astype(np.uint8)).save(path, quality=95)
+    return str(path)
+
+
+def _scene(seed: int, blur: bool = False) -> np.ndarray:
+    """带色块和细节的合成画面"""
+    rng = np.random.default_rng(seed)
+    img = np.zeros((360, 640, 3), dtype=np.float32)
+    img[:] = rng.integers(40, 200, 3)
+    for _ in range(20):
+        x, y = rng.integers(0, 520), rng.integers(0, 260)
+        img[y:y + 100, x:x + 120] = rng.integers(0, 255, 3)
+    img[::4, :, :] *= 0.6  # 细条纹
+    if blur:
+        img = np.asarray(Image.fromarray(img.astype(np.uint8)).resize((80, 45)).resize((640, 360)), dtype=np.float32)
+    return img
+
+
+class TestFrameScoring:
+    """批量评分测试"""
+
+    def test_rank_prefers_sharp_frame_and_flags_blank(self, tmp_path):
+        """测试清晰帧排在模糊帧前，黑屏帧被标记并排到最后"""
+        from app.services.frame_scoring import rank_frames
+
+        paths = [
+            _save(tmp_path / "black.jpg", np.zeros((360, 640, 3))),
+            _save(tmp_path / "blurry.jpg", _scene(1, blur=True)),
+            _save(tmp_path / "sharp.jpg", _scene(1)),
+        ]
+        ranked = rank_frames(paths)
+        assert [f.index for f in ranked] == [2, 1, 0]
+        assert ranked[-1].is_blank
+        assert not ranked[0].is_blank
+
+    def test_duplicate_frames_keep_best_copy(self, tmp_path):
+        """测试重复帧只保留得分最高的一张，其余指向它"""
+        from app.services.frame_scoring import rank_frames
+
+        scene = _scene(2)
+        paths = [
+            _save(tmp_path / "a.jpg", scene),
+            _save(tmp_path / "b.jpg", _scene(3)),
+            _save(tmp_path / "a_copy.jpg", scene * 0.97),
+        ]
+        ranked = rank_frames(paths)
+        duplicates = [f for f in ranked if f.duplicate_of is not None]
+        assert len(duplicates) == 1
+        assert {duplicates[0].index, duplicates[0].duplicate_of} == {0, 2}
+        assert ranked[-1] is duplicates[0]
+
+    def test_unreadable_frames_are_skipped_and_weights_apply(self, tmp_path):
+        """测试读取失败的帧被跳过，位置权重参与排序"""
+        from app.services.frame_scoring import score_frames
+
+        broken = tmp_path / "broken.jpg"
+        broken.write_bytes(b"not an image")
+        scene = _scene(4)
+        paths = [_save(tmp_path / "x.jpg", scene), str(broken), _save(tmp_path / "y.jpg", scene[:, ::-1])]
+
+        plain = score_frames(paths)
+        weighted = score_frames(paths, weights=[1.0, 1.0, 2.0])
+        assert [f.index for f in plain] == [0, 2]
+        assert weighted[1].score > plain[1].score
+
+    def test_face_bonus_is_optional(self, tmp_path, monkeypatch):
+        """测试人脸加分只在 faces=True 时生效，检测到人脸的帧加 FACE_BONUS 分"""
+        from app.services import frame_scoring
+
+        paths = [_save(tmp_path / "a.jpg", _scene(5)), _save(tmp_path / "b.jpg", _scene(6))]
+        plain = frame_scoring.score_frames(paths)
+
+        monkeypatch.setattr(frame_scoring, "detect_faces", lambda frame_paths: [False, True])
+        assert [f.score for f in frame_scoring.score_frames(paths)] == [f.score for f in plain]
+        scored = frame_scoring.score_frames(paths, faces=True)
+        assert [f.has_face for f in scored] == [False, True]
+        assert scored[0].score == plain[0].score
+        assert scored[1].score == pytest.approx(plain[1].score + frame_scoring.FACE_BONUS, abs=0.01)
+
+
+class TestSharedCopy:
+    """后端与转码服务共用同一份代码"""
+
+    def test_transcode_service_copy_is_identical(self):
+        """测试 transcode_service/frame_scoring.py 与 app/services/frame_scoring.py 逐字节一致（改动须同步两份）"""
+        root = Path(__file__).resolve().parents[2]
+        backend = root / "backend" / "app" / "services" / "frame_scoring.py"
+        transcode = root / "transcode_service" / "frame_scoring.py"
+        assert transcode.read_bytes() == backend.read_bytes(), f"{transcode} 与 {backend} 不一致"
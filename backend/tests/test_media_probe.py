@@ -0,0 +1,106 @@
+"""
+媒体信息探测测试
+"""
+import json
+import os
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+
+PROBE_OUTPUT = {
+    "packets": [
+        {"stream_index": 0, "pts_time": "0.000000", "flags": "K__"},
+        {"stream_index": 1, "pts_time": "0.000000", "flags": "K__"},
+        {"stream_index": 0, "pts_time": "0.033367", "flags": "___"},
+        {"stream_index": 0, "pts_time": "2.002000", "flags": "K__"},
+        {"stream_index": 0, "pts_time": "4.004000", "flags": "K__"},
+    ],
+    "streams": [
+        {
+            "index": 0, "codec_type": "video", "codec_name": "h264",
+            "width": 1920, "height": 1080, "avg_frame_rate": "30000/1001",
+            "side_data_list": [{"side_data_type": "Display Matrix", "rotation": -90}],
+        },
+        {"index": 1, "codec_type": "audio", "codec_name": "aac"},
+    ],
+    "format": {"duration": "125.500000", "bit_rate": "4200000"},
+}
+
+
+class TestParseProbeOutput:
+    """ffprobe 输出解析测试"""
+
+    def test_parse_full_metadata(self):
+        """测试解析时长、帧率、编码、码率、关键帧间隔和旋转"""
+        from app.services.media_probe import parse_probe_output
+
+        info = parse_probe_output(PROBE_OUTPUT)
+        assert info.duration == 125.5
+        assert (info.width, info.height) == (1920, 1080)
+        assert info.fps == 29.97
+        assert (info.video_codec, info.audio_codec) == ("h264", "aac")
+        assert info.bitrate == 4200000
+        assert info.keyframe_interval == 2.002
+        assert info.rotation == 90
+        assert (info.display_width, info.display_height) == (1080, 1920)
+        assert info.has_audio
+
+    def test_duration_falls_back_to_frame_count(self):
+        """测试容器和流都没有时长时用帧数/帧率计算"""
+        from app.services.media_probe import parse_probe_output
+
+        info = parse_probe_output({
+            "streams": [{"index": 0, "codec_type": "video", "r_frame_rate": "25/1", "nb_frames": "250"}],
+            "format": {},
+        })
+        assert info.duration == 10.0
+        assert not info.has_audio
+
+
+class TestMediaProbeCache:
+    """探测缓存测试"""
+
+    def test_second_probe_uses_cache_until_file_changes(self, tmp_path):
+        """测试重复探测不再启动 ffprobe，文件变化后重新探测"""
+        from app.services.media_probe import MediaProbe
+
+        video = tmp_path / "a.mp4"
+        video.write_bytes(b"x" * 10)
+        completed = MagicMock(returncode=0, stdout=json.dumps(PROBE_OUTPUT).encode(), stderr=b"")
+
+        with patch("app.services.media_probe.subprocess.run", return_value=completed) as run:
+            probe = MediaProbe(str(tmp_path / "cache" / "probe.db"))
+            first = probe.probe(str(video))
+            # 新实例（例如进程重启）也能读到持久缓存
+            second = MediaProbe(str(tmp_path / "cache" / "probe.db")).probe(str(video))
+            assert run.call_count == 1
+            assert first == second
+
+            video.write_bytes(b"x" * 20)
+            probe.probe(str(video))
+            assert run.call_count == 2
+
+    def test_failed_probe_is_not_cached(self, tmp_path):
+        """测试 ffprobe 失败时返回空信息且不缓存"""
+        from app.services.media_probe import MediaProbe
+
+        video = tmp_path / "broken.mp4"
+        video.write_bytes(b"x")
+        failed = MagicMock(returncode=1, stdout=b"", stderr=b"Invalid data")
+
+        with patch("app.services.media_probe.subprocess.run", return_value=failed) as run:
+            probe = MediaProbe(str(tmp_path / "probe.db"))
+            assert probe.probe(str(video)).duration == 0
+            probe.probe(str(video))
+            assert run.call_count == 2
+
+
+class TestSharedCopy:
+    """后端与转码服务共用同一份代码"""
+
+    def test_transcode_service_copy_is_identical(self):
+        """测试 transcode_service/media_probe.py 与 app/services/media_probe.py 逐字节一致（改动须同步两份）"""
+        root = Path(__file__).resolve().parents[2]
+        backend = root / "backend" / "app" / "services" / "media_probe.py"
+        transcode = root / "transcode_service" / "media_probe.py"
+        assert transcode.read_bytes() == backend.read_bytes(), f"{transcode} 与 {backend} 不一致"
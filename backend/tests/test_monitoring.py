@@ -0,0 +1,161 @@
+"""
+性能监控测试（延迟直方图、按路由模板统计、SQL/Redis 埋点、多 worker 合并与 Prometheus 导出）
+"""
+import json
+import os
+
+import pytest
+import redis.asyncio as redis
+from fastapi import FastAPI, HTTPException
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import text
+
+from tests.redis_standin import RedisStandIn
+
+
+@pytest.fixture
+def fresh_monitor():
+    from app.services.monitoring_service import monitor
+
+    monitor.reset_metrics()
+    monitor.snapshot_dir = None
+    yield monitor
+    monitor.reset_metrics()
+    monitor.snapshot_dir = None
+
+
+class TestLatencyHistogram:
+    """固定分桶直方图"""
+
+    def test_quantiles_within_bucket(self):
+        """测试分位数在桶内插值，首尾用实际最小/最大值收紧"""
+        from app.services.monitoring_service import LatencyHistogram
+
+        histogram = LatencyHistogram()
+        for ms in range(1, 101):          # 1ms ~ 100ms 均匀分布
+            histogram.observe(ms / 1000)
+        assert histogram.count == 100
+        assert 0.04 <= histogram.quantile(0.5) <= 0.06
+        assert 0.09 <= histogram.quantile(0.95) <= 0.1
+        assert histogram.quantile(0.99) <= histogram.max == 0.1
+        assert histogram.quantile(0.0) >= histogram.min == 0.001
+
+        histogram.observe(45.0)           # 超过最大分桶，落在 +Inf 桶
+        assert histogram.counts[-1] == 1
+        assert histogram.quantile(1.0) == 45.0
+
+
+class TestMonitoringMiddleware:
+    """中间件按路由模板归类，并统计请求内的 SQL 和 Redis 往返"""
+
+    @pytest.mark.asyncio
+    async def test_route_template_db_and_redis(self, make_db, fresh_monitor):
+        """测试 /items/1 与 /items/2 归到同一路由；每个请求 2 条 SQL、2 次 Redis 往返（pipeline 算一次）"""
+        from app.services.monitoring_service import (
+            MonitoringMiddleware, UNMATCHED_ROUTE, instrument_engine, instrument_redis_pool
+        )
+
+        engine, _ = await make_db()
+        instrument_engine(engine)
+        instrument_engine(engine)  # 重复注册无副作用
+        server = RedisStandIn()
+        port = await server.start()
+        pool = redis.ConnectionPool(host="127.0.0.1", port=port, decode_responses=True)
+        instrument_redis_pool(pool)
+        client = redis.Redis(connection_pool=pool)
+        await client.ping()  # 请求外建立连接，不计入请求
+
+        app = FastAPI()
+
+        @app.get("/items/{item_id}")
+        async def get_item(item_id: int):
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                await conn.execute(text("SELECT :id"), {"id": item_id})
+            await client.zadd("items", {str(item_id): item_id})
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.zscore("items", "1")
+                pipe.zscore("items", "2")
+                await pipe.execute()
+            if item_id == 3:
+                raise HTTPException(status_code=400, detail="bad")
+            return {"id": item_id}
+
+        app.add_middleware(MonitoringMiddleware)
+        try:
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as http:
+                for item_id in (1, 2, 3):
+                    await http.get(f"/items/{item_id}")
+                assert (await http.get("/no/such/path/123")).status_code == 404
+                await http.get("/api/health")
+
+            metrics = fresh_monitor.endpoint_metrics
+            assert set(metrics) == {("GET", "/items/{item_id}"), ("GET", UNMATCHED_ROUTE)}
+            item = metrics[("GET", "/items/{item_id}")]
+            assert (item.total_requests, item.total_errors) == (3, 1)
+            assert dict(item.status_codes) == {200: 2, 400: 1}
+            assert (item.db_queries, item.redis_calls) == (6, 6)
+            assert item.db_time > 0 and item.redis_time > 0
+            assert item.latency.count == 3
+
+            report = fresh_monitor.get_endpoint_metrics()[0]
+            assert report["endpoint"] == "GET:/items/{item_id}"
+            assert report["avg_db_queries"] == 2 and report["avg_redis_calls"] == 2
+            assert report["p99_response_time_ms"] <= report["max_response_time_ms"]
+        finally:
+            await client.aclose()
+            await pool.disconnect()
+            await server.stop()
+
+
+class TestMultiprocessExport:
+    """多 worker 快照合并与 Prometheus 导出"""
+
+    @pytest.mark.asyncio
+    async def test_merge_snapshots_and_render(self, fresh_monitor, tmp_path, monkeypatch):
+        """测试合并其他 worker 的快照、跳过分桶不同的旧快照，导出的直方图为累计计数"""
+        from prometheus_client.parser import text_string_to_metric_families
+        from app.core.config import settings
+        from app.api.monitoring import get_prometheus_metrics
+        from app.services.monitoring_service import RequestStats, RequestMetrics
+
+        stats = RequestStats()
+        stats.db_queries, stats.redis_calls = 3, 1
+        fresh_monitor.record_request("/videos/{video_id}", "GET", 200, 0.02, stats=stats)
+        fresh_monitor.record_request("/videos/{video_id}", "GET", 500, 0.3, stats=stats)
+
+        other = RequestMetrics()
+        other.total_requests = 1
+        other.status_codes[200] = 1
+        other.latency.observe(0.004)
+        other.db_queries = 5
+        snapshot = {"pid": 1, "buckets": list(fresh_monitor.snapshot()["buckets"]),
+                    "endpoints": [{"method": "GET", "route": "/videos/{video_id}", **other.to_dict()}]}
+        (tmp_path / "perf-1.json").write_text(json.dumps(snapshot))
+        (tmp_path / "perf-2.json").write_text(json.dumps({**snapshot, "buckets": [1.0]}))
+        fresh_monitor.snapshot_dir = str(tmp_path)
+        fresh_monitor.write_snapshot()
+        assert os.path.exists(tmp_path / f"perf-{os.getpid()}.json")
+
+        merged = fresh_monitor.collect()[("GET", "/videos/{video_id}")]
+        assert (merged.total_requests, merged.total_errors, merged.db_queries) == (3, 1, 11)
+        assert fresh_monitor.get_application_metrics()["total_requests"] == 3
+
+        monkeypatch.setattr(settings, "METRICS_TOKEN", "secret")
+        with pytest.raises(HTTPException) as exc:
+            await get_prometheus_metrics(authorization="Bearer wrong")
+        assert exc.value.status_code == 401
+        response = await get_prometheus_metrics(authorization="Bearer secret")
+
+        samples = {
+            (s.name, s.labels.get("le"), s.labels.get("status")): s.value
+            for family in text_string_to_metric_families(response.body.decode())
+            for s in family.samples
+        }
+        assert samples[("http_request_duration_seconds_count", None, None)] == 3
+        assert samples[("http_request_duration_seconds_bucket", "0.005", None)] == 1
+        assert samples[("http_request_duration_seconds_bucket", "0.025", None)] == 2
+        assert samples[("http_request_duration_seconds_bucket", "+Inf", None)] == 3
+        assert samples[("http_requests_total", None, "200")] == 2
+        assert samples[("http_request_db_queries_total", None, None)] == 11
+        assert samples[("http_request_redis_roundtrips_total", None, None)] == 2
@@ -0,0 +1,144 @@
+"""
+通知收件箱测试
+"""
+import pytest
+from sqlalchemy import select, func
+
+
+async def _make_db(make_db):
+    """创建独立的内存数据库，并插入三个用户"""
+    from app.models.user import User
+    from app.models.video import Video
+    from app.models.comment import Comment, CommentLike
+    from app.models.notification import NotificationInboxItem, NotificationCounter
+
+    engine, db = await make_db(User, Video, Comment, CommentLike, NotificationInboxItem, NotificationCounter)
+    db.add_all([
+        User(id=1, username="author", email="author@example.com", hashed_password="x"),
+        User(id=2, username="fan", email="fan@example.com", hashed_password="x"),
+        User(id=3, username="other", email="other@example.com", hashed_password="x"),
+    ])
+    await db.commit()
+    return engine, db
+
+
+async def _push_like(db, source_id, actor_id=2, user_id=1):
+    from app.services.notification_inbox import NotificationInbox, NotificationCategory
+
+    return await NotificationInbox.push(
+        db, user_id=user_id, actor_id=actor_id,
+        category=NotificationCategory.LIKE, notification_type='like',
+        source_type='video_like', source_id=source_id,
+        target_type='video', target_id=10, target_title='v10'
+    )
+
+
+class TestNotificationInbox:
+    """收件箱写入、撤回、分页与计数"""
+
+    @pytest.mark.asyncio
+    async def test_push_counts_and_skips(self, make_db):
+        """测试写入计数，自己触发和同一来源重复写入被忽略"""
+        from app.services.notification_inbox import NotificationInbox
+
+        engine, db = await _make_db(make_db)
+        assert await _push_like(db, 1) is not None
+        assert await _push_like(db, 2, actor_id=3) is not None
+        assert await _push_like(db, 1) is None            # 重复来源
+        assert await _push_like(db, 3, actor_id=1) is None  # 自己点赞自己
+        await db.commit()
+
+        counter = await NotificationInbox.counts(db, 1)
+        assert (counter.like_total, counter.like_unread) == (2, 2)
+        assert (counter.comment_total, counter.comment_unread) == (0, 0)
+        assert await NotificationInbox.counts(db, 2) is None
+
+    @pytest.mark.asyncio
+    async def test_mark_read_and_retract(self, make_db):
+        """测试已读游标：撤回已读记录只减总数，撤回未读记录同时减未读数"""
+        from app.services.notification_inbox import NotificationInbox, NotificationCategory
+
+        engine, db = await _make_db(make_db)
+        await _push_like(db, 1)
+        await _push_like(db, 2)
+        await NotificationInbox.mark_read(db, 1, NotificationCategory.LIKE)
+        await _push_like(db, 3)
+        await db.commit()
+
+        counter = await NotificationInbox.counts(db, 1)
+        await db.refresh(counter)
+        assert (counter.like_total, counter.like_unread) == (3, 1)
+
+        assert await NotificationInbox.retract(db, 'video_like', 1) == 1
+        await db.refresh(counter)
+        assert (counter.like_total, counter.like_unread) == (2, 1)
+
+        assert await NotificationInbox.retract(db, 'video_like', 3) == 1
+        await db.refresh(counter)
+        assert (counter.like_total, counter.like_unread) == (1, 0)
+
+        assert await NotificationInbox.retract(db, 'video_like', 3) == 0
+
+        # rebuild 与增量维护的结果一致
+        await NotificationInbox.rebuild(db, 1)
+        await db.refresh(counter)
+        assert (counter.like_total, counter.like_unread) == (1, 0)
+
+    @pytest.mark.asyncio
+    async def test_fetch_keyset_pages(self, make_db):
+        """测试按 id 倒序的 keyset 分页，页码分页结果一致"""
+        from app.services.notification_inbox import NotificationInbox, NotificationCategory
+
+        engine, db = await _make_db(make_db)
+        for source_id in range(1, 8):
+            await _push_like(db, source_id)
+        await db.commit()
+
+        seen = []
+        cursor = None
+        while True:
+            rows = await NotificationInbox.fetch(db, 1, NotificationCategory.LIKE, limit=3, before_id=cursor)
+            seen.extend(item.source_id for item, _ in rows)
+            if len(rows) < 3:
+                break
+            cursor = rows[-1][0].id
+        assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+        rows = await NotificationInbox.fetch(db, 1, NotificationCategory.LIKE, limit=3, offset=3)
+        assert [item.source_id for item, _ in rows] == [4, 3, 2]
+        assert all(actor.username == "fan" for _, actor in rows)
+
+    @pytest.mark.asyncio
+    async def test_retract_comment_withdraws_likes(self, make_db):
+        """测试隐藏评论时撤回评论通知及其点赞通知"""
+        from app.models.video import Video
+        from app.models.comment import Comment, CommentLike
+        from app.models.notification import NotificationInboxItem
+        from app.services.notification_inbox import NotificationInbox, NotificationCategory
+
+        engine, db = await _make_db(make_db)
+        db.add(Video(id=10, title="v10", uploader_id=1))
+        comment = Comment(id=5, video_id=10, user_id=2, content="nice")
+        like = CommentLike(id=9, comment_id=5, user_id=3)
+        db.add_all([comment, like])
+        await db.flush()
+        await NotificationInbox.push(
+            db, user_id=1, actor_id=2,
+            category=NotificationCategory.COMMENT, notification_type='comment',
+            source_type='video_comment', source_id=5,
+            target_type='video', target_id=10, content="nice"
+        )
+        await NotificationInbox.push(
+            db, user_id=2, actor_id=3,
+            category=NotificationCategory.LIKE, notification_type='like',
+            source_type='video_comment_like', source_id=9,
+            target_type='video_comment', target_id=10, content="nice"
+        )
+        await db.commit()
+
+        assert await NotificationInbox.retract_comment(db, 'short', 5) == 2
+        await db.commit()
+        remaining = await db.scalar(select(func.count(NotificationInboxItem.id)))
+        assert remaining == 0
+        assert (await NotificationInbox.counts(db, 1)).comment_unread == 0
+        assert (await NotificationInbox.counts(db, 2)).like_unread == 0
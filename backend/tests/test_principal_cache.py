@@ -0,0 +1,90 @@
+"""
+认证主体缓存测试
+"""
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+
+@pytest_asyncio.fixture
+async def session_factory(make_db):
+    from app.models.user import User, UserVIP
+
+    engine, _ = await make_db(User, UserVIP)
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    factory.statements = statements
+
+    with patch("app.core.redis.get_redis", new_callable=AsyncMock) as mock_get:
+        mock_get.return_value = None
+        import app.core.redis as redis_module
+        from app.services.principal_cache import PrincipalCache
+
+        redis_module._memory_cache.clear()
+        async with factory() as db:
+            db.add(User(id=1, username="alice", email="alice@example.com", hashed_password="x", nickname="A"))
+            db.add(UserVIP(user_id=1, vip_level=2, is_active=True, expire_date=datetime.utcnow() + timedelta(days=3)))
+            await db.commit()
+        await PrincipalCache.wait_pending()
+        yield factory
+        redis_module._memory_cache.clear()
+
+
+class TestPrincipalCache:
+    """认证主体缓存测试"""
+
+    @pytest.mark.asyncio
+    async def test_second_request_hits_snapshot_without_sql(self, session_factory):
+        """测试第二次请求直接使用快照，不查询数据库"""
+        from app.services.principal_cache import PrincipalCache
+
+        async with session_factory() as db:
+            _, _, principal = await PrincipalCache.resolve(db, "tok", 1)
+        assert principal.user.username == "alice" and principal.is_vip
+
+        session_factory.statements.clear()
+        async with session_factory() as db:
+            token_flag, user_flag, principal = await PrincipalCache.resolve(db, "tok", 1)
+            assert (token_flag, user_flag) == (False, False)
+            assert principal.user.nickname == "A"
+            assert principal.vip_level == 2 and principal.is_vip
+            assert principal.user in db
+        assert session_factory.statements == []
+
+    @pytest.mark.asyncio
+    async def test_commit_invalidates_snapshot(self, session_factory):
+        """测试修改缓存出来的用户并提交后，UPDATE 生效且快照失效"""
+        from app.models.user import User
+        from app.services.principal_cache import PrincipalCache
+
+        async with session_factory() as db:
+            await PrincipalCache.resolve(db, "tok", 1)
+        async with session_factory() as db:
+            _, _, principal = await PrincipalCache.resolve(db, "tok", 1)
+            principal.user.nickname = "B"
+            await db.commit()
+        await PrincipalCache.wait_pending()
+
+        async with session_factory() as db:
+            assert (await db.execute(select(User.nickname).where(User.id == 1))).scalar() == "B"
+            session_factory.statements.clear()
+            _, _, principal = await PrincipalCache.resolve(db, "tok", 1)
+        assert principal.user.nickname == "B"
+        assert len(session_factory.statements) == 1
+
+    @pytest.mark.asyncio
+    async def test_blacklist_and_missing_user(self, session_factory):
+        """测试黑名单令牌不返回主体，不存在的用户返回 None"""
+        from app.core.token_blacklist import TokenBlacklist
+        from app.services.principal_cache import PrincipalCache
+
+        await TokenBlacklist.add("revoked", 60)
+        async with session_factory() as db:
+            assert await PrincipalCache.resolve(db, "revoked", 1) == (True, False, None)
+            assert await PrincipalCache.resolve(db, "tok", 404) == (False, False, None)
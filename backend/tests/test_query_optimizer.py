@@ -0,0 +1,159 @@
+"""
+查询优化工具测试（游标分页）
+"""
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+from sqlalchemy import select, update
+
+
+async def _make_db(make_db, video_count: int = 25):
+    """创建内存数据库，插入带重复播放量的视频（测试排序并列）"""
+    from app.models.user import User
+    from app.models.video import Video
+
+    engine, db = await make_db(User, Video)
+    user = User(username="keyset", email="keyset@example.com", hashed_password="x")
+    db.add(user)
+    await db.flush()
+    base = datetime(2026, 1, 1)
+    db.add_all([
+        Video(
+            id=i,
+            title=f"v{i}",
+            uploader_id=user.id,
+            view_count=i % 4,
+            like_count=i % 3,
+            created_at=base + timedelta(minutes=i // 2),
+        )
+        for i in range(1, video_count + 1)
+    ])
+    await db.commit()
+    return engine, db
+
+
+class TestKeysetOrder:
+    """游标编码测试"""
+
+    def test_cursor_round_trip(self):
+        """测试游标编码解码（含日期时间）"""
+        from app.core.query_optimizer import KeysetOrder
+        from app.models.video import Video
+
+        order = KeysetOrder.newest(Video)
+        row = Video(id=7, created_at=datetime(2026, 3, 4, 5, 6, 7))
+        cursor = order.encode(row)
+
+        assert order.decode(cursor) == [datetime(2026, 3, 4, 5, 6, 7), 7]
+
+    def test_cursor_order_mismatch(self):
+        """测试游标不能跨排序方式使用"""
+        from app.core.query_optimizer import KeysetOrder, KeysetCursorError
+        from app.models.video import Video
+
+        cursor = KeysetOrder.most_viewed(Video).encode(Video(id=1, view_count=3))
+
+        with pytest.raises(KeysetCursorError):
+            KeysetOrder.most_liked(Video).decode(cursor)
+
+    def test_cursor_garbage(self):
+        """测试无效游标"""
+        from app.core.query_optimizer import KeysetOrder, KeysetCursorError
+        from app.models.video import Video
+
+        with pytest.raises(KeysetCursorError):
+            KeysetOrder.newest(Video).decode("not-a-cursor")
+
+
+class TestKeysetQuery:
+    """游标分页查询测试"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("fields", [
+        ("created_at", "id"),
+        ("view_count", "id"),
+        ("like_count", "id"),
+        ("view_count", "like_count", "id"),
+    ])
+    async def test_keyset_matches_offset(self, make_db, fields):
+        """测试游标分页遍历结果与 OFFSET 全量排序一致，无重复无遗漏"""
+        from app.core.query_optimizer import QueryOptimizer, KeysetOrder
+        from app.models.video import Video
+
+        engine, db = await _make_db(make_db)
+        order = KeysetOrder.of(Video, *fields)
+        expected = (await db.execute(select(Video.id).order_by(*order.order_by()))).scalars().all()
+
+        seen = []
+        cursor = None
+        while True:
+            items, cursor, has_more = await QueryOptimizer.keyset_query(
+                db, select(Video), order, cursor, page_size=4
+            )
+            seen.extend(v.id for v in items)
+            if not has_more:
+                assert cursor is None
+                break
+
+        assert seen == list(expected)
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("fields", [
+        ("created_at", "id"),
+        ("view_count", "id"),
+        ("like_count", "id"),
+        ("view_count", "like_count", "id"),
+    ])
+    async def test_null_values_cross_pages(self, make_db, fields):
+        """测试排序列为 NULL 的行跨页时不丢行、不重复（NULL 按 0 / 纪元时间参与排序）"""
+        from app.core.query_optimizer import QueryOptimizer, KeysetOrder
+        from app.models.video import Video
+
+        engine, db = await _make_db(make_db, video_count=15)
+        # 列默认值会在插入时填上，建好后再置空
+        await db.execute(
+            update(Video).where(Video.id > 10).values(view_count=None, like_count=None, created_at=None)
+        )
+        await db.commit()
+
+        order = KeysetOrder.of(Video, *fields)
+        expected = (await db.execute(select(Video.id).order_by(*order.order_by()))).scalars().all()
+        seen = []
+        cursor = None
+        while True:
+            items, cursor, has_more = await QueryOptimizer.keyset_query(
+                db, select(Video), order, cursor, page_size=4
+            )
+            seen.extend(v.id for v in items)
+            if not has_more:
+                break
+
+        assert seen == list(expected)
+        assert sorted(seen) == list(range(1, 16))
+
+    @pytest.mark.asyncio
+    async def test_cached_count(self, make_db):
+        """测试计数缓存命中后不再查询数据库"""
+        from app.core.query_optimizer import QueryOptimizer
+        from app.core.redis import RedisCache
+
+        store = {}
+
+        async def fake_get(key):
+            return store.get(key)
+
+        async def fake_set(key, value, expire=3600):
+            store[key] = value
+            return True
+
+        engine, db = await _make_db(make_db, 5)
+        from app.models.video import Video
+        with patch.object(RedisCache, "get", side_effect=fake_get), \
+                patch.object(RedisCache, "set", side_effect=fake_set), \
+                patch.object(QueryOptimizer, "count", new_callable=AsyncMock) as mock_count:
+            mock_count.return_value = 5
+            query = select(Video).where(Video.view_count >= 0)
+
+            assert await QueryOptimizer.cached_count(db, query) == 5
+            assert await QueryOptimizer.cached_count(db, query) == 5
+            assert mock_count.call_count == 1
@@ -0,0 +1,147 @@
+"""
+物化排行榜测试
+"""
+import asyncio
+
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+
+async def _make_db(make_db):
+    """创建内存数据库：30 个长视频（部分发布于两周前）+ 1 个短视频"""
+    from app.models.user import User
+    from app.models.video import Video, VideoStatus, VideoCategory
+    from app.models.video import VideoTag, video_tags
+
+    engine, db = await make_db(User, VideoCategory, Video, VideoTag, video_tags)
+    user = User(username="ranker", email="ranker@example.com", hashed_password="x")
+    db.add(user)
+    await db.flush()
+    now = datetime.utcnow()
+    db.add_all([
+        Video(
+            id=i, title=f"v{i}", uploader_id=user.id, status=VideoStatus.PUBLISHED,
+            view_count=(i % 10) * 100, like_count=i,
+            created_at=now - timedelta(days=14 if i % 3 == 0 else 1)
+        )
+        for i in range(1, 31)
+    ])
+    db.add(Video(id=100, title="short", uploader_id=user.id, status=VideoStatus.PUBLISHED,
+                 is_short=True, view_count=99999))
+    await db.commit()
+    return engine, db
+
+
+@pytest.fixture
+def memory_mode():
+    """RedisCache 处于内存缓存模式"""
+    from app.core.redis import RedisCache
+    from app.services.ranking_service import RankingService
+
+    RankingService._boards.clear()
+    RankingService._cards.clear()
+    with patch.object(RedisCache, "get_client", new_callable=AsyncMock) as mock_client:
+        mock_client.return_value = None
+        yield
+    RankingService._boards.clear()
+    RankingService._cards.clear()
+
+
+class TestRankingService:
+    """排行榜服务测试（内存模式）"""
+
+    def test_score_encoding_matches_order(self):
+        """测试分数编码与 (view_count, like_count) 降序一致"""
+        from app.services.ranking_service import RankingService
+
+        pairs = [(10, 5), (10, 6), (9, 999), (11, 0)]
+        by_score = sorted(pairs, key=lambda p: -RankingService.encode_score(*p))
+        assert by_score == sorted(pairs, reverse=True)
+        assert RankingService.decode_score(RankingService.encode_score(123, 45)) == (123, 45)
+
+    @pytest.mark.asyncio
+    async def test_page_and_cursor_walk(self, make_db, memory_mode):
+        """测试榜单分页与数据库排序一致，游标翻页不重复"""
+        from app.services.ranking_service import RankingService
+
+        engine, db = await _make_db(make_db)
+        expected = sorted(
+            [((i % 10) * 100, i, i) for i in range(1, 31)], reverse=True
+        )
+        await RankingService.rebuild(db, "videos", "total")
+        await RankingService.rebuild(db, "videos", "week")
+        first = await RankingService.get_page(db, "videos", "total", page=1, page_size=7)
+        assert [item["id"] for item in first["items"]] == [e[2] for e in expected[:7]]
+        assert first["has_more"]
+
+        seen = [item["id"] for item in first["items"]]
+        cursor = first["next_cursor"]
+        while cursor:
+            data = await RankingService.get_page(db, "videos", "total", page_size=7, cursor=cursor)
+            seen.extend(item["id"] for item in data["items"])
+            cursor = data["next_cursor"]
+        assert seen == [e[2] for e in expected]
+
+        # 周榜不包含两周前的视频，短视频不进入长视频榜
+        week = await RankingService.get_page(db, "videos", "week", page_size=50)
+        assert all(item["id"] % 3 != 0 for item in week["items"])
+        assert 100 not in [item["id"] for item in week["items"]]
+
+    @pytest.mark.asyncio
+    async def test_incremental_update(self, make_db, memory_mode):
+        """测试增量更新会改变排名，且只影响对应时间范围"""
+        from app.models.video import Video
+        from app.services.ranking_service import RankingService
+
+        engine, db = await _make_db(make_db)
+        await RankingService.rebuild(db, "videos", "total")
+        await RankingService.rebuild(db, "videos", "week")
+        old_video = await db.get(Video, 3)
+        await RankingService.record("videos", 3, old_video.created_at, views=10000)
+
+        total = await RankingService.get_page(db, "videos", "total", page_size=1)
+        assert total["items"][0]["id"] == 3
+        assert total["items"][0]["view_count"] == 10300
+
+        week = await RankingService.get_page(db, "videos", "week", page_size=1)
+        assert week["items"][0]["id"] != 3
+
+    @pytest.mark.asyncio
+    async def test_truncated_board_falls_back(self, make_db, memory_mode):
+        """测试超出榜单保留范围的翻页回退到数据库"""
+        from app.services.ranking_service import RankingService
+
+        engine, db = await _make_db(make_db)
+        with patch.object(RankingService, "MAX_SIZE", 10):
+            await RankingService.rebuild(db, "videos", "total")
+            assert await RankingService.get_page(db, "videos", "total", page=1, page_size=5) is not None
+            assert await RankingService.get_page(db, "videos", "total", page=2, page_size=5) is None
+
+    @pytest.mark.asyncio
+    async def test_missing_board_rebuilt_once_in_background(self, make_db, memory_mode):
+        """测试榜单缺失时请求回退数据库，并发请求只触发一次后台重建"""
+        from app.services.ranking_service import RankingService
+
+        engine, db = await _make_db(make_db)
+        rebuilds = []
+        real_rebuild = RankingService.rebuild.__func__
+
+        async def counted_rebuild(cls, db, kind, time_range):
+            rebuilds.append((kind, time_range))
+            await asyncio.sleep(0.05)
+            return await real_rebuild(cls, db, kind, time_range)
+
+        with patch.object(RankingService, "session_factory", async_sessionmaker(engine)), \
+                patch.object(RankingService, "rebuild", classmethod(counted_rebuild)):
+            pages = await asyncio.gather(*[
+                RankingService.get_page(db, "videos", "total", page_size=5) for _ in range(10)
+            ])
+            assert pages == [None] * 10
+            await asyncio.gather(*RankingService._background)
+
+            assert rebuilds == [("videos", "total")]
+            assert not RankingService._rebuilding
+            page = await RankingService.get_page(db, "videos", "total", page_size=5)
+            assert len(page["items"]) == 5
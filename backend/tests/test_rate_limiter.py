@@ -0,0 +1,84 @@
+"""
+限流引擎测试
+"""
+import pytest
+from unittest.mock import AsyncMock, patch
+
+
+class TestPathRules:
+    """路径规则匹配测试"""
+
+    def test_longest_prefix_and_whitelist(self):
+        """测试最长前缀匹配、白名单和默认规则"""
+        from app.core.rate_limiter import PathRules, RateLimitConfig
+
+        rules = PathRules(RateLimitConfig.PATHS, RateLimitConfig.WHITELIST, RateLimitConfig.DEFAULT)
+        assert rules.match("/api/v1/auth/login") == (3, 60)
+        # 更具体的规则优先于 /api/v1/payments
+        assert rules.match("/api/v1/payments/epay/create") == (3, 60)
+        assert rules.match("/api/v1/payments/orders") == (5, 60)
+        assert rules.match("/api/v1/comments/12/like") == (10, 60)
+        assert rules.match("/api/v1/videos/12") == RateLimitConfig.DEFAULT
+        # 按路径段匹配，不会误匹配同前缀的其他路径
+        assert rules.match("/api/v1/postsearch") == RateLimitConfig.DEFAULT
+        assert rules.match("/uploads/covers/1.jpg") == PathRules.WHITELISTED
+        assert rules.match("/api/v1/payments/epay/notify") == PathRules.WHITELISTED
+
+
+class TestTokenBucket:
+    """进程内令牌桶测试"""
+
+    def test_burst_then_block_then_refill(self):
+        """测试突发用完后被限流，过一段时间后恢复"""
+        from app.core.rate_limiter import TokenBucketLimiter
+
+        bucket = TokenBucketLimiter()
+        with patch("app.core.rate_limiter.time.monotonic", return_value=1000.0):
+            results = [bucket.hit("k", 3, 60) for _ in range(4)]
+        assert [r.allowed for r in results] == [True, True, True, False]
+        assert results[0].remaining == 2
+        assert results[3].retry_after == 20
+
+        with patch("app.core.rate_limiter.time.monotonic", return_value=1020.0):
+            assert bucket.hit("k", 3, 60).allowed
+            assert not bucket.hit("k", 3, 60).allowed
+
+    def test_lru_eviction(self):
+        """测试键数量超过上限时淘汰最久未访问的键"""
+        from app.core.rate_limiter import TokenBucketLimiter
+
+        bucket = TokenBucketLimiter(max_keys=100)
+        for i in range(1000):
+            bucket.hit(f"ip:{i}", 10, 60)
+        assert len(bucket) == 100
+
+
+class TestRateLimiter:
+    """限流引擎测试"""
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_local_bucket(self):
+        """测试 Redis 不可用时使用进程内令牌桶"""
+        from app.core.redis import RedisCache
+        from app.core.rate_limiter import RateLimiter
+
+        engine = RateLimiter()
+        with patch.object(RedisCache, "get_client", new_callable=AsyncMock) as mock_client:
+            mock_client.return_value = None
+            results = [await engine.hit("rate_limit:/x:1", 2, 60) for _ in range(3)]
+        assert [r.allowed for r in results] == [True, True, False]
+        assert results[2].retry_after > 0
+
+    @pytest.mark.asyncio
+    async def test_legacy_decorator_api_uses_engine(self):
+        """测试 core.rate_limit 的 '次数/周期' 接口走同一个引擎"""
+        from app.core.redis import RedisCache
+        from app.core.rate_limit import rate_limiter
+
+        with patch.object(RedisCache, "get_client", new_callable=AsyncMock) as mock_client:
+            mock_client.return_value = None
+            first = await rate_limiter.is_allowed("10.0.0.1:/api/v1/auth/login", "2/minute")
+            await rate_limiter.is_allowed("10.0.0.1:/api/v1/auth/login", "2/minute")
+            blocked = await rate_limiter.is_allowed("10.0.0.1:/api/v1/auth/login", "2/minute")
+        assert first == (True, 1, 60)
+        assert blocked[0] is False and blocked[2] > 0
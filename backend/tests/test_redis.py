@@ -0,0 +1,102 @@
+"""
+Redis 连接层测试（熔断与批量接口）
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+@pytest.fixture
+def redis_module():
+    """每个用例使用干净的连接状态"""
+    import app.core.redis as redis_module
+
+    redis_module._client = None
+    redis_module._healthy, redis_module._verified = False, False
+    redis_module._retry_at, redis_module._backoff = 0.0, 0.0
+    yield redis_module
+    redis_module._client = None
+    redis_module._healthy, redis_module._verified = False, False
+    redis_module._retry_at, redis_module._backoff = 0.0, 0.0
+
+
+def _fake_client(ping_error=None):
+    client = MagicMock()
+    client.ping = AsyncMock(side_effect=ping_error)
+    client.mget = AsyncMock(return_value=["1", None])
+    return client
+
+
+class TestCircuitBreaker:
+    """熔断测试"""
+
+    @pytest.mark.asyncio
+    async def test_ping_only_once_when_healthy(self, redis_module):
+        """测试连接正常时只在首次使用时 PING，之后直接复用客户端"""
+        client = _fake_client()
+        with patch.object(redis_module, "_ensure_client", return_value=client):
+            redis_module._client = client
+            for _ in range(5):
+                assert await redis_module.get_redis() is client
+        assert client.ping.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_open_breaker_skips_redis_until_retry(self, redis_module):
+        """测试连接失败后在重试时间前不再访问 Redis，到期后探测成功即恢复"""
+        client = _fake_client(ping_error=ConnectionError("refused"))
+        with patch.object(redis_module, "_ensure_client", return_value=client):
+            redis_module._client = client
+            assert await redis_module.get_redis() is None
+            assert await redis_module.get_redis() is None
+            assert client.ping.await_count == 1
+            assert redis_module.redis_status()["healthy"] is False
+
+            # 到达重试时间，Redis 已恢复
+            client.ping.side_effect = None
+            redis_module._retry_at = 0.0
+            assert await redis_module.get_redis() is client
+            assert redis_module._backoff == 0.0
+
+    @pytest.mark.asyncio
+    async def test_command_error_trips_breaker(self, redis_module):
+        """测试命令连接错误会触发熔断并降级到内存缓存"""
+        from app.core.redis import RedisCache
+
+        client = _fake_client()
+        client.set = AsyncMock(return_value=True)
+        client.get = AsyncMock(side_effect=ConnectionError("reset"))
+        redis_module._client = client
+        redis_module._healthy = redis_module._verified = True
+
+        # 写入 Redis 成功，读取时连接断开：降级读内存缓存（没有该键）
+        await RedisCache.set("test:breaker", "v", 60)
+        assert await RedisCache.get("test:breaker") is None
+        assert redis_module._healthy is False
+        assert redis_module._retry_at > 0
+
+
+class TestBatchOperations:
+    """批量接口测试（内存备用缓存）"""
+
+    @pytest.mark.asyncio
+    async def test_get_set_incr_many_memory(self):
+        """测试 Redis 不可用时批量接口使用内存缓存"""
+        from app.core.redis import RedisCache
+
+        with patch("app.core.redis.get_redis", new_callable=AsyncMock) as mock_get:
+            mock_get.return_value = None
+            await RedisCache.set_many({"test:m1": "a", "test:m2": "b"}, expire=60)
+            assert await RedisCache.get_many(["test:m1", "test:missing", "test:m2"]) == ["a", None, "b"]
+
+            assert await RedisCache.incr_many(["test:c1", "test:c2"]) == [1, 1]
+            assert await RedisCache.incr_many(["test:c1"], amount=5, expire=60) == [6]
+
+    @pytest.mark.asyncio
+    async def test_blacklist_check_single_round_trip(self):
+        """测试黑名单检查只发一次 MGET"""
+        from app.core.token_blacklist import TokenBlacklist
+
+        client = _fake_client()
+        with patch("app.core.redis.get_redis", new_callable=AsyncMock) as mock_get:
+            mock_get.return_value = client
+            assert await TokenBlacklist.check("tok", 7) == (True, False)
+        client.mget.assert_awaited_once_with(["token_blacklist:tok", "token_blacklist:user:7"])
@@ -0,0 +1,207 @@
+"""
+全文搜索索引测试
+"""
+import pytest
+from sqlalchemy import select, update, func
+
+
+async def _make_db(make_db):
+    """创建独立的内存数据库（含搜索表）"""
+    from app.models.user import User
+    from app.models.video import Video, VideoTag, video_tags
+    from app.models.community import Post, Gallery, GalleryComment, Novel
+    from app.models.search import SearchDocument, SearchPosting, SearchSuggestion
+
+    engine, db = await make_db(
+        User, Video, VideoTag, video_tags, Post, Gallery, GalleryComment, Novel, SearchDocument, SearchPosting,
+        SearchSuggestion
+    )
+    db.add(User(id=1, username="author", email="author@example.com", hashed_password="x"))
+    await db.commit()
+    return engine, db
+
+
+def _video(video_id, title, description=None, views=0, **kwargs):
+    from app.models.video import Video, VideoStatus
+
+    return Video(id=video_id, title=title, description=description, uploader_id=1,
+                 status=kwargs.pop("status", VideoStatus.PUBLISHED), view_count=views, **kwargs)
+
+
+async def _ids(db, keyword, doc_types=None):
+    from app.services.search_index import SearchIndex
+
+    return [doc_id for _, doc_id, _, _ in await SearchIndex.search(db, keyword, doc_types)]
+
+
+class TestTokenize:
+    """分词"""
+
+    def test_cjk_bigrams_and_words(self):
+        """测试中文二元切分（含段尾单字）、英文按词、全角归一化"""
+        from app.services.search_index import tokenize, parse_query
+
+        assert tokenize("小猫咪 Hello，ＷＯＲＬＤ2") == ["小猫", "猫咪", "咪", "hello", "world2"]
+        assert parse_query("猫 猫咪 hello hello") == [("猫", True), ("猫咪", False), ("hello", True)]
+        # 只有最后一个字母数字词按前缀匹配
+        assert parse_query("my vlo") == [("my", False), ("vlo", True)]
+        assert parse_query("！！") == []
+
+
+class TestSearchIndex:
+    """索引维护与查询"""
+
+    @pytest.mark.asyncio
+    async def test_orm_changes_maintain_index(self, make_db):
+        """测试新增、改标题、下架、删除随事务提交同步到索引"""
+        from app.models.video import VideoTag, VideoStatus
+        from app.models.community import Gallery
+        from app.models.search import SearchDocument, SearchPosting
+        from app.services.search_index import SearchIndex
+
+        engine, db = await _make_db(make_db)
+        video = _video(1, "可爱的小猫咪合集", "每天更新", ai_tags="宠物,萌宠")
+        video.tags = [VideoTag(id=1, name="动物")]
+        gallery = Gallery(id=1, title="Funny dog pictures", cover="c.jpg")
+        db.add_all([video, _video(2, "Funny dog videos"), gallery])
+        await db.commit()
+
+        assert await _ids(db, "小猫") == [1]
+        assert await _ids(db, "猫") == [1]          # 单字前缀
+        assert await _ids(db, "萌宠") == [1]        # ai_tags
+        assert await _ids(db, "动物") == [1]        # 标签
+        assert await _ids(db, "DOG", ["video"]) == [2]
+        assert await _ids(db, "dog pictures") == [1]
+        assert await _ids(db, "小猫 dog") == []     # 所有词项都须命中
+
+        video.title = "狗狗日常"
+        await db.commit()
+        assert await _ids(db, "小猫") == []
+        assert await _ids(db, "狗狗") == [1]
+        assert await SearchIndex.suggest(db, "狗") == ["狗狗日常"]
+
+        video.status = VideoStatus.DELETED
+        await db.commit()
+        assert await _ids(db, "狗狗") == []
+
+        await db.delete(gallery)
+        await db.commit()
+        assert await _ids(db, "funny") == [2]
+
+        await db.execute(update(type(video)).where(type(video).id == 2).values(status=VideoStatus.DELETED))
+        await db.commit()
+        await SearchIndex.reconcile(db)
+        assert await db.scalar(select(func.count(SearchDocument.id))) == 0
+        assert await db.scalar(select(func.count()).select_from(SearchPosting)) == 0
+        assert await SearchIndex.suggest(db, "f") == []
+
+    @pytest.mark.asyncio
+    async def test_ranking_and_suggestions(self, make_db):
+        """测试标题命中优先于简介命中，同等相关度按热度排序；联想按热度排序"""
+        from app.services.search_index import SearchIndex
+
+        engine, db = await _make_db(make_db)
+        db.add_all([
+            _video(1, "旅行日记", "海边风景", views=10),
+            _video(2, "海边风景", views=10),
+            _video(3, "海边风景合集", views=100000),
+        ])
+        await db.commit()
+
+        assert await _ids(db, "海边") == [3, 2, 1]
+        assert await SearchIndex.suggest(db, "海边") == ["海边风景合集", "海边风景"]
+        assert await SearchIndex.suggest(db, "海边风景合") == ["海边风景合集"]
+
+    @pytest.mark.asyncio
+    async def test_listing_filter_and_reconcile(self, make_db):
+        """测试列表筛选条件，以及 Core 批量更新由对账补齐"""
+        from app.models.video import Video
+        from app.models.community import Post
+        from app.services.search_index import SearchIndex
+
+        engine, db = await _make_db(make_db)
+        db.add_all([_video(1, "夏日海滩"), _video(2, "冬日雪山"),
+                    Post(id=1, user_id=1, content="海滩上的日落\n很美")])
+        await db.commit()
+
+        query = select(Video.id).where(await SearchIndex.filter(db, "video", Video.id, Video.title, "海滩"))
+        assert (await db.execute(query)).scalars().all() == [1]
+        assert await _ids(db, "海滩", ["post"]) == [1]
+        # 没有可用词项时退回 ILIKE
+        query = select(Video.id).where(SearchIndex.condition("video", Video.id, Video.title, "%"))
+        assert len((await db.execute(query)).scalars().all()) == 2
+
+        # Core 更新绕过会话事件（updated_at 由 onupdate 刷新）
+        await db.execute(update(Video).where(Video.id == 2).values(title="冬日海滩"))
+        await db.execute(update(Post).where(Post.id == 1).values(status="hidden"))
+        await db.commit()
+        assert await _ids(db, "海滩") == [1, 1]
+
+        assert await SearchIndex.reconcile(db) == 2
+        assert sorted(await _ids(db, "海滩")) == [1, 2]
+        assert await _ids(db, "海滩", ["post"]) == []
+        assert await SearchIndex.reconcile(db) == 0
+
+        counts = await SearchIndex.rebuild(db)
+        assert counts == {"video": 2, "post": 0, "novel": 0, "gallery": 0}
+        assert sorted(await _ids(db, "海滩")) == [1, 2]
+
+    @pytest.mark.asyncio
+    async def test_reconcile_refreshes_popularity_without_reindexing(self, make_db):
+        """测试只有计数变化的文档对账时只刷新 boost 和联想词权重，不重建倒排"""
+        from app.models.video import Video
+        from app.models.search import SearchDocument, SearchPosting, SearchSuggestion
+        from app.services.search_index import SearchIndex
+
+        engine, db = await _make_db(make_db)
+        db.add_all([_video(1, "夏日海滩"), _video(2, "冬日雪山")])
+        await db.commit()
+        doc = (await db.execute(select(SearchDocument).where(SearchDocument.doc_id == 1))).scalar_one()
+        indexed_at, postings = doc.indexed_at, await db.scalar(select(func.count()).select_from(SearchPosting))
+
+        # 观看数刷入是 Core 批量更新，onupdate 会刷新 updated_at
+        await db.execute(update(Video).where(Video.id == 1).values(view_count=Video.view_count + 100))
+        await db.commit()
+        assert await SearchIndex.reconcile(db) == 1
+
+        db.expire_all()
+        doc = (await db.execute(select(SearchDocument).where(SearchDocument.doc_id == 1))).scalar_one()
+        assert doc.boost > 1 and doc.indexed_at == indexed_at
+        assert await db.scalar(select(func.count()).select_from(SearchPosting)) == postings
+        assert await db.scalar(select(SearchSuggestion.weight).where(SearchSuggestion.keyword == "夏日海滩")) == doc.boost
+        assert await SearchIndex.reconcile(db) == 0
+
+        # 被索引内容变了才重建
+        await db.execute(update(Video).where(Video.id == 1).values(description="日落", view_count=0))
+        await db.commit()
+        assert await SearchIndex.reconcile(db) == 1
+        db.expire_all()
+        doc = (await db.execute(select(SearchDocument).where(SearchDocument.doc_id == 1))).scalar_one()
+        assert doc.boost == 1 and doc.indexed_at > indexed_at
+        assert await _ids(db, "日落") == [1]
+
+    @pytest.mark.asyncio
+    async def test_listing_filter_matches_title_prefix_only(self, make_db):
+        """测试列表筛选：最后一个英文词按前缀匹配，只匹配标题（标签、简介命中不算），统一搜索仍含简介"""
+        from app.models.video import Video
+        from app.services.search_index import SearchIndex
+
+        engine, db = await _make_db(make_db)
+        db.add_all([
+            _video(1, "Daily vlog 海滩"),
+            _video(2, "Travel notes", "my vlog about 海滩"),
+            _video(3, "Vlogger tips", ai_tags="海滩"),
+        ])
+        await db.commit()
+
+        async def listing(keyword):
+            condition = await SearchIndex.filter(db, "video", Video.id, Video.title, keyword)
+            return (await db.execute(select(Video.id).where(condition).order_by(Video.id))).scalars().all()
+
+        assert await listing("vlo") == [1, 3]
+        assert await listing("vlog") == [1, 3]
+        assert await listing("daily vl") == [1]
+        assert await listing("海滩") == [1]
+        assert await listing("vlog 海滩") == [1]
+        assert sorted(await _ids(db, "海滩")) == [1, 2, 3]
+        assert sorted(await _ids(db, "vlo")) == [1, 2, 3]
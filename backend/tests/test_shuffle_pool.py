@@ -0,0 +1,161 @@
+"""
+随机推荐池测试
+"""
+import asyncio
+
+import pytest
+from unittest.mock import patch
+
+
+def _fake_redis():
+    """用字典替代 RedisCache 的 get/set"""
+    store = {}
+
+    async def fake_get(key):
+        return store.get(key)
+
+    async def fake_set(key, value, expire=3600):
+        store[key] = value
+        return True
+
+    return store, fake_get, fake_set
+
+
+async def _make_db(make_db, short_count: int = 37):
+    from app.models.user import User
+    from app.models.video import Video, VideoStatus
+
+    engine, db = await make_db(User, Video)
+    user = User(username="shuffle", email="shuffle@example.com", hashed_password="x")
+    db.add(user)
+    await db.flush()
+    db.add_all([
+        Video(
+            id=i, title=f"s{i}", uploader_id=user.id, is_short=True,
+            status=VideoStatus.PUBLISHED, short_category_id=1 if i % 2 else 2
+        )
+        for i in range(1, short_count + 1)
+    ])
+    # 非短视频、未发布视频不应进入短视频池
+    db.add(Video(id=1000, title="long", uploader_id=user.id, is_short=False, status=VideoStatus.PUBLISHED))
+    db.add(Video(id=1001, title="draft", uploader_id=user.id, is_short=True, status=VideoStatus.REVIEWING))
+    await db.commit()
+    return engine, db
+
+
+class TestShufflePermutation:
+    """伪随机置换测试"""
+
+    @pytest.mark.parametrize("n", [1, 2, 3, 10, 97, 1000, 4097])
+    def test_is_permutation(self, n):
+        """测试置换覆盖 [0, n) 且不重复"""
+        from app.services.shuffle_pool import ShufflePermutation
+
+        perm = ShufflePermutation(n, seed=12345)
+        assert sorted(perm[i] for i in range(n)) == list(range(n))
+
+    def test_seed_changes_order(self):
+        """测试不同种子得到不同顺序，相同种子顺序稳定"""
+        from app.services.shuffle_pool import ShufflePermutation
+
+        a = [ShufflePermutation(500, 1)[i] for i in range(500)]
+        b = [ShufflePermutation(500, 2)[i] for i in range(500)]
+        assert a != b
+        assert a == [ShufflePermutation(500, 1)[i] for i in range(500)]
+        assert a != list(range(500))
+
+
+class TestShufflePool:
+    """随机推荐池测试"""
+
+    @pytest.mark.asyncio
+    async def test_cursor_walk_no_repeats(self, make_db):
+        """测试沿游标翻页不重复、不遗漏，且只包含已发布短视频"""
+        from app.core.redis import RedisCache
+        from app.services.shuffle_pool import ShufflePool
+
+        ShufflePool._local.clear()
+        store, fake_get, fake_set = _fake_redis()
+        engine, db = await _make_db(make_db)
+        try:
+            with patch.object(RedisCache, "get", side_effect=fake_get), \
+                    patch.object(RedisCache, "set", side_effect=fake_set):
+                seen = []
+                ids, cursor, total = await ShufflePool.page(db, ShufflePool.KIND_SHORTS, None, limit=5)
+                seen.extend(ids)
+                while cursor:
+                    ids, cursor, total = await ShufflePool.page(
+                        db, ShufflePool.KIND_SHORTS, None, limit=5, cursor=cursor
+                    )
+                    seen.extend(ids)
+
+            assert total == 37
+            assert sorted(seen) == list(range(1, 38))
+            assert seen != sorted(seen)
+        finally:
+            ShufflePool._local.clear()
+
+    @pytest.mark.asyncio
+    async def test_category_pool_and_cursor_mismatch(self, make_db):
+        """测试分类池只含该分类，且游标不能跨分类使用"""
+        from app.core.query_optimizer import KeysetCursorError
+        from app.core.redis import RedisCache
+        from app.services.shuffle_pool import ShufflePool, hydrate_videos
+
+        ShufflePool._local.clear()
+        store, fake_get, fake_set = _fake_redis()
+        engine, db = await _make_db(make_db)
+        try:
+            with patch.object(RedisCache, "get", side_effect=fake_get), \
+                    patch.object(RedisCache, "set", side_effect=fake_set):
+                ids, cursor, total = await ShufflePool.page(db, ShufflePool.KIND_SHORTS, 2, limit=4)
+                assert total == 18
+                videos = await hydrate_videos(db, ids)
+                assert [v.id for v in videos] == ids
+                assert all(v.short_category_id == 2 for v in videos)
+
+                with pytest.raises(KeysetCursorError):
+                    await ShufflePool.page(db, ShufflePool.KIND_SHORTS, 1, limit=4, cursor=cursor)
+        finally:
+            ShufflePool._local.clear()
+
+    @pytest.mark.asyncio
+    async def test_missing_pool_rebuilt_once(self, make_db):
+        """测试池缺失时并发请求只重建一次，其余请求拿到同一版本"""
+        from app.core.redis import RedisCache
+        from app.services.shuffle_pool import ShufflePool
+
+        ShufflePool._local.clear()
+        store, fake_get, fake_set = _fake_redis()
+        engine, db = await _make_db(make_db)
+        builds = []
+        real_build = ShufflePool.build.__func__
+
+        async def slow_build(cls, db, kind, category_id=None):
+            builds.append(kind)
+            await asyncio.sleep(0.05)
+            return await real_build(cls, db, kind, category_id)
+
+        async def no_client():
+            return None
+
+        try:
+            with patch.object(RedisCache, "get", side_effect=fake_get), \
+                    patch.object(RedisCache, "set", side_effect=fake_set), \
+                    patch.object(RedisCache, "get_client", side_effect=no_client), \
+                    patch.object(ShufflePool, "build", classmethod(slow_build)):
+                results = await asyncio.gather(*[ShufflePool.get(db, ShufflePool.KIND_SHORTS) for _ in range(20)])
+
+                assert builds == [ShufflePool.KIND_SHORTS]
+                assert len({version for version, _ in results}) == 1
+                assert all(len(ids) == 37 for _, ids in results)
+                assert not ShufflePool._building
+
+                # 版本指针还在但池内容已过期，同样只重建一次
+                ShufflePool._local.clear()
+                version = results[0][0]
+                del store[f"pool:shorts:all:{version}"]
+                await asyncio.gather(*[ShufflePool.get(db, ShufflePool.KIND_SHORTS) for _ in range(5)])
+                assert len(builds) == 2
+        finally:
+            ShufflePool._local.clear()
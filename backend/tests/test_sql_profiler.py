@@ -0,0 +1,136 @@
+"""
+SQL 分析测试（指纹归一化、请求内 N+1 检测、端点排行、查询预算插件）
+"""
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import text
+
+
+@pytest.fixture
+def profiler():
+    from app.core.database import sql_profiler
+
+    was_enabled = sql_profiler.enabled
+    sql_profiler.enable()
+    sql_profiler.reset()
+    yield sql_profiler
+    sql_profiler.reset()
+    sql_profiler.enabled = was_enabled
+
+
+async def _make_engine(make_db):
+    engine, _ = await make_db()
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE posts (id INTEGER PRIMARY KEY, user_id INTEGER)"))
+        await conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)"))
+        for i in range(1, 7):
+            await conn.execute(text(f"INSERT INTO posts VALUES ({i}, {i})"))
+            await conn.execute(text(f"INSERT INTO users VALUES ({i}, 'u{i}')"))
+    return engine
+
+
+def _make_app(engine) -> FastAPI:
+    from app.services.monitoring_service import MonitoringMiddleware
+
+    app = FastAPI()
+
+    @app.get("/posts/{topic_id}")
+    async def list_posts_one_by_one(topic_id: int):
+        async with engine.connect() as conn:
+            posts = (await conn.execute(text("SELECT id, user_id FROM posts"))).all()
+            for post in posts:  # 每条帖子单独查作者
+                await conn.execute(text("SELECT name FROM users WHERE id = :id"), {"id": post.user_id})
+        return {"count": len(posts)}
+
+    @app.get("/posts-batched")
+    async def list_posts_batched():
+        async with engine.connect() as conn:
+            posts = (await conn.execute(text("SELECT id, user_id FROM posts"))).all()
+            ids = ",".join(str(p.user_id) for p in posts)
+            await conn.execute(text(f"SELECT id, name FROM users WHERE id IN ({ids})"))
+        return {"count": len(posts)}
+
+    app.add_middleware(MonitoringMiddleware)
+    return app
+
+
+class TestFingerprint:
+    """SQL 指纹归一化"""
+
+    def test_literals_and_in_lists(self):
+        """测试不同参数、不同长度的 IN 列表得到同一指纹"""
+        from app.core.database import fingerprint
+
+        assert fingerprint("SELECT name FROM users WHERE id = 1") == fingerprint("SELECT name FROM users WHERE id = 42")
+        assert fingerprint("SELECT * FROM t WHERE id IN (?, ?, ?)") == "SELECT * FROM t WHERE id IN (...)"
+        assert fingerprint("SELECT * FROM t WHERE id IN (1,2)") == fingerprint("SELECT * FROM t WHERE id IN (%(id_1)s)")
+        assert fingerprint("SELECT * FROM t WHERE a = 'x''y'\n  AND b = $1") == "SELECT * FROM t WHERE a = ? AND b = ?"
+        assert fingerprint("SELECT anon_1.id FROM anon_1 LIMIT :param_1") == "SELECT anon_1.id FROM anon_1 LIMIT ?"
+
+
+class TestRequestProfiling:
+    """中间件逐请求记录 SQL 并按端点汇总"""
+
+    @pytest.mark.asyncio
+    async def test_n_plus_one_reported_per_endpoint(self, make_db, profiler):
+        """测试逐条查询被标记为 N+1，批量查询不会；排行按 N+1 请求数优先"""
+        engine = await _make_engine(make_db)
+        async with AsyncClient(transport=ASGITransport(app=_make_app(engine)), base_url="http://test") as http:
+            await http.get("/posts/1")
+            await http.get("/posts/2")
+            await http.get("/posts-batched")
+
+        offenders = profiler.top_offenders()
+        assert [o["endpoint"] for o in offenders] == ["GET:/posts/{topic_id}", "GET:/posts-batched"]
+        worst, batched = offenders
+        assert (worst["requests"], worst["avg_queries"], worst["max_queries"]) == (2, 7, 7)
+        assert worst["n_plus_one_requests"] == 2
+        statement = worst["statements"][0]
+        assert statement["fingerprint"] == "SELECT name FROM users WHERE id = ?"
+        assert (statement["executions"], statement["max_per_request"], statement["n_plus_one_requests"]) == (12, 6, 2)
+        assert (batched["avg_queries"], batched["n_plus_one_requests"]) == (2, 0)
+
+    @pytest.mark.asyncio
+    async def test_disabled_records_nothing(self, make_db, profiler):
+        """测试关闭时中间件不记录"""
+        profiler.enabled = False
+        engine = await _make_engine(make_db)
+        async with AsyncClient(transport=ASGITransport(app=_make_app(engine)), base_url="http://test") as http:
+            await http.get("/posts/1")
+        assert profiler.top_offenders() == []
+
+
+class TestQueryBudgetPlugin:
+    """pytest 查询预算插件"""
+
+    @pytest.mark.asyncio
+    async def test_fixture_enforces_count_and_n_plus_one(self, make_db, query_budget):
+        """测试超出条数或出现 N+1 时失败，allow_repeats 只检查条数"""
+        engine = await _make_engine(make_db)
+        async def one_by_one():
+            async with engine.connect() as conn:
+                for i in range(1, 6):
+                    await conn.execute(text("SELECT name FROM users WHERE id = :id"), {"id": i})
+
+        with query_budget(5, allow_repeats=True) as log:
+            await one_by_one()
+        assert log.count == 5
+
+        with pytest.raises(pytest.fail.Exception, match="疑似 N\\+1"):
+            with query_budget(10):
+                await one_by_one()
+        with pytest.raises(pytest.fail.Exception, match="执行了 5 条 SQL，预算 4 条"):
+            with query_budget(4, allow_repeats=True, label="one_by_one"):
+                await one_by_one()
+
+    @pytest.mark.asyncio
+    @pytest.mark.query_budget(2)
+    async def test_marker_checks_each_request(self, make_db):
+        """测试标记后每个经过中间件的请求都按预算检查（批量接口 2 条 SQL）"""
+        from app.core.database import sql_profiler
+
+        assert sql_profiler.enabled and sql_profiler.listeners
+        engine = await _make_engine(make_db)
+        async with AsyncClient(transport=ASGITransport(app=_make_app(engine)), base_url="http://test") as http:
+            assert (await http.get("/posts-batched")).status_code == 200
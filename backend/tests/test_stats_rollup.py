@@ -0,0 +1,211 @@
+"""
+数据看板预聚合测试（小时/日汇总、活跃与留存、重算幂等、看板读取）
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event, select, func
+
+D0 = date(2024, 3, 1)
+D1 = D0 + timedelta(days=1)
+
+
+def at(day: date, hour: int, minute: int = 0) -> datetime:
+    return datetime(day.year, day.month, day.day, hour, minute)
+
+
+async def _make_db(make_db):
+    """创建独立的内存数据库，写入一天的业务数据"""
+    from app.models.user import User, UserVIP
+    from app.models.video import Video, VideoStatus, VideoView
+    from app.models.comment import Comment
+    from app.models.coins import RechargeOrder, VideoPurchase
+    from app.models.payment import PaymentOrder, PaymentStatus, OrderType
+    from app.models.creator import Creator, CreatorWithdrawal, VideoTip
+    from app.models.statistics import (
+        HourlyStats, UserDailyActivity, PlatformDailyStats, DailyRevenueReport, UserRetentionStats
+    )
+
+    engine, db = await make_db(
+        User, UserVIP, Video, VideoView, Comment, RechargeOrder, VideoPurchase, PaymentOrder, Creator,
+        CreatorWithdrawal, VideoTip, HourlyStats, UserDailyActivity, PlatformDailyStats, DailyRevenueReport,
+        UserRetentionStats
+    )
+    db.add_all([
+        User(id=1, username="u1", email="u1@example.com", hashed_password="x", created_at=at(D0, 10, 15)),
+        User(id=2, username="u2", email="u2@example.com", hashed_password="x", created_at=at(D0, 11, 30)),
+        User(id=3, username="u3", email="u3@example.com", hashed_password="x", created_at=at(D0, 23, 50)),
+        UserVIP(user_id=2, is_active=True, expire_date=datetime(2099, 1, 1)),
+        Video(id=1, title="v1", uploader_id=1, status=VideoStatus.PUBLISHED, created_at=at(D0, 10, 20)),
+        VideoView(video_id=1, user_id=1, created_at=at(D0, 10, 40)),
+        VideoView(video_id=1, user_id=None, created_at=at(D0, 10, 41)),   # 游客不算活跃
+        VideoView(video_id=1, user_id=1, created_at=at(D0, 11, 5)),
+        VideoView(video_id=1, user_id=2, created_at=at(D1, 9)),
+        Comment(video_id=1, user_id=1, content="c", created_at=at(D0, 11, 10)),
+        RechargeOrder(order_no="r1", user_id=1, coins=300, amount=Decimal("30.00"), status="paid",
+                      paid_at=at(D0, 10, 50)),
+        RechargeOrder(order_no="r2", user_id=3, coins=100, amount=Decimal("10.00"), status="pending"),
+        PaymentOrder(order_no="p1", user_id=2, order_type=OrderType.VIP_MONTHLY, amount=Decimal("50.00"),
+                     status=PaymentStatus.SUCCESS, paid_at=at(D0, 11, 40)),
+        VideoPurchase(user_id=1, video_id=1, coins_paid=20, created_at=at(D0, 10, 55)),
+        Creator(id=1, user_id=1),
+        VideoTip(video_id=1, user_id=2, creator_id=1, coins_amount=100, created_at=at(D0, 11, 45)),
+        CreatorWithdrawal(creator_id=1, coins_amount=500, cash_amount=Decimal("5.00"), status="completed",
+                          processed_at=at(D0, 12)),
+    ])
+    await db.commit()
+    return engine, db
+
+
+class QueryCounter:
+    """统计引擎上执行的 SQL 条数"""
+
+    def __init__(self, engine):
+        self.engine = engine.sync_engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+class TestStatsRollup:
+    """小时汇总、日汇总与留存"""
+
+    @pytest.mark.asyncio
+    async def test_hourly_and_daily_rollup(self, make_db):
+        """测试按整点汇总各项指标，日汇总由小时相加，去重指标来自活跃记录和订单"""
+        from app.models.statistics import HourlyStats, PlatformDailyStats, DailyRevenueReport
+        from app.services.stats_rollup import StatsRollup
+
+        engine, db = await _make_db(make_db)
+        assert await StatsRollup.backfill(db, D0, D1) == 2
+        hours = {
+            row.stat_hour.hour: row
+            for row in (await db.execute(
+                select(HourlyStats).where(HourlyStats.stat_hour < at(D1, 0))
+            )).scalars().all()
+        }
+        assert len(hours) == 24
+        h10, h11 = hours[10], hours[11]
+        assert (h10.new_users, h10.new_videos, h10.views, h10.active_users) == (1, 1, 2, 1)
+        assert (h10.recharge_amount, h10.recharge_orders, h10.purchase_coins) == (Decimal("30.00"), 1, 20)
+        assert (h11.new_users, h11.views, h11.new_comments, h11.active_users) == (1, 1, 1, 2)
+        assert (h11.payment_amount, h11.tip_coins, h11.tip_count) == (Decimal("50.00"), 100, 1)
+        assert hours[12].withdrawal_coins == 500
+        assert hours[23].active_users == 1
+        assert hours[3].views == 0
+
+        stats = await db.scalar(select(PlatformDailyStats).where(PlatformDailyStats.stat_date == D0))
+        assert (stats.new_users, stats.total_users, stats.dau, stats.total_views) == (3, 3, 3, 3)
+        assert (stats.total_comments, stats.total_consumption, stats.creator_payouts) == (1, 120, 500)
+        assert stats.platform_revenue == Decimal("80.00")
+        assert stats.active_creators == 1
+
+        report = await db.scalar(select(DailyRevenueReport).where(DailyRevenueReport.report_date == D0))
+        assert (report.recharge_users, report.paying_users, report.active_users) == (1, 2, 3)
+        assert report.total_vip_sales == Decimal("50.00")
+        assert report.arppu == Decimal("40.00")
+        assert report.pay_rate == pytest.approx(0.6667)
+
+        next_day = await db.scalar(select(PlatformDailyStats).where(PlatformDailyStats.stat_date == D1))
+        assert (next_day.total_users, next_day.new_users, next_day.dau, next_day.mau) == (3, 0, 1, 3)
+
+    @pytest.mark.asyncio
+    async def test_retention_from_activity(self, make_db):
+        """测试留存按第N天的真实活跃计算（原实现固定按 30% 估算）"""
+        from app.services.stats_rollup import StatsRollup
+
+        engine, db = await _make_db(make_db)
+        await StatsRollup.backfill(db, D0, D1)
+        cohorts = await StatsRollup.retention(db, D0, D1)
+        assert list(cohorts) == [D0]
+        day1 = cohorts[D0][1]
+        assert (day1.total_users, day1.retained_users) == (3, 1)
+        assert day1.retention_rate == pytest.approx(0.3333)
+
+    @pytest.mark.asyncio
+    async def test_rerun_is_idempotent_and_picks_up_late_rows(self, make_db):
+        """测试重复回填结果不变；增量任务重算最近两个整点，补上延迟写入的数据"""
+        from app.models.video import VideoView
+        from app.models.statistics import HourlyStats, PlatformDailyStats, UserDailyActivity, UserRetentionStats
+        from app.services.stats_rollup import StatsRollup
+
+        engine, db = await _make_db(make_db)
+        await StatsRollup.backfill(db, D0, D1)
+        await StatsRollup.backfill(db, D0, D1)
+        assert await db.scalar(select(func.count()).select_from(HourlyStats)) == 48
+        assert await db.scalar(select(func.count()).select_from(UserDailyActivity)) == 4
+        assert await db.scalar(select(func.count()).select_from(UserRetentionStats)) == 1
+        stats = await db.scalar(select(PlatformDailyStats).where(PlatformDailyStats.stat_date == D0))
+        assert (stats.total_views, stats.dau) == (3, 3)
+
+        db.add(VideoView(video_id=1, user_id=3, created_at=at(D0, 10, 30)))
+        await db.commit()
+        assert await StatsRollup.run(db, now=at(D0, 11, 20)) == [D0]
+        hour = await db.scalar(select(HourlyStats).where(HourlyStats.stat_hour == at(D0, 10)))
+        assert (hour.views, hour.active_users) == (3, 2)
+        await db.refresh(stats)
+        assert (stats.total_views, stats.dau) == (4, 3)
+        # 汇总当天时刷新快照
+        assert (stats.vip_users, stats.published_videos, stats.total_creators) == (1, 1, 1)
+
+
+    @pytest.mark.asyncio
+    async def test_run_recomputes_dirty_hours(self, make_db):
+        """测试积压刷入的旧观看记录登记后，增量任务重算对应整点和日期"""
+        from unittest.mock import AsyncMock, patch
+        from app.core.redis import RedisCache
+        from app.models.video import VideoView
+        from app.models.statistics import HourlyStats, PlatformDailyStats
+        from app.services.stats_rollup import StatsRollup
+
+        engine, db = await _make_db(make_db)
+        with patch.object(RedisCache, "get_client", new_callable=AsyncMock) as mock_client:
+            mock_client.return_value = None
+            StatsRollup._local_dirty.clear()
+            await StatsRollup.backfill(db, D0, D1)
+
+            late = VideoView(video_id=1, user_id=3, created_at=at(D0, 10, 30))
+            db.add(late)
+            await db.commit()
+            assert await StatsRollup.run(db, now=at(D1, 9, 30)) == [D1]  # 超出最近两个整点，没有重算
+
+            await StatsRollup.mark_dirty([late.created_at, at(D0, 11, 59)])
+            assert await StatsRollup.run(db, now=at(D1, 9, 30)) == [D0, D1]
+            hour = await db.scalar(select(HourlyStats).where(HourlyStats.stat_hour == at(D0, 10)))
+            assert (hour.views, hour.active_users) == (3, 2)
+            stats = await db.scalar(select(PlatformDailyStats).where(PlatformDailyStats.stat_date == D0))
+            await db.refresh(stats)
+            assert (stats.total_views, stats.dau) == (4, 3)
+            assert StatsRollup._local_dirty == set()
+
+
+class TestDashboardReadsRollup:
+    """看板接口只读汇总表"""
+
+    @pytest.mark.asyncio
+    async def test_dashboard_query_count(self, make_db):
+        """测试仪表盘两条查询读出累计值，不再扫描业务表"""
+        from app.models.user import User
+        from app.api.admin import get_dashboard_stats
+        from app.services.stats_rollup import StatsRollup
+
+        engine, db = await _make_db(make_db)
+        await StatsRollup.backfill(db, D0, D1)
+        await StatsRollup.run(db, now=at(D1, 9, 30))
+        admin = await db.get(User, 1)
+
+        with QueryCounter(engine) as counter:
+            stats = await get_dashboard_stats(current_user=admin, db=db)
+        assert counter.count == 2
+        assert (stats.total_users, stats.total_vip_users, stats.total_videos) == (3, 1, 1)
+        assert stats.total_revenue == 50.0
+        assert stats.new_users_today == 0  # 数据在 2024 年，"今天"没有汇总行
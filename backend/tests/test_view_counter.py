@@ -0,0 +1,95 @@
+"""
+观看计数缓冲测试
+"""
+import pytest
+from unittest.mock import AsyncMock, patch
+from sqlalchemy import select, func
+
+
+async def _make_db(make_db):
+    """创建独立的内存数据库，并插入一个用户和两个视频"""
+    from app.models.user import User
+    from app.models.video import Video, VideoView
+
+    engine, db = await make_db(User, Video, VideoView)
+    user = User(username="viewer", email="viewer@example.com", hashed_password="x")
+    db.add(user)
+    await db.flush()
+    db.add_all([
+        Video(id=1, title="v1", uploader_id=user.id, view_count=10),
+        Video(id=2, title="v2", uploader_id=user.id, view_count=0),
+    ])
+    await db.commit()
+    return engine, db
+
+
+class TestViewCounter:
+    """观看计数缓冲测试（内存缓冲模式）"""
+
+    @pytest.mark.asyncio
+    async def test_record_and_flush_memory_mode(self, make_db):
+        """测试Redis不可用时的内存缓冲与批量刷入"""
+        from app.core.redis import RedisCache
+        from app.models.video import Video, VideoView
+        from app.services.view_counter import ViewCounter
+
+        ViewCounter._drain_local()
+        engine, db = await _make_db(make_db)
+        with patch.object(RedisCache, "get_client", new_callable=AsyncMock) as mock_client:
+            mock_client.return_value = None
+
+            for _ in range(5):
+                await ViewCounter.record(1, None)
+            await ViewCounter.record(2, 1)
+            # 已删除/不存在的视频不应导致刷入失败
+            await ViewCounter.record(999, None)
+
+            assert await ViewCounter.get_pending(1) == 5
+
+            result = await ViewCounter.flush(db)
+            assert result["views"] == 7
+            assert result["events"] == 6
+            assert await ViewCounter.get_pending(1) == 0
+
+        counts = dict((await db.execute(select(Video.id, Video.view_count))).all())
+        assert counts == {1: 15, 2: 1}
+
+        total = (await db.execute(select(func.count(VideoView.id)))).scalar()
+        assert total == 6
+
+    @pytest.mark.asyncio
+    async def test_flush_empty(self):
+        """测试没有缓冲数据时不访问数据库"""
+        from app.core.redis import RedisCache
+        from app.services.view_counter import ViewCounter
+
+        ViewCounter._drain_local()
+        mock_db = AsyncMock()
+        with patch.object(RedisCache, "get_client", new_callable=AsyncMock) as mock_client:
+            mock_client.return_value = None
+            result = await ViewCounter.flush(mock_db)
+
+        assert result == {"videos": 0, "views": 0, "events": 0}
+        mock_db.execute.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_flush_failure_restores_buffer(self):
+        """测试刷入失败时计数被放回缓冲"""
+        from app.core.redis import RedisCache
+        from app.services.view_counter import ViewCounter
+
+        ViewCounter._drain_local()
+        mock_db = AsyncMock()
+        mock_db.execute.side_effect = RuntimeError("db down")
+
+        with patch.object(RedisCache, "get_client", new_callable=AsyncMock) as mock_client:
+            mock_client.return_value = None
+            await ViewCounter.record(1, None)
+            await ViewCounter.record(1, None)
+
+            with pytest.raises(RuntimeError):
+                await ViewCounter.flush(mock_db)
+
+            assert await ViewCounter.get_pending(1) == 2
+
+        ViewCounter._drain_local()
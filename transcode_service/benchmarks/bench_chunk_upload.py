@@ -0,0 +1,98 @@
+"""分块上传基准：原“分块落地 + 整块读入拼接” vs 直接写入预分配文件的对应偏移
+
+用法（在 transcode_service 目录下运行）:
+    python benchmarks/bench_chunk_upload.py [--size-mb 1024] [--chunk-mb 5]
+
+在临时目录模拟乱序到达的分块（来自内存中的随机数据），统计两种方式的
+墙钟时间、写盘字节数和 Python 峰值内存（tracemalloc），并校验拼出的文件与源数据一致。
+"""
+import argparse
+import hashlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Tuple
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunk_upload import ChunkUploadStore
+
+
+class ChunkStream(io.BytesIO):
+    """模拟 request.files['chunk'].stream"""
+
+
+def legacy(tmp: str, chunks, total: int, chunk_size: int) -> Tuple[str, int]:
+    """原 upload_chunk：每块存成文件，最后一块到达时逐块 read() 后写入目标文件"""
+    temp_dir = os.path.join(tmp, "legacy_chunks")
+    os.makedirs(temp_dir)
+    written = 0
+    for index, data in chunks:
+        with open(os.path.join(temp_dir, f"chunk_{index}"), "wb") as f:
+            f.write(data)
+        written += len(data)
+    video_path = os.path.join(tmp, "legacy.mp4")
+    with open(video_path, "wb") as outfile:
+        for i in range(total):
+            with open(os.path.join(temp_dir, f"chunk_{i}"), "rb") as infile:
+                block = infile.read()
+                outfile.write(block)
+                written += len(block)
+    shutil.rmtree(temp_dir)
+    return video_path, written
+
+
+def offset_writes(tmp: str, chunks, size: int, chunk_size: int) -> Tuple[str, int]:
+    """ChunkUploadStore：分块流式写到预分配文件的偏移处"""
+    store = ChunkUploadStore(os.path.join(tmp, "sessions.db"), os.path.join(tmp, "processing"))
+    session = store.create("bench", "offset.mp4", size, chunk_size)
+    written = 0
+    for index, data in chunks:
+        store.write_chunk(session, index, ChunkStream(data))
+        written += len(data)
+    return session.path, written
+
+
+def run(name, func, tmp, chunks, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    path, written = func(tmp, chunks, *args)
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    os.remove(path)
+    return name, wall, written, peak, digest
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--chunk-mb", type=int, default=5)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024 + 12345
+    chunk_size = args.chunk_mb * 1024 * 1024
+    total = (size + chunk_size - 1) // chunk_size
+    source = os.urandom(size)
+    expected = hashlib.sha256(source).hexdigest()
+
+    order = list(range(total))
+    random.Random(7).shuffle(order)
+    chunks = [(i, source[i * chunk_size:(i + 1) * chunk_size]) for i in order]
+
+    print(f"file: {size / 1e6:.0f}MB, {total} chunks of {args.chunk_mb}MB (out of order)")
+    print(f"{'mode':>8} | {'wall':>7} | {'disk write':>10} | {'py peak':>8} | ok")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, func, extra in (("legacy", legacy, total), ("offset", offset_writes, size)):
+            name, wall, written, peak, digest = run(name, func, tmp, chunks, extra, chunk_size)
+            print(f"{name:>8} | {wall:>6.2f}s | {written / 1e6:>8.0f}MB | {peak / 1e6:>6.1f}MB | {digest == expected}")
+
+
+if __name__ == "__main__":
+    main()
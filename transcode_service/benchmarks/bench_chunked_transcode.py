@@ -0,0 +1,84 @@
+"""分段并行转码基准：整段单进程 vs 分段并行（墙钟时间）
+
+用法（在 transcode_service 目录下运行，需要 ffmpeg/ffprobe）:
+    python benchmarks/bench_chunked_transcode.py [--duration 900] [--height 1080] [--chunk-seconds 60] [--workers N]
+
+用 ffmpeg testsrc + sine 在临时目录生成测试片源，分别用两种方式生成 HLS，
+输出耗时、加速比以及两种方式的总时长是否一致。
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CHUNKED
+from transcoder import Transcoder
+
+
+def make_clip(path: str, duration: int, height: int):
+    width = height * 16 // 9
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc=duration={duration}:size={width}x{height}:rate=30",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "60",
+        "-c:a", "aac", "-shortest", path
+    ], check=True)
+
+
+def playlist_duration(hls_dir: str) -> float:
+    """所有档位中最高档的总时长"""
+    variants = sorted(
+        (d for d in os.listdir(hls_dir) if os.path.isdir(os.path.join(hls_dir, d))),
+        key=lambda d: int(d.rstrip("p")), reverse=True
+    )
+    total = 0.0
+    with open(os.path.join(hls_dir, variants[0], "playlist.m3u8"), encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#EXTINF:"):
+                total += float(line[8:].split(",")[0])
+    return total
+
+
+def run(source: str, output_dir: str, chunked: bool) -> float:
+    CHUNKED["enabled"] = chunked
+    transcoder = Transcoder()
+    duration, height = transcoder.get_video_info(source)
+    start = time.perf_counter()
+    transcoder.generate_hls(source, output_dir, duration, height)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=int, default=900)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--chunk-seconds", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=max(2, multiprocessing.cpu_count() // 2))
+    args = parser.parse_args()
+
+    CHUNKED.update({"min_duration": 0, "chunk_seconds": args.chunk_seconds, "workers": args.workers})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "testsrc.mp4")
+        make_clip(source, args.duration, args.height)
+
+        sequential_dir = os.path.join(tmp, "sequential")
+        chunked_dir = os.path.join(tmp, "chunked")
+        sequential = run(source, sequential_dir, chunked=False)
+        parallel = run(source, chunked_dir, chunked=True)
+
+        print(f"clip: {args.duration}s {args.height}p, cores: {multiprocessing.cpu_count()}, "
+              f"workers: {args.workers}, chunk: {args.chunk_seconds}s")
+        print(f"{'mode':>10} | {'wall':>8} | {'hls duration':>12}")
+        print(f"{'single':>10} | {sequential:>7.1f}s | {playlist_duration(os.path.join(sequential_dir, 'hls')):>11.2f}s")
+        print(f"{'chunked':>10} | {parallel:>7.1f}s | {playlist_duration(os.path.join(chunked_dir, 'hls')):>11.2f}s")
+        print(f"speedup: {sequential / parallel:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""单次解码流水线基准：分步生成（HLS + 10 次封面 + 10 段预览 + 拼接） vs 单个 FFmpeg 进程
+
+用法（在 transcode_service 目录下运行，需要 ffmpeg/ffprobe，仅支持 Linux/macOS）:
+    python benchmarks/bench_fused_pipeline.py [--duration 300] [--height 1080] [--runs 1]
+
+用 ffmpeg testsrc + sine 在临时目录生成测试片源，统计每种方式所有子进程的
+CPU 时间（user + sys，resource.RUSAGE_CHILDREN）、墙钟时间和启动的 FFmpeg 进程数。
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import FFMPEG, CHUNKED
+from transcoder import Transcoder, media_probe
+
+
+def make_clip(path: str, duration: int, height: int):
+    width = height * 16 // 9
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc=duration={duration}:size={width}x{height}:rate=30",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "60",
+        "-c:a", "aac", "-shortest", path
+    ], check=True)
+
+
+class ProcessCounter:
+    """统计启动的 ffmpeg 进程数"""
+
+    def __init__(self):
+        self.count = 0
+        self._popen_init = subprocess.Popen.__init__
+
+    def __enter__(self):
+        counter = self
+
+        def init(popen, args, *rest, **kwargs):
+            if args and os.path.basename(str(args[0])).startswith("ffmpeg"):
+                counter.count += 1
+            counter._popen_init(popen, args, *rest, **kwargs)
+
+        subprocess.Popen.__init__ = init
+        return self
+
+    def __exit__(self, *exc):
+        subprocess.Popen.__init__ = self._popen_init
+
+
+def run(source: str, output_dir: str, fused: bool):
+    FFMPEG["fused_pipeline"] = fused
+    transcoder = Transcoder()
+    duration, height = transcoder.get_video_info(source)
+
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    with ProcessCounter() as counter:
+        _, covers_dir, _, preview = transcoder.process(source, output_dir, duration, height, "bench")
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    covers = len([f for f in os.listdir(covers_dir) if f.endswith(".webp")])
+    return cpu, wall, counter.count, covers, preview is not None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=int, default=300)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--runs", type=int, default=1)
+    args = parser.parse_args()
+
+    CHUNKED["enabled"] = False
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "testsrc.mp4")
+        make_clip(source, args.duration, args.height)
+        media_probe.cache_path = os.path.join(tmp, "probe_cache.db")
+
+        print(f"clip: {args.duration}s {args.height}p")
+        print(f"{'mode':>10} | {'cpu-sec':>8} | {'wall':>7} | {'ffmpeg procs':>12} | {'covers':>6} | preview")
+        for fused in (False, True):
+            for i in range(args.runs):
+                output_dir = os.path.join(tmp, f"{'fused' if fused else 'separate'}_{i}")
+                cpu, wall, procs, covers, preview = run(source, output_dir, fused)
+                print(f"{'fused' if fused else 'separate':>10} | {cpu:>7.1f}s | {wall:>6.1f}s | "
+                      f"{procs:>12} | {covers:>6} | {'yes' if preview else 'no'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""封面候选基准：固定位置逐张 seek vs 关键帧场景扫描
+
+用法（在 transcode_service 目录下运行，需要 ffmpeg/ffprobe，仅支持 Linux/macOS）:
+    python benchmarks/bench_scene_covers.py [--shots 12] [--shot-seconds 20] [--height 1080]
+
+用多种 lavfi 源拼接成带硬切换和黑场的测试片源，分别用两种方式生成封面，
+统计子进程 CPU 时间、墙钟时间、frame_scoring 平均得分以及黑屏/重复封面数量。
+"""
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import FFMPEG
+from frame_scoring import score_frames
+from transcoder import Transcoder, media_probe
+
+SOURCES = ["testsrc2", "mandelbrot", "smptehdbars", "color=c=black", "rgbtestsrc", "cellauto", "life"]
+
+
+def make_clip(path: str, shots: int, shot_seconds: int, height: int):
+    width = height * 16 // 9
+    cmd = ["ffmpeg", "-y", "-v", "error"]
+    for i in range(shots):
+        source = SOURCES[i % len(SOURCES)]
+        sep = ":" if "=" in source else "="
+        cmd += ["-f", "lavfi", "-i", f"{source}{sep}size={width}x{height}:rate=30"]
+    parts = "".join(f"[{i}:v]trim=duration={shot_seconds},setpts=PTS-STARTPTS,format=yuv420p[v{i}];" for i in range(shots))
+    concat = "".join(f"[v{i}]" for i in range(shots))
+    cmd += [
+        "-filter_complex", f"{parts}{concat}concat=n={shots}:v=1:a=0[out]",
+        "-map", "[out]", "-c:v", "libx264", "-preset", "ultrafast", "-g", "60", path
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def run(source: str, output_dir: str, scene: bool):
+    FFMPEG["scene_covers"] = scene
+    transcoder = Transcoder()
+    duration, _ = transcoder.get_video_info(source)
+
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    covers_dir, best = transcoder.generate_covers(source, output_dir, duration)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    paths = [os.path.join(covers_dir, f"cover_{i}.webp") for i in range(1, FFMPEG["cover_count"] + 1)]
+    frames = score_frames([p for p in paths if os.path.exists(p)])
+    mean = sum(f.score for f in frames) / len(frames) if frames else 0
+    blank = sum(f.is_blank for f in frames)
+    duplicates = sum(f.duplicate_of is not None for f in frames)
+    return cpu, wall, mean, blank, duplicates, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shots", type=int, default=12)
+    parser.add_argument("--shot-seconds", type=int, default=20)
+    parser.add_argument("--height", type=int, default=1080)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "shots.mp4")
+        make_clip(source, args.shots, args.shot_seconds, args.height)
+        media_probe.cache_path = os.path.join(tmp, "probe_cache.db")
+
+        print(f"clip: {args.shots} shots x {args.shot_seconds}s {args.height}p")
+        print(f"{'mode':>8} | {'cpu-sec':>8} | {'wall':>7} | {'mean score':>10} | {'blank':>5} | {'dup':>3} | best")
+        for scene in (False, True):
+            output_dir = os.path.join(tmp, "scene" if scene else "seek")
+            cpu, wall, mean, blank, duplicates, best = run(source, output_dir, scene)
+            print(f"{'scene' if scene else 'seek':>8} | {cpu:>7.2f}s | {wall:>6.2f}s | "
+                  f"{mean:>10.1f} | {blank:>5} | {duplicates:>3} | {best}")
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""调度基准：固定 3 个 -threads 0 的并行任务 vs 资源调度（线程预算 + 短视频快速通道）
+
+用法（在 transcode_service 目录下运行）:
+    python benchmarks/bench_scheduler.py [--cores 16] [--long 12] [--short 60] [--seed 1]
+
+用模拟时钟驱动真实的 TaskQueue（临时 SQLite）和 Scheduler：长短视频按随机间隔陆续入队，
+中途有一段外部进程占用 6 个核心。任务进度按下面的模型推进（模型假设，不是实测）：
+- 每线程实际吞吐是开销模型的 0.7 倍（模型有偏差，ETA 需要靠历史吞吐校正）
+- x264 多线程效率 1 / (1 + 0.04 * (线程数 - 1))
+- 总线程需求超过核心数时按比例分摊核心，并有 10% 的上下文切换损失
+输出两种方式的总耗时、短/长视频周转时间、超订程度，以及中途快照时 ETA 的平均误差。
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from statistics import mean
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import SCHEDULER
+from scheduler import Scheduler
+from task_queue import TaskQueue, TaskStatus, TaskType
+from transcoder import Transcoder
+
+TRUE_RATE = 0.7
+EXTERNAL = (3000, 6000, 6)  # 外部负载：开始、结束（秒）、占用核心数
+
+
+def efficiency(threads: int) -> float:
+    return 1 / (1 + 0.04 * (threads - 1))
+
+
+def make_workload(long_count: int, short_count: int, seed: int):
+    rng = random.Random(seed)
+    arrivals = []
+    t = 0.0
+    for _ in range(long_count):
+        t += rng.uniform(0, 900)
+        arrivals.append((t, TaskType.LONG, rng.choice([1200, 2400, 3600, 5400]), rng.choice([1080, 720])))
+    t = 0.0
+    for _ in range(short_count):
+        t += rng.uniform(0, 300)
+        arrivals.append((t, TaskType.SHORT, rng.uniform(20, 180), rng.choice([1080, 720])))
+    arrivals.sort(key=lambda a: a[0])
+    return arrivals
+
+
+def external_load(t: float) -> int:
+    start, end, cores = EXTERNAL
+    return cores if start <= t < end else 0
+
+
+class LegacyScheduler:
+    """原 run_parallel：最多 max_workers 个任务按队列顺序运行，每个 FFmpeg 都用全部核心"""
+
+    def __init__(self, queue: TaskQueue, cores: int, max_workers: int):
+        self.queue, self.cores, self.max_workers = queue, cores, max_workers
+        self.jobs = {}
+
+    def admit(self):
+        if len(self.jobs) >= self.max_workers:
+            return None
+        worker_id = next(i for i in range(1, self.max_workers + 2) if i not in self.jobs)
+        task = self.queue.get_pending_task(worker_id)
+        if task is None:
+            return None
+        job = type("Job", (), {"task": task, "worker_id": worker_id, "threads": self.cores,
+                               "lane": task["task_type"]})()
+        self.jobs[worker_id] = job
+        return job
+
+    def release(self, job):
+        self.jobs.pop(job.worker_id, None)
+
+
+def legacy_eta(queue: TaskQueue):
+    """原 get_queue_with_eta：估算时间逐个累加"""
+    tasks = []
+    cumulative = 0.0
+    for task in queue.get_queue_with_eta():
+        if task["status"] == "processing":
+            task["eta_seconds"] = task["estimated_time"] * (1 - task["progress"] / 100)
+        else:
+            cumulative += task["estimated_time"]
+            task["eta_seconds"] = cumulative
+        tasks.append(task)
+    return tasks
+
+
+def simulate(db_path: str, arrivals, cores: int, scheduled: bool):
+    queue = TaskQueue(db_path, progress_interval=0)
+    now = [0.0]
+    if scheduled:
+        scheduler = Scheduler(queue, cores=cores,
+                              fast_lane_threads=SCHEDULER["fast_lane_threads"],
+                              max_jobs=SCHEDULER["max_jobs"],
+                              load_probe=lambda: scheduler.used_threads() + external_load(now[0]),
+                              disk_probe=lambda: 500.0)
+    else:
+        scheduler = LegacyScheduler(queue, cores, min(3, max(1, cores // 2)))
+
+    pending = list(arrivals)
+    arrived, finished, running = {}, {}, {}   # task_id -> 到达时间 / 完成时间 / [job, 剩余开销, 开始时间]
+    snapshot, oversub = None, []
+    while pending or running or queue.get_pending_tasks(1):
+        t = now[0]
+        while pending and pending[0][0] <= t:
+            _, task_type, duration, height = pending.pop(0)
+            transcoder = Transcoder(is_short=task_type == TaskType.SHORT)
+            task_id = queue.add_task(f"{len(arrived)}.mp4", f"/sim/{len(arrived)}.mp4", task_type)
+            queue.update_estimate(task_id, duration, height,
+                                  cpu_cost=transcoder.estimate_cpu_cost(duration, height),
+                                  estimated_time=transcoder.estimate_transcode_time(duration, height))
+            arrived[task_id] = t
+        while True:
+            job = scheduler.admit()
+            if job is None:
+                break
+            running[job.task["id"]] = [job, job.task["cpu_cost"], t]
+            queue.update_status(job.task["id"], TaskStatus.PROCESSING, threads=job.threads)  # 与 worker 一致
+
+        # 中途快照：一半任务已入队时记录预测完成时间
+        if snapshot is None and len(arrived) >= len(arrivals) // 2 and len(finished) >= 5:
+            tasks = queue.get_queue_with_eta() if scheduled else legacy_eta(queue)
+            snapshot = {task["id"]: t + task["eta_seconds"] for task in tasks}
+
+        demand = sum(job.threads for job, _, _ in running.values()) + external_load(t)
+        share = min(1.0, cores / demand) if demand else 1.0
+        penalty = 0.9 if demand > cores else 1.0
+        oversub.append(demand / cores)
+        speeds = {
+            task_id: TRUE_RATE * job.threads * share * efficiency(job.threads) * penalty
+            for task_id, (job, _, _) in running.items()
+        }
+        steps = [remaining / speeds[task_id] for task_id, (_, remaining, _) in running.items()]
+        if pending:
+            steps.append(pending[0][0] - t)
+        for boundary in EXTERNAL[:2]:
+            if boundary > t:
+                steps.append(boundary - t)
+        dt = max(min(steps), 1e-6) if steps else 1.0
+        now[0] = t + dt
+
+        for task_id in list(running):
+            job, remaining, started = running[task_id]
+            remaining -= speeds[task_id] * dt
+            running[task_id][1] = remaining
+            progress = 100 * (1 - remaining / job.task["cpu_cost"])
+            queue.update_progress(task_id, min(100.0, progress))
+            if remaining <= 1e-6:
+                queue.update_status(task_id, TaskStatus.COMPLETED,
+                                    transcode_seconds=now[0] - started, threads=job.threads)
+                scheduler.release(job)
+                finished[task_id] = now[0]
+                del running[task_id]
+
+    types = {task_id: queue.get_task(task_id)["task_type"] for task_id in arrived}
+    turnaround = {
+        lane: [finished[i] - arrived[i] for i in arrived if types[i] == lane]
+        for lane in (TaskType.SHORT.value, TaskType.LONG.value)
+    }
+    errors = [abs(snapshot[i] - finished[i]) / max(1.0, finished[i]) for i in snapshot if i in finished]
+    return max(finished.values()), turnaround, max(oversub), mean(errors) if errors else float("nan")
+
+
+def p95(values):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cores", type=int, default=16)
+    parser.add_argument("--long", type=int, default=12)
+    parser.add_argument("--short", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # 按模拟的核心数重算依赖 CPU 数的配置（与 config.py 的公式一致）
+    SCHEDULER.update(cores=args.cores, max_jobs=max(2, args.cores // 2),
+                     fast_lane_threads=max(2, args.cores // 4))
+    arrivals = make_workload(args.long, args.short, args.seed)
+    print(f"{args.cores} cores, {args.long} long + {args.short} short videos, "
+          f"external load {EXTERNAL[2]} cores during {EXTERNAL[0]}-{EXTERNAL[1]}s")
+    print(f"{'mode':>9} | {'makespan':>8} | {'short mean':>10} | {'short p95':>9} | "
+          f"{'long mean':>9} | {'max oversub':>11} | {'ETA err':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for scheduled in (False, True):
+            name = "scheduled" if scheduled else "legacy"
+            makespan, turnaround, oversub, eta_error = simulate(
+                os.path.join(tmp, f"{name}.db"), arrivals, args.cores, scheduled
+            )
+            short, long = turnaround["short"], turnaround["long"]
+            print(f"{name:>9} | {makespan / 60:>6.0f}m | {mean(short) / 60:>8.1f}m | {p95(short) / 60:>7.1f}m | "
+                  f"{mean(long) / 60:>7.1f}m | {oversub:>10.1f}x | {eta_error * 100:>6.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""HLS 上传基准：原单通道逐文件上传 vs 多通道并行 / 断点续传 / 边转码边上传
+
+用法（在 transcode_service 目录下运行，只需要 paramiko）:
+    python benchmarks/bench_uploader.py [--variants 3] [--segments 60] [--segment-kb 512] [--rtt-ms 20]
+
+在本进程内启动一个 paramiko SFTP 服务端作为主服务器的替身（tests/sftp_standin.py，文件写到临时目录），
+每个 SFTP 请求（打开/关闭/stat/mkdir/改名）和 exec 命令都额外等待 --rtt-ms 模拟网络往返。
+依次测量：
+- legacy：原实现（每次操作前 exec "echo ok"、每个文件 _mkdir_p、单通道逐个 put）
+- channels=N：Uploader.upload_directory 并行上传
+- resume：上传到一半时服务端断开，重新上传只补传剩余文件，最后校验远端与本地一致
+- stream：模拟 FFmpeg 逐个写分片，对比“转码完成后再上传”和 stream_hls 的收尾等待时间
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paramiko
+
+from uploader import StreamingUpload
+from tests.sftp_standin import StandInState, StandInUploader, serve
+
+
+# ========== 原实现（用于对比） ==========
+
+class LegacyUploader(StandInUploader):
+    """原 upload_directory：每次 _connect 都 exec echo ok，每个文件 _mkdir_p，单通道逐个 put"""
+
+    def _connect(self):
+        if self._client is not None:
+            try:
+                _, stdout, _ = self._client.exec_command('echo ok', timeout=5)
+                stdout.read()
+                return True
+            except:
+                self._close()
+        self._client = self._open_client()
+        self._sftp = self._client.open_sftp()
+        return True
+
+    def _mkdir_p(self, remote_path: str):
+        if not self._connect():
+            return
+        dirs = []
+        while remote_path and remote_path != '/':
+            try:
+                self._sftp.stat(remote_path)
+                break
+            except:
+                dirs.append(remote_path)
+                remote_path = os.path.dirname(remote_path)
+        for d in reversed(dirs):
+            try:
+                self._sftp.mkdir(d)
+            except:
+                pass
+
+    def upload_directory(self, local_dir: str, remote_dir: str) -> int:
+        self._connect()
+        self._mkdir_p(remote_dir)
+        count = 0
+        for local_path, remote_path in self._walk(local_dir, remote_dir):
+            self._mkdir_p(os.path.dirname(remote_path))
+            self._sftp.put(local_path, remote_path)
+            count += 1
+        return count
+
+
+# ========== 测试数据 ==========
+
+def write_segment(path: str, size: int):
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+
+
+def make_hls(directory: str, variants: int, segments: int, size: int):
+    for v in range(variants):
+        variant_dir = os.path.join(directory, f"{720 - v * 120}p")
+        os.makedirs(variant_dir)
+        lines = ["#EXTM3U"]
+        for i in range(segments):
+            write_segment(os.path.join(variant_dir, f"seg_{i:03d}.ts"), size)
+            lines += ["#EXTINF:10.0,", f"seg_{i:03d}.ts"]
+        with open(os.path.join(variant_dir, "playlist.m3u8"), "w") as f:
+            f.write("\n".join(lines + ["#EXT-X-ENDLIST"]) + "\n")
+    with open(os.path.join(directory, "master.m3u8"), "w") as f:
+        f.write("#EXTM3U\n")
+
+
+def tree_digest(directory: str) -> dict:
+    digest = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                digest[os.path.relpath(path, directory)] = hashlib.sha1(f.read()).hexdigest()
+    return digest
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variants", type=int, default=3)
+    parser.add_argument("--segments", type=int, default=60)
+    parser.add_argument("--segment-kb", type=int, default=512)
+    parser.add_argument("--rtt-ms", type=float, default=20)
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--segment-interval", type=float, default=0.15, help="模拟编码出一个分片的间隔（秒）")
+    args = parser.parse_args()
+
+    host_key = paramiko.RSAKey.generate(2048)
+    size = args.segment_kb * 1024
+
+    with tempfile.TemporaryDirectory() as tmp:
+        local = os.path.join(tmp, "hls")
+        remote_root = os.path.join(tmp, "remote")
+        os.makedirs(local)
+        os.makedirs(os.path.join(remote_root, "uploads"))
+        make_hls(local, args.variants, args.segments, size)
+        total = sum(1 for _ in os.walk(local) for _ in _[2])
+        local_digest = tree_digest(local)
+
+        state = StandInState(remote_root, args.rtt_ms / 1000)
+        port = serve(state, host_key)
+        remote = lambda video_id: os.path.join(remote_root, "uploads", "hls", video_id)
+
+        print(f"files: {total} ({args.variants} variants x {args.segments} x {args.segment_kb}KB), rtt {args.rtt_ms}ms")
+        print(f"{'mode':>12} | {'wall':>7} | {'MB/s':>6} | {'uploaded':>8} | remote ok")
+
+        def report(mode, uploader, video_id):
+            start = time.perf_counter()
+            count = uploader.upload_hls(local, video_id) and len(tree_digest(remote(video_id)))
+            wall = time.perf_counter() - start
+            ok = tree_digest(remote(video_id)) == local_digest
+            print(f"{mode:>12} | {wall:>6.2f}s | {total * size / wall / 1e6:>6.1f} | {count:>8} | {ok}")
+            uploader.close()
+
+        report("legacy", LegacyUploader(port, channels=1, manifest_path=None), "legacy")
+        for channels in args.channels:
+            uploader = StandInUploader(port, channels=channels, manifest_path=os.path.join(tmp, f"m{channels}.db"))
+            report(f"channels={channels}", uploader, f"c{channels}")
+
+        # 断点续传：写入一半后服务端拒绝写入，再次上传只补传剩余部分
+        manifest = os.path.join(tmp, "resume.db")
+        state.writes, state.fail_after = 0, total // 2
+        StandInUploader(port, manifest_path=manifest).upload_hls(local, "resume")
+        first = state.writes
+        state.writes, state.fail_after = 0, None
+        start = time.perf_counter()
+        StandInUploader(port, manifest_path=manifest).upload_hls(local, "resume")
+        ok = tree_digest(remote("resume")) == local_digest
+        print(f"{'resume':>12} | {time.perf_counter() - start:>6.2f}s | {'':>6} | {state.writes:>8} | {ok}"
+              f"  (interrupted after {first}, re-sent {state.writes} of {total})")
+
+        # 边转码边上传：每 --segment-interval 写一个分片并更新播放列表
+        interval = args.segment_interval
+        for streaming in (False, True):
+            encode_dir = os.path.join(tmp, f"encode_{streaming}")
+            uploader = StandInUploader(port, manifest_path=os.path.join(tmp, f"stream_{streaming}.db"))
+            video_id = f"stream_{streaming}"
+
+            def encode():
+                for v in range(args.variants):
+                    os.makedirs(os.path.join(encode_dir, f"{v}p"), exist_ok=True)
+                lines = {v: ["#EXTM3U"] for v in range(args.variants)}
+                for i in range(args.segments):
+                    time.sleep(interval)
+                    for v in range(args.variants):
+                        shutil.copy(os.path.join(local, f"{720 - v * 120}p", f"seg_{i:03d}.ts"),
+                                    os.path.join(encode_dir, f"{v}p", f"seg_{i:03d}.ts"))
+                        lines[v] += ["#EXTINF:10.0,", f"seg_{i:03d}.ts"]
+                        with open(os.path.join(encode_dir, f"{v}p", "playlist.m3u8"), "w") as f:
+                            f.write("\n".join(lines[v]) + "\n")
+
+            start = time.perf_counter()
+            if streaming:
+                with StreamingUpload(uploader, encode_dir, f"{uploader.upload_base}/hls/{video_id}", interval=0.2):
+                    encode()
+            else:
+                encode()
+            encoded = time.perf_counter()
+            uploader.upload_hls(encode_dir, video_id)
+            done = time.perf_counter()
+            mode = "stream" if streaming else "after-encode"
+            print(f"{mode:>12} | {done - start:>6.2f}s | {'':>6} | {'':>8} | "
+                  f"encode {encoded - start:.2f}s + tail {done - encoded:.2f}s")
+            uploader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+分块断点续传
+
+- 初始化时在处理目录预分配（稀疏）目标文件，每个分块直接写到自己的偏移位置，
+  不再先存分块文件、最后整块读入内存拼接
+- 已收到的分块以位图持久化在 SQLite 中，同时记录每块的 SHA256；
+  重传内容相同的分块直接跳过，客户端传了校验值时不一致的分块会被拒绝
+- 客户端可查询已收到哪些分块后续传；全部收到后 .part 改名即为源文件，直接开始转码
+- 旧客户端只带 total_chunks：分块大小取第一个收到的分块长度，文件大小在最后一块到达后确定（create_legacy）
+"""
+import os
+import time
+import base64
+import sqlite3
+import hashlib
+import threading
+import subprocess
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, List, Tuple, BinaryIO
+
+# 写入分块时每次读取的大小
+COPY_BLOCK = 1024 * 1024
+
+
+class ChunkError(ValueError):
+    """分块参数或内容不合法"""
+
+
+@dataclass
+class UploadSession:
+    """一个分块上传会话"""
+    file_id: str
+    filename: str
+    size: int
+    chunk_size: int
+    total_chunks: int
+    video_type: str
+    task_id: str
+    path: str              # 上传完成后的源文件路径（处理目录/task_id/filename）
+    bitmap: bytearray      # 已收到分块位图，第 i 块对应 bitmap[i // 8] 的第 i % 8 位
+    completed: bool = False
+    size_exact: bool = True  # False：旧协议会话，size 是按满块估的上限，最后一块到达后才准确
+
+    @property
+    def part_path(self) -> str:
+        return self.path + ".part"
+
+    def has_chunk(self, index: int) -> bool:
+        return bool(self.bitmap[index // 8] & (1 << (index % 8)))
+
+    @property
+    def received_count(self) -> int:
+        return sum(bin(b).count("1") for b in self.bitmap)
+
+    def missing(self) -> List[int]:
+        return [i for i in range(self.total_chunks) if not self.has_chunk(i)]
+
+    @property
+    def progress(self) -> float:
+        return self.received_count / self.total_chunks * 100 if self.total_chunks else 100.0
+
+    def chunk_range(self, index: int) -> Tuple[int, int]:
+        """第 index 块的 (偏移, 长度)"""
+        offset = index * self.chunk_size
+        return offset, min(self.chunk_size, self.size - offset)
+
+    def to_dict(self) -> dict:
+        return {
+            "file_id": self.file_id,
+            "filename": self.filename,
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "total_chunks": self.total_chunks,
+            "received": self.received_count,
+            "bitmap": base64.b64encode(bytes(self.bitmap)).decode(),
+            "missing": self.missing(),
+            "progress": round(self.progress, 2),
+            "complete": self.completed,
+            "size_exact": self.size_exact,
+        }
+
+
+def _make_sparse(path: str):
+    """NTFS 需要显式标记稀疏文件，否则乱序写入高偏移时会先填零"""
+    if os.name == "nt":
+        subprocess.run(["fsutil", "sparse", "setflag", path], capture_output=True)
+
+
+class ChunkUploadStore:
+    """分块上传会话存储（SQLite）"""
+
+    def __init__(self, db_path: str, target_root: str):
+        self.db_path = db_path
+        self.target_root = target_root
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS upload_sessions (
+                    file_id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    chunk_size INTEGER NOT NULL,
+                    total_chunks INTEGER NOT NULL,
+                    video_type TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    bitmap BLOB NOT NULL,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    size_exact INTEGER NOT NULL DEFAULT 1,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            try:
+                conn.execute("ALTER TABLE upload_sessions ADD COLUMN size_exact INTEGER NOT NULL DEFAULT 1")
+            except sqlite3.OperationalError:
+                pass
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS upload_chunks (
+                    file_id TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    PRIMARY KEY (file_id, chunk_index)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _row_to_session(self, row) -> UploadSession:
+        return UploadSession(
+            file_id=row[0], filename=row[1], size=row[2], chunk_size=row[3],
+            total_chunks=row[4], video_type=row[5], task_id=row[6], path=row[7],
+            bitmap=bytearray(row[8]), completed=bool(row[9]), size_exact=bool(row[10]),
+        )
+
+    def get(self, file_id: str) -> Optional[UploadSession]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT file_id, filename, size, chunk_size, total_chunks, video_type, task_id, path, bitmap, completed, "
+                "size_exact FROM upload_sessions WHERE file_id = ?", (file_id,)
+            ).fetchone()
+        return self._row_to_session(row) if row else None
+
+    def create(self, file_id: str, filename: str, size: int, chunk_size: int,
+               video_type: str = "long", size_exact: bool = True) -> UploadSession:
+        """创建会话并预分配目标文件；会话已存在（续传）时直接返回"""
+        session = self.get(file_id)
+        if session is not None:
+            if (session.size_exact and session.size != size) or session.chunk_size != chunk_size:
+                raise ChunkError("文件大小或分块大小与已有上传不一致")
+            return session
+
+        filename = os.path.basename(filename or "")
+        if not filename or size <= 0 or chunk_size <= 0:
+            raise ChunkError("filename、size、chunk_size 不能为空")
+
+        task_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        task_dir = os.path.join(self.target_root, task_id)
+        os.makedirs(task_dir, exist_ok=True)
+        total_chunks = (size + chunk_size - 1) // chunk_size
+        session = UploadSession(
+            file_id=file_id, filename=filename, size=size, chunk_size=chunk_size,
+            total_chunks=total_chunks, video_type=video_type, task_id=task_id,
+            path=os.path.join(task_dir, filename), bitmap=bytearray((total_chunks + 7) // 8),
+            size_exact=size_exact,
+        )
+
+        with open(session.part_path, "wb") as f:
+            f.truncate(size)
+        _make_sparse(session.part_path)
+
+        try:
+            with self._lock, self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO upload_sessions (file_id, filename, size, chunk_size, total_chunks, video_type, "
+                    "task_id, path, bitmap, completed, size_exact, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?)",
+                    (file_id, filename, size, chunk_size, total_chunks, video_type,
+                     task_id, session.path, bytes(session.bitmap), int(size_exact), time.time())
+                )
+        except sqlite3.IntegrityError:
+            # 同一 file_id 的并发初始化，以先写入的会话为准
+            os.remove(session.part_path)
+            os.rmdir(task_dir)
+            return self.get(file_id)
+        return session
+
+    def create_legacy(self, file_id: str, filename: str, total_chunks: int,
+                      chunk_index: int, chunk_length: int, video_type: str = "long") -> UploadSession:
+        """
+        为只带 total_chunks 的旧客户端创建会话：除最后一块外每块等长，分块大小取收到的这一块的长度，
+        文件按满块预分配，最后一块到达后截到实际大小
+        """
+        if total_chunks <= 0 or chunk_length <= 0:
+            raise ChunkError("total_chunks 和分块内容不能为空")
+        if total_chunks == 1:
+            return self.create(file_id, filename, chunk_length, chunk_length, video_type)
+        if chunk_index == total_chunks - 1:
+            raise ChunkError("无法从最后一块推断分块大小，请先发送其他分块")
+        return self.create(file_id, filename, chunk_length * total_chunks, chunk_length,
+                           video_type, size_exact=False)
+
+    def chunk_checksum(self, file_id: str, index: int) -> Optional[str]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT sha256 FROM upload_chunks WHERE file_id = ? AND chunk_index = ?",
+                (file_id, index)
+            ).fetchone()
+        return row[0] if row else None
+
+    def write_chunk(self, session: UploadSession, index: int, stream: BinaryIO,
+                    checksum: Optional[str] = None) -> bool:
+        """
+        把分块流式写到目标文件的对应偏移，返回本次写入后上传是否刚好完成
+        已收到且校验值相同的分块不再写入；上传已完成后迟到的重复分块直接忽略
+        """
+        if session.completed:
+            return False
+        if not 0 <= index < session.total_chunks:
+            raise ChunkError(f"分块序号超出范围: {index}")
+        checksum = checksum.lower() if checksum else None
+        if checksum and session.has_chunk(index) and self.chunk_checksum(session.file_id, index) == checksum:
+            return False
+
+        offset, length = session.chunk_range(index)
+        # 旧协议会话的最后一块长度未知，不超过分块大小即可
+        open_ended = not session.size_exact and index == session.total_chunks - 1
+        sha256 = hashlib.sha256()
+        written = 0
+        try:
+            f = open(session.part_path, "r+b")
+        except FileNotFoundError:
+            # 另一个请求刚补齐最后一块并把 .part 改了名
+            current = self.get(session.file_id)
+            if current is None or not current.completed:
+                raise ChunkError("上传文件不存在")
+            session.bitmap, session.completed = current.bitmap, True
+            return False
+        with f:
+            f.seek(offset)
+            while True:
+                block = stream.read(COPY_BLOCK)
+                if not block:
+                    break
+                written += len(block)
+                if written > length:
+                    break
+                sha256.update(block)
+                f.write(block)
+        digest = sha256.hexdigest()
+        error = None
+        if written != length and not (open_ended and 0 < written < length):
+            error = f"分块 {index} 长度应为 {length}，实际 {written}"
+        elif checksum and digest != checksum:
+            error = f"分块 {index} 校验失败"
+
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT bitmap, completed, size FROM upload_sessions WHERE file_id = ?", (session.file_id,)
+            ).fetchone()
+            if row is None:
+                raise ChunkError("上传会话不存在")
+            bitmap = bytearray(row[0])
+            if row[1]:
+                # 写入期间已被其他请求补齐，文件已改名，不再改动位图
+                session.bitmap, session.completed = bitmap, True
+                return False
+            if error:
+                # 这段数据已被覆盖，之前收到过也要重传
+                bitmap[index // 8] &= ~(1 << (index % 8)) & 0xFF
+            else:
+                bitmap[index // 8] |= 1 << (index % 8)
+            session.bitmap = bitmap
+            session.size = offset + written if open_ended and not error else row[2]
+            # 只有补齐最后一块的那次请求返回 True
+            just_completed = not error and session.received_count == session.total_chunks
+            conn.execute(
+                "UPDATE upload_sessions SET bitmap = ?, completed = ?, size = ?, updated_at = ? WHERE file_id = ?",
+                (bytes(bitmap), int(just_completed), session.size, time.time(), session.file_id)
+            )
+            if error:
+                conn.execute(
+                    "DELETE FROM upload_chunks WHERE file_id = ? AND chunk_index = ?", (session.file_id, index)
+                )
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO upload_chunks (file_id, chunk_index, sha256) VALUES (?, ?, ?)",
+                    (session.file_id, index, digest)
+                )
+        if error:
+            raise ChunkError(error)
+        if just_completed:
+            session.completed = True
+            if not session.size_exact:
+                # 按满块预分配的尾部截掉
+                os.truncate(session.part_path, session.size)
+            os.replace(session.part_path, session.path)
+        return just_completed
+
+    def discard(self, file_id: str, remove_file: bool = False):
+        """删除会话记录（可选删除未完成的目标文件）"""
+        session = self.get(file_id)
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM upload_sessions WHERE file_id = ?", (file_id,))
+            conn.execute("DELETE FROM upload_chunks WHERE file_id = ?", (file_id,))
+        if remove_file and session and os.path.exists(session.part_path):
+            os.remove(session.part_path)
+
+    def cleanup(self, max_age_days: int = 7) -> int:
+        """清理长时间未更新的会话和未完成文件，返回清理数量"""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT file_id FROM upload_sessions WHERE updated_at < ?",
+                (time.time() - max_age_days * 86400,)
+            ).fetchall()
+        for (file_id,) in rows:
+            self.discard(file_id, remove_file=True)
+        return len(rows)
@@ -23,6 +23,14 @@ DIRS = {
 
 # 数据库
 DATABASE_PATH = os.path.join(DIRS["db"], "transcode.db")
+# ffprobe 探测结果缓存
+PROBE_CACHE_PATH = os.path.join(DIRS["db"], "probe_cache.db")
+
+# 分块上传会话（Web UI 断点续传）
+UPLOAD_SESSIONS_PATH = os.path.join(DIRS["db"], "upload_sessions.db")
+
+# 上传清单（断点续传）
+UPLOAD_MANIFEST_PATH = os.path.join(DIRS["db"], "upload_manifest.db")
 
 # 主服务器配置
 MAIN_SERVER = {
@@ -43,12 +51,42 @@ FFMPEG = {
     "cover_count": 10,
     "cover_quality": 85,
     "threads": 0,                 # 0=自动使用所有CPU核心
+    "abr_enabled": True,          # HLS 多码率（一次解码输出多档分辨率）
+    "abr_ladder": [1080, 720, 480, 360],  # 多码率档位（不超过源分辨率）
+    "keyframe_interval": 2,       # 关键帧间隔（秒），各档位对齐，分片边界一致
+    "fused_pipeline": True,       # 一次解码同时输出 HLS、封面和预览（失败时退回分步生成）
+    "scene_covers": True,         # 分步生成封面时：只解码关键帧、按场景切换一次扫描出候选池
+    "scene_threshold": 0.3,       # 场景切换阈值（select gt(scene,x)）
+    "scene_pool": 30,             # 候选池上限，从中挑出 cover_count 张
 }
 
 # 并行转码配置
 PARALLEL = {
-    "max_workers": min(3, max(1, multiprocessing.cpu_count() // 2)),  # 最多3个并行任务
+    "max_workers": min(3, max(1, multiprocessing.cpu_count() // 2)),  # 未启用调度器时的并行任务数
+    "enabled": True,
+}
+
+# 资源调度：按编码开销给每个任务分配线程预算，总线程数不超过 CPU 核心数
+SCHEDULER = {
     "enabled": True,
+    "cores": multiprocessing.cpu_count(),  # 可分配的线程总数
+    "max_jobs": max(2, multiprocessing.cpu_count() // 2),  # 同时运行的任务数上限
+    "fast_lane_threads": max(2, multiprocessing.cpu_count() // 4),  # 为短视频预留的线程数
+    "min_threads": 2,             # 长视频任务最少线程数，不足时不启动
+    "max_threads": 8,             # 单个任务线程数上限（x264 超过 8 线程收益很小）
+    "target_seconds": 600,        # 线程预算按“约这么久编完”折算：开销 / 目标时长
+    "output_ratio": 1.5,          # 产物体积估算：源文件大小的倍数（用于磁盘预留）
+    "history": 50,                # 吞吐学习取最近多少个完成的任务
+}
+
+# 长视频分段并行转码：按关键帧切成若干段，多个 FFmpeg 进程并行编码后拼接为 HLS
+CHUNKED = {
+    "enabled": True,
+    "min_duration": 600,          # 超过该时长（秒）才分段
+    "chunk_seconds": 120,         # 每段目标时长（秒），实际在其后的第一个关键帧处切分
+    "threads_per_chunk": 2,       # 每个分段进程的编码线程数
+    # 同时编码的分段数：CPU核心按并行任务数均分
+    "workers": max(1, multiprocessing.cpu_count() // 2 // PARALLEL["max_workers"]),
 }
 
 # 服务配置
@@ -62,6 +100,13 @@ SERVICE = {
     "watchdog_interval": 60,  # 进程守护检查间隔
 }
 
+# 任务队列：领取任务即获得租约，工作线程定期续约；租约过期的任务会被重新领取
+QUEUE = {
+    "lease_seconds": 300,         # 租约时长（秒），进程崩溃后最多这么久任务会被重新派发
+    "heartbeat_interval": 60,     # 续约间隔（秒）
+    "progress_interval": 5,       # 转码进度最短写库间隔（秒），期间的进度只保留最新值
+}
+
 # 磁盘监控配置
 DISK = {
     "min_free_gb": 10,        # 最小剩余空间(GB)
@@ -79,6 +124,9 @@ LOGGING = {
 UPLOAD = {
     "chunk_size": 5 * 1024 * 1024,  # 5MB分块
     "max_retries": 3,
+    "channels": 4,                  # 并行 SFTP 通道数（同一个 SSH 连接）
+    "poll_interval": 2,             # 转码时扫描已完成分片的间隔（秒）
+    "channel_wait": 30,             # 通道全部占用时等待空闲通道的上限（秒）
 }
 
 # 确保目录存在
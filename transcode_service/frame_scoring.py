@@ -0,0 +1,238 @@
+"""
+候选帧批量评分（封面 / 缩略图选择）
+
+把所有候选帧按分析尺寸缩小后装入一个 (N, H, W, 3) 的 uint8 数组，
+清晰度、对比度、亮度、色彩丰富度都在整批数组上一次计算；
+同时用均值感知哈希识别黑屏/纯色帧和重复帧，返回按得分排序的候选列表。
+人脸检测是可选的加分项（faces=True，需要 opencv；未安装时不加分）。
+
+本模块只依赖 numpy 和 Pillow（opencv 可选），后端（app/services/frame_scoring.py）与转码服务
+（transcode_service/frame_scoring.py）使用同一份代码。
+"""
+from dataclasses import dataclass, asdict
+from typing import Optional, List, Dict, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+# 分析尺寸（宽, 高），宽高都能被 HASH_SIZE 整除
+ANALYSIS_SIZE = (160, 96)
+# 感知哈希边长（8x8 = 64 位）
+HASH_SIZE = 8
+# 汉明距离不超过该值视为重复帧
+DUPLICATE_DISTANCE = 4
+
+# 坏帧（黑屏/白屏/纯色）判定阈值
+MIN_CONTRAST = 15
+MIN_BRIGHTNESS = 30
+MAX_BRIGHTNESS = 230
+
+# 坏帧、重复帧的得分惩罚
+BLANK_PENALTY = 0.3
+DUPLICATE_PENALTY = 0.5
+
+# 有人脸的帧加分
+FACE_BONUS = 50
+
+_GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+_face_cascade = None
+
+
+@dataclass
+class FrameScore:
+    """单帧评分结果"""
+    index: int                          # 在输入列表中的位置
+    path: str
+    score: float = 0.0                  # 综合得分（已含位置权重和惩罚）
+    sharpness: float = 0.0              # 拉普拉斯方差
+    contrast: float = 0.0               # 灰度标准差
+    brightness: float = 0.0             # 灰度均值
+    colorfulness: float = 0.0           # Hasler-Süsstrunk 色彩丰富度
+    is_blank: bool = False              # 黑屏/白屏/纯色
+    has_face: bool = False              # 检测到人脸（faces=True 且安装了 opencv 时）
+    duplicate_of: Optional[int] = None  # 与哪一帧重复（保留得分更高的那帧）
+    phash: int = 0                      # 64 位均值哈希
+
+    @property
+    def usable(self) -> bool:
+        return not self.is_blank and self.duplicate_of is None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def load_frames(paths: Sequence[str], size=ANALYSIS_SIZE) -> Tuple[np.ndarray, List[int]]:
+    """
+    解码并缩小所有候选帧
+
+    返回 (frames, loaded)：frames 为 (M, H, W, 3) uint8，loaded 为成功读取的帧在 paths 中的下标
+    """
+    width, height = size
+    frames = np.empty((len(paths), height, width, 3), dtype=np.uint8)
+    loaded = []
+    for i, path in enumerate(paths):
+        try:
+            with Image.open(path) as img:
+                # JPEG 直接按 1/2、1/4、1/8 缩放解码到不小于分析尺寸
+                img.draft("RGB", size)
+                frames[len(loaded)] = np.asarray(
+                    img.convert("RGB").resize(size, Image.BILINEAR), dtype=np.uint8
+                )
+            loaded.append(i)
+        except Exception as e:
+            print(f"[FrameScoring] 读取帧失败 {path}: {e}")
+    return frames[:len(loaded)], loaded
+
+
+def compute_metrics(frames: np.ndarray) -> Dict[str, np.ndarray]:
+    """对整批帧计算各项指标，每项返回长度为 N 的数组"""
+    rgb = frames.astype(np.float32)
+    gray = rgb @ _GRAY_WEIGHTS
+
+    # 清晰度：4 邻域拉普拉斯响应的方差
+    laplacian = (
+        4 * gray[:, 1:-1, 1:-1]
+        - gray[:, :-2, 1:-1] - gray[:, 2:, 1:-1]
+        - gray[:, 1:-1, :-2] - gray[:, 1:-1, 2:]
+    )
+    sharpness = laplacian.var(axis=(1, 2))
+
+    # 色彩丰富度：rg / yb 对立通道的标准差与均值
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    rg = r - g
+    yb = 0.5 * (r + g) - b
+    colorfulness = (
+        np.sqrt(rg.var(axis=(1, 2)) + yb.var(axis=(1, 2)))
+        + 0.3 * np.sqrt(rg.mean(axis=(1, 2)) ** 2 + yb.mean(axis=(1, 2)) ** 2)
+    )
+
+    return {
+        "sharpness": sharpness,
+        "contrast": gray.std(axis=(1, 2)),
+        "brightness": gray.mean(axis=(1, 2)),
+        "colorfulness": colorfulness,
+        "hash_bits": _hash_bits(gray),
+    }
+
+
+def _hash_bits(gray: np.ndarray) -> np.ndarray:
+    """均值哈希：灰度图分成 8x8 块，块均值高于整图块均值中位数记 1，返回 (N, 64) bool"""
+    n, h, w = gray.shape
+    blocks = gray.reshape(n, HASH_SIZE, h // HASH_SIZE, HASH_SIZE, w // HASH_SIZE).mean(axis=(2, 4))
+    blocks = blocks.reshape(n, -1)
+    return blocks > np.median(blocks, axis=1, keepdims=True)
+
+
+def hamming_matrix(bits: np.ndarray) -> np.ndarray:
+    """两两汉明距离 (N, N)"""
+    return np.count_nonzero(bits[:, None, :] != bits[None, :, :], axis=2)
+
+
+def detect_faces(paths: Sequence[str]) -> List[bool]:
+    """逐帧用 OpenCV Haar 级联检测人脸（按 1/2 灰度解码）；未安装 opencv 时全部为 False"""
+    global _face_cascade
+    try:
+        import cv2
+    except ImportError:
+        return [False] * len(paths)
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    found = []
+    for path in paths:
+        try:
+            gray = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+            found.append(gray is not None and len(_face_cascade.detectMultiScale(gray, 1.1, 4)) > 0)
+        except Exception:
+            found.append(False)
+    return found
+
+
+def quality_scores(metrics: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    各项指标归一化到 0-100 后加权
+
+    清晰度 35% + 对比度 20% + 亮度 15% + 色彩 20% + 基础分 10%
+    """
+    sharpness = 100 * metrics["sharpness"] / (metrics["sharpness"] + 200)
+    contrast = np.minimum(100, metrics["contrast"] * 100 / 64)
+    brightness = np.maximum(0, 100 - np.abs(metrics["brightness"] - 130) * 0.8)
+    colorfulness = np.minimum(100, metrics["colorfulness"])
+    return sharpness * 0.35 + contrast * 0.20 + brightness * 0.15 + colorfulness * 0.20 + 10
+
+
+def score_frames(
+    paths: Sequence[str], weights: Optional[Sequence[float]] = None, faces: bool = False
+) -> List[FrameScore]:
+    """
+    批量评分（按输入顺序返回，读取失败的帧不在结果中）
+
+    Args:
+        paths: 候选帧图片路径
+        weights: 每帧的附加权重（例如位置权重），与 paths 等长
+        faces: 是否检测人脸，有人脸的帧加 FACE_BONUS 分
+    """
+    frames, loaded = load_frames(paths)
+    if not loaded:
+        return []
+
+    metrics = compute_metrics(frames)
+    scores = quality_scores(metrics)
+    has_face = np.zeros(len(loaded), dtype=bool)
+    if faces:
+        has_face = np.asarray(detect_faces([paths[i] for i in loaded]), dtype=bool)
+        scores = scores + FACE_BONUS * has_face
+    if weights is not None:
+        scores = scores * np.asarray(weights, dtype=np.float32)[loaded]
+
+    blank = (
+        (metrics["contrast"] < MIN_CONTRAST)
+        | (metrics["brightness"] < MIN_BRIGHTNESS)
+        | (metrics["brightness"] > MAX_BRIGHTNESS)
+    )
+    scores = np.where(blank, scores * BLANK_PENALTY, scores)
+
+    # 重复帧：按得分从高到低，与已保留帧距离过近的标记为重复
+    bits = metrics["hash_bits"]
+    distances = hamming_matrix(bits)
+    duplicate_of = [None] * len(loaded)
+    kept = []
+    for i in np.argsort(-scores, kind="stable"):
+        if blank[i]:
+            continue
+        near = [k for k in kept if distances[i, k] <= DUPLICATE_DISTANCE]
+        if near:
+            duplicate_of[i] = loaded[near[0]]
+        else:
+            kept.append(i)
+
+    weights64 = np.left_shift(np.uint64(1), np.arange(bits.shape[1], dtype=np.uint64))
+    hashes = (bits.astype(np.uint64) * weights64).sum(axis=1)
+
+    results = []
+    for i, index in enumerate(loaded):
+        score = float(scores[i])
+        if duplicate_of[i] is not None:
+            score *= DUPLICATE_PENALTY
+        results.append(FrameScore(
+            index=index,
+            path=paths[index],
+            score=round(score, 2),
+            sharpness=round(float(metrics["sharpness"][i]), 2),
+            contrast=round(float(metrics["contrast"][i]), 2),
+            brightness=round(float(metrics["brightness"][i]), 2),
+            colorfulness=round(float(metrics["colorfulness"][i]), 2),
+            is_blank=bool(blank[i]),
+            has_face=bool(has_face[i]),
+            duplicate_of=duplicate_of[i],
+            phash=int(hashes[i]),
+        ))
+    return results
+
+
+def rank_frames(
+    paths: Sequence[str], weights: Optional[Sequence[float]] = None, faces: bool = False
+) -> List[FrameScore]:
+    """批量评分并按优先级排序：可用帧在前，同组内得分从高到低"""
+    return sorted(score_frames(paths, weights, faces), key=lambda f: (not f.usable, -f.score))
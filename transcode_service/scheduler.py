@@ -0,0 +1,160 @@
+"""
+转码资源调度
+
+- 每个任务按编码开销（Transcoder.estimate_cpu_cost）分配明确的线程预算，所有任务的线程之和不超过核心数，
+  不再让多个 -threads 0 的 FFmpeg 各自占满全部核心
+- 短视频走快速通道：预留 fast_lane_threads 个线程只给短视频，不会排在长视频后面等
+- 并发随实测负载和剩余磁盘调整：外部进程占用的核心从可分配线程中扣除，
+  磁盘低于警告阈值时同一时间只跑一个任务
+"""
+import os
+import math
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Callable
+
+from config import SCHEDULER, DISK, get_free_disk_space
+from task_queue import TaskQueue, TaskType
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    """一个已领取、已分配线程的任务"""
+    task: dict
+    worker_id: int
+    threads: int
+    lane: str               # 通道：short / long
+    disk_gb: float          # 为产物预留的磁盘空间
+    started: float = field(default_factory=time.monotonic)
+
+
+def measure_busy_cores() -> Optional[float]:
+    """整机正在使用的核心数（含本服务的 FFmpeg），无法测量时返回 None"""
+    if HAS_PSUTIL:
+        return psutil.cpu_percent(interval=None) / 100 * (psutil.cpu_count() or 1)
+    if hasattr(os, "getloadavg"):
+        return os.getloadavg()[0]
+    return None
+
+
+class Scheduler:
+    def __init__(self, queue: TaskQueue,
+                 cores: int = SCHEDULER["cores"],
+                 fast_lane_threads: int = SCHEDULER["fast_lane_threads"],
+                 max_jobs: int = SCHEDULER["max_jobs"],
+                 load_probe: Callable[[], Optional[float]] = measure_busy_cores,
+                 disk_probe: Callable[[], float] = get_free_disk_space):
+        self.queue = queue
+        self.cores = cores
+        self.fast_lane_threads = min(fast_lane_threads, cores)
+        self.max_jobs = max_jobs
+        self.load_probe = load_probe
+        self.disk_probe = disk_probe
+        self.jobs: Dict[int, Job] = {}  # worker_id -> Job
+        self._lock = threading.Lock()
+
+    def used_threads(self, lane: Optional[str] = None) -> int:
+        return sum(j.threads for j in self.jobs.values() if lane is None or j.lane == lane)
+
+    def capacity(self) -> int:
+        """当前可分配的线程总数：核心数减去外部进程占用的核心"""
+        busy = self.load_probe()
+        if busy is None:
+            return self.cores
+        external = max(0.0, busy - self.used_threads())
+        return max(0, self.cores - int(round(external)))
+
+    def threads_for(self, cost: float, available: int, lane: str) -> int:
+        """按开销折算线程数：约 target_seconds 内编完所需的线程，限制在 [下限, 上限] 和可用线程内"""
+        floor = 1 if lane == TaskType.SHORT.value else SCHEDULER["min_threads"]
+        wanted = math.ceil(cost / SCHEDULER["target_seconds"]) if cost else floor
+        return max(1, min(max(wanted, floor), SCHEDULER["max_threads"], available))
+
+    def _disk_allows_more(self) -> bool:
+        """扣除运行中任务的预留后，剩余空间低于警告阈值只允许一个任务，低于下限不再启动"""
+        free_gb = self.disk_probe() - sum(j.disk_gb for j in self.jobs.values())
+        if free_gb < DISK["min_free_gb"]:
+            return False
+        return free_gb >= DISK["warning_free_gb"] or not self.jobs
+
+    def _next_worker_id(self) -> int:
+        worker_id = 1
+        while worker_id in self.jobs:
+            worker_id += 1
+        return worker_id
+
+    def _claim(self, lane: TaskType, available: int) -> Optional[Job]:
+        worker_id = self._next_worker_id()
+        task = self.queue.get_pending_task(worker_id, task_type=lane)
+        if task is None:
+            return None
+        threads = self.threads_for(task.get("cpu_cost") or 0, available, lane.value)
+        try:
+            size = os.path.getsize(task["filepath"])
+        except OSError:
+            size = 0
+        job = Job(task=task, worker_id=worker_id, threads=threads, lane=lane.value,
+                  disk_gb=size * SCHEDULER["output_ratio"] / 1024 ** 3)
+        self.jobs[worker_id] = job
+        return job
+
+    def admit(self) -> Optional[Job]:
+        """
+        在资源允许时领取一个任务并分配线程，没有可启动的任务返回 None
+        短视频可用任意空闲线程；长视频不能占用快速通道中短视频尚未用到的预留线程
+        """
+        with self._lock:
+            if len(self.jobs) >= self.max_jobs or not self._disk_allows_more():
+                return None
+            free = self.capacity() - self.used_threads()
+            if not self.jobs:
+                # 外部负载再高也至少跑一个任务，避免队列停滞
+                free = max(free, SCHEDULER["min_threads"])
+            if free < 1:
+                return None
+
+            job = self._claim(TaskType.SHORT, free)
+            if job:
+                return job
+
+            reserved = max(0, self.fast_lane_threads - self.used_threads(TaskType.SHORT.value))
+            long_free = free - reserved if self.jobs else free
+            if long_free < SCHEDULER["min_threads"]:
+                return None
+            # 线程数在启动时就固定了：大任务至少等到所需线程的一半再启动，
+            # 否则在运行中的长任务释放线程前先等待，避免用很少的线程跑几个小时
+            head = self.queue.peek_pending_task(TaskType.LONG)
+            if head is None:
+                return None
+            wanted = self.threads_for(head.get("cpu_cost") or 0, self.cores, TaskType.LONG.value)
+            if long_free * 2 < wanted and self.used_threads(TaskType.LONG.value):
+                return None
+            return self._claim(TaskType.LONG, long_free)
+
+    def release(self, job: Job):
+        with self._lock:
+            self.jobs.pop(job.worker_id, None)
+
+    def snapshot(self) -> dict:
+        """调度状态（Web UI / 日志用）"""
+        with self._lock:
+            return {
+                "cores": self.cores,
+                "fast_lane_threads": self.fast_lane_threads,
+                "used_threads": self.used_threads(),
+                "jobs": [
+                    {"task_id": j.task["id"], "worker_id": j.worker_id, "lane": j.lane,
+                     "threads": j.threads, "running_seconds": round(time.monotonic() - j.started)}
+                    for j in self.jobs.values()
+                ],
+            }
@@ -1,16 +1,32 @@
 """
 SQLite任务队列 - 优化版
 支持：并行任务、定时发布、任务排序、历史记录
+
+- 每个线程复用一个持久连接，数据库开启 WAL，读写互不阻塞
+- 领取任务在 BEGIN IMMEDIATE 事务里用一条 UPDATE ... RETURNING 完成，多个工作线程/进程不会领到同一个任务
+- 领取即获得租约，处理期间定期续约；进程崩溃后租约过期的任务会被重新派发（取代启动时的 reset_stuck_tasks）
+- 转码进度在内存中合并，按 QUEUE["progress_interval"] 写库，同时顺带续约
+- 带 lease_owner 的状态/进度写入只在仍持有租约时生效，租约被收回后原持有者的完成结果会被拒绝
 """
 import sqlite3
 import json
 import os
+import time
+import uuid
+import socket
+import logging
+import threading
 from datetime import datetime, timedelta
 from enum import Enum
 from typing import Optional, List, Dict, Any
 from contextlib import contextmanager
 
-from config import DATABASE_PATH, ensure_dirs
+from config import DATABASE_PATH, QUEUE, SERVICE, SCHEDULER, ensure_dirs
+
+logger = logging.getLogger(__name__)
+
+# UPDATE ... RETURNING 需要 SQLite 3.35+，更老的版本在同一个 IMMEDIATE 事务里先查后改
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
 
 
 class TaskStatus(Enum):
@@ -24,29 +40,79 @@ class TaskStatus(Enum):
     FAILED = "failed"
 
 
+class LeaseLostError(Exception):
+    """任务租约已被收回（已过期并被重新派发），当前处理者应放弃该任务"""
+
+
 class TaskType(Enum):
     LONG = "long"
     SHORT = "short"
 
 
+# 可领取的任务：待处理，或到点的定时任务；定时任务优先
+_CLAIMABLE = """
+    SELECT id FROM tasks
+    WHERE (status = 'pending' OR (status = 'scheduled' AND scheduled_at <= datetime('now'))) {type_filter}
+    ORDER BY CASE status WHEN 'scheduled' THEN 0 ELSE 1 END, priority DESC, sort_order ASC, id ASC
+    LIMIT 1
+"""
+
+_CLAIM_SET = """
+    status = 'processing', worker_id = ?, lease_owner = ?, lease_expires_at = ?,
+    heartbeat_at = ?, started_at = ?
+"""
+
+
 class TaskQueue:
-    def __init__(self, db_path: str = DATABASE_PATH):
+    def __init__(self, db_path: str = DATABASE_PATH,
+                 lease_seconds: float = QUEUE["lease_seconds"],
+                 progress_interval: float = QUEUE["progress_interval"]):
         ensure_dirs()
         self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.progress_interval = progress_interval
+        self._local = threading.local()
+        # task_id -> [最新进度, 上次写库时间, 已写库的进度, 租约]
+        self._progress: Dict[int, list] = {}
+        self._progress_lock = threading.Lock()
         self._init_db()
-    
+
+    def _connection(self) -> sqlite3.Connection:
+        """当前线程的持久连接（首次使用时打开）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：事务由 _get_conn 显式 BEGIN/COMMIT
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
     @contextmanager
-    def _get_conn(self):
-        conn = sqlite3.connect(self.db_path, timeout=30)
-        conn.row_factory = sqlite3.Row
+    def _get_conn(self, immediate: bool = False):
+        """
+        在当前线程的连接上开启事务，正常退出提交、异常回滚
+        immediate=True 时开始即拿写锁，用于先读后写的操作
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
         try:
             yield conn
-            conn.commit()
-        finally:
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
             conn.close()
+            self._local.conn = None
     
     def _init_db(self):
-        with self._get_conn() as conn:
+        with self._get_conn(immediate=True) as conn:
             # 检查表是否存在
             cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='tasks'")
             table_exists = cursor.fetchone() is not None
@@ -73,6 +139,13 @@ class TaskQueue:
                         scheduled_at TIMESTAMP,
                         estimated_time REAL DEFAULT 0,
                         worker_id INTEGER,
+                        cpu_cost REAL,
+                        threads INTEGER,
+                        transcode_seconds REAL,
+                        lease_owner TEXT,
+                        lease_expires_at REAL,
+                        heartbeat_at REAL,
+                        video_id TEXT,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         started_at TIMESTAMP,
                         completed_at TIMESTAMP,
@@ -96,6 +169,27 @@ class TaskQueue:
                 try:
                     conn.execute("ALTER TABLE tasks ADD COLUMN worker_id INTEGER")
                 except: pass
+                try:
+                    conn.execute("ALTER TABLE tasks ADD COLUMN cpu_cost REAL")
+                except: pass
+                try:
+                    conn.execute("ALTER TABLE tasks ADD COLUMN threads INTEGER")
+                except: pass
+                try:
+                    conn.execute("ALTER TABLE tasks ADD COLUMN transcode_seconds REAL")
+                except: pass
+                try:
+                    conn.execute("ALTER TABLE tasks ADD COLUMN lease_owner TEXT")
+                except: pass
+                try:
+                    conn.execute("ALTER TABLE tasks ADD COLUMN lease_expires_at REAL")
+                except: pass
+                try:
+                    conn.execute("ALTER TABLE tasks ADD COLUMN heartbeat_at REAL")
+                except: pass
+                try:
+                    conn.execute("ALTER TABLE tasks ADD COLUMN video_id TEXT")
+                except: pass
             
             # 发布历史表
             cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='publish_history'")
@@ -123,11 +217,14 @@ class TaskQueue:
             try:
                 conn.execute("CREATE INDEX IF NOT EXISTS idx_created ON tasks(created_at)")
             except: pass
+            try:
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_claim ON tasks(status, priority DESC, sort_order)")
+            except: pass
     
     def add_task(self, filename: str, filepath: str, task_type: TaskType, 
                  priority: int = 0) -> int:
         """添加新任务"""
-        with self._get_conn() as conn:
+        with self._get_conn(immediate=True) as conn:
             # 检查是否已存在
             existing = conn.execute(
                 "SELECT id FROM tasks WHERE filepath = ? AND status NOT IN ('completed', 'failed')",
@@ -149,54 +246,144 @@ class TaskQueue:
             )
             return cursor.lastrowid
     
-    def get_pending_task(self, worker_id: int = 0) -> Optional[Dict[str, Any]]:
-        """获取一个待处理任务（支持并行）"""
+    def get_pending_task(self, worker_id: int = 0,
+                         task_type: Optional[TaskType] = None) -> Optional[Dict[str, Any]]:
+        """
+        原子领取一个待处理任务（支持多线程/多进程并行），可只领取指定类型
+        领到的任务状态置为 processing 并带上租约，返回的字典里 lease_owner 用于续约
+        """
+        now = time.time()
+        owner = f"{socket.gethostname()}:{os.getpid()}:{worker_id}:{uuid.uuid4().hex[:8]}"
+        params = (worker_id, owner, now + self.lease_seconds, now, datetime.now().isoformat())
+        claimable = _CLAIMABLE.format(type_filter="AND task_type = ?" if task_type else "")
+        type_params = (task_type.value,) if task_type else ()
+        with self._get_conn(immediate=True) as conn:
+            self._requeue_expired(conn, now)
+            if HAS_RETURNING:
+                row = conn.execute(
+                    f"UPDATE tasks SET {_CLAIM_SET} WHERE id = ({claimable}) RETURNING *",
+                    params + type_params
+                ).fetchone()
+            else:
+                row = conn.execute(claimable, type_params).fetchone()
+                if row:
+                    conn.execute(f"UPDATE tasks SET {_CLAIM_SET} WHERE id = ?", params + (row["id"],))
+                    row = conn.execute("SELECT * FROM tasks WHERE id = ?", (row["id"],)).fetchone()
+        if row is None:
+            return None
+        with self._progress_lock:
+            self._progress.pop(row["id"], None)
+        return dict(row)
+    
+    def peek_pending_task(self, task_type: Optional[TaskType] = None) -> Optional[Dict[str, Any]]:
+        """查看下一个会被领取的任务（不领取），调度器据此决定线程是否够用"""
+        claimable = _CLAIMABLE.format(type_filter="AND task_type = ?" if task_type else "")
         with self._get_conn() as conn:
-            # 先检查定时任务
-            scheduled = conn.execute(
-                """SELECT * FROM tasks 
-                   WHERE status = ? AND scheduled_at <= datetime('now')
-                   ORDER BY scheduled_at ASC LIMIT 1""",
-                (TaskStatus.SCHEDULED.value,)
-            ).fetchone()
-            
-            if scheduled:
-                conn.execute(
-                    "UPDATE tasks SET status = ?, worker_id = ? WHERE id = ?",
-                    (TaskStatus.PENDING.value, worker_id, scheduled["id"])
-                )
-                return dict(scheduled)
-            
-            # 获取普通待处理任务
             row = conn.execute(
-                """SELECT * FROM tasks 
-                   WHERE status = ? AND (worker_id IS NULL OR worker_id = 0)
-                   ORDER BY priority DESC, sort_order ASC LIMIT 1""",
-                (TaskStatus.PENDING.value,)
+                f"SELECT * FROM tasks WHERE id = ({claimable})",
+                (task_type.value,) if task_type else ()
             ).fetchone()
-            
-            if row:
-                # 标记worker
-                conn.execute(
-                    "UPDATE tasks SET worker_id = ? WHERE id = ?",
-                    (worker_id, row["id"])
-                )
-                return dict(row)
-            return None
+        return dict(row) if row else None
+    
+    def _requeue_expired(self, conn: sqlite3.Connection, now: float) -> int:
+        """
+        租约过期（处理进程已崩溃或卡死）的任务放回待处理并计一次重试，超过重试上限则置为失败
+        升级前遗留的、没有租约的处理中任务同样视为过期
+        """
+        cursor = conn.execute(
+            """UPDATE tasks SET
+                   status = CASE WHEN retry_count + 1 >= ? THEN 'failed' ELSE 'pending' END,
+                   completed_at = CASE WHEN retry_count + 1 >= ? THEN ? ELSE completed_at END,
+                   error_message = '租约过期：处理进程无响应',
+                   retry_count = retry_count + 1,
+                   worker_id = NULL, lease_owner = NULL, lease_expires_at = NULL
+               WHERE status IN (?, ?) AND COALESCE(lease_expires_at, 0) < ?""",
+            (SERVICE["max_retries"], SERVICE["max_retries"], datetime.now().isoformat(),
+             TaskStatus.PROCESSING.value, TaskStatus.UPLOADING.value, now)
+        )
+        if cursor.rowcount:
+            logger.warning(f"{cursor.rowcount} 个任务租约过期，已重新排队")
+        return cursor.rowcount
     
     def get_pending_tasks(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """获取多个待处理任务（用于并行）"""
+        """查看待处理任务（只读，不领取；领取请用 get_pending_task）"""
         with self._get_conn() as conn:
             rows = conn.execute(
                 """SELECT * FROM tasks 
-                   WHERE status = ? AND (worker_id IS NULL OR worker_id = 0)
+                   WHERE status = ?
                    ORDER BY priority DESC, sort_order ASC LIMIT ?""",
                 (TaskStatus.PENDING.value, limit)
             ).fetchall()
             return [dict(row) for row in rows]
     
-    def update_status(self, task_id: int, status: TaskStatus, **kwargs):
-        """更新任务状态"""
+    def heartbeat(self, task_id: int, lease_owner: str) -> bool:
+        """续约，同时写入合并中的最新进度；租约已被收回（任务被重新派发）时返回 False"""
+        with self._progress_lock:
+            pending = self._progress.get(task_id)
+            progress = pending[0] if pending else None
+        now = time.time()
+        with self._get_conn() as conn:
+            cursor = conn.execute(
+                """UPDATE tasks SET lease_expires_at = ?, heartbeat_at = ?, progress = COALESCE(?, progress)
+                   WHERE id = ? AND lease_owner = ?""",
+                (now + self.lease_seconds, now, progress, task_id, lease_owner)
+            )
+        if pending:
+            with self._progress_lock:
+                pending[1], pending[2] = time.monotonic(), progress
+        return cursor.rowcount == 1
+    
+    @contextmanager
+    def hold_lease(self, task: Dict[str, Any], interval: float = QUEUE["heartbeat_interval"]):
+        """
+        处理任务期间在后台线程定期续约
+        产出一个 threading.Event，续约被拒绝（租约已被收回）时置位，处理方据此中止（见 check_lease）
+        """
+        lost = threading.Event()
+        lease_owner = task.get("lease_owner")
+        if not lease_owner:
+            yield lost
+            return
+        stop = threading.Event()
+
+        def beat():
+            try:
+                while not stop.wait(interval):
+                    try:
+                        if not self.heartbeat(task["id"], lease_owner):
+                            logger.warning(f"任务 {task['id']} 租约已失效，可能已被重新派发")
+                            lost.set()
+                            return
+                    except sqlite3.Error as e:
+                        logger.error(f"任务 {task['id']} 续约失败: {e}")
+            finally:
+                self.close()
+
+        thread = threading.Thread(target=beat, name=f"lease-{task['id']}", daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join(timeout=5)
+    
+    def check_lease(self, task: Dict[str, Any], lost: Optional[threading.Event] = None):
+        """
+        确认仍持有任务租约（同时续约一次），否则抛出 LeaseLostError
+        上传、回调等不可撤销的步骤之前调用，不必等到下一次后台续约才发现租约已丢
+        """
+        lease_owner = task.get("lease_owner")
+        if (lost is not None and lost.is_set()) or (lease_owner and not self.heartbeat(task["id"], lease_owner)):
+            if lost is not None:
+                lost.set()
+            raise LeaseLostError(f"任务 {task['id']} 的租约已被收回")
+    
+    def update_status(self, task_id: int, status: TaskStatus,
+                      lease_owner: Optional[str] = None, **kwargs) -> bool:
+        """
+        更新任务状态
+        传入 lease_owner 时只在仍持有租约时更新；返回是否更新到了任务
+        """
         with self._get_conn() as conn:
             updates = ["status = ?"]
             values = [status.value]
@@ -207,27 +394,83 @@ class TaskQueue:
             elif status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
                 updates.append("completed_at = ?")
                 values.append(datetime.now().isoformat())
+            if status in (TaskStatus.PENDING, TaskStatus.COMPLETED, TaskStatus.FAILED):
+                # 释放租约，重试的任务可以被再次领取
                 updates.append("worker_id = NULL")
+                updates.append("lease_owner = NULL")
+                updates.append("lease_expires_at = NULL")
+                kwargs.pop("worker_id", None)
             
             for key, value in kwargs.items():
                 if key in ("progress", "duration", "height", "output_dir", 
                           "hls_url", "cover_url", "preview_url", "error_message", 
-                          "retry_count", "estimated_time", "worker_id"):
+                          "retry_count", "estimated_time", "worker_id",
+                          "cpu_cost", "threads", "transcode_seconds"):
                     updates.append(f"{key} = ?")
                     values.append(value)
             
             values.append(task_id)
-            conn.execute(
-                f"UPDATE tasks SET {', '.join(updates)} WHERE id = ?",
+            where = "id = ?"
+            if lease_owner:
+                where += " AND lease_owner = ?"
+                values.append(lease_owner)
+            cursor = conn.execute(
+                f"UPDATE tasks SET {', '.join(updates)} WHERE {where}",
                 values
             )
+        if status in (TaskStatus.PENDING, TaskStatus.COMPLETED, TaskStatus.FAILED):
+            with self._progress_lock:
+                self._progress.pop(task_id, None)
+        return cursor.rowcount == 1
+    
+    def update_progress(self, task_id: int, progress: float, lease_owner: Optional[str] = None):
+        """
+        更新转码进度
+        FFmpeg 每秒回调多次，这里只记在内存里，距上次写库超过 progress_interval 或到 100% 时才写一次
+        传入 lease_owner 时租约已被收回的旧处理者写不进去
+        """
+        now = time.monotonic()
+        with self._progress_lock:
+            state = self._progress.get(task_id)
+            if state is None:
+                state = self._progress[task_id] = [progress, 0.0, None]
+            state[0] = progress
+            if progress == state[2] or (progress < 100 and now - state[1] < self.progress_interval):
+                return
+            state[1], state[2] = now, progress
+        with self._get_conn() as conn:
+            if lease_owner:
+                conn.execute(
+                    "UPDATE tasks SET progress = ? WHERE id = ? AND lease_owner = ?",
+                    (progress, task_id, lease_owner)
+                )
+            else:
+                conn.execute(
+                    "UPDATE tasks SET progress = ? WHERE id = ?",
+                    (progress, task_id)
+                )
+    
+    def assign_video_id(self, task_id: int, video_id: str) -> str:
+        """
+        首次处理时记下任务的远程目录名，之后的重试沿用同一个（上传清单按远程路径记录，断点续传才能命中）
+        已有记录时返回原值
+        """
+        with self._get_conn(immediate=True) as conn:
+            conn.execute(
+                "UPDATE tasks SET video_id = ? WHERE id = ? AND video_id IS NULL",
+                (video_id, task_id)
+            )
+            row = conn.execute("SELECT video_id FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return row["video_id"] if row and row["video_id"] else video_id
     
-    def update_progress(self, task_id: int, progress: float):
-        """更新转码进度"""
+    def update_estimate(self, task_id: int, duration: float, height: int,
+                        cpu_cost: float, estimated_time: float):
+        """写入入队时探测得到的时长、分辨率和编码开销估算（调度和 ETA 用）"""
         with self._get_conn() as conn:
             conn.execute(
-                "UPDATE tasks SET progress = ? WHERE id = ?",
-                (progress, task_id)
+                """UPDATE tasks SET duration = ?, height = ?, cpu_cost = ?, estimated_time = ?
+                   WHERE id = ?""",
+                (duration, height, cpu_cost, estimated_time, task_id)
             )
     
     def update_sort_order(self, task_ids: List[int]):
@@ -266,17 +509,6 @@ class TaskQueue:
             ).fetchall()
             return [dict(row) for row in rows]
     
-    def reset_stuck_tasks(self):
-        """重置卡住的任务（服务重启时调用）"""
-        with self._get_conn() as conn:
-            conn.execute(
-                """UPDATE tasks SET status = ?, retry_count = retry_count + 1, worker_id = NULL
-                   WHERE status IN (?, ?)""",
-                (TaskStatus.PENDING.value, 
-                 TaskStatus.PROCESSING.value, 
-                 TaskStatus.UPLOADING.value)
-            )
-    
     def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
         with self._get_conn() as conn:
@@ -310,8 +542,30 @@ class TaskQueue:
             ).fetchall()
             return [dict(row) for row in rows]
     
+    def get_throughput(self, history: int = SCHEDULER["history"]) -> Dict[str, float]:
+        """
+        按任务类型统计最近完成任务的实际吞吐：每线程每秒完成的编码开销（cpu_cost / 线程·秒）
+        没有历史记录的类型不出现在结果里
+        """
+        with self._get_conn() as conn:
+            rows = conn.execute(
+                """SELECT task_type, SUM(cpu_cost), SUM(transcode_seconds * threads) FROM (
+                       SELECT task_type, cpu_cost, transcode_seconds, threads,
+                              ROW_NUMBER() OVER (PARTITION BY task_type ORDER BY completed_at DESC) AS rn
+                       FROM tasks
+                       WHERE status = ? AND cpu_cost > 0 AND transcode_seconds > 0 AND threads > 0
+                   ) WHERE rn <= ? GROUP BY task_type""",
+                (TaskStatus.COMPLETED.value, history)
+            ).fetchall()
+        return {row[0]: row[1] / row[2] for row in rows if row[2]}
+    
     def get_queue_with_eta(self) -> List[Dict[str, Any]]:
-        """获取队列及预计完成时间"""
+        """
+        获取队列及预计完成时间
+        短视频走快速通道、长视频用其余线程，两条通道各自排队；
+        每个任务的耗时 = 编码开销 / 历史吞吐（无历史时按开销估算值本身是线程·秒），
+        通道内积压的线程·秒除以通道线程数即为完成时间
+        """
         with self._get_conn() as conn:
             rows = conn.execute(
                 """SELECT * FROM tasks 
@@ -324,22 +578,38 @@ class TaskQueue:
                        END,
                        priority DESC, sort_order ASC"""
             ).fetchall()
+        
+        throughput = self.get_throughput()
+        fast_lane = SCHEDULER["fast_lane_threads"]
+        lane_threads = {
+            TaskType.SHORT.value: fast_lane,
+            TaskType.LONG.value: max(1, SCHEDULER["cores"] - fast_lane),
+        }
+        backlog = {lane: 0.0 for lane in lane_threads}  # 各通道积压（线程·秒）
+        
+        tasks = []
+        for row in rows:
+            task = dict(row)
+            lane = task["task_type"] if task["task_type"] in lane_threads else TaskType.LONG.value
+            rate = throughput.get(lane)
+            task["eta_learned"] = bool(rate and task["cpu_cost"])
+            if task["cpu_cost"]:
+                work = task["cpu_cost"] / (rate or 1.0)
+            else:
+                # 旧任务没有开销估算，按整机估算时间折算
+                work = (task["estimated_time"] or 0) * lane_threads[lane]
             
-            tasks = []
-            cumulative_time = 0
-            
-            for row in rows:
-                task = dict(row)
-                if task["status"] == "processing":
-                    # 正在处理的任务，计算剩余时间
-                    remaining = task["estimated_time"] * (1 - task["progress"] / 100)
-                    task["eta_seconds"] = remaining
-                else:
-                    cumulative_time += task["estimated_time"]
-                    task["eta_seconds"] = cumulative_time
-                tasks.append(task)
-            
-            return tasks
+            if task["status"] == "processing":
+                # 正在处理的任务，按已分配的线程计算剩余时间
+                remaining = work * (1 - (task["progress"] or 0) / 100)
+                task["eta_seconds"] = remaining / (task["threads"] or lane_threads[lane])
+                backlog[lane] += remaining
+            else:
+                backlog[lane] += work
+                task["eta_seconds"] = backlog[lane] / lane_threads[lane]
+            tasks.append(task)
+        
+        return tasks
     
     # ============ 发布历史 ============
     
@@ -0,0 +1,20 @@
+"""
+Pytest 配置：服务模块按脚本方式平铺导入（from config import ...），测试时把服务目录加入 sys.path
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def service_dirs(tmp_path, monkeypatch):
+    """把 config.DIRS 指向临时目录（默认是 Windows 路径），返回该字典"""
+    import config
+
+    for name in list(config.DIRS):
+        monkeypatch.setitem(config.DIRS, name, str(tmp_path / "service" / name))
+    config.ensure_dirs()
+    return config.DIRS
@@ -0,0 +1,161 @@
+"""
+本地 SFTP 服务端替身：paramiko 实现的主服务器替身，文件写到本地临时目录，供上传测试和压测使用
+
+    state = StandInState(root, rtt=0.02)     # 每个 SFTP 请求额外等待 rtt 秒模拟网络往返
+    port = serve(state, paramiko.RSAKey.generate(2048))
+    uploader = StandInUploader(port, manifest_path=...)
+
+state.fail_after / state.fail_paths 用于模拟上传中断，state.renamed 记录远程文件完成的先后顺序。
+"""
+import os
+import socket
+import threading
+import time
+
+import paramiko
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface, SFTP_OK, SFTP_FAILURE
+from paramiko.sftp import SFTP_NO_SUCH_FILE
+
+from uploader import Uploader
+
+
+class StandInState:
+    def __init__(self, root: str, rtt: float):
+        self.root = root
+        self.rtt = rtt
+        self.lock = threading.Lock()
+        self.writes = 0                 # 打开写入的文件数
+        self.fail_after = None          # 写入这么多文件后拒绝后续写入（模拟中断）
+        self.fail_paths = set()         # 拒绝写入的远程路径（.part 之前的目标路径）
+        self.renamed = []               # 按完成顺序记录的远程路径（.part 改名为目标文件）
+
+    def wait(self):
+        if self.rtt:
+            time.sleep(self.rtt)
+
+
+class StandInHandle(SFTPHandle):
+    def __init__(self, state: StandInState, flags: int):
+        super().__init__(flags)
+        self.state = state
+
+    def stat(self):
+        self.state.wait()
+        return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+    def close(self):
+        self.state.wait()
+        super().close()
+
+
+class StandInSFTP(SFTPServerInterface):
+    def __init__(self, server, state: StandInState, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.state = state
+
+    def _local(self, path: str) -> str:
+        return os.path.join(self.state.root, self.canonicalize(path).lstrip("/"))
+
+    def open(self, path, flags, attr):
+        self.state.wait()
+        with self.state.lock:
+            if self.state.fail_after is not None and self.state.writes >= self.state.fail_after:
+                return SFTP_FAILURE
+            if self.canonicalize(path).rsplit(".part", 1)[0] in self.state.fail_paths:
+                return SFTP_FAILURE
+            self.state.writes += 1
+        try:
+            f = open(self._local(path), "w+b" if flags & os.O_TRUNC or flags & os.O_CREAT else "r+b")
+        except OSError:
+            return SFTP_NO_SUCH_FILE
+        handle = StandInHandle(self.state, flags)
+        handle.readfile = handle.writefile = f
+        return handle
+
+    def stat(self, path):
+        self.state.wait()
+        try:
+            return SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError:
+            return SFTP_NO_SUCH_FILE
+
+    lstat = stat
+
+    def mkdir(self, path, attr):
+        self.state.wait()
+        try:
+            os.mkdir(self._local(path))
+            return SFTP_OK
+        except OSError:
+            return SFTP_FAILURE
+
+    def posix_rename(self, oldpath, newpath):
+        self.state.wait()
+        os.replace(self._local(oldpath), self._local(newpath))
+        with self.state.lock:
+            self.state.renamed.append(self.canonicalize(newpath))
+        return SFTP_OK
+
+    rename = posix_rename
+
+    def remove(self, path):
+        self.state.wait()
+        os.remove(self._local(path))
+        return SFTP_OK
+
+
+class StandInServer(paramiko.ServerInterface):
+    def __init__(self, state: StandInState):
+        self.state = state
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        def reply():
+            self.state.wait()
+            channel.send(b"ok\n")
+            channel.send_exit_status(0)
+            channel.close()
+        threading.Thread(target=reply, daemon=True).start()
+        return True
+
+
+def serve(state: StandInState, host_key) -> int:
+    """在本机随机端口启动服务端（后台线程），返回端口"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+
+    def accept():
+        while True:
+            conn, _ = sock.accept()
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(host_key)
+            transport.set_subsystem_handler("sftp", SFTPServer, StandInSFTP, state)
+            transport.start_server(server=StandInServer(state))
+
+    threading.Thread(target=accept, daemon=True).start()
+    return sock.getsockname()[1]
+
+
+class StandInUploader(Uploader):
+    def __init__(self, port: int, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.port = port
+        self.upload_base = "/uploads"
+
+    def _open_client(self):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect("127.0.0.1", port=self.port, username="root", password="x",
+                       look_for_keys=False, allow_agent=False, timeout=30)
+        return client
+
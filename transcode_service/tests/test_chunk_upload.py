@@ -0,0 +1,119 @@
+"""
+分块断点续传存储测试
+"""
+import base64
+import hashlib
+import io
+import os
+
+import pytest
+
+from chunk_upload import ChunkUploadStore, ChunkError
+
+CHUNK = 1024
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkUploadStore(str(tmp_path / "sessions.db"), str(tmp_path / "processing"))
+
+
+def chunks_of(data: bytes, size: int = CHUNK):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestWriteChunk:
+    """分块写入、校验和位图"""
+
+    def test_out_of_order_writes(self, store):
+        """测试乱序写入后文件内容正确，只有补齐最后缺口的那次返回 True"""
+        data = os.urandom(CHUNK * 4 + 300)
+        parts = chunks_of(data)
+        session = store.create("f1", "a.mp4", len(data), CHUNK)
+        assert session.total_chunks == 5
+
+        done = [store.write_chunk(session, i, io.BytesIO(parts[i])) for i in (4, 2, 0, 3, 1)]
+        assert done == [False, False, False, False, True]
+        assert not os.path.exists(session.part_path)
+        with open(session.path, "rb") as f:
+            assert f.read() == data
+
+    def test_bad_checksum_clears_bit(self, store):
+        """测试校验失败的分块被拒绝，之前收到过的位也被清掉；同内容重传直接跳过"""
+        data = os.urandom(CHUNK * 3)
+        parts = chunks_of(data)
+        session = store.create("f2", "b.mp4", len(data), CHUNK)
+        good = hashlib.sha256(parts[1]).hexdigest()
+        store.write_chunk(session, 1, io.BytesIO(parts[1]), good)
+        assert store.get("f2").has_chunk(1)
+        assert not store.write_chunk(session, 1, io.BytesIO(b""), good.upper())  # 已收到，不读流
+
+        with pytest.raises(ChunkError, match="校验失败"):
+            store.write_chunk(session, 1, io.BytesIO(os.urandom(CHUNK)), "0" * 64)
+        assert not store.get("f2").has_chunk(1)
+        assert store.chunk_checksum("f2", 1) is None
+        with pytest.raises(ChunkError, match="长度"):
+            store.write_chunk(session, 0, io.BytesIO(parts[0][:10]))
+        assert store.get("f2").missing() == [0, 1, 2]
+
+    def test_resume_from_bitmap(self, store, tmp_path):
+        """测试重新打开存储后位图和缺失分块可用于续传，init 重复调用返回同一会话"""
+        data = os.urandom(CHUNK * 10)
+        parts = chunks_of(data)
+        session = store.create("f3", "c.mp4", len(data), CHUNK)
+        for i in (0, 1, 2, 8):
+            store.write_chunk(session, i, io.BytesIO(parts[i]))
+
+        reopened = ChunkUploadStore(store.db_path, store.target_root)
+        resumed = reopened.create("f3", "c.mp4", len(data), CHUNK)
+        state = resumed.to_dict()
+        assert resumed.task_id == session.task_id
+        assert state["missing"] == [3, 4, 5, 6, 7, 9]
+        assert base64.b64decode(state["bitmap"]) == bytes([0b00000111, 0b00000001])
+        with pytest.raises(ChunkError):
+            reopened.create("f3", "c.mp4", len(data), CHUNK * 2)
+
+        for i in state["missing"]:
+            reopened.write_chunk(resumed, i, io.BytesIO(parts[i]))
+        with open(resumed.path, "rb") as f:
+            assert f.read() == data
+
+    def test_duplicate_after_completion(self, store):
+        """测试上传完成后迟到的重复分块（会话在完成前读取）被忽略而不是报错"""
+        data = os.urandom(CHUNK * 2)
+        parts = chunks_of(data)
+        store.create("f4", "d.mp4", len(data), CHUNK)
+        stale = store.get("f4")
+        store.write_chunk(store.get("f4"), 0, io.BytesIO(parts[0]))
+        assert store.write_chunk(store.get("f4"), 1, io.BytesIO(parts[1]))
+
+        assert not store.write_chunk(stale, 1, io.BytesIO(parts[1]))
+        assert stale.completed and stale.received_count == 2
+        with open(stale.path, "rb") as f:
+            assert f.read() == data
+
+
+class TestLegacyProtocol:
+    """只带 total_chunks 的旧客户端"""
+
+    def test_chunk_size_inferred_and_file_truncated(self, store):
+        """测试分块大小取第一块长度，最后一块较短时文件截到实际大小"""
+        data = os.urandom(CHUNK * 3 + 100)
+        parts = chunks_of(data)
+        session = store.create_legacy("old", "a.mp4", total_chunks=4, chunk_index=0, chunk_length=len(parts[0]))
+        assert (session.chunk_size, session.size_exact) == (CHUNK, False)
+
+        done = [store.write_chunk(store.get("old"), i, io.BytesIO(part)) for i, part in enumerate(parts)]
+        assert done == [False, False, False, True]
+        with open(session.path, "rb") as f:
+            assert f.read() == data
+        assert store.get("old").size == len(data)
+
+    def test_single_chunk_and_last_chunk_first(self, store):
+        """测试只有一块时按该块建会话；多块时先到最后一块无法推断分块大小"""
+        session = store.create_legacy("one", "b.mp4", total_chunks=1, chunk_index=0, chunk_length=10)
+        assert (session.size, session.size_exact) == (10, True)
+        assert store.write_chunk(session, 0, io.BytesIO(b"x" * 10))
+
+        with pytest.raises(ChunkError):
+            store.create_legacy("last", "c.mp4", total_chunks=3, chunk_index=2, chunk_length=10)
@@ -0,0 +1,172 @@
+"""
+调度测试（线程预算、短视频快速通道、负载/磁盘限流、两条通道的 ETA）
+"""
+import pytest
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """固定调度参数，不随本机核心数变化"""
+    import config
+
+    for key, value in {"cores": 12, "fast_lane_threads": 2, "max_jobs": 4,
+                       "min_threads": 2, "max_threads": 8, "target_seconds": 600}.items():
+        monkeypatch.setitem(config.SCHEDULER, key, value)
+    monkeypatch.setitem(config.DISK, "min_free_gb", 10)
+    monkeypatch.setitem(config.DISK, "warning_free_gb", 50)
+    return config.SCHEDULER
+
+
+@pytest.fixture
+def queue(tmp_path, service_dirs, limits):
+    from task_queue import TaskQueue
+
+    queue = TaskQueue(db_path=str(tmp_path / "queue.db"))
+    yield queue
+    queue.close()
+
+
+def _add(queue, name, task_type, cpu_cost):
+    task_id = queue.add_task(name, f"/downloads/{name}", task_type)
+    queue.update_estimate(task_id, duration=60, height=720, cpu_cost=cpu_cost, estimated_time=cpu_cost)
+    return task_id
+
+
+def _scheduler(queue, busy=None, free_gb=500.0, **kwargs):
+    from scheduler import Scheduler
+
+    options = {"cores": 12, "fast_lane_threads": 2, "max_jobs": 4}
+    options.update(kwargs)
+    return Scheduler(queue, load_probe=lambda: busy, disk_probe=lambda: free_gb, **options)
+
+
+class TestThreadsFor:
+    """按开销折算线程数"""
+
+    def test_budget_follows_cost(self, queue):
+        """测试线程数 = 开销 / 目标时长，向上取整"""
+        scheduler = _scheduler(queue)
+        assert scheduler.threads_for(600 * 3, 12, "long") == 3
+        assert scheduler.threads_for(600 * 3 + 1, 12, "long") == 4
+
+    def test_floor_per_lane(self, queue):
+        """测试没有开销估算时长视频取最少线程数，短视频可以只用一个线程"""
+        scheduler = _scheduler(queue)
+        assert scheduler.threads_for(0, 12, "long") == 2
+        assert scheduler.threads_for(0, 12, "short") == 1
+        assert scheduler.threads_for(10, 12, "short") == 1
+
+    def test_capped_by_max_and_available(self, queue):
+        """测试不超过单任务上限和可用线程"""
+        scheduler = _scheduler(queue)
+        assert scheduler.threads_for(600 * 100, 12, "long") == 8
+        assert scheduler.threads_for(600 * 100, 3, "long") == 3
+        assert scheduler.threads_for(600 * 100, 0, "long") == 1
+
+
+class TestAdmit:
+    """任务准入"""
+
+    def test_short_video_takes_fast_lane(self, queue):
+        """测试长视频在剩余线程不足时等待，短视频仍从快速通道立即启动"""
+        from task_queue import TaskType
+
+        first = _add(queue, "long1.mp4", TaskType.LONG, 600 * 20)
+        _add(queue, "long2.mp4", TaskType.LONG, 600 * 20)
+        scheduler = _scheduler(queue)
+
+        job = scheduler.admit()
+        assert job.task["id"] == first and job.lane == "long" and job.threads == 8
+        # 剩余 4 个线程中 2 个是快速通道预留，长视频只能用 2 个，不到所需 8 个的一半
+        assert scheduler.admit() is None
+
+        short = _add(queue, "short.mp4", TaskType.SHORT, 600 * 3)
+        job = scheduler.admit()
+        assert job.task["id"] == short and job.lane == "short" and job.threads == 3
+        assert scheduler.used_threads() == 11
+
+    def test_long_video_does_not_take_reserved_threads(self, queue):
+        """测试长视频只用快速通道以外的线程"""
+        from task_queue import TaskType
+
+        _add(queue, "long1.mp4", TaskType.LONG, 600 * 6)
+        _add(queue, "long2.mp4", TaskType.LONG, 600 * 6)
+        scheduler = _scheduler(queue)
+
+        assert scheduler.admit().threads == 6
+        job = scheduler.admit()
+        assert job.threads == 4  # 12 - 6 - 快速通道预留的 2
+        assert scheduler.admit() is None
+
+    def test_external_load_reduces_capacity(self, queue):
+        """测试外部进程占满核心时仍启动一个任务（最少线程），之后不再启动"""
+        from task_queue import TaskType
+
+        _add(queue, "long1.mp4", TaskType.LONG, 600 * 6)
+        _add(queue, "short.mp4", TaskType.SHORT, 600)
+        scheduler = _scheduler(queue, busy=16.0)
+
+        assert scheduler.capacity() == 0
+        job = scheduler.admit()
+        assert job.lane == "short" and job.threads == 1
+        assert scheduler.admit() is None
+
+    def test_max_jobs(self, queue):
+        """测试同时运行的任务数不超过上限"""
+        from task_queue import TaskType
+
+        for i in range(3):
+            _add(queue, f"short{i}.mp4", TaskType.SHORT, 600)
+        scheduler = _scheduler(queue, max_jobs=2)
+
+        assert scheduler.admit() and scheduler.admit()
+        assert scheduler.admit() is None
+
+        scheduler.release(next(iter(scheduler.jobs.values())))
+        assert scheduler.admit() is not None
+
+    def test_low_disk_runs_one_job(self, queue):
+        """测试磁盘低于警告阈值时只跑一个任务，低于下限时不启动"""
+        from task_queue import TaskType
+
+        for i in range(2):
+            _add(queue, f"short{i}.mp4", TaskType.SHORT, 600)
+
+        assert _scheduler(queue, free_gb=5.0).admit() is None
+
+        scheduler = _scheduler(queue, free_gb=20.0)
+        assert scheduler.admit() is not None
+        assert scheduler.admit() is None
+
+
+class TestQueueEta:
+    """两条通道各自排队的 ETA"""
+
+    def test_lanes_queue_separately(self, queue):
+        """测试短视频只排在短视频后面，通道线程数 = 快速通道 / 其余核心"""
+        from task_queue import TaskType
+
+        _add(queue, "long.mp4", TaskType.LONG, 600)
+        _add(queue, "short1.mp4", TaskType.SHORT, 100)
+        _add(queue, "short2.mp4", TaskType.SHORT, 100)
+
+        eta = {task["filename"]: task["eta_seconds"] for task in queue.get_queue_with_eta()}
+        assert eta == {"long.mp4": 60.0, "short1.mp4": 50.0, "short2.mp4": 100.0}
+
+    def test_learned_throughput_and_processing(self, queue):
+        """测试按历史吞吐折算耗时，正在处理的任务按已分配线程和进度计算剩余时间"""
+        from task_queue import TaskType, TaskStatus
+
+        done = _add(queue, "done.mp4", TaskType.LONG, 1200)
+        queue.update_status(done, TaskStatus.COMPLETED, threads=4, transcode_seconds=100)
+        assert queue.get_throughput() == {"long": 3.0}
+
+        running = _add(queue, "running.mp4", TaskType.LONG, 1800)
+        queue.get_pending_task(1)
+        queue.update_status(running, TaskStatus.PROCESSING, threads=5, progress=50)
+        _add(queue, "next.mp4", TaskType.LONG, 600)
+
+        tasks = {task["filename"]: task for task in queue.get_queue_with_eta()}
+        assert tasks["running.mp4"]["eta_seconds"] == pytest.approx(300 / 5)
+        assert tasks["next.mp4"]["eta_seconds"] == pytest.approx((300 + 200) / 10)
+        assert tasks["next.mp4"]["eta_learned"]
@@ -0,0 +1,136 @@
+"""
+任务队列测试（并发领取只派发一次、租约过期重新排队、旧持有者写入被拒绝）
+"""
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+
+@pytest.fixture
+def make_queue(tmp_path, service_dirs):
+    """同一个 WAL 数据库上的多个 TaskQueue（模拟多个进程）"""
+    from task_queue import TaskQueue
+
+    queues = []
+
+    def factory(**kwargs):
+        queue = TaskQueue(db_path=str(tmp_path / "queue.db"), **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield factory
+    for queue in queues:
+        queue.close()
+
+
+def _add_tasks(queue, count):
+    from task_queue import TaskType
+
+    return [queue.add_task(f"v{i}.mp4", f"/downloads/v{i}.mp4", TaskType.LONG) for i in range(count)]
+
+
+class TestClaim:
+    """原子领取"""
+
+    def test_concurrent_claims_dispatch_each_task_once(self, make_queue):
+        """测试多个队列实例、多线程并发领取，每个任务恰好被领取一次"""
+        queue = make_queue()
+        task_ids = _add_tasks(queue, 200)
+        with queue._get_conn() as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+        claimed = []
+        start = threading.Barrier(8)
+
+        def claim_all(worker_id):
+            own = make_queue()
+            start.wait()
+            while True:
+                task = own.get_pending_task(worker_id)
+                if task is None:
+                    break
+                claimed.append(task["id"])
+            own.close()
+
+        threads = [threading.Thread(target=claim_all, args=(i + 1,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert [task_id for task_id, n in Counter(claimed).items() if n > 1] == []
+        assert sorted(claimed) == sorted(task_ids)
+        assert queue.get_stats()["pending"] == 0
+
+
+class TestLease:
+    """租约过期与旧持有者"""
+
+    def test_expired_lease_requeued_with_retry(self, make_queue):
+        """测试租约过期的任务在下次领取时重新排队，retry_count 加一，由新的持有者领到"""
+        queue = make_queue(lease_seconds=0.05)
+        task_id, = _add_tasks(queue, 1)
+        first = queue.get_pending_task(1)
+        assert first["retry_count"] == 0
+
+        assert queue.get_pending_task(2) is None  # 租约未过期
+        time.sleep(0.1)
+        second = queue.get_pending_task(2)
+        assert second["id"] == task_id
+        assert second["retry_count"] == 1
+        assert second["lease_owner"] != first["lease_owner"]
+        assert "租约过期" in second["error_message"]
+
+    def test_expired_lease_fails_after_max_retries(self, make_queue, monkeypatch):
+        """测试过期次数达到重试上限时置为失败，不再派发"""
+        import task_queue
+        from task_queue import TaskStatus
+
+        monkeypatch.setitem(task_queue.SERVICE, "max_retries", 1)
+        queue = make_queue(lease_seconds=0.05)
+        task_id, = _add_tasks(queue, 1)
+        queue.get_pending_task(1)
+        time.sleep(0.1)
+        assert queue.get_pending_task(2) is None
+        assert queue.get_task(task_id)["status"] == TaskStatus.FAILED.value
+
+    def test_stale_owner_writes_rejected(self, make_queue):
+        """测试租约被收回后，旧持有者的状态、进度写入和续约都被拒绝，新持有者不受影响"""
+        from task_queue import LeaseLostError, TaskStatus
+
+        queue = make_queue(lease_seconds=0.05, progress_interval=0)
+        task_id, = _add_tasks(queue, 1)
+        stale = queue.get_pending_task(1)
+        time.sleep(0.1)
+        current = queue.get_pending_task(2)
+
+        assert queue.update_status(task_id, TaskStatus.COMPLETED, stale["lease_owner"]) is False
+        queue.update_progress(task_id, 80, stale["lease_owner"])
+        assert queue.heartbeat(task_id, stale["lease_owner"]) is False
+        with pytest.raises(LeaseLostError):
+            queue.check_lease(stale)
+        stored = queue.get_task(task_id)
+        assert stored["status"] == TaskStatus.PROCESSING.value
+        assert stored["lease_owner"] == current["lease_owner"] and not stored["progress"]
+
+        queue.update_progress(task_id, 40, current["lease_owner"])
+        queue.check_lease(current)
+        assert queue.update_status(task_id, TaskStatus.COMPLETED, current["lease_owner"]) is True
+        stored = queue.get_task(task_id)
+        assert (stored["status"], stored["progress"]) == (TaskStatus.COMPLETED.value, 40)
+
+    def test_hold_lease_signals_loss(self, make_queue):
+        """测试后台续约被拒绝时 hold_lease 产出的事件置位，check_lease 随即报错"""
+        from task_queue import LeaseLostError
+
+        queue = make_queue(lease_seconds=0.05)
+        _add_tasks(queue, 1)
+        task = queue.get_pending_task(1)
+        with queue.hold_lease(task, interval=0.2) as lost:
+            time.sleep(0.1)
+            assert make_queue(lease_seconds=30).get_pending_task(2) is not None  # 过期后被重新领取
+            assert lost.wait(2)
+            with pytest.raises(LeaseLostError):
+                queue.check_lease(task, lost)
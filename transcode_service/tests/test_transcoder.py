@@ -0,0 +1,270 @@
+"""
+转码命令构建测试（只检查生成的 FFmpeg 参数，不需要 ffmpeg）
+"""
+import pytest
+
+
+@pytest.fixture
+def ffmpeg(monkeypatch):
+    """固定多码率档位配置"""
+    import config
+
+    monkeypatch.setitem(config.FFMPEG, "abr_enabled", True)
+    monkeypatch.setitem(config.FFMPEG, "abr_ladder", [1080, 720, 480, 360])
+    return config.FFMPEG
+
+
+@pytest.fixture
+def transcoder(ffmpeg):
+    from transcoder import Transcoder
+
+    return Transcoder(threads=4)
+
+
+def option_values(cmd: list, option: str) -> list:
+    """命令中某个参数出现的所有取值"""
+    return [cmd[i + 1] for i, arg in enumerate(cmd) if arg == option]
+
+
+def parse_stream_map(value: str) -> list:
+    """'v:0,a:0,name:720p v:1,...' -> [{'v': '0', 'a': '0', 'name': '720p'}, ...]"""
+    return [dict(field.split(":", 1) for field in entry.split(",")) for entry in value.split(" ")]
+
+
+class TestHlsRenditions:
+    """HLS 档位"""
+
+    @pytest.mark.parametrize("height, expected", [
+        (2160, [1080, 720, 480, 360]),
+        (1080, [1080, 720, 480, 360]),
+        (720, [720, 480, 360]),
+        (540, [540, 480, 360]),   # 不在档位表中：以源高度作为最高档
+        (500, [500, 360]),        # 与 480 相差不足 10%：替换该档
+        (241, [240]),             # 低于最低档，取偶数高度
+    ])
+    def test_ladder_capped_at_source(self, transcoder, height, expected):
+        """测试只保留不超过源高度的档位，从高到低"""
+        renditions = transcoder.hls_renditions(height)
+        assert renditions == expected
+        assert max(renditions) <= height
+
+    def test_unknown_height_defaults_to_720(self, transcoder):
+        """测试没有高度信息时按 720p 处理"""
+        assert transcoder.hls_renditions(0) == [720, 480, 360]
+
+    def test_single_rendition_when_abr_disabled(self, transcoder, ffmpeg):
+        """测试关闭多码率时只输出源分辨率一档"""
+        ffmpeg["abr_enabled"] = False
+        assert transcoder.hls_renditions(1080) == [1080]
+
+
+class TestBuildHlsCommand:
+    """单次解码多档位 HLS 命令"""
+
+    @pytest.mark.parametrize("has_audio", [True, False])
+    def test_stream_map_matches_maps(self, transcoder, has_audio):
+        """测试 -var_stream_map 的每个变体都对应一对 -map（视频档位 + 音频）"""
+        renditions = [720, 480, 360]
+        cmd = transcoder._build_hls_command("in.mp4", "/out/hls", renditions, has_audio)
+
+        maps = option_values(cmd, "-map")
+        variants = parse_stream_map(option_values(cmd, "-var_stream_map")[0])
+        video_maps = [m for m in maps if m.startswith("[v")]
+        audio_maps = [m for m in maps if m == "0:a:0"]
+
+        assert video_maps == [f"[v{i}out]" for i in range(len(renditions))]
+        assert len(audio_maps) == (len(renditions) if has_audio else 0)
+        assert [v["name"] for v in variants] == ["720p", "480p", "360p"]
+        assert [v["v"] for v in variants] == ["0", "1", "2"]
+        if has_audio:
+            assert maps == [m for i in range(len(renditions)) for m in (f"[v{i}out]", "0:a:0")]
+            assert [v["a"] for v in variants] == ["0", "1", "2"]
+            assert option_values(cmd, "-c:a") == ["aac"]
+        else:
+            assert all("a" not in v for v in variants)
+            assert "-c:a" not in cmd
+
+    def test_single_decode_split_and_scale(self, transcoder):
+        """测试只有一个输入，split 后每档各自缩放，码率上限按档位设置"""
+        cmd = transcoder._build_hls_command("in.mp4", "/out/hls", [1080, 480], True)
+
+        assert option_values(cmd, "-i") == ["in.mp4"]
+        assert option_values(cmd, "-filter_complex") == [
+            "[0:v]split=2[v0][v1];[v0]scale=-2:1080[v0out];[v1]scale=-2:480[v1out]"
+        ]
+        assert option_values(cmd, "-maxrate:v:0") == ["4500k"]
+        assert option_values(cmd, "-maxrate:v:1") == ["1500k"]
+        assert option_values(cmd, "-threads") == ["4", "4"]
+        assert cmd[-1].replace("\\", "/") == "/out/hls/%v/playlist.m3u8"
+
+
+class TestPlanChunks:
+    """分段规划"""
+
+    @pytest.fixture(autouse=True)
+    def chunk_seconds(self, monkeypatch):
+        import config
+
+        monkeypatch.setitem(config.CHUNKED, "chunk_seconds", 120)
+
+    @staticmethod
+    def assert_covers(chunks, duration, keyframes):
+        """分段首尾相接覆盖整个时长，除第一段外都从关键帧开始"""
+        assert chunks[0][0] == 0.0
+        for (start, length), (next_start, _) in zip(chunks, chunks[1:]):
+            assert start + length == pytest.approx(next_start)
+        assert sum(length for _, length in chunks) == pytest.approx(duration)
+        assert all(length > 0 for _, length in chunks)
+        if keyframes:
+            assert all(start in keyframes for start, _ in chunks[1:])
+
+    def test_cuts_on_first_keyframe_after_target(self, transcoder):
+        """测试在每个目标时间之后的第一个关键帧处切分"""
+        keyframes = [i * 7.0 for i in range(100)]
+        chunks = transcoder.plan_chunks(650.0, keyframes)
+
+        assert [start for start, _ in chunks] == [0.0, 126.0, 252.0, 378.0, 504.0]
+        self.assert_covers(chunks, 650.0, keyframes)
+
+    def test_regular_gop(self, transcoder):
+        """测试固定 GOP 时按 chunk_seconds 等长切分，结尾不足半段时并入最后一段"""
+        keyframes = [i * 2.0 for i in range(330)]
+        chunks = transcoder.plan_chunks(655.0, keyframes)
+
+        assert chunks[:-1] == [(0.0, 120.0), (120.0, 120.0), (240.0, 120.0), (360.0, 120.0)]
+        assert chunks[-1] == (480.0, 175.0)
+        self.assert_covers(chunks, 655.0, keyframes)
+
+    def test_keyframes_end_early(self, transcoder):
+        """测试关键帧列表提前结束时不再切分，最后一段延伸到结尾"""
+        keyframes = [0.0, 60.0, 130.0, 200.0]
+        chunks = transcoder.plan_chunks(900.0, keyframes)
+
+        assert chunks == [(0.0, 130.0), (130.0, 770.0)]
+        self.assert_covers(chunks, 900.0, keyframes)
+
+    def test_without_keyframes(self, transcoder):
+        """测试没有关键帧信息时按固定间隔切分"""
+        chunks = transcoder.plan_chunks(500.0, [])
+
+        assert [start for start, _ in chunks] == [0.0, 120.0, 240.0, 360.0]
+        self.assert_covers(chunks, 500.0, [])
+
+    def test_short_video_single_chunk(self, transcoder):
+        """测试不足一段半的视频不切分"""
+        assert transcoder.plan_chunks(170.0, [i * 2.0 for i in range(85)]) == [(0.0, 170.0)]
+
+
+class TestBuildFusedCommand:
+    """单次解码同时输出 HLS、封面和预览"""
+
+    def test_one_decode_three_outputs(self, transcoder, ffmpeg):
+        """测试一次解码 split 到各档位、封面和预览三个分支，每个分支都被输出引用"""
+        cmd = transcoder._build_fused_command(
+            "in.mp4", "/out/hls", "/out/covers", "/out/v_preview.webm", [720, 480], True, 300.0, 25.0
+        )
+        filters = option_values(cmd, "-filter_complex")[0].split(";")
+
+        assert option_values(cmd, "-i") == ["in.mp4"]
+        assert filters[0] == "[0:v]split=4[s0][s1][s2][s3]"
+        assert filters[1:3] == ["[s0]scale=-2:720[v0out]", "[s1]scale=-2:480[v1out]"]
+        assert filters[3].startswith("[s2]select=") and filters[3].endswith("[covers]")
+        assert filters[4].startswith("[s3]select=") and filters[4].endswith("[preview]")
+        assert "setpts=N/(25.000*TB)" in filters[4]
+
+        assert option_values(cmd, "-map") == [
+            "[v0out]", "0:a:0", "[v1out]", "0:a:0", "[covers]", "[preview]",
+        ]
+        variants = parse_stream_map(option_values(cmd, "-var_stream_map")[0])
+        assert variants == [{"v": "0", "a": "0", "name": "720p"}, {"v": "1", "a": "1", "name": "480p"}]
+        assert cmd[-1] == "/out/v_preview.webm"
+
+    def test_cover_branch_selects_each_position(self, transcoder, ffmpeg):
+        """测试封面分支在每个截取点各取一帧"""
+        cmd = transcoder._build_fused_command(
+            "in.mp4", "/out/hls", "/out/covers", None, [720], False, 110.0, 30.0
+        )
+        cover_filter = option_values(cmd, "-filter_complex")[0].split(";")[2]
+        positions = [position for _, position in transcoder._cover_positions(110.0)]
+
+        assert cover_filter.count("gte(t\\,") == ffmpeg["cover_count"] == len(positions)
+        for position in positions:
+            assert f"gte(t\\,{position:.3f})" in cover_filter
+        assert option_values(cmd, "-frames:v") == [str(ffmpeg["cover_count"])]
+
+    def test_without_preview(self, transcoder):
+        """测试不生成预览时少一个分支，也没有预览输出"""
+        cmd = transcoder._build_fused_command(
+            "in.mp4", "/out/hls", "/out/covers", None, [720, 480], False, 300.0, 30.0
+        )
+
+        assert option_values(cmd, "-filter_complex")[0].startswith("[0:v]split=3[s0][s1][s2];")
+        assert option_values(cmd, "-map") == ["[v0out]", "[v1out]", "[covers]"]
+        assert "libvpx-vp9" not in cmd
+        assert cmd[-1].replace("\\", "/") == "/out/covers/cover_%d.webp"
+
+
+class TestSceneCovers:
+    """关键帧场景扫描封面"""
+
+    def test_scene_command_keeps_fixed_positions(self, transcoder, ffmpeg):
+        """测试只解码关键帧，场景切换之外各固定截取点也会选入（没有场景切换时按均匀间隔取）"""
+        cmd = transcoder._build_scene_command("in.mp4", "/out/pool", 300.0)
+        select = option_values(cmd, "-vf")[0]
+
+        assert cmd[cmd.index("-skip_frame") + 1] == "nokey"
+        assert f"gt(scene\\,{ffmpeg['scene_threshold']})" in select
+        assert f"gte(t-prev_selected_t\\,{300.0 / ffmpeg['scene_pool']:.3f})" in select
+        for _, position in transcoder._cover_positions(300.0):
+            assert f"gte(t\\,{position:.3f})" in select
+        assert "between(t\\,9.000\\,291.000)" in select
+        assert option_values(cmd, "-frames:v") == [str(ffmpeg["scene_pool"] + ffmpeg["cover_count"])]
+
+    def test_small_pool_kept_whole(self, transcoder):
+        """测试候选不足所需张数时全部保留"""
+        paths = [f"/pool/candidate_{i}.webp" for i in range(1, 4)]
+        assert transcoder._pick_scene_covers(paths, [10.0, 50.0, 90.0], 100.0, 5) == [0, 1, 2]
+
+    def test_even_spacing_without_scoring(self, transcoder, monkeypatch):
+        """测试无法评分时在候选池中均匀取"""
+        import sys
+
+        monkeypatch.setitem(sys.modules, "frame_scoring", None)
+        paths = [f"/pool/candidate_{i}.webp" for i in range(1, 13)]
+        times = [i * 8.0 for i in range(1, 13)]
+        assert transcoder._pick_scene_covers(paths, times, 100.0, 4) == [0, 3, 6, 9]
+
+    def test_prefers_usable_frames(self, transcoder, tmp_path):
+        """测试优先挑出非黑屏的候选，按时间顺序返回"""
+        np = pytest.importorskip("numpy")
+        from PIL import Image
+
+        rng = np.random.default_rng(0)
+        paths, textured = [], []
+        for i in range(12):
+            path = str(tmp_path / f"candidate_{i + 1}.png")
+            if i % 3 == 0:
+                Image.fromarray(rng.integers(0, 256, (96, 160, 3), dtype=np.uint8)).save(path)
+                textured.append(i)
+            else:
+                Image.new("RGB", (160, 96)).save(path)
+            paths.append(path)
+
+        chosen = transcoder._pick_scene_covers(paths, [i * 8.0 for i in range(1, 13)], 100.0, 4)
+        assert chosen == textured
+
+
+class TestSelectBestCover:
+    """最佳封面"""
+
+    def test_simple_selection_without_scoring(self, transcoder, tmp_path, monkeypatch):
+        """测试无法评分时按文件大小（中间位置加权）选择"""
+        import sys
+
+        monkeypatch.setitem(sys.modules, "frame_scoring", None)
+        for i, size in enumerate([100, 900, 500, 600], 1):
+            (tmp_path / f"cover_{i}.webp").write_bytes(b"x" * size)
+        assert transcoder._select_best_cover(str(tmp_path)) == 2
+
+        (tmp_path / "cover_4.webp").write_bytes(b"x" * 800)  # 800 * 1.2 > 900
+        assert transcoder._select_best_cover(str(tmp_path)) == 4
@@ -0,0 +1,95 @@
+"""
+HLS 上传测试（本地 SFTP 替身：断点续传、播放列表最后上传）
+"""
+import hashlib
+import os
+
+import paramiko
+import pytest
+
+from tests.sftp_standin import StandInState, StandInUploader, serve
+
+SEGMENTS = 6
+
+
+@pytest.fixture(scope="module")
+def host_key():
+    return paramiko.RSAKey.generate(2048)
+
+
+@pytest.fixture
+def server(tmp_path, host_key):
+    os.makedirs(tmp_path / "remote" / "uploads")
+    state = StandInState(str(tmp_path / "remote"), rtt=0)
+    return state, serve(state, host_key)
+
+
+@pytest.fixture
+def hls_dir(tmp_path):
+    """两档 HLS 目录：每档 SEGMENTS 个分片 + playlist.m3u8，外加 master.m3u8"""
+    root = tmp_path / "hls"
+    for variant in ("720p", "480p"):
+        (root / variant).mkdir(parents=True)
+        lines = ["#EXTM3U"]
+        for i in range(SEGMENTS):
+            (root / variant / f"seg_{i:03d}.ts").write_bytes(os.urandom(4096))
+            lines += ["#EXTINF:10.0,", f"seg_{i:03d}.ts"]
+        (root / variant / "playlist.m3u8").write_text("\n".join(lines + ["#EXT-X-ENDLIST"]) + "\n")
+    (root / "master.m3u8").write_text("#EXTM3U\n720p/playlist.m3u8\n480p/playlist.m3u8\n")
+    return str(root)
+
+
+def tree_digest(directory: str) -> dict:
+    digest = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                digest[os.path.relpath(path, directory)] = hashlib.sha1(f.read()).hexdigest()
+    return digest
+
+
+class TestUploadHls:
+    """upload_hls 并行上传"""
+
+    def test_playlists_uploaded_last(self, server, hls_dir, tmp_path):
+        """测试所有播放列表都在全部分片之后完成，远端目录与本地一致"""
+        state, port = server
+        uploader = StandInUploader(port, channels=4, manifest_path=str(tmp_path / "manifest.db"))
+        try:
+            assert uploader.upload_hls(hls_dir, "v1") == "/uploads/hls/v1/master.m3u8"
+        finally:
+            uploader.close()
+
+        assert tree_digest(str(tmp_path / "remote" / "uploads" / "hls" / "v1")) == tree_digest(hls_dir)
+        is_playlist = [path.endswith(".m3u8") for path in state.renamed]
+        assert len(is_playlist) == 2 * SEGMENTS + 3
+        assert is_playlist == sorted(is_playlist)  # 分片（False）全部排在播放列表（True）之前
+
+    def test_resume_after_interruption(self, server, hls_dir, tmp_path):
+        """测试有分片失败时不上传播放列表；再次上传只补传剩余文件"""
+        state, port = server
+        manifest = str(tmp_path / "manifest.db")
+        state.fail_paths = {"/uploads/hls/v2/720p/seg_003.ts", "/uploads/hls/v2/480p/seg_005.ts"}
+
+        uploader = StandInUploader(port, channels=4, manifest_path=manifest)
+        try:
+            uploader.upload_hls(hls_dir, "v2")
+        finally:
+            uploader.close()
+        assert not any(path.endswith(".m3u8") for path in state.renamed)
+        assert len(state.renamed) == 2 * SEGMENTS - 2
+
+        state.fail_paths, state.renamed = set(), []
+        uploader = StandInUploader(port, channels=4, manifest_path=manifest)
+        try:
+            assert uploader.upload_hls(hls_dir, "v2") == "/uploads/hls/v2/master.m3u8"
+        finally:
+            uploader.close()
+
+        assert sorted(state.renamed) == sorted([
+            "/uploads/hls/v2/720p/seg_003.ts", "/uploads/hls/v2/480p/seg_005.ts",
+            "/uploads/hls/v2/720p/playlist.m3u8", "/uploads/hls/v2/480p/playlist.m3u8",
+            "/uploads/hls/v2/master.m3u8",
+        ])
+        assert tree_digest(str(tmp_path / "remote" / "uploads" / "hls" / "v2")) == tree_digest(hls_dir)
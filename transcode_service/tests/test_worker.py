@@ -0,0 +1,110 @@
+"""
+转码工作线程测试（本地 SFTP 替身：上传不完整时不发布、按失败重试）
+"""
+import os
+import threading
+from unittest.mock import MagicMock
+
+import paramiko
+import pytest
+
+from tests.sftp_standin import StandInState, StandInUploader, serve
+
+VIDEO_ID = "v1"
+
+
+class FakeTranscoder:
+    """不调用 FFmpeg：process 写出两档 HLS 和封面目录"""
+
+    def __init__(self, progress_callback=None, is_short=False, threads=None):
+        self.progress_callback = progress_callback
+
+    def get_video_info(self, path):
+        return 30.0, 720
+
+    def estimate_transcode_time(self, duration, height):
+        return 10.0
+
+    def estimate_cpu_cost(self, duration, height):
+        return 1.0
+
+    def process(self, input_path, output_dir, duration, height, name, with_preview=True):
+        hls_dir = os.path.join(output_dir, "hls")
+        for variant in ("720p", "480p"):
+            os.makedirs(os.path.join(hls_dir, variant), exist_ok=True)
+            for i in range(3):
+                with open(os.path.join(hls_dir, variant, f"seg_{i:03d}.ts"), "wb") as f:
+                    f.write(os.urandom(2048))
+            with open(os.path.join(hls_dir, variant, "playlist.m3u8"), "w") as f:
+                f.write("#EXTM3U\n" + "".join(f"#EXTINF:10.0,\nseg_{i:03d}.ts\n" for i in range(3)))
+        with open(os.path.join(hls_dir, "master.m3u8"), "w") as f:
+            f.write("#EXTM3U\n720p/playlist.m3u8\n480p/playlist.m3u8\n")
+        covers_dir = os.path.join(output_dir, "covers")
+        os.makedirs(covers_dir, exist_ok=True)
+        with open(os.path.join(covers_dir, "cover_1.webp"), "wb") as f:
+            f.write(b"webp")
+        return hls_dir, covers_dir, 1, None
+
+
+@pytest.fixture
+def worker(tmp_path, service_dirs, monkeypatch):
+    import worker as worker_module
+    from task_queue import TaskQueue
+
+    monkeypatch.setattr(worker_module, "Transcoder", FakeTranscoder)
+    monkeypatch.setattr(worker_module, "check_disk_space", lambda: (True, None))
+
+    os.makedirs(tmp_path / "remote" / "uploads")
+    state = StandInState(str(tmp_path / "remote"), rtt=0)
+    port = serve(state, paramiko.RSAKey.generate(2048))
+
+    instance = worker_module.TranscodeWorker.__new__(worker_module.TranscodeWorker)
+    instance.queue = TaskQueue(db_path=str(tmp_path / "queue.db"))
+    instance.uploader = StandInUploader(port, channels=2, manifest_path=str(tmp_path / "manifest.db"))
+    instance.callback = MagicMock()
+    instance.callback.send_completion.return_value = {"video_id": 42}
+    instance.current_tasks = {}
+    instance.lock = threading.Lock()
+    yield instance, state
+    instance.uploader.close()
+    instance.queue.close()
+
+
+def _claim(queue, service_dirs):
+    from task_queue import TaskType
+
+    filepath = os.path.join(service_dirs["downloads_long"], "clip.mp4")
+    if not os.path.exists(filepath):
+        with open(filepath, "wb") as f:
+            f.write(b"mp4")
+    task_id = queue.add_task("clip.mp4", filepath, TaskType.LONG)
+    queue.assign_video_id(task_id, VIDEO_ID)
+    return queue.get_pending_task(1)
+
+
+class TestProcessTaskUpload:
+    """上传不完整时不发布"""
+
+    def test_failed_segment_keeps_task_pending_and_sends_nothing(self, worker, service_dirs):
+        """测试有分片上传失败时不回调、不记发布历史、任务回到待处理；重试成功后才发布"""
+        from task_queue import TaskStatus
+
+        instance, state = worker
+        state.fail_paths = {f"/uploads/hls/{VIDEO_ID}/720p/seg_001.ts"}
+        task = _claim(instance.queue, service_dirs)
+
+        assert instance.process_task(task, 1) is False
+        instance.callback.send_completion.assert_not_called()
+        assert instance.queue.get_publish_history() == []
+        stored = instance.queue.get_task(task["id"])
+        assert stored["status"] == TaskStatus.PENDING.value
+        assert stored["retry_count"] == 1 and not stored["hls_url"]
+        assert "HLS" in stored["error_message"]
+        assert not any(path.endswith(".m3u8") for path in state.renamed)
+
+        state.fail_paths, state.renamed = set(), []
+        task = instance.queue.get_pending_task(1)
+        assert instance.process_task(task, 1) is True
+        assert instance.callback.send_completion.call_args.kwargs["hls_url"] == f"/uploads/hls/{VIDEO_ID}/master.m3u8"
+        assert instance.queue.get_task(task["id"])["status"] == TaskStatus.COMPLETED.value
+        assert f"/uploads/hls/{VIDEO_ID}/master.m3u8" in state.renamed
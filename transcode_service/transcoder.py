@@ -1,100 +1,78 @@
 """
 FFmpeg转码封装 - 优化版
-支持：预设优化、预计时间估算
+支持：预设优化、预计时间估算、HLS 多码率（ABR）
 """
 import os
 import subprocess
 import re
 import shutil
-from typing import Callable, Optional, Tuple
+import threading
+import concurrent.futures
+from typing import Callable, Optional, Tuple, List, Dict
 from datetime import datetime
 
-from config import FFMPEG, DIRS
+from config import FFMPEG, DIRS, CHUNKED, PROBE_CACHE_PATH
+from media_probe import MediaProbe, MediaInfo
+
+# 媒体信息探测（单次 ffprobe，结果按文件大小/修改时间缓存，进程内共享）
+media_probe = MediaProbe(PROBE_CACHE_PATH)
+
+
+# HLS 码率表：(最低高度, 码率, 最大码率, 缓冲区)
+HLS_BITRATES = [
+    (1080, "4000k", "4500k", "8000k"),
+    (720, "2500k", "3000k", "5000k"),
+    (480, "1200k", "1500k", "2400k"),
+    (0, "800k", "1000k", "1600k"),
+]
+
+# x264 预设的相对编码开销（以 fast 为 1）
+PRESET_COST = {
+    "ultrafast": 0.25, "superfast": 0.4, "veryfast": 0.55, "faster": 0.75,
+    "fast": 1.0, "medium": 1.3, "slow": 2.0, "slower": 3.5, "veryslow": 7.0,
+}
+
+# 1 秒 1080p 单档 fast 预设视频的编码开销（CPU 线程·秒），实际吞吐由历史任务学习校正
+COST_PER_SECOND_1080P = 3.0
+
+
+def hls_bitrate(height: int) -> Tuple[str, str, str]:
+    """按分辨率选择码率，返回 (码率, 最大码率, 缓冲区)"""
+    for min_height, bitrate, maxrate, bufsize in HLS_BITRATES:
+        if height >= min_height:
+            return bitrate, maxrate, bufsize
+    return HLS_BITRATES[-1][1:]
 
 
 class Transcoder:
     def __init__(self, progress_callback: Optional[Callable[[float], None]] = None,
-                 is_short: bool = False):
+                 is_short: bool = False, threads: Optional[int] = None):
         self.progress_callback = progress_callback
         self.is_short = is_short
         # 根据视频类型选择预设
         self.preset = FFMPEG["preset_short"] if is_short else FFMPEG["preset_long"]
+        # 线程预算（由调度器分配）；未指定时沿用配置（0=FFmpeg 自动使用所有核心）
+        self.threads = threads or FFMPEG.get("threads", 0)
+        # 分段并行时同时编码的分段数：按线程预算折算，未指定时沿用配置
+        if threads:
+            self.chunk_workers = max(1, threads // CHUNKED.get("threads_per_chunk", 2))
+        else:
+            self.chunk_workers = CHUNKED.get("workers", 1)
+    
+    def probe(self, video_path: str) -> MediaInfo:
+        """获取完整媒体信息（单次 ffprobe，带缓存）"""
+        return media_probe.probe(video_path)
     
     def get_video_info(self, video_path: str) -> Tuple[float, int]:
-        """获取视频时长和高度"""
-        duration = 0.0
-        height = 720
-        
-        # 获取时长
-        try:
-            result = subprocess.run(
-                ["ffprobe", "-v", "error", "-show_entries", "format=duration",
-                 "-of", "csv=p=0", video_path],
-                capture_output=True, text=True, encoding="utf-8", timeout=30
-            )
-            if result.returncode == 0 and result.stdout.strip():
-                duration_str = result.stdout.strip().split('\n')[0]
-                duration = float(duration_str)
-                print(f"[VideoInfo] Duration: {duration:.2f}s from ffprobe")
-            else:
-                print(f"[VideoInfo] ffprobe duration failed: returncode={result.returncode}, stderr={result.stderr[:200] if result.stderr else 'none'}")
-        except Exception as e:
-            print(f"[VideoInfo] Duration error: {e}")
-        
-        # 如果 format=duration 失败，尝试从流信息获取
-        if duration <= 0:
-            try:
-                result = subprocess.run(
-                    ["ffprobe", "-v", "error", "-select_streams", "v:0",
-                     "-show_entries", "stream=duration", "-of", "csv=p=0", video_path],
-                    capture_output=True, text=True, encoding="utf-8", timeout=30
-                )
-                if result.returncode == 0 and result.stdout.strip():
-                    duration_str = result.stdout.strip().split('\n')[0]
-                    if duration_str and duration_str != 'N/A':
-                        duration = float(duration_str)
-                        print(f"[VideoInfo] Duration from stream: {duration:.2f}s")
-            except Exception as e:
-                print(f"[VideoInfo] Stream duration error: {e}")
-        
-        # 如果还是失败，使用 ffprobe 的 -count_frames 方式（较慢但更准确）
-        if duration <= 0:
-            try:
-                result = subprocess.run(
-                    ["ffprobe", "-v", "error", "-select_streams", "v:0",
-                     "-show_entries", "stream=r_frame_rate,nb_frames", "-of", "csv=p=0", video_path],
-                    capture_output=True, text=True, encoding="utf-8", timeout=60
-                )
-                if result.returncode == 0 and result.stdout.strip():
-                    lines = result.stdout.strip().split('\n')
-                    if lines:
-                        parts = lines[0].split(',')
-                        if len(parts) >= 2:
-                            fps_str = parts[0]  # e.g., "30/1"
-                            nb_frames = parts[1]
-                            if '/' in fps_str and nb_frames.isdigit():
-                                fps_parts = fps_str.split('/')
-                                fps = float(fps_parts[0]) / float(fps_parts[1])
-                                duration = int(nb_frames) / fps
-                                print(f"[VideoInfo] Duration from frames: {duration:.2f}s (fps={fps}, frames={nb_frames})")
-            except Exception as e:
-                print(f"[VideoInfo] Frame count error: {e}")
-        
-        # 获取高度
-        try:
-            result = subprocess.run(
-                ["ffprobe", "-v", "error", "-select_streams", "v:0",
-                 "-show_entries", "stream=height", "-of", "csv=p=0", video_path],
-                capture_output=True, text=True, encoding="utf-8", timeout=30
-            )
-            if result.returncode == 0 and result.stdout.strip():
-                height = int(result.stdout.strip().split('\n')[0])
-                print(f"[VideoInfo] Height: {height}p")
-        except Exception as e:
-            print(f"[VideoInfo] Height error: {e}")
+        """获取视频时长和（旋转后的）显示高度"""
+        info = self.probe(video_path)
+        duration = info.duration
+        height = info.display_height or 720
         
-        # 最终检查
-        if duration <= 0:
+        if duration > 0:
+            print(f"[VideoInfo] Duration: {duration:.2f}s, {info.display_width}x{height}, "
+                  f"{info.fps}fps, {info.video_codec}/{info.audio_codec or '-'}, GOP {info.keyframe_interval}s")
+        else:
             print(f"[VideoInfo] WARNING: Could not determine duration for {video_path}, using 0")
         
         return duration, height
@@ -117,77 +95,681 @@ class Transcoder:
         else:
             res_factor = 0.7
         
-        # 估算时间 = 视频时长 * 基础系数 * 分辨率系数 + 封面生成时间(30s) + 上传时间估算
-        estimated = duration * base_factor * res_factor + 30 + (duration * 0.1)
+        # 多码率各档位的额外编码量
+        ladder_factor = self.estimate_ladder_factor(height)
+        
+        # 分段并行：按并行进程数加速（并行效率按 80% 估算）
+        if self.use_chunked(duration):
+            chunks = max(1, int(duration // CHUNKED.get("chunk_seconds", 120)))
+            parallel_factor = 1 / max(1.0, min(self.chunk_workers, chunks) * 0.8)
+        else:
+            parallel_factor = 1.0
+        
+        # 估算时间 = 视频时长 * 基础系数 * 分辨率系数 * 档位系数 * 并行系数 + 封面生成时间(30s) + 上传时间估算
+        estimated = duration * base_factor * res_factor * ladder_factor * parallel_factor + 30 + (duration * 0.1)
         
         return estimated
     
+    def estimate_cpu_cost(self, duration: float, height: int) -> float:
+        """
+        估算编码开销（CPU 线程·秒）：时长 × 各档位像素数（相对 1080p）× 预设系数
+        与线程数无关，调度器据此分配线程预算并按历史吞吐折算耗时
+        """
+        height = height or 720
+        pixels = sum((h / 1080) ** 2 for h in self.hls_renditions(height))
+        return max(1.0, duration * pixels * PRESET_COST.get(self.preset, 1.0) * COST_PER_SECOND_1080P)
+    
+    def estimate_ladder_factor(self, height: int) -> float:
+        """多码率相对单档（源分辨率）的编码开销，按像素数估算"""
+        renditions = self.hls_renditions(height)
+        return sum((h / height) ** 2 for h in renditions) if height > 0 else 1.0
+    
+    def hls_renditions(self, height: int) -> List[int]:
+        """
+        计算 HLS 输出档位（从高到低）
+        - 不放大：只保留不超过源高度的档位
+        - 源高度不在档位表中时以源高度作为最高档（与下一档相差不足 10% 时替换该档）
+        """
+        if height <= 0:
+            height = 720  # 与 get_video_info 的默认值一致
+        height -= height % 2
+        if not FFMPEG.get("abr_enabled"):
+            return [height]
+        
+        ladder = sorted(FFMPEG.get("abr_ladder") or [], reverse=True)
+        renditions = [h for h in ladder if h <= height]
+        if ladder and height < ladder[0] and height not in renditions:
+            if renditions and height <= renditions[0] * 1.1:
+                renditions[0] = height
+            else:
+                renditions.insert(0, height)
+        return renditions or [height]
+    
+    def _probe_streams(self, video_path: str) -> Tuple[int, int, bool]:
+        """获取视频显示宽高和是否有音频流，返回 (宽, 高, 是否有音频)"""
+        info = self.probe(video_path)
+        if not info.video_codec:
+            return 0, 0, True
+        return info.display_width, info.display_height, info.has_audio
+    
+    def _ladder_filter(self, renditions: List[int]) -> str:
+        """一次解码后 split 到各档位并缩放，输出标签 [v0out] [v1out] ..."""
+        count = len(renditions)
+        filters = [f"[0:v]split={count}" + "".join(f"[v{i}]" for i in range(count))]
+        for i, h in enumerate(renditions):
+            filters.append(f"[v{i}]scale=-2:{h}[v{i}out]")
+        return ";".join(filters)
+    
+    def _video_encode_args(self, threads: str) -> list:
+        """
+        视频编码参数（各档位共用）
+        按固定间隔强制关键帧（关闭场景切换关键帧），保证各档位、各分段的分片边界对齐
+        """
+        keyint = FFMPEG.get("keyframe_interval", 2)
+        return [
+            "-c:v", "libx264",
+            "-preset", self.preset,
+            "-tune", "fastdecode",  # 优化解码速度，播放更流畅
+            "-crf", str(FFMPEG["crf"]),
+            "-threads", threads,  # 多线程编码
+            "-force_key_frames", f"expr:gte(t,n_forced*{keyint})",
+            "-sc_threshold", "0",
+        ]
+    
+    def _hls_output_args(self, hls_dir: str, renditions: List[int], has_audio: bool) -> list:
+        """HLS 多变体输出参数"""
+        stream_map = [
+            f"v:{i},a:{i},name:{h}p" if has_audio else f"v:{i},name:{h}p"
+            for i, h in enumerate(renditions)
+        ]
+        return [
+            "-f", "hls",
+            "-hls_time", str(FFMPEG["hls_time"]),
+            "-hls_list_size", "0",
+            "-hls_segment_filename", os.path.join(hls_dir, "%v", "seg_%03d.ts"),
+            "-var_stream_map", " ".join(stream_map),
+            os.path.join(hls_dir, "%v", "playlist.m3u8"),
+        ]
+    
+    def _build_hls_command(self, video_path: str, hls_dir: str,
+                           renditions: List[int], has_audio: bool) -> list:
+        """一次解码，split 后缩放到各档位，用 -var_stream_map 输出多个变体"""
+        threads = str(self.threads)
+        cmd = [
+            "ffmpeg", "-y",
+            "-threads", threads,  # 多线程解码
+            "-i", video_path,
+            "-filter_complex", self._ladder_filter(renditions),
+        ]
+        for i in range(len(renditions)):
+            cmd += ["-map", f"[v{i}out]"]
+            if has_audio:
+                cmd += ["-map", "0:a:0"]
+        
+        # 各档位码率上限（沿用单档码率表）
+        for i, h in enumerate(renditions):
+            _, maxrate, bufsize = hls_bitrate(h)
+            cmd += [f"-maxrate:v:{i}", maxrate, f"-bufsize:v:{i}", bufsize]
+        
+        cmd += self._video_encode_args(threads)
+        if has_audio:
+            cmd += ["-c:a", "aac", "-b:a", FFMPEG["audio_bitrate"]]
+        cmd += self._hls_output_args(hls_dir, renditions, has_audio)
+        return cmd
+    
+    # ========== 分段并行转码 ==========
+    
+    def use_chunked(self, duration: float) -> bool:
+        """是否对该视频使用分段并行转码"""
+        return (
+            CHUNKED.get("enabled", False)
+            and self.chunk_workers > 1
+            and duration >= CHUNKED.get("min_duration", 600)
+        )
+    
+    def _keyframe_times(self, video_path: str) -> List[float]:
+        """读取视频流关键帧时间（只读包信息，不解码）"""
+        try:
+            result = subprocess.run(
+                ["ffprobe", "-v", "error", "-select_streams", "v:0",
+                 "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path],
+                capture_output=True, text=True, encoding="utf-8", timeout=300
+            )
+        except Exception as e:
+            print(f"[Chunked] 读取关键帧失败: {e}")
+            return []
+        
+        times = []
+        for line in result.stdout.splitlines():
+            parts = line.split(",")
+            if len(parts) >= 2 and "K" in parts[1] and parts[0] not in ("", "N/A"):
+                times.append(float(parts[0]))
+        return sorted(times)
+    
+    def plan_chunks(self, duration: float, keyframes: List[float]) -> List[Tuple[float, float]]:
+        """
+        规划分段，返回 [(起始时间, 时长), ...]
+        每隔 chunk_seconds 在其后的第一个关键帧（GOP 边界）处切分；没有关键帧信息时按固定间隔切分
+        """
+        chunk_seconds = CHUNKED.get("chunk_seconds", 120)
+        cuts = [0.0]
+        target = chunk_seconds
+        index = 0
+        while target < duration - chunk_seconds / 2:
+            if keyframes:
+                while index < len(keyframes) and keyframes[index] < target:
+                    index += 1
+                if index >= len(keyframes):
+                    break
+                cut = keyframes[index]
+            else:
+                cut = target
+            if cut >= duration - 1:
+                break
+            if cut > cuts[-1]:
+                cuts.append(cut)
+            target = cut + chunk_seconds
+        
+        return [
+            (start, (cuts[i + 1] if i + 1 < len(cuts) else duration) - start)
+            for i, start in enumerate(cuts)
+        ]
+    
+    def _build_chunk_command(self, video_path: str, chunk_dir: str, index: int,
+                             start: float, length: float, renditions: List[int]) -> list:
+        """编码一个分段的所有档位（仅视频），每个档位输出一个 mp4"""
+        threads = str(CHUNKED.get("threads_per_chunk", 2))
+        cmd = [
+            "ffmpeg", "-y",
+            "-threads", threads,
+            "-ss", f"{start:.6f}",
+            "-i", video_path,
+            "-t", f"{length:.6f}",
+            "-filter_complex", self._ladder_filter(renditions),
+        ]
+        for i, h in enumerate(renditions):
+            _, maxrate, bufsize = hls_bitrate(h)
+            cmd += ["-map", f"[v{i}out]"]
+            cmd += self._video_encode_args(threads)
+            cmd += ["-maxrate", maxrate, "-bufsize", bufsize, "-an",
+                    os.path.join(chunk_dir, f"chunk_{index:04d}_{h}p.mp4")]
+        return cmd
+    
+    def _generate_hls_chunked(self, video_path: str, hls_dir: str, duration: float,
+                              renditions: List[int], has_audio: bool) -> bool:
+        """
+        分段并行转码：按关键帧切分 -> 多个 FFmpeg 并行编码各分段（音频单独编码一次）
+        -> concat 拼接（时间戳连续）后直接复制为 HLS 分片
+        进度按各分段已编码时长汇总，编码阶段占 95%
+        """
+        chunk_dir = os.path.join(os.path.dirname(hls_dir), "chunks")
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        os.makedirs(chunk_dir, exist_ok=True)
+        
+        try:
+            chunks = self.plan_chunks(duration, self._keyframe_times(video_path))
+            workers = min(self.chunk_workers, len(chunks))
+            print(f"[Chunked] {len(chunks)} 个分段，{workers} 个并行进程")
+            
+            lock = threading.Lock()
+            encoded = [0.0] * len(chunks)
+            reported = [-1]
+            
+            def on_time(index: int, seconds: float):
+                with lock:
+                    encoded[index] = min(seconds, chunks[index][1])
+                    progress = min(95.0, sum(encoded) / duration * 95)
+                    if self.progress_callback and int(progress) != reported[0]:
+                        reported[0] = int(progress)
+                        self.progress_callback(progress)
+            
+            def encode_chunk(index: int) -> int:
+                start, length = chunks[index]
+                cmd = self._build_chunk_command(video_path, chunk_dir, index, start, length, renditions)
+                return self._run_ffmpeg_with_progress(
+                    cmd, length, f"Chunk {index}", on_time=lambda t: on_time(index, t)
+                )
+            
+            def encode_audio() -> int:
+                cmd = ["ffmpeg", "-y", "-i", video_path, "-vn",
+                       "-c:a", "aac", "-b:a", FFMPEG["audio_bitrate"],
+                       os.path.join(chunk_dir, "audio.m4a")]
+                return subprocess.run(cmd, capture_output=True).returncode
+            
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                audio_future = executor.submit(encode_audio) if has_audio else None
+                codes = list(executor.map(encode_chunk, range(len(chunks))))
+                if audio_future is not None and audio_future.result() != 0:
+                    codes.append(audio_future.result())
+            
+            if any(code != 0 for code in codes):
+                print(f"[Chunked] 分段编码失败: {codes}")
+                return False
+            
+            # 拼接：每个档位一个 concat 输入，音频单独一个输入
+            cmd = ["ffmpeg", "-y"]
+            for h in renditions:
+                list_path = os.path.join(chunk_dir, f"list_{h}p.txt")
+                with open(list_path, "w", encoding="utf-8") as f:
+                    for index in range(len(chunks)):
+                        path = os.path.join(chunk_dir, f"chunk_{index:04d}_{h}p.mp4").replace('\\', '/')
+                        f.write(f"file '{path}'\n")
+                cmd += ["-f", "concat", "-safe", "0", "-i", list_path]
+            if has_audio:
+                cmd += ["-i", os.path.join(chunk_dir, "audio.m4a")]
+            for i in range(len(renditions)):
+                cmd += ["-map", f"{i}:v:0"]
+                if has_audio:
+                    cmd += ["-map", f"{len(renditions)}:a:0"]
+            cmd += ["-c", "copy"]
+            cmd += self._hls_output_args(hls_dir, renditions, has_audio)
+            
+            result = subprocess.run(cmd, capture_output=True)
+            if result.returncode != 0:
+                print(f"[Chunked] 拼接失败: {result.stderr.decode('utf-8', errors='ignore')[-300:]}")
+                return False
+            
+            if self.progress_callback:
+                self.progress_callback(100)
+            return True
+        except Exception as e:
+            print(f"[Chunked] 分段转码异常: {e}")
+            return False
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+    
+    def _measure_variant(self, variant_dir: str) -> Optional[Dict[str, int]]:
+        """
+        统计变体实际码率：BANDWIDTH 取单个分片的峰值码率，AVERAGE-BANDWIDTH 取整体平均
+        分辨率从第一个分片读取
+        """
+        playlist_path = os.path.join(variant_dir, "playlist.m3u8")
+        if not os.path.exists(playlist_path):
+            return None
+        
+        peak, total_bits, total_duration = 0.0, 0, 0.0
+        first_segment = None
+        segment_duration = 0.0
+        with open(playlist_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("#EXTINF:"):
+                    segment_duration = float(line[8:].split(",")[0])
+                elif line and not line.startswith("#"):
+                    segment_path = os.path.join(variant_dir, line)
+                    if not os.path.exists(segment_path):
+                        continue
+                    bits = os.path.getsize(segment_path) * 8
+                    first_segment = first_segment or segment_path
+                    total_bits += bits
+                    total_duration += segment_duration
+                    if segment_duration > 0:
+                        peak = max(peak, bits / segment_duration)
+        
+        if not first_segment or total_duration <= 0:
+            return None
+        
+        width, height = 0, 0
+        try:
+            result = subprocess.run(
+                ["ffprobe", "-v", "error", "-select_streams", "v:0",
+                 "-show_entries", "stream=width,height", "-of", "csv=p=0", first_segment],
+                capture_output=True, text=True, encoding="utf-8", timeout=30
+            )
+            if result.returncode == 0 and result.stdout.strip():
+                width, height = (int(v) for v in result.stdout.strip().split('\n')[0].split(',')[:2])
+        except Exception as e:
+            print(f"[HLS] 读取分片分辨率失败: {e}")
+        
+        return {
+            "bandwidth": int(peak),
+            "average_bandwidth": int(total_bits / total_duration),
+            "width": width,
+            "height": height,
+        }
+    
+    def _write_master_playlist(self, hls_dir: str, renditions: List[int],
+                               source_width: int, source_height: int) -> int:
+        """写入 master.m3u8（实测码率 + 实际分辨率），返回写入的变体数"""
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+        count = 0
+        for h in renditions:
+            res_name = f"{h}p"
+            info = self._measure_variant(os.path.join(hls_dir, res_name))
+            if info is None:
+                print(f"[HLS] {res_name} 没有输出，跳过")
+                continue
+            
+            width, height = info["width"], info["height"]
+            if not width or not height:
+                # 读取失败时按 scale=-2:h 的规则推算
+                height = h
+                if source_width and source_height:
+                    width = round(h * source_width / source_height / 2) * 2
+                else:
+                    width = int(h * 16 / 9)
+            
+            lines.append(
+                f"#EXT-X-STREAM-INF:BANDWIDTH={info['bandwidth']},"
+                f"AVERAGE-BANDWIDTH={info['average_bandwidth']},RESOLUTION={width}x{height}"
+            )
+            lines.append(f"{res_name}/playlist.m3u8")
+            count += 1
+        
+        with open(os.path.join(hls_dir, "master.m3u8"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return count
+    
     def generate_hls(self, video_path: str, output_dir: str, 
                      duration: float, height: int) -> str:
-        """生成HLS流"""
+        """生成HLS流（多码率：一次解码输出各档位，master.m3u8 使用实测码率）"""
         hls_dir = os.path.join(output_dir, "hls")
         os.makedirs(hls_dir, exist_ok=True)
         
-        res_name = f"{height}p"
-        res_dir = os.path.join(hls_dir, res_name)
-        os.makedirs(res_dir, exist_ok=True)
+        source_width, probed_height, has_audio = self._probe_streams(video_path)
+        source_height = probed_height or height
+        renditions = self.hls_renditions(source_height)
         
-        playlist_path = os.path.join(res_dir, "playlist.m3u8")
-        segment_pattern = os.path.join(res_dir, "seg_%03d.ts")
+        for h in renditions:
+            os.makedirs(os.path.join(hls_dir, f"{h}p"), exist_ok=True)
         
-        # 根据分辨率选择码率
-        if height >= 1080:
-            bitrate = "4000k"
-            maxrate = "4500k"
-            bufsize = "8000k"
-        elif height >= 720:
-            bitrate = "2500k"
-            maxrate = "3000k"
-            bufsize = "5000k"
-        elif height >= 480:
-            bitrate = "1200k"
-            maxrate = "1500k"
-            bufsize = "2400k"
-        else:
-            bitrate = "800k"
-            maxrate = "1000k"
-            bufsize = "1600k"
+        names = "/".join(f"{h}p" for h in renditions)
+        returncode = None
+        if self.use_chunked(duration):
+            if self._generate_hls_chunked(video_path, hls_dir, duration, renditions, has_audio):
+                returncode = 0
+            else:
+                print("[HLS] 分段并行转码失败，改为整段转码")
+                for h in renditions:
+                    shutil.rmtree(os.path.join(hls_dir, f"{h}p"), ignore_errors=True)
+                    os.makedirs(os.path.join(hls_dir, f"{h}p"), exist_ok=True)
+        
+        if returncode is None:
+            cmd = self._build_hls_command(video_path, hls_dir, renditions, has_audio)
+            returncode = self._run_ffmpeg_with_progress(cmd, duration, f"HLS {names}")
+        
+        if returncode != 0 and len(renditions) > 1:
+            # 多码率失败（如 FFmpeg 版本过旧），退回源分辨率单档
+            print(f"[HLS] 多码率转码失败 (code={returncode})，改为单档输出")
+            for h in renditions:
+                shutil.rmtree(os.path.join(hls_dir, f"{h}p"), ignore_errors=True)
+            renditions = [source_height - source_height % 2]
+            os.makedirs(os.path.join(hls_dir, f"{renditions[0]}p"), exist_ok=True)
+            cmd = self._build_hls_command(video_path, hls_dir, renditions, has_audio)
+            self._run_ffmpeg_with_progress(cmd, duration, f"HLS {renditions[0]}p")
+        
+        count = self._write_master_playlist(hls_dir, renditions, source_width, source_height)
+        print(f"[HLS] 输出 {count} 个档位: {names}")
+        
+        return hls_dir
+    
+    def _cover_positions(self, duration: float) -> List[Tuple[int, float]]:
+        """封面截取位置：[(序号, 时间)]，在时长内均匀分布（不含首尾）"""
+        count = FFMPEG["cover_count"]
+        return [(i, duration * (i / (count + 1))) for i in range(1, count + 1)]
+    
+    def _preview_segments(self, duration: float) -> List[Tuple[int, float, float]]:
+        """
+        预览分段：[(序号, 起始时间, 时长)]
+        10段，每段1秒，从开头到结尾均匀分布（0%, 10%, ..., 90%）
+        """
+        num_segments = 10
+        seg_duration = 1.0  # 每段1秒
+        
+        if duration < 10:
+            # 短视频：按视频时长调整，至少保证有几段
+            num_segments = max(3, int(duration))
+            seg_duration = min(1.0, duration / num_segments) if num_segments > 0 else duration
+        
+        segments = []
+        for i in range(num_segments):
+            start_time = duration * (i / num_segments)
+            # 确保不超过视频末尾
+            if start_time + seg_duration > duration:
+                start_time = max(0, duration - seg_duration)
+            segments.append((i, start_time, seg_duration))
+        return segments
+    
+    # ========== 单次解码流水线 ==========
+    
+    def _build_fused_command(self, video_path: str, hls_dir: str, covers_dir: str,
+                             preview_path: Optional[str], renditions: List[int],
+                             has_audio: bool, duration: float, fps: float) -> list:
+        """
+        一个 FFmpeg 进程完成 HLS、封面和预览：
+        解码一次后 split，HLS 各档位缩放编码；封面分支用 select 在各截取点取一帧；
+        预览分支用 select 取各分段的帧并重排时间戳后编码为 VP9
+        """
+        threads = str(self.threads)
+        count = len(renditions)
+        branches = count + 1 + (1 if preview_path else 0)
+        
+        filters = [f"[0:v]split={branches}" + "".join(f"[s{i}]" for i in range(branches))]
+        for i, h in enumerate(renditions):
+            filters.append(f"[s{i}]scale=-2:{h}[v{i}out]")
+        
+        # 封面：到达截取点后的第一帧（上一张选中帧在截取点之前）
+        cover_terms = [
+            f"gte(t\\,{position:.3f})*(isnan(prev_selected_t)+lt(prev_selected_t\\,{position:.3f}))"
+            for _, position in self._cover_positions(duration)
+        ]
+        filters.append(f"[s{count}]select='{'+'.join(cover_terms)}',scale=640:-1[covers]")
+        
+        if preview_path:
+            segment_terms = [
+                f"gte(t\\,{start:.3f})*lt(t\\,{start + length:.3f})"
+                for _, start, length in self._preview_segments(duration)
+            ]
+            filters.append(
+                f"[s{count + 1}]select='{'+'.join(segment_terms)}',"
+                f"setpts=N/({fps:.3f}*TB),scale=480:-2[preview]"
+            )
         
-        # FFmpeg命令 - 优化版（添加多线程和tune参数）
         cmd = [
-            "ffmpeg", "-y", 
-            "-threads", str(FFMPEG.get("threads", 0)),  # 多线程解码
+            "ffmpeg", "-y",
+            "-threads", threads,  # 多线程解码
             "-i", video_path,
-            "-c:v", "libx264", 
-            "-preset", self.preset,
-            "-tune", "fastdecode",  # 优化解码速度，播放更流畅
-            "-crf", str(FFMPEG["crf"]),
-            "-maxrate", maxrate,
-            "-bufsize", bufsize,
-            "-threads", str(FFMPEG.get("threads", 0)),  # 多线程编码
-            "-c:a", "aac", "-b:a", FFMPEG["audio_bitrate"],
-            "-movflags", "+faststart",
-            "-f", "hls", 
-            "-hls_time", str(FFMPEG["hls_time"]), 
-            "-hls_list_size", "0",
-            "-hls_segment_filename", segment_pattern,
-            playlist_path
+            "-filter_complex", ";".join(filters),
         ]
         
-        self._run_ffmpeg_with_progress(cmd, duration, f"HLS {res_name}")
+        # 输出1：HLS 多档位
+        for i in range(count):
+            cmd += ["-map", f"[v{i}out]"]
+            if has_audio:
+                cmd += ["-map", "0:a:0"]
+        for i, h in enumerate(renditions):
+            _, maxrate, bufsize = hls_bitrate(h)
+            cmd += [f"-maxrate:v:{i}", maxrate, f"-bufsize:v:{i}", bufsize]
+        cmd += self._video_encode_args(threads)
+        if has_audio:
+            cmd += ["-c:a", "aac", "-b:a", FFMPEG["audio_bitrate"]]
+        cmd += self._hls_output_args(hls_dir, renditions, has_audio)
+        
+        # 输出2：封面（cover_1.webp ... cover_N.webp）
+        cmd += [
+            "-map", "[covers]",
+            "-vsync", "vfr",
+            "-frames:v", str(FFMPEG["cover_count"]),
+            "-c:v", "libwebp",
+            "-quality", str(FFMPEG["cover_quality"]),
+            os.path.join(covers_dir, "cover_%d.webp"),
+        ]
         
-        # 创建master.m3u8
-        master_path = os.path.join(hls_dir, "master.m3u8")
-        bandwidth = int(bitrate.replace("k", "")) * 1000
-        width = int(height * 16 / 9)
+        # 输出3：预览（与分步生成时的拼接参数一致）
+        if preview_path:
+            cmd += [
+                "-map", "[preview]",
+                "-c:v", "libvpx-vp9",
+                "-b:v", "500k",
+                "-g", "30",
+                "-keyint_min", "30",
+                "-an",
+                preview_path,
+            ]
+        return cmd
+    
+    def _process_fused(self, video_path: str, output_dir: str, duration: float,
+                       height: int, name: str, with_preview: bool
+                       ) -> Optional[Tuple[str, str, int, Optional[str]]]:
+        """单次解码生成全部产物，失败返回 None（由调用方退回分步生成）"""
+        hls_dir = os.path.join(output_dir, "hls")
+        covers_dir = os.path.join(output_dir, "covers")
+        os.makedirs(hls_dir, exist_ok=True)
+        os.makedirs(covers_dir, exist_ok=True)
         
-        with open(master_path, "w", encoding="utf-8") as f:
-            f.write("#EXTM3U\n")
-            f.write("#EXT-X-VERSION:3\n")
-            f.write(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={width}x{height}\n")
-            f.write(f"{res_name}/playlist.m3u8\n")
+        info = self.probe(video_path)
+        source_width, probed_height, has_audio = self._probe_streams(video_path)
+        source_height = probed_height or height
+        renditions = self.hls_renditions(source_height)
+        for h in renditions:
+            os.makedirs(os.path.join(hls_dir, f"{h}p"), exist_ok=True)
         
-        return hls_dir
+        preview_path = os.path.join(output_dir, f"{name}_preview.webm") if with_preview else None
+        cmd = self._build_fused_command(
+            video_path, hls_dir, covers_dir, preview_path, renditions,
+            has_audio, duration, info.fps or 30.0
+        )
+        names = "/".join(f"{h}p" for h in renditions)
+        returncode = self._run_ffmpeg_with_progress(cmd, duration, f"Fused HLS {names} + covers + preview")
+        
+        count = self._write_master_playlist(hls_dir, renditions, source_width, source_height) if returncode == 0 else 0
+        if count == 0:
+            print(f"[Fused] 单次解码失败 (code={returncode})")
+            for h in renditions:
+                shutil.rmtree(os.path.join(hls_dir, f"{h}p"), ignore_errors=True)
+            for i, _ in self._cover_positions(duration):
+                cover_path = os.path.join(covers_dir, f"cover_{i}.webp")
+                if os.path.exists(cover_path):
+                    os.remove(cover_path)
+            if preview_path and os.path.exists(preview_path):
+                os.remove(preview_path)
+            return None
+        
+        print(f"[Fused] HLS {names}，封面 {len(os.listdir(covers_dir))} 张")
+        best_cover = self._select_best_cover(covers_dir)
+        
+        if preview_path and not os.path.exists(preview_path):
+            print("[Fused] 预览未生成，单独生成")
+            preview_path = self.generate_preview(video_path, output_dir, duration, name)
+        
+        return hls_dir, covers_dir, best_cover, preview_path
+    
+    def process(self, video_path: str, output_dir: str, duration: float, height: int,
+                name: str, with_preview: bool = True) -> Tuple[str, str, int, Optional[str]]:
+        """
+        生成 HLS、封面和预览，返回 (HLS目录, 封面目录, 最佳封面序号, 预览路径)
+        优先使用单次解码流水线；分段并行转码或流水线失败时分步生成
+        """
+        if FFMPEG.get("fused_pipeline") and not self.use_chunked(duration):
+            result = self._process_fused(video_path, output_dir, duration, height, name, with_preview)
+            if result is not None:
+                return result
+            print("[Fused] 改为分步生成")
+        
+        hls_dir = self.generate_hls(video_path, output_dir, duration, height)
+        covers_dir, best_cover = self.generate_covers(video_path, output_dir, duration)
+        preview_path = None
+        if with_preview:
+            preview_path = self.generate_preview(video_path, output_dir, duration, name)
+        return hls_dir, covers_dir, best_cover, preview_path
+    
+    # ========== 场景切换封面候选 ==========
+    
+    def _build_scene_command(self, video_path: str, pool_dir: str, duration: float) -> list:
+        """
+        关键帧场景扫描：-skip_frame nokey 只解码关键帧，select 选出
+        场景切换处（与上一候选间隔不小于 duration/pool）的关键帧；
+        各固定截取点之后的第一个关键帧也选入，保证无切换的视频也有候选
+        """
+        pool = FFMPEG["scene_pool"]
+        gap = duration / pool
+        scene_term = (
+            f"gt(scene\\,{FFMPEG['scene_threshold']})"
+            f"*(isnan(prev_selected_t)+gte(t-prev_selected_t\\,{gap:.3f}))"
+        )
+        fixed_terms = [
+            f"gte(t\\,{position:.3f})*(isnan(prev_selected_t)+lt(prev_selected_t\\,{position:.3f}))"
+            for _, position in self._cover_positions(duration)
+        ]
+        # 避开片头片尾；多个条件同时成立时值会大于 1，用 gt(...,0) 归一
+        select = (
+            f"between(t\\,{duration * 0.03:.3f}\\,{duration * 0.97:.3f})"
+            f"*gt({'+'.join([scene_term] + fixed_terms)}\\,0)"
+        )
+        return [
+            "ffmpeg", "-y",
+            "-skip_frame", "nokey",
+            "-i", video_path,
+            "-an", "-sn", "-dn",
+            "-vf", f"select='{select}',showinfo,scale=640:-1",
+            "-vsync", "vfr",
+            "-frames:v", str(pool + FFMPEG["cover_count"]),
+            "-c:v", "libwebp",
+            "-quality", str(FFMPEG["cover_quality"]),
+            os.path.join(pool_dir, "candidate_%d.webp"),
+        ]
+    
+    def _pick_scene_covers(self, paths: List[str], times: List[float],
+                           duration: float, count: int) -> List[int]:
+        """从候选池挑出 count 张（优先画质好、非黑屏、不重复），按时间顺序返回下标"""
+        if len(paths) <= count:
+            return list(range(len(paths)))
+        try:
+            from frame_scoring import rank_frames
+        except ImportError:
+            # 无法评分时在候选池中均匀取
+            step = len(paths) / count
+            return [int(i * step) for i in range(count)]
+        
+        # 中段（30%-70%）加分，与封面位置权重一致
+        weights = [1.15 if 0.3 <= t / duration <= 0.7 else 1.0 for t in times]
+        ranked = rank_frames(paths, weights)
+        chosen = [f.index for f in ranked if f.usable][:count]
+        chosen += [f.index for f in ranked if f.index not in chosen][:count - len(chosen)]
+        return sorted(chosen)
+    
+    def _generate_scene_covers(self, video_path: str, covers_dir: str, duration: float) -> int:
+        """
+        一次线性关键帧扫描生成封面 cover_1..N.webp（按时间顺序），返回生成张数
+        失败或没有候选时返回 0；候选不足 N 张时全部保留
+        """
+        count = FFMPEG["cover_count"]
+        pool_dir = os.path.join(covers_dir, "candidates")
+        shutil.rmtree(pool_dir, ignore_errors=True)
+        os.makedirs(pool_dir, exist_ok=True)
+        
+        try:
+            cmd = self._build_scene_command(video_path, pool_dir, duration)
+            try:
+                result = subprocess.run(cmd, capture_output=True, timeout=max(120, duration / 5))
+            except Exception as e:
+                print(f"[Cover] 关键帧扫描失败: {e}")
+                return 0
+            if result.returncode != 0:
+                print(f"[Cover] 关键帧扫描失败 (code={result.returncode})")
+                return 0
+            
+            # showinfo 按输出顺序打印每个候选的时间
+            stderr = result.stderr.decode("utf-8", errors="ignore")
+            times = [float(t) for t in re.findall(r"\bpts_time:\s*([\d.]+)", stderr)]
+            paths = []
+            for i in range(1, len(times) + 1):
+                path = os.path.join(pool_dir, f"candidate_{i}.webp")
+                if not os.path.exists(path):
+                    break
+                paths.append(path)
+            times = times[:len(paths)]
+            if not paths:
+                return 0
+            
+            chosen = self._pick_scene_covers(paths, times, duration, count)
+            for n, index in enumerate(chosen, 1):
+                os.replace(paths[index], os.path.join(covers_dir, f"cover_{n}.webp"))
+            print(f"[Cover] 关键帧扫描: 候选 {len(paths)} 张，选出 {len(chosen)} 张 "
+                  f"({', '.join(f'{times[i]:.1f}s' for i in chosen)})")
+            return len(chosen)
+        finally:
+            shutil.rmtree(pool_dir, ignore_errors=True)
     
     def generate_covers(self, video_path: str, output_dir: str, 
                         duration: float) -> Tuple[str, int]:
@@ -199,6 +781,11 @@ class Transcoder:
         
         count = FFMPEG["cover_count"]
         
+        # 优先一次关键帧扫描；失败或关键帧太少（短视频）时按固定位置逐张截取
+        if FFMPEG.get("scene_covers") and duration > 0:
+            if self._generate_scene_covers(video_path, covers_dir, duration) >= max(1, count // 2):
+                return covers_dir, self._select_best_cover(covers_dir)
+        
         def generate_single_cover(args):
             """生成单张封面"""
             i, position = args
@@ -224,10 +811,7 @@ class Transcoder:
                 return i, False
         
         # 准备参数
-        tasks = []
-        for i in range(1, count + 1):
-            position = duration * (i / (count + 1))
-            tasks.append((i, position))
+        tasks = self._cover_positions(duration)
         
         # 并行生成（最多4个线程）
         print(f"[Cover] 并行生成 {count} 张封面...")
@@ -245,16 +829,9 @@ class Transcoder:
     def _select_best_cover(self, covers_dir: str) -> int:
         """
         智能选择最佳封面
-        综合评估：清晰度、对比度、亮度、色彩丰富度、位置权重
+        综合评估：清晰度、对比度、亮度、色彩丰富度、位置权重（未安装 PIL/numpy 时按文件大小选择）
         """
-        try:
-            # 尝试使用 PIL 进行图像质量分析
-            from PIL import Image
-            import numpy as np
-            return self._select_best_cover_smart(covers_dir)
-        except ImportError:
-            print("[Cover] PIL/numpy 未安装，使用简单选择")
-            return self._select_best_cover_simple(covers_dir)
+        return self._select_best_cover_smart(covers_dir)
     
     def _select_best_cover_simple(self, covers_dir: str) -> int:
         """简单选择（文件大小+位置权重）- 备用方案"""
@@ -276,99 +853,43 @@ class Transcoder:
     
     def _select_best_cover_smart(self, covers_dir: str) -> int:
         """
-        智能封面选择 - 使用图像质量分析
+        智能封面选择 - 使用批量图像质量分析（frame_scoring）
         评分维度：
         1. 清晰度（拉普拉斯方差）- 越高越清晰
         2. 对比度（标准差）- 适中最好
         3. 亮度（平均值）- 适中最好，避免过暗过亮
-        4. 色彩丰富度（颜色方差）- 越高越好
+        4. 色彩丰富度 - 越高越好
         5. 位置权重 - 中间位置加分
+        黑屏/纯色帧和与更好封面重复的帧排在最后
         """
-        from PIL import Image
-        import numpy as np
-        
-        scores = {}
-        details = {}
+        try:
+            # 批量图像质量分析（需要 PIL + numpy）
+            from frame_scoring import rank_frames
+        except ImportError:
+            print("[Cover] PIL/numpy 未安装，使用简单选择")
+            return self._select_best_cover_simple(covers_dir)
         
-        for i in range(1, 11):
-            cover_path = os.path.join(covers_dir, f"cover_{i}.webp")
-            if not os.path.exists(cover_path):
-                continue
-            
-            try:
-                img = Image.open(cover_path)
-                img_array = np.array(img.convert('RGB'))
-                gray = np.array(img.convert('L'))
-                
-                # 1. 清晰度 - 使用简化的拉普拉斯算子
-                # 计算相邻像素差异的方差
-                dx = np.diff(gray.astype(float), axis=1)
-                dy = np.diff(gray.astype(float), axis=0)
-                sharpness = np.var(dx) + np.var(dy)
-                
-                # 2. 对比度 - 灰度标准差
-                contrast = np.std(gray)
-                
-                # 3. 亮度 - 灰度平均值（最佳范围 80-180）
-                brightness = np.mean(gray)
-                # 亮度评分：越接近130越好
-                brightness_score = 100 - abs(brightness - 130) * 0.8
-                brightness_score = max(0, brightness_score)
-                
-                # 4. 色彩丰富度 - RGB通道的方差之和
-                color_var = np.var(img_array[:,:,0]) + np.var(img_array[:,:,1]) + np.var(img_array[:,:,2])
-                
-                # 5. 位置权重 - 中间位置（4-7）加分
-                position_bonus = 1.15 if 4 <= i <= 7 else 1.0
-                
-                # 6. 检测是否为黑屏/白屏/纯色
-                is_bad_frame = False
-                if contrast < 15:  # 对比度太低，可能是纯色
-                    is_bad_frame = True
-                if brightness < 30 or brightness > 230:  # 太暗或太亮
-                    is_bad_frame = True
-                
-                # 综合评分（归一化后加权）
-                # 清晰度权重最高，其次是色彩和对比度
-                score = (
-                    sharpness * 0.35 +           # 清晰度 35%
-                    contrast * 10 * 0.20 +       # 对比度 20%
-                    brightness_score * 10 * 0.15 + # 亮度 15%
-                    color_var * 0.001 * 0.20 +   # 色彩 20%
-                    100 * 0.10                   # 基础分 10%
-                ) * position_bonus
-                
-                # 坏帧惩罚
-                if is_bad_frame:
-                    score *= 0.3
-                
-                scores[i] = score
-                details[i] = {
-                    'sharpness': sharpness,
-                    'contrast': contrast,
-                    'brightness': brightness,
-                    'color_var': color_var,
-                    'is_bad': is_bad_frame
-                }
-                
-            except Exception as e:
-                print(f"[Cover] 分析封面 {i} 失败: {e}")
-                scores[i] = 0
+        indexes = [i for i in range(1, 11)
+                   if os.path.exists(os.path.join(covers_dir, f"cover_{i}.webp"))]
+        paths = [os.path.join(covers_dir, f"cover_{i}.webp") for i in indexes]
+        # 位置权重 - 中间位置（4-7）加分
+        weights = [1.15 if 4 <= i <= 7 else 1.0 for i in indexes]
         
-        if not scores:
+        ranked = rank_frames(paths, weights)
+        if not ranked:
             return 5
         
-        # 选择得分最高的
-        best_cover = max(scores, key=scores.get)
+        best_cover = indexes[ranked[0].index]
         
         # 打印分析结果
         print(f"[Cover] 智能分析结果:")
-        for i in sorted(scores.keys()):
-            d = details.get(i, {})
+        for frame in sorted(ranked, key=lambda f: f.index):
+            i = indexes[frame.index]
             mark = " ★" if i == best_cover else ""
-            bad = " [差]" if d.get('is_bad') else ""
-            print(f"  封面{i}: 分数={scores[i]:.1f}, 清晰={d.get('sharpness', 0):.0f}, "
-                  f"对比={d.get('contrast', 0):.1f}, 亮度={d.get('brightness', 0):.0f}{bad}{mark}")
+            bad = " [差]" if frame.is_blank else ""
+            dup = f" [同封面{indexes[frame.duplicate_of]}]" if frame.duplicate_of is not None else ""
+            print(f"  封面{i}: 分数={frame.score:.1f}, 清晰={frame.sharpness:.0f}, "
+                  f"对比={frame.contrast:.1f}, 亮度={frame.brightness:.0f}{bad}{dup}{mark}")
         
         return best_cover
     
@@ -384,28 +905,9 @@ class Transcoder:
         
         preview_path = os.path.join(output_dir, f"{name}_preview.webm")
         
-        # 计算分段参数：10段，每段1秒
-        num_segments = 10
-        seg_duration = 1.0  # 每段1秒
-        
-        if duration < 10:
-            # 短视频：按视频时长调整，至少保证有几段
-            num_segments = max(3, int(duration))
-            seg_duration = min(1.0, duration / num_segments) if num_segments > 0 else duration
-        
-        # 计算每段的起始位置（从开头到结尾均匀分布）
-        # 0%, 10%, 20%, ..., 90% 的位置
-        segments = []
-        for i in range(num_segments):
-            # 均匀分布：从0%到90%（避免最后一段超出）
-            position = i / num_segments
-            start_time = duration * position
-            
-            # 确保不超过视频末尾
-            if start_time + seg_duration > duration:
-                start_time = max(0, duration - seg_duration)
-            
-            segments.append((i, start_time, seg_duration))
+        segments = self._preview_segments(duration)
+        num_segments = len(segments)
+        seg_duration = segments[0][2] if segments else 1.0
         
         # 打印分段信息，方便调试
         print(f"[Preview] 视频时长: {duration:.1f}秒")
@@ -428,6 +930,7 @@ class Transcoder:
                 # -ss 放在 -i 前面实现快速 seek
                 cmd_encode = [
                     "ffmpeg", "-y",
+                    "-threads", "1" if self.threads else "0",
                     "-ss", str(start_time),
                     "-i", video_path,
                     "-t", str(seg_dur),
@@ -451,8 +954,9 @@ class Transcoder:
                     print(f"[Preview] 段{idx}异常: {e}")
                     return None
             
-            # 使用线程池并行生成
-            with concurrent.futures.ThreadPoolExecutor(max_workers=min(4, num_segments)) as executor:
+            # 使用线程池并行生成（有线程预算时每段单线程、并行数不超过预算）
+            workers = min(4, num_segments, self.threads or 4)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
                 results = list(executor.map(generate_segment, segments))
             
             # 收集成功的分段
@@ -511,8 +1015,12 @@ class Transcoder:
             except:
                 pass
     
-    def _run_ffmpeg_with_progress(self, cmd: list, duration: float, task_name: str):
-        """运行FFmpeg并报告进度"""
+    def _run_ffmpeg_with_progress(self, cmd: list, duration: float, task_name: str,
+                                  on_time: Optional[Callable[[float], None]] = None) -> int:
+        """
+        运行FFmpeg并报告进度，返回退出码
+        指定 on_time 时改为回报已编码时长（秒），由调用方汇总进度
+        """
         process = subprocess.Popen(
             cmd,
             stdout=subprocess.PIPE,
@@ -530,13 +1038,20 @@ class Transcoder:
                 break
             
             match = time_pattern.search(line)
-            if match and self.progress_callback:
+            if match and (on_time or self.progress_callback):
                 hours, minutes, seconds = match.groups()
                 current_time = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
-                progress = min(100, (current_time / duration) * 100)
-                self.progress_callback(progress)
+                if on_time:
+                    on_time(current_time)
+                else:
+                    progress = min(100, (current_time / duration) * 100)
+                    self.progress_callback(progress)
         
         process.wait()
         
-        if self.progress_callback:
+        if on_time:
+            on_time(duration)
+        elif self.progress_callback:
             self.progress_callback(100)
+        
+        return process.returncode
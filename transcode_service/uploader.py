@@ -1,66 +1,215 @@
 """
 SCP上传模块 - 使用paramiko
+
+- 并行：同一个 SSH 连接上打开多个 SFTP 通道，文件并发上传
+- 目录：每棵目录树的远程目录只创建一次
+- 断点续传：每个文件上传完成后记入本地清单（大小 + SHA1），中断后重新上传时跳过已完成的文件
+- 流水线：转码过程中后台上传播放列表里已写完的分片（stream_hls）
 """
 import os
-import paramiko
-from typing import Optional
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+import posixpath
+import concurrent.futures
+from contextlib import contextmanager
+from typing import Optional, List, Tuple, Set
 import logging
 
-from config import MAIN_SERVER
+import paramiko
+
+from config import MAIN_SERVER, UPLOAD, UPLOAD_MANIFEST_PATH
 
 logger = logging.getLogger(__name__)
 
+# 播放列表最后上传，保证播放器读到的列表里的分片都已存在
+PLAYLIST_EXT = ".m3u8"
+
+
+def file_sha1(path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class UploadManifest:
+    """已上传文件清单（SQLite），按远程路径记录大小、修改时间和 SHA1"""
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS upload_manifest (
+                    remote_path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    sha1 TEXT NOT NULL,
+                    uploaded_at REAL NOT NULL
+                )
+            """)
+    
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def get(self, remote_path: str) -> Optional[Tuple[int, int, str]]:
+        """返回 (size, mtime_ns, sha1)"""
+        with self._lock, self._connect() as conn:
+            return conn.execute(
+                "SELECT size, mtime_ns, sha1 FROM upload_manifest WHERE remote_path = ?",
+                (remote_path,)
+            ).fetchone()
+    
+    def set(self, remote_path: str, size: int, mtime_ns: int, sha1: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO upload_manifest (remote_path, size, mtime_ns, sha1, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (remote_path, size, mtime_ns, sha1, time.time())
+            )
+    
+    def cleanup(self, max_age_days: int = 30) -> int:
+        """清理过期记录，返回删除条数"""
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM upload_manifest WHERE uploaded_at < ?",
+                (time.time() - max_age_days * 86400,)
+            )
+            return cursor.rowcount
+
 
 class Uploader:
-    def __init__(self):
+    def __init__(self, channels: Optional[int] = None, manifest_path: Optional[str] = UPLOAD_MANIFEST_PATH):
         self.host = MAIN_SERVER["host"]
         self.upload_base = MAIN_SERVER["upload_base"]
+        self.channels = channels or UPLOAD["channels"]
+        self.manifest_path = manifest_path
+        self._manifest: Optional[UploadManifest] = None
+        self._manifest_checked = False
         self._client = None
         self._sftp = None
+        self._lock = threading.RLock()
+        self._pool: "queue.Queue[paramiko.SFTPClient]" = queue.Queue()
+        self._opened = 0
+        self._remote_dirs: Set[str] = set()
+    
+    @property
+    def manifest(self) -> Optional[UploadManifest]:
+        """首次使用时打开上传清单，打不开则不做断点续传"""
+        with self._lock:
+            if not self._manifest_checked:
+                self._manifest_checked = True
+                if self.manifest_path:
+                    try:
+                        self._manifest = UploadManifest(self.manifest_path)
+                    except Exception as e:
+                        logger.warning(f"上传清单不可用: {e}")
+        return self._manifest
+    
+    def _open_client(self) -> paramiko.SSHClient:
+        """建立 SSH 连接"""
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        
+        # 尝试使用密钥文件
+        key_path = MAIN_SERVER.get("ssh_key")
+        if key_path and os.path.exists(key_path):
+            client.connect(self.host, username='root', key_filename=key_path, timeout=30)
+        else:
+            # 使用默认密钥
+            client.connect(self.host, username='root', timeout=30)
+        return client
     
     def _connect(self):
-        """建立SSH连接"""
-        if self._client is not None:
+        """确保 SSH 连接可用（只检查传输层状态，不做网络往返）"""
+        with self._lock:
+            if self._client is not None:
+                transport = self._client.get_transport()
+                if transport is not None and transport.is_active():
+                    return True
+                self._close()
+            
             try:
-                self._client.exec_command('echo ok', timeout=5)
+                self._client = self._open_client()
+                self._client.get_transport().set_keepalive(30)
+                self._sftp = self._client.open_sftp()
+                logger.info(f"SSH连接成功: {self.host}")
                 return True
-            except:
+            except Exception as e:
+                logger.error(f"SSH连接失败: {e}")
                 self._close()
-        
-        try:
-            self._client = paramiko.SSHClient()
-            self._client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # 尝试使用密钥文件
-            key_path = MAIN_SERVER.get("ssh_key")
-            if key_path and os.path.exists(key_path):
-                self._client.connect(self.host, username='root', key_filename=key_path, timeout=30)
-            else:
-                # 使用默认密钥
-                self._client.connect(self.host, username='root', timeout=30)
-            
-            self._sftp = self._client.open_sftp()
-            logger.info(f"SSH连接成功: {self.host}")
-            return True
-        except Exception as e:
-            logger.error(f"SSH连接失败: {e}")
-            self._close()
-            return False
+                return False
     
     def _close(self):
         """关闭连接"""
-        if self._sftp:
-            try:
-                self._sftp.close()
-            except:
-                pass
+        with self._lock:
+            channels = [self._sftp]
+            while not self._pool.empty():
+                channels.append(self._pool.get_nowait())
+            for sftp in channels:
+                if sftp:
+                    try:
+                        sftp.close()
+                    except:
+                        pass
             self._sftp = None
-        if self._client:
+            self._opened = 0
+            self._remote_dirs.clear()
+            if self._client:
+                try:
+                    self._client.close()
+                except:
+                    pass
+                self._client = None
+    
+    def close(self):
+        self._close()
+    
+    def _acquire_channel(self) -> paramiko.SFTPClient:
+        """
+        从通道池取一个 SFTP 通道，池空且未达上限时新开
+        SSH 连不上时立即抛出 ConnectionError，不在池上空等
+        """
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if not self._connect():
+                raise ConnectionError(f"SSH 连接不可用: {self.host}")
+            if self._opened < self.channels:
+                self._opened += 1
+                try:
+                    return self._client.open_sftp()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._pool.get(timeout=UPLOAD["channel_wait"])
+        except queue.Empty:
+            raise ConnectionError(f"{UPLOAD['channel_wait']} 秒内没有空闲的 SFTP 通道")
+    
+    def _release_channel(self, sftp: paramiko.SFTPClient, broken: bool = False):
+        if broken:
+            with self._lock:
+                self._opened = max(0, self._opened - 1)
             try:
-                self._client.close()
+                sftp.close()
             except:
                 pass
-            self._client = None
+        else:
+            self._pool.put(sftp)
     
     def _run_ssh(self, command: str) -> bool:
         """执行SSH命令"""
@@ -75,24 +224,90 @@ class Uploader:
             return False
     
     def _mkdir_p(self, remote_path: str):
-        """递归创建远程目录"""
+        """递归创建远程目录（已确认存在的目录不再访问远程）"""
         if not self._connect():
             return
         
-        dirs = []
-        while remote_path and remote_path != '/':
+        with self._lock:
+            dirs = []
+            path = remote_path
+            while path and path != '/' and path not in self._remote_dirs:
+                try:
+                    self._sftp.stat(path)
+                    break
+                except:
+                    dirs.append(path)
+                    path = posixpath.dirname(path)
+            
+            for d in reversed(dirs):
+                try:
+                    self._sftp.mkdir(d)
+                except:
+                    pass
+            
+            while remote_path and remote_path != '/' and remote_path not in self._remote_dirs:
+                self._remote_dirs.add(remote_path)
+                remote_path = posixpath.dirname(remote_path)
+    
+    def _put(self, local_path: str, remote_path: str) -> bool:
+        """
+        上传单个文件（清单中大小和 SHA1 一致则跳过）
+        先写 .part 再改名，中断不会留下不完整的目标文件
+        """
+        stat = os.stat(local_path)
+        manifest = self.manifest
+        record = manifest.get(remote_path) if manifest else None
+        if record and record[0] == stat.st_size and record[1] == stat.st_mtime_ns:
+            return True
+        
+        sha1 = file_sha1(local_path) if manifest else ""
+        if record and record[0] == stat.st_size and record[2] == sha1:
+            manifest.set(remote_path, stat.st_size, stat.st_mtime_ns, sha1)
+            return True
+        
+        retries = UPLOAD["max_retries"]
+        for attempt in range(retries):
+            sftp = None
             try:
-                self._sftp.stat(remote_path)
+                sftp = self._acquire_channel()
+                part_path = remote_path + ".part"
+                sftp.put(local_path, part_path, confirm=True)
+                sftp.posix_rename(part_path, remote_path)
+                self._release_channel(sftp)
                 break
-            except:
-                dirs.append(remote_path)
-                remote_path = os.path.dirname(remote_path)
+            except Exception as e:
+                if sftp is not None:
+                    self._release_channel(sftp, broken=True)
+                if attempt == retries - 1:
+                    logger.error(f"上传失败: {local_path} - {e}")
+                    return False
         
-        for d in reversed(dirs):
-            try:
-                self._sftp.mkdir(d)
-            except:
-                pass
+        if manifest:
+            manifest.set(remote_path, stat.st_size, stat.st_mtime_ns, sha1)
+        return True
+    
+    def upload_files(self, files: List[Tuple[str, str]]) -> int:
+        """
+        并行上传 [(本地路径, 远程路径)]，返回远程已就绪的文件数
+        播放列表在其他文件全部完成后再上传；有文件失败时不上传播放列表，留给下次续传
+        """
+        if not files or not self._connect():
+            return 0
+        
+        for remote_dir in sorted({posixpath.dirname(remote) for _, remote in files}):
+            self._mkdir_p(remote_dir)
+        
+        media = [f for f in files if not f[0].endswith(PLAYLIST_EXT)]
+        playlists = [f for f in files if f[0].endswith(PLAYLIST_EXT)]
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.channels) as executor:
+            count = sum(executor.map(lambda f: self._put(*f), media))
+            if count < len(media):
+                if playlists:
+                    logger.warning(f"{len(media) - count} 个文件上传失败，暂不上传播放列表")
+                return count
+            count += sum(executor.map(lambda f: self._put(*f), playlists))
+        return count
     
     def upload_file(self, local_path: str, remote_path: str) -> bool:
         """上传单个文件"""
@@ -100,79 +315,67 @@ class Uploader:
             logger.warning(f"文件不存在: {local_path}")
             return False
         
-        if not self._connect():
-            return False
-        
-        try:
-            # 确保远程目录存在
-            remote_dir = os.path.dirname(remote_path)
-            self._mkdir_p(remote_dir)
-            
-            # 上传文件
-            self._sftp.put(local_path, remote_path)
+        if self.upload_files([(local_path, remote_path)]):
             logger.info(f"上传成功: {os.path.basename(local_path)}")
             return True
-        except Exception as e:
-            logger.error(f"上传失败: {local_path} - {e}")
-            return False
+        return False
     
-    def upload_directory(self, local_dir: str, remote_dir: str) -> int:
-        """上传整个目录，返回成功上传的文件数"""
+    def _walk(self, local_dir: str, remote_dir: str) -> List[Tuple[str, str]]:
+        files = []
+        for root, dirs, filenames in os.walk(local_dir):
+            for filename in filenames:
+                local_path = os.path.join(root, filename)
+                relative_path = os.path.relpath(local_path, local_dir)
+                files.append((local_path, f"{remote_dir}/{relative_path}".replace("\\", "/")))
+        return files
+    
+    def _upload_tree(self, local_dir: str, remote_dir: str) -> Tuple[int, int]:
+        """上传整个目录，返回 (远程已就绪的文件数, 文件总数)"""
         if not os.path.exists(local_dir):
             logger.warning(f"目录不存在: {local_dir}")
-            return 0
-        
-        if not self._connect():
-            return 0
-        
-        # 创建远程目录
-        self._mkdir_p(remote_dir)
+            return 0, 0
         
-        upload_count = 0
+        files = self._walk(local_dir, remote_dir)
+        start = time.time()
+        upload_count = self.upload_files(files)
         
-        for root, dirs, files in os.walk(local_dir):
-            for filename in files:
-                local_path = os.path.join(root, filename)
-                relative_path = os.path.relpath(local_path, local_dir)
-                remote_path = f"{remote_dir}/{relative_path}".replace("\\", "/")
-                
-                try:
-                    # 确保子目录存在
-                    remote_subdir = os.path.dirname(remote_path)
-                    self._mkdir_p(remote_subdir)
-                    
-                    # 上传
-                    self._sftp.put(local_path, remote_path)
-                    upload_count += 1
-                except Exception as e:
-                    logger.error(f"上传失败: {filename} - {e}")
-        
-        logger.info(f"目录上传完成: {upload_count} 个文件")
-        return upload_count
+        logger.info(f"目录上传完成: {upload_count}/{len(files)} 个文件，{time.time() - start:.1f}秒")
+        return upload_count, len(files)
+    
+    def upload_directory(self, local_dir: str, remote_dir: str) -> int:
+        """上传整个目录，返回成功上传（含之前已上传）的文件数"""
+        return self._upload_tree(local_dir, remote_dir)[0]
+    
+    def _upload_complete(self, local_dir: str, remote_dir: str) -> bool:
+        """上传整个目录，全部文件（含播放列表）都已在远程时返回 True"""
+        count, total = self._upload_tree(local_dir, remote_dir)
+        if count < total:
+            logger.warning(f"{remote_dir} 上传不完整: {count}/{total}，下次上传时续传")
+        return total > 0 and count == total
+    
+    def stream_hls(self, local_hls_dir: str, video_id: str) -> "StreamingUpload":
+        """转码期间边生成边上传 HLS 分片，配合 with 使用，结束后再调用 upload_hls"""
+        return StreamingUpload(self, local_hls_dir, f"{self.upload_base}/hls/{video_id}")
     
     def set_permissions(self, remote_path: str, owner: str = "www:www"):
         """设置远程文件权限"""
         self._run_ssh(f'chown -R {owner} "{remote_path}"')
     
     def upload_hls(self, local_hls_dir: str, video_id: str) -> Optional[str]:
-        """上传HLS目录，返回远程URL路径"""
+        """上传HLS目录，全部文件就绪时返回远程URL路径，否则返回 None"""
         remote_dir = f"{self.upload_base}/hls/{video_id}"
         
-        count = self.upload_directory(local_hls_dir, remote_dir)
-        
-        if count > 0:
+        if self._upload_complete(local_hls_dir, remote_dir):
             self.set_permissions(remote_dir)
             return f"/uploads/hls/{video_id}/master.m3u8"
         
         return None
     
     def upload_covers(self, local_covers_dir: str, video_id: str) -> Optional[str]:
-        """上传封面目录"""
+        """上传封面目录，全部文件就绪时返回远程URL路径，否则返回 None"""
         remote_dir = f"{self.upload_base}/hls/{video_id}/covers"
         
-        count = self.upload_directory(local_covers_dir, remote_dir)
-        
-        if count > 0:
+        if self._upload_complete(local_covers_dir, remote_dir):
             return f"/uploads/hls/{video_id}/covers"
         
         return None
@@ -190,28 +393,24 @@ class Uploader:
             return f"/uploads/previews/{filename}"
         
         return None
-
+    
     # ========== 暗网视频上传方法 ==========
     
     def upload_darkweb_hls(self, local_hls_dir: str, video_id: str) -> Optional[str]:
-        """上传暗网HLS目录，返回远程URL路径"""
+        """上传暗网HLS目录，全部文件就绪时返回远程URL路径，否则返回 None"""
         remote_dir = f"{self.upload_base}/darkweb_hls/{video_id}"
         
-        count = self.upload_directory(local_hls_dir, remote_dir)
-        
-        if count > 0:
+        if self._upload_complete(local_hls_dir, remote_dir):
             self.set_permissions(remote_dir)
             return f"/uploads/darkweb_hls/{video_id}/master.m3u8"
         
         return None
     
     def upload_darkweb_covers(self, local_covers_dir: str, video_id: str) -> Optional[str]:
-        """上传暗网封面目录"""
+        """上传暗网封面目录，全部文件就绪时返回远程URL路径，否则返回 None"""
         remote_dir = f"{self.upload_base}/darkweb_hls/{video_id}/covers"
         
-        count = self.upload_directory(local_covers_dir, remote_dir)
-        
-        if count > 0:
+        if self._upload_complete(local_covers_dir, remote_dir):
             return f"/uploads/darkweb_hls/{video_id}/covers"
         
         return None
@@ -229,3 +428,72 @@ class Uploader:
             return f"/uploads/darkweb_previews/{video_id}_{filename}"
         
         return None
+
+
+class StreamingUpload:
+    """
+    边转码边上传：后台线程定期读取各档位 playlist.m3u8，
+    上传列表中已出现（即 FFmpeg 已写完）的分片；播放列表本身留给最后的 upload_hls。
+    已上传的分片记在清单里，之后 upload_hls 只补传剩余文件
+    """
+    
+    def __init__(self, uploader: Uploader, local_dir: str, remote_dir: str,
+                 interval: Optional[float] = None):
+        self.uploader = uploader
+        self.local_dir = local_dir
+        self.remote_dir = remote_dir
+        self.interval = interval if interval is not None else UPLOAD["poll_interval"]
+        self.uploaded = 0
+        self._sent: Set[str] = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="hls-stream-upload", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+    
+    def _ready_segments(self) -> List[Tuple[str, str]]:
+        """各 playlist.m3u8 中已列出、尚未上传的分片"""
+        files = []
+        if not os.path.isdir(self.local_dir):
+            return files
+        for root, dirs, filenames in os.walk(self.local_dir):
+            for filename in filenames:
+                if not filename.endswith(PLAYLIST_EXT):
+                    continue
+                try:
+                    with open(os.path.join(root, filename), encoding="utf-8") as f:
+                        entries = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+                except OSError:
+                    continue
+                for entry in entries:
+                    local_path = os.path.join(root, entry)
+                    if entry.endswith(PLAYLIST_EXT) or local_path in self._sent or not os.path.isfile(local_path):
+                        continue
+                    relative_path = os.path.relpath(local_path, self.local_dir)
+                    files.append((local_path, f"{self.remote_dir}/{relative_path}".replace("\\", "/")))
+        return files
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            files = self._ready_segments()
+            if not files:
+                continue
+            try:
+                self.uploaded += self.uploader.upload_files(files)
+                self._sent.update(local for local, _ in files)
+            except Exception as e:
+                logger.warning(f"分片预上传失败（将在转码完成后重传）: {e}")
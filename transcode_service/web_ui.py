@@ -9,9 +9,10 @@ from datetime import datetime
 from flask import Flask, render_template, request, jsonify, send_from_directory
 from flask_cors import CORS
 
-from config import DIRS, SERVICE, MAIN_SERVER, ensure_dirs, get_free_disk_space
+from config import DIRS, SERVICE, MAIN_SERVER, UPLOAD_SESSIONS_PATH, ensure_dirs, get_free_disk_space
+from chunk_upload import ChunkUploadStore, ChunkError
 from task_queue import TaskQueue, TaskStatus, TaskType
-from transcoder import Transcoder
+from transcoder import Transcoder, media_probe
 from uploader import Uploader
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
@@ -21,7 +22,7 @@ app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024 * 1024
 queue = TaskQueue()
 uploader = Uploader()
 pending_publish = {}
-upload_progress = {}
+chunk_store = None
 
 # 发布队列 - 确保发布任务串行执行
 publish_queue = []
@@ -176,11 +177,7 @@ def recover_pending_tasks():
             if duration == 0:
                 video_path = os.path.join(task_path, filename)
                 try:
-                    import subprocess
-                    cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', video_path]
-                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-                    if result.returncode == 0 and result.stdout.strip():
-                        duration = float(result.stdout.strip())
+                    duration = media_probe.probe(video_path).duration
                 except:
                     pass
             covers = []
@@ -376,33 +373,86 @@ def add_local_file():
     })
 
 
+def get_chunk_store() -> ChunkUploadStore:
+    """分块上传会话存储（首次使用时打开）"""
+    global chunk_store
+    if chunk_store is None:
+        chunk_store = ChunkUploadStore(UPLOAD_SESSIONS_PATH, DIRS["processing"])
+    return chunk_store
+
+
+@app.route('/api/upload/init', methods=['POST'])
+def init_chunk_upload():
+    """创建（或恢复）分块上传，返回已收到的分块供客户端续传"""
+    data = request.json or {}
+    try:
+        session = get_chunk_store().create(
+            file_id=str(data.get('file_id', '')) or datetime.now().strftime('%Y%m%d%H%M%S%f'),
+            filename=data.get('filename', ''),
+            size=int(data.get('size', 0)),
+            chunk_size=int(data.get('chunk_size', 5 * 1024 * 1024)),
+            video_type=data.get('video_type', 'long'),
+        )
+    except (ChunkError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(session.to_dict())
+
+
+@app.route('/api/upload/<file_id>/chunks')
+def get_chunk_upload(file_id):
+    """查询已收到哪些分块"""
+    session = get_chunk_store().get(file_id)
+    if session is None:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(session.to_dict())
+
+
 @app.route('/api/upload/chunk', methods=['POST'])
 def upload_chunk():
     file_id = request.form.get('file_id')
     chunk_index = int(request.form.get('chunk_index', 0))
-    total_chunks = int(request.form.get('total_chunks', 1))
-    filename = request.form.get('filename')
-    video_type = request.form.get('video_type', 'long')
-    is_short = video_type == 'short'
-    is_darkweb = video_type == 'darkweb'
     if 'chunk' not in request.files:
         return jsonify({"error": "No chunk data"}), 400
-    temp_dir = os.path.join(DIRS["uploads"], file_id)
-    os.makedirs(temp_dir, exist_ok=True)
-    chunk_path = os.path.join(temp_dir, f"chunk_{chunk_index}")
-    request.files['chunk'].save(chunk_path)
-    upload_progress[file_id] = {"progress": (chunk_index + 1) / total_chunks * 100}
-    if chunk_index + 1 == total_chunks:
-        task_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
-        task_dir = os.path.join(DIRS["processing"], task_id)
-        os.makedirs(task_dir, exist_ok=True)
-        video_path = os.path.join(task_dir, filename)
-        with open(video_path, 'wb') as outfile:
-            for i in range(total_chunks):
-                with open(os.path.join(temp_dir, f"chunk_{i}"), 'rb') as infile:
-                    outfile.write(infile.read())
-        shutil.rmtree(temp_dir, ignore_errors=True)
-        del upload_progress[file_id]
+    
+    chunk = request.files['chunk']
+    store = get_chunk_store()
+    try:
+        session = store.get(file_id)
+        if session is None and request.form.get('file_size'):
+            # 未调用 init 的客户端可以在第一个分块里带上文件大小和分块大小
+            session = store.create(
+                file_id=file_id,
+                filename=request.form.get('filename', ''),
+                size=int(request.form.get('file_size', 0)),
+                chunk_size=int(request.form.get('chunk_size', 0)),
+                video_type=request.form.get('video_type', 'long'),
+            )
+        elif session is None:
+            # 旧客户端只带 total_chunks 和 filename，分块大小按这一块的长度推断
+            chunk.stream.seek(0, os.SEEK_END)
+            chunk_length = chunk.stream.tell()
+            chunk.stream.seek(0)
+            session = store.create_legacy(
+                file_id=file_id,
+                filename=request.form.get('filename', ''),
+                total_chunks=int(request.form.get('total_chunks', 1)),
+                chunk_index=chunk_index,
+                chunk_length=chunk_length,
+                video_type=request.form.get('video_type', 'long'),
+            )
+        # 分块直接写到源文件对应偏移，不落地临时分块
+        completed = store.write_chunk(
+            session, chunk_index, chunk.stream, request.form.get('checksum')
+        )
+    except (ChunkError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if completed:
+        task_id = session.task_id
+        video_path = session.path
+        filename = session.filename
+        is_short = session.video_type == 'short'
+        is_darkweb = session.video_type == 'darkweb'
         pending_publish[task_id] = {"status": "uploading", "progress": 0, "filename": filename}
         def transcode():
             try:
@@ -412,7 +462,8 @@ def upload_chunk():
                 pending_publish[task_id] = {"error": str(e), "status": "failed"}
         threading.Thread(target=transcode).start()
         return jsonify({"complete": True, "task_id": task_id})
-    return jsonify({"complete": False, "progress": upload_progress[file_id]["progress"]})
+    return jsonify({"complete": session.completed, "progress": session.progress,
+                    "received": session.received_count, "total_chunks": session.total_chunks})
 
 
 def process_video(task_id, video_path, is_short, is_darkweb=False):
@@ -424,12 +475,9 @@ def process_video(task_id, video_path, is_short, is_darkweb=False):
     transcoder = Transcoder(progress_cb, is_short=is_short)
     duration, height = transcoder.get_video_info(video_path)
     pending_publish[task_id] = {"status": "transcoding", "progress": 0, "filename": filename}
-    hls_dir = transcoder.generate_hls(video_path, task_dir, duration, height)
-    pending_publish[task_id] = {"status": "generating_covers", "progress": 100, "filename": filename}
-    covers_dir, best_cover = transcoder.generate_covers(video_path, task_dir, duration)
-    preview_path = None
-    if not is_short:
-        preview_path = transcoder.generate_preview(video_path, task_dir, duration, name)
+    hls_dir, covers_dir, best_cover, preview_path = transcoder.process(
+        video_path, task_dir, duration, height, name, with_preview=not is_short
+    )
     covers = []
     for i in range(1, 11):
         cp = os.path.join(covers_dir, f"cover_{i}.webp")
@@ -555,6 +603,8 @@ def publish_darkweb_video():
     try:
         video_id = f"darkweb_{datetime.now().strftime('%Y%m%d%H%M%S')}"
         hls_url = uploader.upload_darkweb_hls(task_data['hls_dir'], video_id)
+        if not hls_url:
+            return jsonify({"error": "HLS上传失败"}), 500
         uploader.upload_darkweb_covers(task_data['covers_dir'], video_id)
         
         # 确定封面文件名：优先使用自定义封面，否则使用选择的封面
@@ -11,9 +11,10 @@ from datetime import datetime
 from typing import Optional, List
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from config import DIRS, SERVICE, PARALLEL, ensure_dirs, check_disk_space
-from task_queue import TaskQueue, TaskStatus, TaskType
+from config import DIRS, SERVICE, PARALLEL, SCHEDULER, ensure_dirs, check_disk_space
+from task_queue import TaskQueue, TaskStatus, TaskType, LeaseLostError
 from transcoder import Transcoder
+from scheduler import Scheduler
 from uploader import Uploader
 from callback import CallbackClient
 
@@ -24,6 +25,7 @@ class TranscodeWorker:
     def __init__(self):
         ensure_dirs()
         self.queue = TaskQueue()
+        self.scheduler = Scheduler(self.queue)
         self.uploader = Uploader()
         self.callback = CallbackClient()
         self.running = False
@@ -38,7 +40,8 @@ class TranscodeWorker:
                 if filename.lower().endswith(".mp4"):
                     filepath = os.path.join(DIRS["downloads_long"], filename)
                     if self._is_file_complete(filepath):
-                        self.queue.add_task(filename, filepath, TaskType.LONG)
+                        task_id = self.queue.add_task(filename, filepath, TaskType.LONG)
+                        self._estimate(task_id, filepath, is_short=False)
                         logger.info(f"发现长视频: {filename}")
         except Exception as e:
             logger.error(f"扫描长视频目录失败: {e}")
@@ -48,11 +51,29 @@ class TranscodeWorker:
                 if filename.lower().endswith(".mp4"):
                     filepath = os.path.join(DIRS["downloads_short"], filename)
                     if self._is_file_complete(filepath):
-                        self.queue.add_task(filename, filepath, TaskType.SHORT)
+                        task_id = self.queue.add_task(filename, filepath, TaskType.SHORT)
+                        self._estimate(task_id, filepath, is_short=True)
                         logger.info(f"发现短视频: {filename}")
         except Exception as e:
             logger.error(f"扫描短视频目录失败: {e}")
     
+    def _estimate(self, task_id: int, filepath: str, is_short: bool):
+        """入队时探测时长/分辨率并估算编码开销（结果有缓存），供调度分配线程和计算 ETA"""
+        task = self.queue.get_task(task_id)
+        if not task or task.get("cpu_cost"):
+            return
+        try:
+            transcoder = Transcoder(is_short=is_short)
+            duration, height = transcoder.get_video_info(filepath)
+            if duration > 0:
+                self.queue.update_estimate(
+                    task_id, duration, height,
+                    cpu_cost=transcoder.estimate_cpu_cost(duration, height),
+                    estimated_time=transcoder.estimate_transcode_time(duration, height)
+                )
+        except Exception as e:
+            logger.warning(f"估算任务开销失败 {filepath}: {e}")
+    
     def _is_file_complete(self, filepath: str) -> bool:
         try:
             initial_size = os.path.getsize(filepath)
@@ -62,8 +83,15 @@ class TranscodeWorker:
         except:
             return False
     
-    def process_task(self, task: dict, worker_id: int = 0) -> bool:
+    def process_task(self, task: dict, worker_id: int = 0, threads: Optional[int] = None) -> bool:
+        # 处理期间后台续约，进程崩溃后任务会在租约过期时被重新派发
+        with self.queue.hold_lease(task) as lease_lost:
+            return self._process_task(task, worker_id, threads, lease_lost)
+    
+    def _process_task(self, task: dict, worker_id: int = 0, threads: Optional[int] = None,
+                      lease_lost: Optional[threading.Event] = None) -> bool:
         task_id = task["id"]
+        lease_owner = task.get("lease_owner")
         filename = task["filename"]
         filepath = task["filepath"]
         task_type = task["task_type"]
@@ -90,41 +118,58 @@ class TranscodeWorker:
                 raise FileNotFoundError(f"源文件不存在: {filepath}")
             
             os.makedirs(output_dir, exist_ok=True)
-            self.queue.update_status(task_id, TaskStatus.PROCESSING, 
-                                     output_dir=output_dir, worker_id=worker_id)
+            if not self.queue.update_status(task_id, TaskStatus.PROCESSING, lease_owner,
+                                            output_dir=output_dir, worker_id=worker_id):
+                raise LeaseLostError(f"任务 {task_id} 的租约已被收回")
             
             with self.lock:
                 self.current_tasks[worker_id] = task
             
             def progress_callback(progress):
-                self.queue.update_progress(task_id, progress)
+                self.queue.update_progress(task_id, progress, lease_owner)
             
-            transcoder = Transcoder(progress_callback, is_short=is_short)
+            transcoder = Transcoder(progress_callback, is_short=is_short, threads=threads)
             duration, height = transcoder.get_video_info(processing_path)
             estimated_time = transcoder.estimate_transcode_time(duration, height)
+            cpu_cost = transcoder.estimate_cpu_cost(duration, height)
+            # 未分配线程预算时 FFmpeg 使用全部核心
+            threads = threads or SCHEDULER["cores"]
             
-            self.queue.update_status(task_id, TaskStatus.PROCESSING, 
+            self.queue.update_status(task_id, TaskStatus.PROCESSING, lease_owner,
                                      duration=duration, height=height,
-                                     estimated_time=estimated_time)
+                                     estimated_time=estimated_time,
+                                     cpu_cost=cpu_cost, threads=threads)
             
-            hls_dir = transcoder.generate_hls(processing_path, output_dir, duration, height)
-            covers_dir, best_cover = transcoder.generate_covers(processing_path, output_dir, duration)
+            # 远程目录名在首次处理时生成并记入任务，重试时上传到同一目录，已传完的文件按清单跳过
+            video_id = task.get("video_id") or self.queue.assign_video_id(
+                task_id, f"{'short_' if is_short else ''}{datetime.now().strftime('%Y%m%d%H%M%S')}_{task_id}"
+            )
             
-            preview_path = None
-            if not is_short:
-                preview_path = transcoder.generate_preview(processing_path, output_dir, duration, name)
+            # 转码期间后台上传已写完的 HLS 分片，完成后只需补传剩余文件
+            transcode_start = time.monotonic()
+            with self.uploader.stream_hls(os.path.join(output_dir, "hls"), video_id):
+                hls_dir, covers_dir, best_cover, preview_path = transcoder.process(
+                    processing_path, output_dir, duration, height, name, with_preview=not is_short
+                )
+            transcode_seconds = time.monotonic() - transcode_start
             
-            self.queue.update_status(task_id, TaskStatus.UPLOADING)
-            video_id = f"{'short_' if is_short else ''}{datetime.now().strftime('%Y%m%d%H%M%S')}_{worker_id}"
+            # 上传和回调不可撤销，开始前确认租约仍在（期间已被重新派发则放弃，交给新的处理者）
+            self.queue.check_lease(task, lease_lost)
+            self.queue.update_status(task_id, TaskStatus.UPLOADING, lease_owner)
             
+            # 有文件没传上时不发布，按失败重试（已上传的文件按清单跳过）
             hls_url = self.uploader.upload_hls(hls_dir, video_id)
-            self.uploader.upload_covers(covers_dir, video_id)
+            if not hls_url:
+                raise Exception("HLS 上传不完整")
+            if not self.uploader.upload_covers(covers_dir, video_id):
+                raise Exception("封面上传不完整")
             cover_url = f"/uploads/hls/{video_id}/covers/cover_{best_cover}.webp"
             
             preview_url = ""
             if preview_path:
                 preview_url = self.uploader.upload_preview(preview_path) or ""
             
+            self.queue.check_lease(task, lease_lost)
             result = self.callback.send_completion(
                 filename=name, title=name, is_short=is_short,
                 duration=duration, hls_url=hls_url or "",
@@ -141,8 +186,10 @@ class TranscodeWorker:
             if os.path.exists(processing_path):
                 os.remove(processing_path)
             
-            self.queue.update_status(task_id, TaskStatus.COMPLETED,
-                                     hls_url=hls_url, cover_url=cover_url, preview_url=preview_url)
+            # 实际转码耗时用于学习吞吐（get_queue_with_eta）
+            self.queue.update_status(task_id, TaskStatus.COMPLETED, lease_owner,
+                                     hls_url=hls_url, cover_url=cover_url, preview_url=preview_url,
+                                     transcode_seconds=transcode_seconds)
             
             with self.lock:
                 self.current_tasks.pop(worker_id, None)
@@ -150,6 +197,18 @@ class TranscodeWorker:
             logger.info(f"[W{worker_id}] 完成: {filename}")
             return True
             
+        except LeaseLostError as e:
+            # 任务已归新的处理者，不再改写它的状态
+            logger.warning(f"[W{worker_id}] 放弃: {e}")
+            if os.path.exists(processing_path):
+                try:
+                    shutil.move(processing_path, filepath)
+                except:
+                    pass
+            with self.lock:
+                self.current_tasks.pop(worker_id, None)
+            return False
+            
         except Exception as e:
             logger.error(f"[W{worker_id}] 失败: {e}", exc_info=True)
             
@@ -161,10 +220,10 @@ class TranscodeWorker:
             
             retry_count = task.get("retry_count", 0) + 1
             if retry_count < SERVICE["max_retries"]:
-                self.queue.update_status(task_id, TaskStatus.PENDING,
+                self.queue.update_status(task_id, TaskStatus.PENDING, lease_owner,
                                          error_message=str(e), retry_count=retry_count)
             else:
-                self.queue.update_status(task_id, TaskStatus.FAILED,
+                self.queue.update_status(task_id, TaskStatus.FAILED, lease_owner,
                                          error_message=str(e), retry_count=retry_count)
             
             with self.lock:
@@ -193,12 +252,49 @@ class TranscodeWorker:
                 active_count = len([f for f in futures if not f.done()])
                 available_slots = max_workers - active_count
                 
-                if available_slots > 0:
-                    tasks = self.queue.get_pending_tasks(available_slots)
-                    for i, task in enumerate(tasks):
-                        worker_id = active_count + i + 1
-                        future = self.executor.submit(self.process_task, task, worker_id)
-                        futures[future] = task["id"]
+                for i in range(available_slots):
+                    worker_id = active_count + i + 1
+                    task = self.queue.get_pending_task(worker_id)
+                    if not task:
+                        break
+                    future = self.executor.submit(self.process_task, task, worker_id)
+                    futures[future] = task["id"]
+                
+                time.sleep(1 if futures else SERVICE["check_interval"])
+                    
+            except Exception as e:
+                logger.error(f"循环错误: {e}", exc_info=True)
+                time.sleep(30)
+        
+        self.executor.shutdown(wait=True)
+    
+    def run_scheduled(self):
+        """按资源调度并发：每次循环在线程/磁盘允许时尽量多地启动任务"""
+        scheduler = self.scheduler
+        logger.info(f"资源调度模式，{scheduler.cores} 线程，短视频通道预留 {scheduler.fast_lane_threads} 线程")
+        
+        self.executor = ThreadPoolExecutor(max_workers=scheduler.max_jobs)
+        futures = {}
+        
+        while self.running:
+            try:
+                self.scan_downloads()
+                
+                for f in [f for f in futures if f.done()]:
+                    scheduler.release(futures.pop(f))
+                    try:
+                        f.result()
+                    except Exception as e:
+                        logger.error(f"任务异常: {e}")
+                
+                while self.running:
+                    job = scheduler.admit()
+                    if job is None:
+                        break
+                    logger.info(f"[W{job.worker_id}] 调度 {job.task['filename']}：{job.lane} 通道，"
+                                f"{job.threads} 线程，开销 {job.task.get('cpu_cost') or 0:.0f}")
+                    future = self.executor.submit(self.process_task, job.task, job.worker_id, job.threads)
+                    futures[future] = job
                 
                 time.sleep(1 if futures else SERVICE["check_interval"])
                     
@@ -211,9 +307,10 @@ class TranscodeWorker:
     def run(self):
         self.running = True
         logger.info("转码工作线程启动")
-        self.queue.reset_stuck_tasks()
         
-        if PARALLEL["enabled"] and PARALLEL["max_workers"] > 1:
+        if SCHEDULER["enabled"]:
+            self.run_scheduled()
+        elif PARALLEL["enabled"] and PARALLEL["max_workers"] > 1:
             self.run_parallel()
         else:
             self.run_single()
@@ -222,7 +319,7 @@ class TranscodeWorker:
         while self.running:
             try:
                 self.scan_downloads()
-                task = self.queue.get_pending_task()
+                task = self.queue.get_pending_task(worker_id=1)
                 if task:
                     self.process_task(task, worker_id=1)
                 else:
@@ -243,5 +340,6 @@ class TranscodeWorker:
                 "running": self.running,
                 "active_tasks": len(self.current_tasks),
                 "current_tasks": list(self.current_tasks.values()),
-                "stats": self.queue.get_stats()
+                "stats": self.queue.get_stats(),
+                "scheduler": self.scheduler.snapshot(),
             }